@@ -0,0 +1,248 @@
+"""SoulNutri AI - Backends de busca do DishIndex
+Exato (produto escalar em todas as linhas) ou IVF aproximado (NumPy puro).
+
+Selecionado por deploy via SOULNUTRI_ANN_BACKEND=exact|ivf (default: exact).
+O IVF e persistido ao lado de dish_index_embeddings.npy como
+dish_index_ivf.npz (escrita atomica, como o indice principal) e reconstruido
+sozinho se os embeddings mudarem.
+
+Antes de ligar o IVF em producao, rodar:
+    python scripts/ann_recall_report.py
+e conferir a concordancia top-5 com a busca exata.
+"""
+
+import os
+import time
+import hashlib
+import logging
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .index_store import atomic_write
+
+logger = logging.getLogger(__name__)
+
+ANN_BACKEND = os.environ.get("SOULNUTRI_ANN_BACKEND", "exact").strip().lower()
+IVF_NLIST = int(os.environ.get("SOULNUTRI_IVF_NLIST", "0"))  # 0 = automatico (~sqrt(N))
+IVF_NPROBE = int(os.environ.get("SOULNUTRI_IVF_NPROBE", "8"))
+IVF_VERSION = 1
+
+
+def embeddings_fingerprint(embeddings: np.ndarray) -> str:
+    """SHA1 dos bytes da matriz — detecta IVF desatualizado."""
+    return hashlib.sha1(np.ascontiguousarray(embeddings).tobytes()).hexdigest()
+
+
+class ExactSearch:
+    """Busca exata: similaridade com todas as linhas do indice."""
+
+    name = "exact"
+
+    def __init__(self, embeddings: np.ndarray):
+        self.embeddings = embeddings
+
+    def candidates(self, query: np.ndarray) -> Tuple[Optional[np.ndarray], np.ndarray]:
+        """Retorna (linhas, similaridades). linhas=None significa todas as linhas."""
+        return None, np.dot(self.embeddings, query)
+
+    def rebase(self, embeddings: np.ndarray, kept_rows: np.ndarray) -> "ExactSearch":
+        """Backend para a matriz apos add/remove incremental."""
+        return ExactSearch(embeddings)
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+class IVFSearch:
+    """Inverted File (IVF-Flat) com k-means esferico em NumPy.
+
+    Cada embedding pertence a lista do centroide mais proximo. A busca
+    visita as nprobe listas mais proximas da query e calcula a similaridade
+    exata apenas nesses candidatos.
+    """
+
+    name = "ivf"
+
+    def __init__(self, embeddings: np.ndarray, centroids: np.ndarray, assign: np.ndarray, nprobe: int = IVF_NPROBE):
+        self.embeddings = embeddings
+        self.centroids = centroids.astype(np.float32)
+        self.assign = assign.astype(np.int32)
+        self.nprobe = max(1, min(nprobe, len(self.centroids)))
+        # Linhas ordenadas por lista + offsets: lista c = rows[offsets[c]:offsets[c+1]]
+        self._rows = np.argsort(self.assign, kind="stable").astype(np.int64)
+        counts = np.bincount(self.assign, minlength=len(self.centroids))
+        self._offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    @staticmethod
+    def train(embeddings: np.ndarray, nlist: int = 0, iterations: int = 20, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """K-means esferico (cosseno). Deterministico para o mesmo seed."""
+        n = len(embeddings)
+        if nlist <= 0:
+            nlist = max(1, int(np.sqrt(n)))
+        nlist = min(nlist, n)
+        rng = np.random.default_rng(seed)
+        centroids = embeddings[rng.choice(n, nlist, replace=False)].astype(np.float32)
+        assign = np.zeros(n, dtype=np.int32)
+        for _ in range(iterations):
+            assign = np.argmax(embeddings @ centroids.T, axis=1).astype(np.int32)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, embeddings)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Lista vazia: re-semeia com um ponto aleatorio
+            if empty.any():
+                sums[empty] = embeddings[rng.choice(n, int(empty.sum()), replace=False)]
+                norms[empty] = np.linalg.norm(sums[empty], axis=1, keepdims=True)
+            centroids = sums / norms
+        assign = np.argmax(embeddings @ centroids.T, axis=1).astype(np.int32)
+        return centroids, assign
+
+    def candidates(self, query: np.ndarray) -> Tuple[Optional[np.ndarray], np.ndarray]:
+        centroid_sims = self.centroids @ query
+        if self.nprobe < len(centroid_sims):
+            probe = np.argpartition(-centroid_sims, self.nprobe - 1)[:self.nprobe]
+        else:
+            probe = np.arange(len(centroid_sims))
+        rows = np.concatenate([self._rows[self._offsets[c]:self._offsets[c + 1]] for c in probe])
+        return rows, np.dot(self.embeddings[rows], query)
+
+    def rebase(self, embeddings: np.ndarray, kept_rows: np.ndarray) -> "IVFSearch":
+        """Backend para a matriz apos add/remove incremental, sem re-treinar.
+
+        kept_rows: linhas antigas mantidas, na ordem em que aparecem no inicio
+        de `embeddings`; as linhas seguintes sao novas e vao para a lista do
+        centroide mais proximo. Os centroides envelhecem ate o proximo
+        treino (compactacao/rebuild muda o fingerprint e re-treina).
+        """
+        new_rows = embeddings[len(kept_rows):]
+        assign = self.assign[kept_rows]
+        if len(new_rows):
+            assign = np.concatenate([assign, np.argmax(new_rows @ self.centroids.T, axis=1)])
+        return IVFSearch(embeddings, self.centroids, assign, self.nprobe)
+
+    def save(self, path: str, fingerprint: str):
+        """Arquivo temporario + os.replace: queda no meio nao deixa .npz truncado."""
+        atomic_write(path, lambda f: np.savez(f, centroids=self.centroids, assign=self.assign,
+                                              fingerprint=np.array(fingerprint), version=np.array(IVF_VERSION)))
+
+    def stats(self) -> dict:
+        sizes = np.diff(self._offsets)
+        return {
+            "backend": self.name,
+            "nlist": int(len(self.centroids)),
+            "nprobe": int(self.nprobe),
+            "avg_list_size": round(float(sizes.mean()), 1) if len(sizes) else 0,
+        }
+
+
+def ivf_path_for(emb_file: str) -> str:
+    """dish_index_embeddings.npy -> dish_index_ivf.npz"""
+    return emb_file.replace('_embeddings.npy', '_ivf.npz')
+
+
+def load_or_build_ivf(embeddings: np.ndarray, emb_file: str, nlist: int = IVF_NLIST, nprobe: int = IVF_NPROBE) -> IVFSearch:
+    """Carrega o IVF persistido se corresponder aos embeddings; senao treina e salva."""
+    path = ivf_path_for(emb_file)
+    fingerprint = embeddings_fingerprint(embeddings)
+    if os.path.exists(path):
+        try:
+            data = np.load(path)
+            if int(data["version"]) == IVF_VERSION and str(data["fingerprint"]) == fingerprint:
+                return IVFSearch(embeddings, data["centroids"], data["assign"], nprobe)
+            logger.info("[ann] IVF desatualizado, re-treinando")
+        except Exception as e:
+            logger.warning(f"[ann] Erro ao carregar IVF {path}: {e}")
+    start = time.time()
+    centroids, assign = IVFSearch.train(embeddings, nlist)
+    ivf = IVFSearch(embeddings, centroids, assign, nprobe)
+    try:
+        ivf.save(path, fingerprint)
+    except Exception as e:
+        logger.warning(f"[ann] Erro ao salvar IVF {path}: {e}")
+    logger.info(f"[ann] IVF treinado em {time.time()-start:.2f}s: {ivf.stats()}")
+    return ivf
+
+
+def create_backend(embeddings: np.ndarray, emb_file: str, backend: str = ANN_BACKEND):
+    """Fabrica do backend configurado. Qualquer falha cai para a busca exata."""
+    if embeddings is None or len(embeddings) == 0:
+        return None
+    if backend == "ivf":
+        try:
+            return load_or_build_ivf(embeddings, emb_file)
+        except Exception as e:
+            logger.warning(f"[ann] IVF indisponivel, usando busca exata: {e}")
+    elif backend != "exact":
+        logger.warning(f"[ann] Backend desconhecido '{backend}', usando busca exata")
+    return ExactSearch(embeddings)
+
+
+def _top_rows(rows: Optional[np.ndarray], sims: np.ndarray, k: int) -> np.ndarray:
+    order = np.argsort(-sims, kind="stable")[:k]
+    return order if rows is None else rows[order]
+
+
+def _top_dishes(row_ids: np.ndarray, dish_ids: np.ndarray, k: int) -> list:
+    seen = []
+    for r in row_ids:
+        d = int(dish_ids[r])
+        if d not in seen:
+            seen.append(d)
+            if len(seen) == k:
+                break
+    return seen
+
+
+def recall_report(embeddings: np.ndarray, dishes: list, backend, sample: int = 300,
+                  k: int = 5, seed: int = 0) -> dict:
+    """Compara um backend aproximado com a busca exata (leave-one-out).
+
+    Cada query e um embedding do proprio indice; a linha da query e
+    descartada dos dois resultados. Mede recall de linhas no top-(k*10)
+    usado pelo DishIndex.search, concordancia do top-1 de prato e
+    sobreposicao media do top-k de pratos.
+    """
+    n = len(embeddings)
+    rng = np.random.default_rng(seed)
+    queries = rng.choice(n, min(sample, n), replace=False)
+    _, dish_ids = np.unique(np.asarray(dishes), return_inverse=True)
+    exact = ExactSearch(embeddings)
+    depth = k * 10
+
+    row_recall, top1_agree, topk_overlap, topk_same = [], 0, [], 0
+    candidate_frac = []
+    t_exact = t_ann = 0.0
+    for qi in queries:
+        q = embeddings[qi]
+        t0 = time.perf_counter()
+        e_rows = _top_rows(*exact.candidates(q), depth + 1)
+        t_exact += time.perf_counter() - t0
+        t0 = time.perf_counter()
+        a_cand, a_sims = backend.candidates(q)
+        a_rows = _top_rows(a_cand, a_sims, depth + 1)
+        t_ann += time.perf_counter() - t0
+        candidate_frac.append(1.0 if a_cand is None else len(a_cand) / n)
+
+        e_rows = e_rows[e_rows != qi][:depth]
+        a_rows = a_rows[a_rows != qi][:depth]
+        row_recall.append(len(np.intersect1d(e_rows, a_rows)) / max(1, len(e_rows)))
+        e_d = _top_dishes(e_rows, dish_ids, k)
+        a_d = _top_dishes(a_rows, dish_ids, k)
+        top1_agree += int(bool(e_d) and bool(a_d) and e_d[0] == a_d[0])
+        topk_overlap.append(len(set(e_d) & set(a_d)) / max(1, len(e_d)))
+        topk_same += int(e_d == a_d)
+
+    m = len(queries)
+    return {
+        "backend": backend.stats(),
+        "queries": int(m),
+        "k": k,
+        "row_recall_at_depth": round(float(np.mean(row_recall)), 4),
+        "dish_top1_agreement": round(top1_agree / m, 4),
+        "dish_topk_overlap": round(float(np.mean(topk_overlap)), 4),
+        "dish_topk_identical": round(topk_same / m, 4),
+        "avg_candidate_fraction": round(float(np.mean(candidate_frac)), 4),
+        "exact_ms_per_query": round(t_exact * 1000 / m, 3),
+        "ann_ms_per_query": round(t_ann * 1000 / m, 3),
+    }
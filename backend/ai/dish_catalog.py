@@ -0,0 +1,131 @@
+"""SoulNutri AI - Catálogo de pratos em memória para a policy
+Os dish_info.json de /app/datasets/organized/<slug>/ são lidos UMA vez (no
+startup ou no primeiro uso) e guardados como registros imutáveis; cada slug
+resolvido pela policy (nome, categoria, info com benefícios já filtrados) fica
+memorizado. analyze_result vira só lookup em memória: sem os.path.exists,
+json.load nem filtro de benefícios por scan.
+
+Edições (admin, auditoria, moderação) chamam invalidate(slug), que relê só o
+arquivo daquele prato; invalidate() sem slug recarrega o catálogo inteiro.
+Slug sem dish_info.json no snapshot (pasta criada depois do load) é procurado
+no disco na primeira vez e de novo a cada MISSING_RECHECK_S, então um prato
+novo ganha nome/info sem restart e sem I/O por chamada.
+
+Os registros são MappingProxyType/tuplas: quem precisa de dict mutável usa
+thaw() (a policy devolve cópias, o server altera a decisão depois).
+"""
+
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from types import MappingProxyType
+from typing import Callable, Dict, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+DATASET_DIR = Path("/app/datasets/organized")
+MISSING_RECHECK_S = 60.0  # intervalo entre buscas no disco de um slug sem arquivo
+
+
+class DishRecord(NamedTuple):
+    """Prato resolvido pela policy."""
+    name: str
+    category: str
+    info: MappingProxyType
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    if isinstance(value, MappingProxyType):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(v) for v in value]
+    return value
+
+
+class DishCatalog:
+    """dish_info.json por slug + memo dos registros resolvidos.
+
+    resolver(slug, file_info) -> DishRecord; file_info é o dish_info.json
+    congelado ou None quando o prato não tem arquivo.
+    """
+
+    def __init__(self, resolver: Callable[[str, Optional[MappingProxyType]], DishRecord],
+                 dataset_dir: Path = DATASET_DIR):
+        self.resolver = resolver
+        self.dataset_dir = Path(dataset_dir)
+        self._files: Optional[Dict[str, MappingProxyType]] = None
+        self._resolved: Dict[str, DishRecord] = {}
+        self._missing: Dict[str, float] = {}  # slug sem arquivo -> monotonic da última busca
+        self._lock = threading.Lock()
+
+    def _read(self, slug: str) -> Optional[MappingProxyType]:
+        try:
+            with open(self.dataset_dir / slug / "dish_info.json", 'r', encoding='utf-8') as f:
+                info = json.load(f)
+            return freeze(info) if isinstance(info, dict) else None
+        except (OSError, ValueError):
+            return None
+
+    def load(self) -> int:
+        """Lê todos os dish_info.json do dataset (chamado no startup)."""
+        files = {}
+        if self.dataset_dir.is_dir():
+            for dish_dir in self.dataset_dir.iterdir():
+                info = self._read(dish_dir.name) if dish_dir.is_dir() else None
+                if info is not None:
+                    files[dish_dir.name] = info
+        with self._lock:
+            self._files = files
+            self._resolved = {}
+            self._missing = {}
+        logger.info(f"[DISH_CATALOG] {len(files)} dish_info.json em memória")
+        return len(files)
+
+    def files(self) -> Dict[str, MappingProxyType]:
+        if self._files is None:
+            self.load()
+        return self._files
+
+    def get(self, slug: str) -> DishRecord:
+        record = self._resolved.get(slug)
+        checked = self._missing.get(slug)
+        if record is not None and (checked is None or time.monotonic() - checked < MISSING_RECHECK_S):
+            return record
+        info = self.files().get(slug)
+        if info is None:
+            info = self._read(slug)  # pasta criada depois do snapshot?
+            with self._lock:
+                if info is None:
+                    self._missing[slug] = time.monotonic()
+                else:
+                    self._files = dict(self._files, **{slug: info})
+                    self._missing.pop(slug, None)
+        record = self.resolver(slug, info)
+        self._resolved[slug] = record
+        return record
+
+    def invalidate(self, slug: Optional[str] = None):
+        """Relê o dish_info.json do prato (ou o catálogo inteiro, sem slug)."""
+        if slug is None or self._files is None:
+            self.load()
+            return
+        info = self._read(slug)
+        with self._lock:
+            files = dict(self._files)
+            if info is None:
+                files.pop(slug, None)
+            else:
+                files[slug] = info
+            self._files = files
+            self._resolved.pop(slug, None)
+            self._missing.pop(slug, None)
@@ -8,6 +8,11 @@ from PIL import Image
 import io
 import time
 import logging
+import queue
+import threading
+from typing import List, Optional
+
+from services.metrics_service import observe as observe_stage
 
 logger = logging.getLogger(__name__)
 
@@ -33,8 +38,43 @@ _ONNX_CONFIG = {
     "intra_op_num_threads": None,
 }
 
-# Caminho do modelo ONNX (gerado no Docker build)
-ONNX_MODEL_PATH = "/app/clip_visual_fp16.onnx"
+# ═══════════════════════════════════════════════════════
+# Micro-batching dinamico do ONNX
+# Requisicoes concorrentes de /api/ai/identify sao agrupadas por alguns ms
+# e executadas num unico _ONNX_SESSION.run com shape (N,3,224,224).
+# So ativa se o modelo exportado tiver eixo de batch dinamico
+# (scripts/export_onnx.py com dynamic_axes). Modelo com batch fixo = 1
+# continua no caminho serial de sempre.
+# SOULNUTRI_MICRO_BATCH=0 desliga (rollback).
+# ═══════════════════════════════════════════════════════
+MICRO_BATCH_ENABLED = os.environ.get("SOULNUTRI_MICRO_BATCH", "1") == "1"
+BATCH_MAX_SIZE = max(1, int(os.environ.get("SOULNUTRI_BATCH_MAX_SIZE", "4")))
+BATCH_MAX_WAIT_MS = max(0.0, float(os.environ.get("SOULNUTRI_BATCH_MAX_WAIT_MS", "8")))
+_BATCHER = None
+_BATCH_COUNT = 0
+_BATCH_ITEMS = 0
+
+# Caminho do modelo ONNX (gerado no Docker build). SOULNUTRI_ONNX_VARIANT escolhe
+# uma variante FP16/INT8 — so ativa se aprovada no gate (ai/model_variants.py).
+from .model_variants import select_model_path
+ONNX_VARIANT, ONNX_MODEL_PATH = select_model_path()
+
+# ═══════════════════════════════════════════════════════
+# Preprocessing rapido (padrao)
+# JPEG decodificado ja reduzido (Image.draft, escala DCT 1/2..1/8) com o
+# menor lado >= DRAFT_MIN_SIDE; resize/crop para 224 e so depois o realce
+# (autocontrast/sharpness/color) + normalizacao CLIP em NumPy sobre 224x224,
+# com buffers reaproveitados por thread. Evita 3 copias de 12MP por foto.
+# Paridade com o caminho PIL: tests/test_fast_preprocess.py.
+# SOULNUTRI_FAST_PREPROCESS=0 volta ao caminho PIL (rollback).
+# ═══════════════════════════════════════════════════════
+FAST_PREPROCESS = os.environ.get("SOULNUTRI_FAST_PREPROCESS", "1") == "1"
+DRAFT_MIN_SIDE = 448
+
+# Versao do preprocessing (autocontrast/sharpness/color + resize/crop/normalize).
+# Incrementar ao mudar qualquer passo: invalida o cache de embeddings
+# (ai/embedding_cache.py), que e indexado por conteudo + versao.
+PREPROCESS_VERSION = 2 if FAST_PREPROCESS else 1
 
 # Constantes CLIP ViT-B-16 preprocessing
 CLIP_MEAN = np.array([0.48145466, 0.4578275, 0.40821073], dtype=np.float32)
@@ -69,6 +109,286 @@ def _preprocess_clip_numpy(img):
     return arr
 
 
+def _decode_image(image_bytes: bytes):
+    return Image.open(io.BytesIO(image_bytes)).convert("RGB")
+
+
+def _enhance(img):
+    """Realce (autocontrast/sharpness/color) aplicado antes do CLIP."""
+    from PIL import ImageEnhance, ImageOps
+    img = ImageOps.autocontrast(img, cutoff=1)
+    img = ImageEnhance.Sharpness(img).enhance(1.3)
+    return ImageEnhance.Color(img).enhance(1.1)
+
+
+def _enhance_and_preprocess(img) -> np.ndarray:
+    """Realce (autocontrast/sharpness/color) + preprocessing CLIP -> (1,3,224,224)."""
+    return _preprocess_clip_numpy(_enhance(img))
+
+
+def _decode_image_reduced(image_bytes: bytes):
+    """Decode JPEG ja reduzido (menor lado >= DRAFT_MIN_SIDE). Retorna (img RGB, tamanho original)."""
+    img = Image.open(io.BytesIO(image_bytes))
+    orig_size = img.size
+    if img.format == "JPEG":
+        img.draft("RGB", (DRAFT_MIN_SIDE, DRAFT_MIN_SIDE))
+    return img.convert("RGB"), orig_size
+
+
+def _autocontrast_lut(img, cutoff: int = 1) -> np.ndarray:
+    """LUT (3,256) igual a ImageOps.autocontrast(cutoff=1), por canal."""
+    hist = np.asarray(img.histogram(), dtype=np.int64).reshape(3, 256)
+    cut = hist[0].sum() * cutoff // 100
+    ix = np.arange(256, dtype=np.float32)
+    lut = np.empty((3, 256), dtype=np.float32)
+    for c in range(3):
+        lo = int(np.searchsorted(np.cumsum(hist[c]), cut, side="right"))
+        hi = 255 - int(np.searchsorted(np.cumsum(hist[c][::-1]), cut, side="right"))
+        if hi <= lo:
+            lut[c] = ix
+        else:
+            scale = 255.0 / (hi - lo)
+            lut[c] = np.clip(np.floor(ix * scale - lo * scale), 0, 255)
+    return lut
+
+
+class _PreprocessBuffers(threading.local):
+    """Buffers 224x224 reaproveitados (um conjunto por thread do to_thread/executor)."""
+
+    def __init__(self):
+        self.idx = np.empty((224, 224, 3), dtype=np.intp)
+        self.rgb = np.empty((224, 224, 3), dtype=np.float32)
+        self.pad = np.empty((226, 226, 3), dtype=np.float32)
+        self.tmp = np.empty((224, 224, 3), dtype=np.float32)
+        self.gray = np.empty((224, 224), dtype=np.float32)
+
+
+_BUFFERS = _PreprocessBuffers()
+_LUT_OFFSETS = np.array([0, 256, 512], dtype=np.intp)
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+_NORM_SCALE = (1.0 / (255.0 * CLIP_STD)).astype(np.float32)
+_NORM_BIAS = (CLIP_MEAN / CLIP_STD).astype(np.float32)
+
+
+def _fast_preprocess(img, orig_size) -> np.ndarray:
+    """Imagem (reduzida) -> tensor (1,3,224,224): resize/crop + realce e normalizacao em NumPy.
+
+    Equivalente ao _enhance_and_preprocess, com o realce aplicado depois do
+    resize. O histograma do autocontrast vem da imagem >= DRAFT_MIN_SIDE (antes
+    do resize, que suaviza as caudas). O sharpness na foto original quase some
+    no resize para 224: aqui a intensidade cai na mesma proporcao.
+    """
+    w, h = orig_size
+    if w < h:
+        new_w, new_h = 224, int(h * 224 / w)
+    else:
+        new_w, new_h = int(w * 224 / h), 224
+    lut = _autocontrast_lut(img)
+    left = (new_w - 224) // 2
+    top = (new_h - 224) // 2
+    img = img.resize((new_w, new_h), Image.BICUBIC).crop((left, top, left + 224, top + 224))
+    crop = np.asarray(img)
+
+    buf = _BUFFERS
+    rgb, tmp = buf.rgb, buf.tmp
+
+    # Autocontrast: LUT por canal
+    np.add(crop, _LUT_OFFSETS, out=buf.idx, casting="unsafe")
+    np.take(lut.ravel(), buf.idx, out=rgb)
+
+    # Sharpness: rgb + k * (rgb - SMOOTH(rgb)), SMOOTH = [[1,1,1],[1,5,1],[1,1,1]] / 13
+    amount = 0.3 * min(1.0, 224.0 / min(w, h))
+    if amount >= 0.01:
+        pad = buf.pad
+        pad[1:-1, 1:-1] = rgb
+        pad[0, 1:-1], pad[-1, 1:-1] = rgb[0], rgb[-1]
+        pad[:, 0], pad[:, -1] = pad[:, 1], pad[:, -2]
+        np.multiply(rgb, 4.0, out=tmp)
+        for dy in range(3):
+            for dx in range(3):
+                tmp += pad[dy:dy + 224, dx:dx + 224]
+        tmp *= -1.0 / 13.0
+        tmp += rgb
+        tmp *= amount
+        rgb += tmp
+        np.clip(rgb, 0, 255, out=rgb)
+
+    # Color(1.1): cinza + 1.1 * (rgb - cinza)
+    np.dot(rgb, _LUMA, out=buf.gray)
+    buf.gray *= 0.1
+    rgb *= 1.1
+    rgb -= buf.gray[..., np.newaxis]
+    np.clip(rgb, 0, 255, out=rgb)
+
+    # Normalizacao CLIP fundida (x / 255 - mean) / std, HWC -> BCHW
+    out = np.empty((1, 3, 224, 224), dtype=np.float32)
+    for c in range(3):
+        np.multiply(rgb[..., c], _NORM_SCALE[c], out=out[0, c])
+        out[0, c] -= _NORM_BIAS[c]
+    return out
+
+
+def preprocess_image_bytes(image_bytes: bytes) -> np.ndarray:
+    """Bytes -> tensor (1,3,224,224) do caminho ONNX. Nao usa o modelo:
+    pode rodar em processos separados (ai/parallel_build.py)."""
+    if FAST_PREPROCESS:
+        return _fast_preprocess(*_decode_image_reduced(image_bytes))
+    return _enhance_and_preprocess(_decode_image(image_bytes))
+
+
+def _normalize_rows(raw: np.ndarray) -> np.ndarray:
+    """Normaliza linha a linha exatamente como o caminho serial (norma do vetor 1-D)."""
+    out = raw.astype(np.float32)
+    for i in range(len(out)):
+        norm = np.linalg.norm(out[i])
+        if norm > 0:
+            out[i] = out[i] / norm
+    return out
+
+
+def embed_preprocessed_batch(session, inputs: np.ndarray) -> np.ndarray:
+    """Roda tensores (N,3,224,224) numa sessao ONNX. Retorna (N,D) normalizado.
+
+    Modelo com batch fixo = 1 roda uma linha por vez.
+    """
+    if len(inputs) > 1 and not _onnx_supports_batching(session):
+        raw = np.concatenate([session.run(None, {'image': inputs[i:i + 1]})[0] for i in range(len(inputs))])
+    else:
+        raw = session.run(None, {'image': inputs})[0]
+    return _normalize_rows(raw)
+
+
+def _onnx_session_options(ort, threads: int = 2):
+    # ═══════════════════════════════════════════════════════
+    # CRITICAL:
+    # Nao alterar para ORT_DISABLE_ALL.
+    # Isso causa inferencia de 9-50 segundos no Render.
+    # Esta configuracao foi validada em producao em Abr/2026.
+    # Benchmark Mai/2026: ORT_ENABLE_ALL + threads=2 → min:292ms (sweet spot para 2 vCPUs)
+    # threads=4 piora em 1 vCPU (context switching) — otimizado para Render Pro (2 vCPU)
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    opts.inter_op_num_threads = threads
+    opts.intra_op_num_threads = threads
+    opts.enable_mem_pattern = False
+    opts.enable_cpu_mem_arena = False
+    return opts
+
+
+def create_onnx_session(threads: int = 2):
+    """Sessao ONNX independente da global (rebuild offline com varias sessoes)."""
+    import onnxruntime as ort
+    return ort.InferenceSession(ONNX_MODEL_PATH, _onnx_session_options(ort, threads))
+
+
+def _onnx_supports_batching(session) -> bool:
+    """True se o input 'image' do modelo aceita batch dinamico (dim 0 simbolica)."""
+    try:
+        dim0 = session.get_inputs()[0].shape[0]
+    except Exception:
+        return False
+    return not isinstance(dim0, int)
+
+
+class _PendingEmbedding:
+    """Uma requisicao aguardando sua linha do batch."""
+    __slots__ = ("arr", "done", "result", "error")
+
+    def __init__(self, arr):
+        self.arr = arr
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _MicroBatcher:
+    """Agrupa tensores (1,3,224,224) de threads concorrentes num unico run ONNX.
+
+    Uma thread daemon consome a fila: pega o primeiro item, espera ate
+    max_wait_ms por mais itens (ou ate max_batch_size), concatena e roda.
+    Cada chamador recebe apenas a sua linha do resultado.
+    """
+
+    def __init__(self, session, max_batch_size: int, max_wait_ms: float):
+        self._session = session
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="onnx-microbatch", daemon=True)
+        self._thread.start()
+
+    def submit(self, img_np: np.ndarray) -> np.ndarray:
+        """Bloqueia ate o batch contendo img_np ser executado. Retorna embedding bruto (D,)."""
+        pending = _PendingEmbedding(img_np)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        global _BATCH_COUNT, _BATCH_ITEMS
+        while True:
+            batch = self._collect()
+            try:
+                inputs = np.concatenate([p.arr for p in batch], axis=0)
+                result = self._session.run(None, {'image': inputs})[0]
+                for i, p in enumerate(batch):
+                    p.result = result[i]
+                _BATCH_COUNT += 1
+                _BATCH_ITEMS += len(batch)
+                if len(batch) > 1:
+                    logger.info(f"[BATCH] size={len(batch)}")
+            except Exception as e:
+                for p in batch:
+                    p.error = e
+            finally:
+                for p in batch:
+                    p.done.set()
+
+
+def _start_micro_batcher():
+    """Inicia o micro-batcher se habilitado e suportado pelo modelo carregado."""
+    global _BATCHER
+    if not MICRO_BATCH_ENABLED or BATCH_MAX_SIZE < 2 or _ONNX_SESSION is None:
+        return False
+    if not _onnx_supports_batching(_ONNX_SESSION):
+        logger.info("[embedder] Modelo ONNX com batch fixo — micro-batching desativado "
+                    "(re-exportar com scripts/export_onnx.py para habilitar)")
+        return False
+    if _BATCHER is None:
+        _BATCHER = _MicroBatcher(_ONNX_SESSION, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS)
+        logger.info(f"[embedder] Micro-batching ativo: max_batch={BATCH_MAX_SIZE} max_wait={BATCH_MAX_WAIT_MS:.0f}ms")
+    return True
+
+
+def get_identify_concurrency() -> int:
+    """Quantos identify podem entrar no CLIP ao mesmo tempo.
+
+    Sem micro-batching mantemos 2 (sweet spot validado para 2 vCPUs).
+    Com o batcher rodando, deixamos entrar ate um batch cheio — o ONNX
+    continua rodando um forward por vez na thread do batcher. So vale
+    depois do preload_model(): MICRO_BATCH_ENABLED com modelo de batch fixo
+    (ou ainda nao carregado) nao liga o batcher e fica em 2.
+    """
+    if _BATCHER is not None:
+        return max(2, BATCH_MAX_SIZE)
+    return 2
+
+
 def _try_load_onnx_model():
     """Tenta carregar modelo ONNX (deploy - usa ~300MB RAM)"""
     global _ONNX_SESSION, _USE_ONNX, _USE_HF_API
@@ -82,30 +402,18 @@ def _try_load_onnx_model():
         logger.info("[embedder] Carregando modelo CLIP via ONNX Runtime (deploy)...")
         start = time.time()
         
-        # ═══════════════════════════════════════════════════════
-        # CRITICAL:
-        # Nao alterar para ORT_DISABLE_ALL.
-        # Isso causa inferencia de 9-50 segundos no Render.
-        # Esta configuracao foi validada em producao em Abr/2026.
-        # Benchmark Mai/2026: ORT_ENABLE_ALL + threads=2 → min:292ms (sweet spot para 2 vCPUs)
-        # threads=4 piora em 1 vCPU (context switching) — otimizado para Render Pro (2 vCPU)
-        opts = ort.SessionOptions()
-        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
-        opts.inter_op_num_threads = 2
-        opts.intra_op_num_threads = 2
-        opts.enable_mem_pattern = False
-        opts.enable_cpu_mem_arena = False
-        
-        _ONNX_SESSION = ort.InferenceSession(ONNX_MODEL_PATH, opts)
+        _ONNX_SESSION = ort.InferenceSession(ONNX_MODEL_PATH, _onnx_session_options(ort, 2))
         _USE_ONNX = True
         _USE_HF_API = False
         
         _ONNX_CONFIG["onnx_mode"] = "ENABLE_ALL"
+        _ONNX_CONFIG["variant"] = ONNX_VARIANT
         _ONNX_CONFIG["inter_op_num_threads"] = 2
         _ONNX_CONFIG["intra_op_num_threads"] = 2
         
-        logger.info("[embedder] ONNX mode: ENABLE_ALL / threads=2")
+        logger.info(f"[embedder] ONNX mode: ENABLE_ALL / threads=2 / variante={ONNX_VARIANT}")
         logger.info(f"[embedder] Modelo ONNX carregado em {time.time()-start:.2f}s (~300MB RAM)")
+        _start_micro_batcher()
         return True
         
     except Exception as e:
@@ -216,32 +524,42 @@ def get_image_embedding(image_bytes: bytes) -> np.ndarray:
     # ═══ MODO ONNX (deploy) ═══
     if _USE_ONNX and _ONNX_SESSION is not None:
         try:
-            from PIL import ImageEnhance, ImageOps
             global _LAST_INFERENCE_MS, _INFERENCE_COUNT, _TOTAL_INFERENCE_MS
             
             # --- t_decode: decodificar bytes -> PIL.Image ---
             t_decode_start = time.time()
-            img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+            if FAST_PREPROCESS:
+                img, orig_size = _decode_image_reduced(image_bytes)
+            else:
+                img = _decode_image(image_bytes)
             t_decode = (time.time() - t_decode_start) * 1000
             
-            # --- t_preprocess: enhance + resize + normalize (CLIP) ---
+            # --- t_enhance: autocontrast/sharpness/color (no rapido: fundido no preprocess) ---
+            t_enhance = 0.0
+            if not FAST_PREPROCESS:
+                t_enhance_start = time.time()
+                img = _enhance(img)
+                t_enhance = (time.time() - t_enhance_start) * 1000
+            
+            # --- t_preprocess: resize + normalize (CLIP) ---
             t_preprocess_start = time.time()
-            img = ImageOps.autocontrast(img, cutoff=1)
-            img = ImageEnhance.Sharpness(img).enhance(1.3)
-            img = ImageEnhance.Color(img).enhance(1.1)
-            img_np = _preprocess_clip_numpy(img)
+            img_np = _fast_preprocess(img, orig_size) if FAST_PREPROCESS else _preprocess_clip_numpy(img)
             del img
             t_preprocess = (time.time() - t_preprocess_start) * 1000
             
             # --- t_clip_inference: ONNX Runtime forward ---
+            # Com micro-batching inclui a espera pelo batch (max BATCH_MAX_WAIT_MS)
             t_clip_start = time.time()
-            result = _ONNX_SESSION.run(None, {'image': img_np})[0]
+            if _BATCHER is not None:
+                embedding = _BATCHER.submit(img_np).astype(np.float32)
+            else:
+                result = _ONNX_SESSION.run(None, {'image': img_np})[0]
+                embedding = result[0].astype(np.float32)
+                del result
             t_clip_inference = (time.time() - t_clip_start) * 1000
             del img_np
             
             # Normalizar embedding (fora do timing de CLIP)
-            embedding = result[0].astype(np.float32)
-            del result
             norm = np.linalg.norm(embedding)
             if norm > 0:
                 embedding = embedding / norm
@@ -256,10 +574,15 @@ def get_image_embedding(image_bytes: bytes) -> np.ndarray:
             _LAST_INFERENCE_MS = round(t_clip_inference, 1)
             _INFERENCE_COUNT += 1
             _TOTAL_INFERENCE_MS += t_clip_inference
+            observe_stage("decode", t_decode)
+            if not FAST_PREPROCESS:
+                observe_stage("enhance", t_enhance)
+            observe_stage("preprocess", t_preprocess)
+            observe_stage("onnx_run", t_clip_inference)
             
             # --- Log estruturado unico (1 linha por request) ---
             logger.info(
-                f"[TIMING] decode={t_decode:.0f}ms preprocess={t_preprocess:.0f}ms "
+                f"[TIMING] decode={t_decode:.0f}ms enhance={t_enhance:.0f}ms preprocess={t_preprocess:.0f}ms "
                 f"clip={t_clip_inference:.0f}ms total={t_total:.0f}ms"
             )
             
@@ -324,6 +647,39 @@ def image_embedding_from_path(image_path: str) -> np.ndarray:
     return get_image_embedding(image_bytes)
 
 
+def get_image_embeddings(images: List[bytes], chunk_size: int = 16) -> List[Optional[np.ndarray]]:
+    """Embeddings de varias imagens (QA em lote): preprocess por imagem, ONNX em blocos.
+
+    Um forward (N,3,224,224) por bloco em vez de N forwards; imagem que nao
+    decodifica vira None sem derrubar o bloco. Sem ONNX cai no caminho unitario.
+    """
+    if not (_USE_ONNX and _ONNX_SESSION is not None):
+        return [get_image_embedding(b) for b in images]
+    out: List[Optional[np.ndarray]] = [None] * len(images)
+    for start in range(0, len(images), chunk_size):
+        rows, tensors = [], []
+        t0 = time.perf_counter()
+        for i in range(start, min(start + chunk_size, len(images))):
+            try:
+                tensors.append(preprocess_image_bytes(images[i]))
+                rows.append(i)
+            except Exception as e:
+                logger.warning(f"[embedder] Lote: imagem {i} ignorada ({e})")
+        if not tensors:
+            continue
+        observe_stage("preprocess", (time.perf_counter() - t0) * 1000 / len(tensors))
+        t0 = time.perf_counter()
+        try:
+            embeddings = embed_preprocessed_batch(_ONNX_SESSION, np.concatenate(tensors, axis=0))
+        except Exception as e:
+            logger.error(f"[embedder] Erro ONNX (lote de {len(tensors)}): {e}")
+            continue
+        observe_stage("onnx_run", (time.perf_counter() - t0) * 1000 / len(tensors))
+        for i, emb in zip(rows, embeddings):
+            out[i] = emb
+    return out
+
+
 def _get_embedding_via_api(image_bytes: bytes) -> np.ndarray:
     """DESABILITADO"""
     logger.error("[embedder] ERRO: API externa desabilitada")
@@ -338,20 +694,47 @@ def get_performance_stats():
     avg = None
     if _INFERENCE_COUNT > 0:
         avg = round(_TOTAL_INFERENCE_MS / _INFERENCE_COUNT, 1)
+    avg_batch = None
+    if _BATCH_COUNT > 0:
+        avg_batch = round(_BATCH_ITEMS / _BATCH_COUNT, 2)
     return {
         "onnx_mode": _ONNX_CONFIG.get("onnx_mode"),
+        "onnx_variant": _ONNX_CONFIG.get("variant"),
         "threads": _ONNX_CONFIG.get("inter_op_num_threads"),
         "last_inference_ms": _LAST_INFERENCE_MS,
         "avg_inference_ms": avg,
         "inference_count": _INFERENCE_COUNT,
+        "micro_batch": {
+            "active": _BATCHER is not None,
+            "max_batch_size": BATCH_MAX_SIZE,
+            "max_wait_ms": BATCH_MAX_WAIT_MS,
+            "batches": _BATCH_COUNT,
+            "avg_batch_size": avg_batch,
+        },
     }
 
 
+def get_embedding_version() -> str:
+    """Identifica modelo + preprocessing. Embeddings de versoes diferentes nao se misturam."""
+    if _USE_ONNX:
+        try:
+            size = os.path.getsize(ONNX_MODEL_PATH)
+        except OSError:
+            size = 0
+        model = f"onnx:{os.path.basename(ONNX_MODEL_PATH)}:{size}"
+    elif _MODEL is not None:
+        model = "openclip:ViT-B-16:datacomp_xl_s13b_b90k"
+    else:
+        model = "none"
+    return f"{model}/pp{PREPROCESS_VERSION}"
+
+
 def get_model_info():
     """Retorna informacoes do modelo em uso"""
     if _USE_ONNX:
         return {
             "model": "ViT-B-16 (ONNX fp16)",
+            "variant": ONNX_VARIANT,
             "provider": "ONNX Runtime (deploy)",
             "local": True,
             "device": "cpu"
@@ -0,0 +1,113 @@
+"""SoulNutri AI - Cache persistente de embeddings
+Chave = sha256 dos bytes da imagem + versao do modelo/preprocessing
+(embedder.get_embedding_version). Renomear pastas, consolidar pratos
+duplicados ou mudar max_per_dish nao muda os bytes: o rebuild so roda
+o CLIP para imagens realmente novas.
+
+SQLite (stdlib) ao lado do indice: dish_index_embcache.sqlite.
+Varios processos (workers + rebuild_index.py) podem ler/escrever juntos.
+
+SOULNUTRI_EMBED_CACHE=0 desliga. SOULNUTRI_EMBED_CACHE_PATH muda o arquivo.
+"""
+
+import os
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBED_CACHE_ENABLED = os.environ.get("SOULNUTRI_EMBED_CACHE", "1") == "1"
+EMBED_CACHE_PATH = os.environ.get("SOULNUTRI_EMBED_CACHE_PATH", "")
+_COMMIT_EVERY = 64  # build_index grava em lote; commit a cada N embeddings novos
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class EmbeddingCache:
+    """Embeddings float32 por (sha256 do conteudo, versao do modelo)."""
+
+    def __init__(self, path: str, version: str):
+        self.path = path
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " hash TEXT NOT NULL, version TEXT NOT NULL, dim INTEGER NOT NULL, vec BLOB NOT NULL,"
+            " PRIMARY KEY (hash, version))"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT dim, vec FROM embeddings WHERE hash = ? AND version = ?",
+                (key, self.version),
+            ).fetchone()
+            if row is None or len(row[1]) != row[0] * 4:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return np.frombuffer(row[1], dtype='<f4').astype(np.float32)
+
+    def put(self, key: str, embedding: np.ndarray):
+        vec = np.ascontiguousarray(embedding, dtype='<f4')
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (hash, version, dim, vec) VALUES (?, ?, ?, ?)",
+                (key, self.version, int(vec.shape[0]), vec.tobytes()),
+            )
+            self._pending += 1
+            if self._pending >= _COMMIT_EVERY:
+                self._conn.commit()
+                self._pending = 0
+
+    def flush(self):
+        with self._lock:
+            self._conn.commit()
+            self._pending = 0
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        with self._lock:
+            entries = self._conn.execute(
+                "SELECT COUNT(*) FROM embeddings WHERE version = ?", (self.version,)
+            ).fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "entries": int(entries),
+            "version": self.version,
+        }
+
+
+def open_embedding_cache(index_file: str, version: str) -> Optional[EmbeddingCache]:
+    """Abre o cache ao lado do indice. Qualquer falha desliga o cache (nunca o build)."""
+    if not EMBED_CACHE_ENABLED:
+        return None
+    path = EMBED_CACHE_PATH or index_file.replace('.json', '_embcache.sqlite')
+    try:
+        return EmbeddingCache(path, version)
+    except Exception as e:
+        logger.warning(f"[embcache] Cache de embeddings indisponivel ({path}): {e}")
+        return None
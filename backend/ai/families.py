@@ -203,13 +203,31 @@ def get_family_members(dish_name: str):
     return []
 
 
-def detect_family_ambiguity(results: list, raw_gap_threshold: float = 0.03):
+def _close_family_members(family_name: str, dish_scores: dict, top1_raw: float, window: float = 0.05):
+    """Membros da familia cujo melhor score raw esta a menos de `window` do top-1.
+    
+    Usa o vetor completo de scores por prato (DishIndex.search com
+    with_dish_scores=True), entao enxerga membros fora do top-5.
+    """
+    if not dish_scores:
+        return []
+    members = [
+        (m, dish_scores[m]) for m in DISH_FAMILIES.get(family_name, [])
+        if m in dish_scores and top1_raw - dish_scores[m] < window
+    ]
+    members.sort(key=lambda x: x[1], reverse=True)
+    return [m for m, _ in members]
+
+
+def detect_family_ambiguity(results: list, raw_gap_threshold: float = 0.03, dish_scores: dict = None):
     """
     Detecta ambiguidade de familia nos resultados do CLIP.
     
     Args:
         results: Lista de resultados do CLIP search [{dish, score, raw_score, ...}]
         raw_gap_threshold: Gap maximo entre top-1 e top-2 raw scores para considerar ambiguo
+        dish_scores: Opcional. Melhor score raw de todos os pratos ({prato: score});
+            se presente, membros da familia fora do top-5 tambem viram candidatos
         
     Returns:
         dict com:
@@ -239,6 +257,9 @@ def detect_family_ambiguity(results: list, raw_gap_threshold: float = 0.03):
             r_dish = r.get("dish", "")
             if get_family(r_dish) == top1_family and r_dish not in candidates:
                 candidates.append(r_dish)
+        for m in _close_family_members(top1_family, dish_scores, top1_raw):
+            if m not in candidates:
+                candidates.append(m)
         
         if len(candidates) < 2:
             return {"is_ambiguous": False, "family_name": None, "candidates": [], "reason": ""}
@@ -290,6 +311,9 @@ def detect_family_ambiguity(results: list, raw_gap_threshold: float = 0.03):
             r_dish = r.get("dish", "")
             if r_dish in family_members:
                 candidates_in_results.append(r_dish)
+        for m in _close_family_members(top1_family, dish_scores, top1_raw):
+            if m not in candidates_in_results:
+                candidates_in_results.append(m)
         
         if len(candidates_in_results) >= 2:
             return {
@@ -1,145 +1,451 @@
 """
 SoulNutri - Serviço de Hash de Imagem
-Detecta imagens idênticas/muito similares ao dataset para retorno instantâneo.
-Usa thumbnail hash: reduz imagem a 16x16 grayscale e gera hash dos pixels.
+Detecta fotos quase idênticas às do dataset para retorno instantâneo (antes do CLIP)
+e duplicatas dentro do próprio dataset.
+
+Hash perceptual de 64 bits por imagem:
+- pHash: DCT 32x32 da imagem em cinza, bits das 8x8 frequências baixas vs. mediana
+- dHash: gradiente horizontal de uma miniatura 9x8
+Recompressão JPEG, redimensionamento, pequenos cortes e rotação EXIF mudam
+poucos bits; a busca é por distância de Hamming numa BK-tree (pHash),
+confirmada pelo dHash. Sem match, o identify segue para o CLIP.
+
+O índice acompanha o dataset: fotos adicionadas/removidas/movidas e pratos
+consolidados atualizam o índice carregado (add_image/remove_image/rename_dish,
+chamados junto com a atualização incremental do DishIndex) e o arquivo em
+disco; outro processo (worker, rebuild_index.py) que regrave o arquivo é
+detectado por refresh() e o índice é recarregado. Um match cujo arquivo não
+está mais na pasta do prato (is_current) não vale para o fast path.
+
+Escrita do arquivo compartilhado: lock exclusivo entre processos (flock em
+<arquivo>.lock) + escrita atômica (index_store.atomic_write). Atualizações
+incrementais fazem refresh -> altera -> grava dentro do mesmo lock, então um
+rebuild ou outro worker nunca tem a sua gravação sobrescrita por uma cópia velha.
 """
 
-import hashlib
-import logging
 import json
+import logging
 import os
 import time
-from pathlib import Path
-from PIL import Image
 import io
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from .index_store import atomic_write
+
+try:
+    import fcntl
+except ImportError:  # Windows (dev local): sem lock entre processos
+    fcntl = None
 
 logger = logging.getLogger(__name__)
 
-_HASH_INDEX = None
+HASH_INDEX_VERSION = 2
+# Distâncias máximas (de 64 bits) para considerar a mesma foto.
+# pHash é o filtro largo da BK-tree (cortes pequenos mudam até ~14 bits);
+# dHash confirma (recompressão/corte mudam 0-2 bits, fotos diferentes > 12).
+PHASH_MAX_DISTANCE = int(os.environ.get("SOULNUTRI_PHASH_MAX_DISTANCE", "16"))
+DHASH_MAX_DISTANCE = int(os.environ.get("SOULNUTRI_DHASH_MAX_DISTANCE", "6"))
+# Fast path do /api/ai/identify (match por hash antes do CLIP)
+HASH_FAST_PATH_ENABLED = os.environ.get("SOULNUTRI_HASH_FAST_PATH", "1") == "1"
+
+_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+DATASET_DIR = "/app/datasets/organized"
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Matriz DCT-II ortonormal n x n."""
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m
+
+
+_DCT32 = _dct_matrix(32)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.astype(np.uint8)).tobytes(), "big")
+
+
+def _load_gray(image_bytes: bytes) -> Image.Image:
+    img = Image.open(io.BytesIO(image_bytes))
+    img = ImageOps.exif_transpose(img)  # foto girada via EXIF = mesma foto
+    return img.convert("L")
+
 
-def _compute_image_hash(image_bytes: bytes) -> str:
-    """Gera hash perceptual básico: thumbnail 16x16 grayscale → SHA256."""
+def phash64(gray: Image.Image) -> int:
+    pixels = np.asarray(gray.resize((32, 32), Image.LANCZOS), dtype=np.float64)
+    low = (_DCT32 @ pixels @ _DCT32.T)[:8, :8].ravel()
+    median = np.median(low[1:])  # DC fora da mediana (só brilho médio)
+    return _bits_to_int(low > median)
+
+
+def dhash64(gray: Image.Image) -> int:
+    pixels = np.asarray(gray.resize((9, 8), Image.LANCZOS), dtype=np.int16)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def compute_hashes(image_bytes: bytes) -> Optional[Tuple[int, int]]:
+    """(pHash, dHash) de 64 bits, ou None se a imagem não abre."""
     try:
-        img = Image.open(io.BytesIO(image_bytes))
-        img = img.convert("L").resize((16, 16), Image.LANCZOS)
-        pixel_data = img.tobytes()
-        return hashlib.sha256(pixel_data).hexdigest()
+        gray = _load_gray(image_bytes)
+        return phash64(gray), dhash64(gray)
     except Exception as e:
         logger.warning(f"[hash] Erro ao computar hash: {e}")
         return None
 
 
-class ImageHashIndex:
-    """Índice de hashes de imagens do dataset para match instantâneo."""
-    
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """BK-tree sobre códigos de 64 bits (métrica de Hamming).
+
+    Cada nó guarda um código e os ids de todas as imagens com esse código;
+    filhos indexados pela distância ao pai. A busca por raio r só desce nos
+    filhos com distância em [d - r, d + r] (desigualdade triangular).
+    """
+
     def __init__(self):
-        self.hash_to_dish = {}
+        self._root = None  # [code, ids, children]
+        self.size = 0
+
+    def add(self, code: int, item_id: int):
+        self.size += 1
+        if self._root is None:
+            self._root = [code, [item_id], {}]
+            return
+        node = self._root
+        while True:
+            d = hamming(code, node[0])
+            if d == 0:
+                node[1].append(item_id)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [code, [item_id], {}]
+                return
+            node = child
+
+    def search(self, code: int, radius: int) -> List[Tuple[int, int]]:
+        """[(distância, id)] de todos os itens a distância <= radius, ordenados."""
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            d = hamming(code, node[0])
+            if d <= radius:
+                found.extend((d, i) for i in node[1])
+            for dist, child in node[2].items():
+                if d - radius <= dist <= d + radius:
+                    stack.append(child)
+        found.sort()
+        return found
+
+
+class ImageHashIndex:
+    """Índice de hashes perceptuais das imagens do dataset."""
+
+    def __init__(self, index_file: str = "/app/datasets/image_hash_index.json",
+                 dataset_dir: str = DATASET_DIR):
+        self.entries: List[Dict] = []  # {slug, display_name, file, phash, dhash}
         self.total_hashes = 0
-        self.index_file = Path("/app/datasets/image_hash_index.json")
-    
-    def build(self, dataset_dir: str = "/app/datasets/organized"):
+        self.index_file = Path(index_file)
+        self.dataset_dir = Path(dataset_dir)
+        self._tree = BKTree()
+        self._lock = threading.RLock()
+        self._file_sig = None  # (inode, mtime_ns) do arquivo carregado/salvo por este processo
+
+    def _add_entry(self, entry: Dict):
+        self.entries.append(entry)
+        self._tree.add(entry["phash"], len(self.entries) - 1)
+        self.total_hashes = len(self.entries)
+
+    def _reset(self, entries: List[Dict]):
+        self.entries = []
+        self._tree = BKTree()
+        for entry in entries:
+            self._add_entry(entry)
+        self.total_hashes = len(self.entries)
+
+    def _display_name(self, dish_slug: str) -> str:
+        """Nome de exibição do dish_info.json (fallback: slug)."""
+        info_path = self.dataset_dir / dish_slug / "dish_info.json"
+        if info_path.exists():
+            try:
+                with open(info_path) as f:
+                    return json.load(f).get("nome", dish_slug)
+            except Exception:
+                pass
+        return dish_slug
+
+    def build(self, dataset_dir: str = None):
         """Constrói o índice de hashes a partir das imagens do dataset."""
         start = time.time()
-        self.hash_to_dish = {}
-        
-        base = Path(dataset_dir)
+        if dataset_dir is not None:
+            self.dataset_dir = Path(dataset_dir)
+        entries = []
+
+        base = self.dataset_dir
         if not base.exists():
             logger.warning("[hash] Diretório do dataset não encontrado")
+            with self._lock:
+                self._reset([])
             return
-        
-        for dish_dir in base.iterdir():
+
+        for dish_dir in sorted(base.iterdir()):
             if not dish_dir.is_dir():
                 continue
-            
+
             dish_slug = dish_dir.name
-            
-            # Ler nome de exibição do dish_info.json
-            display_name = dish_slug
-            info_path = dish_dir / "dish_info.json"
-            if info_path.exists():
-                try:
-                    with open(info_path) as f:
-                        info = json.load(f)
-                    display_name = info.get("nome", dish_slug)
-                except Exception:
-                    pass
-            
+            display_name = self._display_name(dish_slug)
+
             # Hashear todas as imagens do prato
-            for img_file in dish_dir.iterdir():
-                if img_file.suffix.lower() in (".jpg", ".jpeg", ".png", ".webp"):
+            for img_file in sorted(dish_dir.iterdir()):
+                if img_file.suffix.lower() in _IMAGE_EXTENSIONS:
                     try:
-                        img_bytes = img_file.read_bytes()
-                        h = _compute_image_hash(img_bytes)
-                        if h:
-                            self.hash_to_dish[h] = {
+                        hashes = compute_hashes(img_file.read_bytes())
+                        if hashes:
+                            entries.append({
                                 "slug": dish_slug,
-                                "display_name": display_name
-                            }
+                                "display_name": display_name,
+                                "file": img_file.name,
+                                "phash": hashes[0],
+                                "dhash": hashes[1],
+                            })
                     except Exception as e:
                         logger.warning(f"[hash] Erro ao processar {img_file.name}: {e}")
-        
-        self.total_hashes = len(self.hash_to_dish)
+
+        with self._lock:
+            self._reset(entries)
         elapsed = time.time() - start
         logger.info(f"[hash] Índice construído: {self.total_hashes} hashes em {elapsed:.1f}s")
-        
+
         # Salvar para carregamento rápido
-        self._save()
-    
-    def _save(self):
-        """Salva índice em disco."""
+        with self._file_lock():
+            self._write_file()
+
+    def _signature(self):
+        try:
+            st = os.stat(self.index_file)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    @contextmanager
+    def _file_lock(self):
+        """Lock exclusivo entre processos (workers, rebuild_index.py) sobre o arquivo do índice."""
         try:
-            with open(self.index_file, "w") as f:
-                json.dump(self.hash_to_dish, f)
+            self.index_file.parent.mkdir(parents=True, exist_ok=True)
+            f = open(self.index_file.with_name(self.index_file.name + ".lock"), "a+b")
+        except OSError as e:
+            logger.warning(f"[hash] Lock do índice indisponível: {e}")
+            yield
+            return
+        with f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            yield  # fechar o arquivo libera o flock
+
+    def _write_file(self):
+        """Salva índice em disco (códigos em hex). Chamar com _file_lock() adquirido."""
+        with self._lock:
+            data = {
+                "version": HASH_INDEX_VERSION,
+                "entries": [dict(e, phash=f"{e['phash']:016x}", dhash=f"{e['dhash']:016x}") for e in self.entries],
+            }
+        try:
+            atomic_write(str(self.index_file), lambda f: f.write(json.dumps(data).encode("utf-8")))
+            self._file_sig = self._signature()
             logger.info(f"[hash] Índice salvo: {self.index_file}")
         except Exception as e:
             logger.error(f"[hash] Erro ao salvar: {e}")
-    
+
     def load(self):
-        """Carrega índice do disco."""
+        """Carrega índice do disco. Formato antigo (SHA-256 de thumbnail) não serve: rebuild."""
         if self.index_file.exists():
             try:
+                sig = self._signature()
                 with open(self.index_file) as f:
-                    self.hash_to_dish = json.load(f)
-                self.total_hashes = len(self.hash_to_dish)
+                    data = json.load(f)
+                if not isinstance(data, dict) or data.get("version") != HASH_INDEX_VERSION:
+                    logger.info("[hash] Índice em formato antigo, será reconstruído")
+                    return False
+                entries = [dict(e, phash=int(e["phash"], 16), dhash=int(e["dhash"], 16))
+                           for e in data.get("entries", [])]
+                with self._lock:
+                    self._reset(entries)
+                    self._file_sig = sig
                 logger.info(f"[hash] Índice carregado: {self.total_hashes} hashes")
                 return True
             except Exception as e:
                 logger.error(f"[hash] Erro ao carregar: {e}")
         return False
-    
-    def lookup(self, image_bytes: bytes) -> dict:
+
+    def refresh(self) -> bool:
+        """Recarrega se outro processo regravou o arquivo (um os.stat). True se recarregou."""
+        sig = self._signature()
+        if sig is None or sig == self._file_sig:
+            return False
+        logger.info("[hash] Índice alterado em disco, recarregando")
+        return self.load()
+
+    # ─────────────────────────────────────────────────────────────
+    # Atualização incremental (mesmas operações do DishIndex)
+    # ─────────────────────────────────────────────────────────────
+
+    def add_image(self, slug: str, filename: str, image_bytes: bytes, save: bool = True) -> int:
+        """Hasheia uma foto nova do prato (substitui entrada anterior do mesmo arquivo)."""
+        hashes = compute_hashes(image_bytes)
+        if not hashes:
+            return 0
+        entry = {"slug": slug, "display_name": self._display_name(slug), "file": filename,
+                 "phash": hashes[0], "dhash": hashes[1]}
+        with self._file_lock():
+            with self._lock:
+                self.refresh()
+                if any(e["slug"] == slug and e["file"] == filename for e in self.entries):
+                    self._reset([e for e in self.entries if not (e["slug"] == slug and e["file"] == filename)])
+                self._add_entry(entry)
+            if save:
+                self._write_file()
+        return 1
+
+    def remove_image(self, slug: str, filename: str, save: bool = True) -> int:
+        """Remove as entradas de um arquivo do prato (BK-tree é reconstruída: sem remoção no lugar)."""
+        with self._file_lock():
+            with self._lock:
+                self.refresh()
+                kept = [e for e in self.entries if not (e["slug"] == slug and e["file"] == filename)]
+                removed = len(self.entries) - len(kept)
+                if removed:
+                    self._reset(kept)
+            if removed and save:
+                self._write_file()
+        return removed
+
+    def rename_dish(self, old: str, new: str, save: bool = True) -> int:
+        """Prato consolidado/renomeado: entradas de `old` passam a apontar para `new`."""
+        if old == new:
+            return 0
+        display_name = self._display_name(new)
+        with self._file_lock():
+            with self._lock:
+                self.refresh()
+                rows = [i for i, e in enumerate(self.entries) if e["slug"] == old]
+                for i in rows:
+                    self.entries[i] = dict(self.entries[i], slug=new, display_name=display_name)
+            if rows and save:
+                self._write_file()
+        return len(rows)
+
+    def is_current(self, match: dict) -> bool:
+        """O arquivo do match ainda está na pasta do prato (não foi movido/removido)."""
+        return (self.dataset_dir / match["slug"] / match["file"]).is_file()
+
+    def nearest(self, phash: int, dhash: int, max_distance: int = PHASH_MAX_DISTANCE,
+                max_dhash_distance: int = DHASH_MAX_DISTANCE) -> List[Dict]:
+        """Entradas próximas (pHash na BK-tree, confirmadas pelo dHash), mais próximas primeiro."""
+        matches = []
+        with self._lock:
+            for d, i in self._tree.search(phash, max_distance):
+                entry = self.entries[i]
+                dd = hamming(dhash, entry["dhash"])
+                if dd <= max_dhash_distance:
+                    matches.append(dict(entry, distance=d, dhash_distance=dd))
+        matches.sort(key=lambda m: (m["distance"], m["dhash_distance"]))
+        return matches
+
+    def lookup(self, image_bytes: bytes, max_distance: int = PHASH_MAX_DISTANCE) -> Optional[dict]:
         """
-        Busca uma imagem no índice de hashes.
-        Retorna dict com slug e display_name se encontrado, None caso contrário.
+        Busca uma imagem quase idêntica no índice.
+        Retorna dict com slug, display_name, file e distance (Hamming do pHash)
+        do match mais próximo, ou None.
         """
-        if not self.hash_to_dish:
+        self.refresh()
+        if not self.entries:
             return None
-        
-        h = _compute_image_hash(image_bytes)
-        if h and h in self.hash_to_dish:
-            match = self.hash_to_dish[h]
-            logger.info(f"[hash] Match exato encontrado: {match['display_name']}")
-            return match
-        
-        return None
-    
+
+        hashes = compute_hashes(image_bytes)
+        if not hashes:
+            return None
+        matches = self.nearest(hashes[0], hashes[1], max_distance)
+        if not matches:
+            return None
+        match = matches[0]
+        logger.info(f"[hash] Near-duplicate: {match['display_name']} (distância {match['distance']})")
+        return match
+
+    def find_near_duplicates(self, max_distance: int = PHASH_MAX_DISTANCE,
+                             max_dhash_distance: int = DHASH_MAX_DISTANCE) -> List[List[Dict]]:
+        """Grupos (union-find) de imagens do dataset quase idênticas entre si.
+
+        Cada grupo é uma lista de entradas na ordem do índice; grupos com
+        imagens de pratos diferentes indicam foto no prato errado ou prato duplicado.
+        """
+        parent = list(range(len(self.entries)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for i, entry in enumerate(self.entries):
+            for d, j in self._tree.search(entry["phash"], max_distance):
+                if j > i and hamming(entry["dhash"], self.entries[j]["dhash"]) <= max_dhash_distance:
+                    parent[find(j)] = find(i)
+
+        groups: Dict[int, List[Dict]] = {}
+        for i, entry in enumerate(self.entries):
+            groups.setdefault(find(i), []).append(entry)
+        return [g for g in groups.values() if len(g) > 1]
+
     def is_ready(self) -> bool:
         return self.total_hashes > 0
-    
+
     def status(self) -> dict:
         return {
             "ready": self.is_ready(),
-            "total_hashes": self.total_hashes
+            "total_hashes": self.total_hashes,
+            "phash_max_distance": PHASH_MAX_DISTANCE
         }
 
 
 # Singleton
 _HASH_INDEX = None
+_HASH_INDEX_LOCK = threading.Lock()
 
 def get_hash_index() -> ImageHashIndex:
+    """Índice global: carrega do disco ou constrói (varre o dataset — usar fora do request)."""
     global _HASH_INDEX
-    if _HASH_INDEX is None:
-        _HASH_INDEX = ImageHashIndex()
-        if not _HASH_INDEX.load():
-            _HASH_INDEX.build()
+    with _HASH_INDEX_LOCK:
+        if _HASH_INDEX is None:
+            index = ImageHashIndex()
+            if not index.load():
+                index.build()
+            _HASH_INDEX = index
+        return _HASH_INDEX
+
+
+def loaded_hash_index() -> Optional[ImageHashIndex]:
+    """Índice global se já carregado (hot path do identify: nunca carrega/constrói)."""
     return _HASH_INDEX
+
+
+def rebuild_hash_index(dataset_dir: str = DATASET_DIR) -> ImageHashIndex:
+    """Reconstrói e troca o índice global (rebuild do dataset)."""
+    global _HASH_INDEX
+    index = ImageHashIndex(dataset_dir=dataset_dir)
+    index.build()
+    with _HASH_INDEX_LOCK:
+        _HASH_INDEX = index
+    return index
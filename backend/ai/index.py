@@ -5,15 +5,43 @@ Meta: resposta em 100ms
 
 import os
 import json
+import base64
+import threading
+import unicodedata
 import numpy as np
-from typing import List, Dict, Tuple, Optional
+from contextlib import contextmanager
+from typing import List, Dict, Tuple, Optional, Union
 from pathlib import Path
 import time
 import logging
 
+try:
+    import fcntl
+except ImportError:  # Windows (dev local): sem lock entre processos
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
-from .embedder import image_embedding_from_path, image_embedding_from_bytes
+from .embedder import image_embedding_from_bytes, get_image_embeddings, get_embedding_version
+from .embedding_cache import content_hash, open_embedding_cache
+from . import parallel_build
+from .ann import create_backend
+from .index_store import atomic_write, read_index_file, write_index_file, IndexFormatError
+from services.metrics_service import observe as observe_stage
+
+# Operacoes incrementais (add/remove/rename) ficam no delta log ate a
+# compactacao, que incorpora tudo no dish_index.bin e zera o log.
+COMPACT_EVERY = int(os.environ.get("SOULNUTRI_INDEX_COMPACT_EVERY", "50"))
+
+
+def _dish_key(name: str) -> str:
+    """Chave de comparacao de pratos: sem acento, minusculo, sem espacos/-/_/parenteses.
+
+    Mesma regra de services/image_service.normalize_slug: o indice tem chaves por
+    nome de pasta (slug) ou por nome de exibicao, conforme quem o construiu.
+    """
+    s = unicodedata.normalize('NFKD', name or '').encode('ascii', 'ignore').decode('ascii')
+    return ''.join(c for c in s.lower() if c not in ' -_()')
 
 
 class DishIndex:
@@ -31,12 +59,53 @@ class DishIndex:
         self.embeddings: Optional[np.ndarray] = None  # Matriz de embeddings
         self.dish_to_idx: Dict[str, List[int]] = {}  # Mapa prato -> índices
         self.metadata: Dict[str, dict] = {}  # Metadados por prato
+        self._search_backend = None  # ExactSearch / IVFSearch (ai/ann.py)
+        self._row_dish = np.empty(0, dtype=np.int32)  # linha -> id do prato
+        self._dish_names: List[str] = []  # id do prato -> nome
+        self._dish_order = np.empty(0, dtype=np.int64)
+        self._dish_starts = np.empty(0, dtype=np.int64)
+        self.files: List[str] = []  # Arquivo de origem de cada linha ("" = desconhecido)
+        self._embed_cache = None  # EmbeddingCache (aberto sob demanda)
+        
+        # Delta log (operações incrementais ainda não compactadas)
+        self._lock = threading.RLock()
+        self._delta_seq = 0  # Última operação aplicada
+        self._delta_offset = 0  # Bytes do log já lidos
+        self._delta_ino = None  # Inode do log lido (muda quando outro processo compacta)
+        self._delta_pending = 0  # Operações no log ainda não incorporadas ao .bin
         
         # Tenta carregar índice existente
         self._load_index()
     
+    def _embeddings_file(self) -> str:
+        return self.index_file.replace('.json', '_embeddings.npy')
+    
+    def _binary_file(self) -> str:
+        return self.index_file.replace('.json', '.bin')
+    
+    def _delta_file(self) -> str:
+        return self.index_file.replace('.json', '_delta.jsonl')
+    
     def _load_index(self) -> bool:
-        """Carrega índice do disco se existir"""
+        """Carrega o índice base e reaplica o delta log por cima."""
+        with self._lock:
+            self._delta_seq = 0
+            self._delta_offset = 0
+            self._delta_ino = None
+            self._delta_pending = 0
+            loaded = self._load_base_index()
+            self._replay_delta()
+            return loaded or self.is_ready()
+    
+    def _load_base_index(self) -> bool:
+        """Carrega índice do disco se existir.
+        
+        Prioridade: dish_index.bin (memmap, compartilhado entre workers) >
+        dish_index.json + _embeddings.npy (legado, convertido para .bin na hora).
+        """
+        if self._load_binary_index():
+            return True
+        
         if not os.path.exists(self.index_file):
             print(f"[index] Índice não encontrado: {self.index_file}")
             return False
@@ -48,11 +117,18 @@ class DishIndex:
             self.dishes = data.get('dishes', [])
             self.dish_to_idx = data.get('dish_to_idx', {})
             self.metadata = data.get('metadata', {})
+            self.files = data.get('files') or [''] * len(self.dishes)
+            self._delta_seq = data.get('delta_seq', 0)
             
             # Carrega embeddings
-            emb_file = self.index_file.replace('.json', '_embeddings.npy')
+            emb_file = self._embeddings_file()
             if os.path.exists(emb_file):
                 self.embeddings = np.load(emb_file)
+                # Migração: gera o .bin para os próximos boots/workers usarem memmap
+                if self._write_binary_index() and self._load_binary_index():
+                    return True
+                self._search_backend = create_backend(self.embeddings, emb_file)
+                self._build_row_maps()
                 print(f"[index] Índice carregado: {len(self.dishes)} itens, {len(self.dish_to_idx)} pratos")
                 return True
             
@@ -61,37 +137,125 @@ class DishIndex:
         
         return False
     
-    def _save_index(self):
-        """Salva índice no disco"""
+    def _load_binary_index(self) -> bool:
+        """Abre dish_index.bin via memmap (somente leitura, page cache compartilhado)."""
+        bin_file = self._binary_file()
+        if not os.path.exists(bin_file):
+            return False
+        try:
+            embeddings, dishes, files, metadata, header = read_index_file(bin_file)
+        except (IndexFormatError, OSError, ValueError, KeyError) as e:
+            print(f"[index] Índice binário inválido ({e}), usando formato legado")
+            return False
+        
+        self.embeddings = embeddings
+        self.dishes = dishes
+        self.files = files
+        self.metadata = metadata
+        self._delta_seq = header.get('delta_seq', 0)
+        self._rebuild_dish_to_idx()
+        self._search_backend = create_backend(self.embeddings, self._embeddings_file())
+        self._build_row_maps()
+        print(f"[index] Índice carregado (mmap v{header['format_version']} {header['dtype']}): "
+              f"{len(self.dishes)} itens, {len(self.dish_to_idx)} pratos")
+        return True
+    
+    def _write_binary_index(self) -> bool:
         try:
+            write_index_file(self._binary_file(), self.embeddings, self.dishes, self.metadata,
+                             files=self.files, delta_seq=self._delta_seq)
+            return True
+        except Exception as e:
+            print(f"[index] Erro ao salvar índice binário: {e}")
+            return False
+    
+    def _save_index(self) -> bool:
+        """Salva índice no disco (escrita atômica: temp + rename)"""
+        try:
+            if self.embeddings is not None and not self._write_binary_index():
+                return False
+            
+            # Formato legado (JSON + .npy): mantido para scripts/Dockerfile que o leem
             data = {
                 'dishes': self.dishes,
                 'dish_to_idx': self.dish_to_idx,
                 'metadata': self.metadata,
+                'files': self.files,
+                'delta_seq': self._delta_seq,
                 'version': '1.0',
                 'total_items': len(self.dishes),
                 'total_dishes': len(self.dish_to_idx)
             }
-            
-            with open(self.index_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            payload = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+            atomic_write(self.index_file, lambda f: f.write(payload))
             
             # Salva embeddings separadamente (mais eficiente)
-            emb_file = self.index_file.replace('.json', '_embeddings.npy')
+            emb_file = self._embeddings_file()
             if self.embeddings is not None:
-                np.save(emb_file, self.embeddings)
+                atomic_write(emb_file, lambda f: np.save(f, np.asarray(self.embeddings)))
             
             print(f"[index] Índice salvo: {self.index_file}")
+            return True
             
         except Exception as e:
             print(f"[index] Erro ao salvar índice: {e}")
+            return False
+    
+    def _plan_build(self, max_per_dish: int) -> Tuple[List[Tuple[str, str, str]], Dict[str, int]]:
+        """Imagens a indexar, na ordem das linhas do índice.
+        
+        Única fonte da ordem: builder serial e paralelo (ai/parallel_build.py)
+        produzem as mesmas linhas na mesma ordem.
+        
+        Returns:
+            ([(prato, arquivo, caminho), ...], {prato: imagens disponíveis})
+        """
+        dish_folders = sorted([d for d in os.listdir(self.data_dir) 
+                               if os.path.isdir(os.path.join(self.data_dir, d))])
+        
+        plan = []
+        available = {}
+        for dish_name in dish_folders:
+            dish_path = os.path.join(self.data_dir, dish_name)
+            
+            # Listar imagens
+            image_extensions = {'.jpg', '.jpeg', '.png', '.webp'}
+            images = [f for f in os.listdir(dish_path)
+                     if Path(f).suffix.lower() in image_extensions]
+            
+            if not images:
+                continue
+            
+            available[dish_name] = len(images)
+            # Limitar número de imagens por prato
+            for img_file in images[:max_per_dish]:
+                plan.append((dish_name, img_file, os.path.join(dish_path, img_file)))
+        return plan, available
+    
+    def _embed_serial(self, plan, cache, progress) -> Tuple[List[Optional[np.ndarray]], List[bool]]:
+        """Um embedding por vez no modelo global (cache por conteúdo primeiro)."""
+        embeddings, hits = [], []
+        for i, (dish_name, _, img_path) in enumerate(plan):
+            embedding, cached = None, False
+            try:
+                with open(img_path, 'rb') as f:
+                    embedding, cached = self._embed_bytes(f.read(), cache)
+            except Exception as e:
+                print(f"[index] Erro ao processar {img_path}: {e}")
+            embeddings.append(embedding)
+            hits.append(cached)
+            dish_done = i + 1 == len(plan) or plan[i + 1][0] != dish_name
+            progress.advance(images=1, dishes=int(dish_done), cache_hits=int(cached))
+        return embeddings, hits
     
-    def build_index(self, max_per_dish: int = 10) -> dict:
+    def build_index(self, max_per_dish: int = 10, workers: Optional[int] = None) -> dict:
         """
         Constrói o índice a partir das pastas de pratos.
         
         Args:
             max_per_dish: Máximo de imagens por prato (para limitar tamanho)
+            workers: Processos de preprocessing (>1 = builder paralelo, só ONNX).
+                Default: SOULNUTRI_BUILD_WORKERS
         
         Returns:
             Estatísticas da indexação
@@ -99,87 +263,412 @@ class DishIndex:
         print(f"[index] Iniciando indexação de {self.data_dir}...")
         start_time = time.time()
         
-        self.dishes = []
-        self.dish_to_idx = {}
+        # Operações do delta log posteriores a este ponto são reaplicadas no fim
+        start_seq = self._delta_seq
+        dishes: List[str] = []
+        files: List[str] = []
+        dish_to_idx: Dict[str, List[int]] = {}
         embeddings_list = []
         
         # Listar pastas de pratos
         if not os.path.exists(self.data_dir):
             return {'error': f'Diretório não encontrado: {self.data_dir}'}
         
-        dish_folders = sorted([d for d in os.listdir(self.data_dir) 
-                               if os.path.isdir(os.path.join(self.data_dir, d))])
+        plan, available = self._plan_build(max_per_dish)
+        dish_names = list(available)
+        cache = self._embedding_cache()
+        
+        workers = parallel_build.BUILD_WORKERS if workers is None else workers
+        embed_fns = parallel_build.default_embed_fns() if workers > 1 and plan else None
+        progress = parallel_build.BuildProgress(len(dish_names), len(plan),
+                                                workers=workers if embed_fns else 1,
+                                                sessions=len(embed_fns) if embed_fns else 1)
+        if embed_fns:
+            print(f"[index] Builder paralelo: {workers} processos, {len(embed_fns)} sessões ONNX")
+            dish_pos = {d: i for i, d in enumerate(dish_names)}
+            embeddings, hits = parallel_build.embed_plan(
+                [p for _, _, p in plan], [dish_pos[d] for d, _, _ in plan],
+                cache, progress, workers, embed_fns
+            )
+        else:
+            if workers > 1:
+                print("[index] ONNX indisponível para o builder paralelo, usando serial")
+            progress.write("embedding")
+            embeddings, hits = self._embed_serial(plan, cache, progress)
         
         total_images = 0
-        
-        for dish_name in dish_folders:
-            dish_path = os.path.join(self.data_dir, dish_name)
-            
-            # Listar imagens
-            image_extensions = {'.jpg', '.jpeg', '.png', '.webp'}
-            images = [f for f in os.listdir(dish_path)
-                     if Path(f).suffix.lower() in image_extensions]
-            
-            if not images:
+        cache_hits = 0
+        for (dish_name, img_file, img_path), embedding, cached in zip(plan, embeddings, hits):
+            # Validar embedding antes de adicionar
+            if embedding is None or not hasattr(embedding, 'shape') or embedding.shape != (512,):
+                print(f"[index] Embedding inválido para {img_path}, pulando")
                 continue
             
-            # Limitar número de imagens por prato
-            images = images[:max_per_dish]
-            
-            dish_indices = []
-            
-            for img_file in images:
-                img_path = os.path.join(dish_path, img_file)
-                
-                try:
-                    # Gerar embedding
-                    embedding = image_embedding_from_path(img_path)
-                    
-                    # Validar embedding antes de adicionar
-                    if embedding is None or not hasattr(embedding, 'shape') or embedding.shape != (512,):
-                        print(f"[index] Embedding inválido para {img_path}, pulando")
-                        continue
-                    
-                    # Adicionar ao índice
-                    idx = len(self.dishes)
-                    self.dishes.append(dish_name)
-                    embeddings_list.append(embedding)
-                    dish_indices.append(idx)
-                    total_images += 1
-                    
-                except Exception as e:
-                    print(f"[index] Erro ao processar {img_path}: {e}")
-            
-            if dish_indices:
-                self.dish_to_idx[dish_name] = dish_indices
-                self.metadata[dish_name] = {
-                    'image_count': len(dish_indices),
-                    'total_available': len([f for f in os.listdir(dish_path)
-                                           if Path(f).suffix.lower() in image_extensions])
-                }
+            # Adicionar ao índice
+            dish_to_idx.setdefault(dish_name, []).append(len(dishes))
+            dishes.append(dish_name)
+            files.append(img_file)
+            embeddings_list.append(embedding)
+            total_images += 1
+            cache_hits += cached
+        
+        for dish_name, dish_indices in dish_to_idx.items():
+            self.metadata[dish_name] = {
+                'image_count': len(dish_indices),
+                'total_available': available[dish_name]
+            }
+        
+        if cache is not None:
+            cache.flush()
         
         if embeddings_list:
-            self.embeddings = np.array(embeddings_list, dtype=np.float32)
-            self._save_index()
+            with self._lock:
+                self.dishes = dishes
+                self.files = files
+                self.dish_to_idx = dish_to_idx
+                self.embeddings = np.array(embeddings_list, dtype=np.float32)
+                self._delta_seq = start_seq
+                if self._save_index():
+                    with self._delta_log() as log:
+                        self._truncate_delta(log, keep_after=start_seq)
+                    self._load_index()
+                else:
+                    self._search_backend = create_backend(self.embeddings, self._embeddings_file())
+                    self._build_row_maps()
         
         elapsed = time.time() - start_time
         stats = {
             'total_dishes': len(self.dish_to_idx),
             'total_images': total_images,
             'embedding_dim': self.embeddings.shape[1] if self.embeddings is not None else 0,
-            'elapsed_seconds': round(elapsed, 1)
+            'elapsed_seconds': round(elapsed, 1),
+            'embedding_cache': {
+                'enabled': cache is not None,
+                'hits': cache_hits,
+                'misses': total_images - cache_hits,
+                'hit_rate': round(cache_hits / total_images, 4) if total_images else 0.0
+            }
         }
         
+        progress.write("done")
         print(f"[index] Indexação concluída: {stats}")
         return stats
     
-    def search(self, image_bytes: bytes, top_k: int = 5) -> List[Dict]:
+    # ─────────────────────────────────────────────────────────────
+    # Atualização incremental (sem re-embedar o dataset inteiro)
+    # ─────────────────────────────────────────────────────────────
+    
+    def resolve_dish(self, name: str) -> str:
+        """Nome do prato como está no índice (aceita slug ou nome de exibição)."""
+        if name in self.dish_to_idx:
+            return name
+        key = _dish_key(name)
+        for dish in self.dish_to_idx:
+            if _dish_key(dish) == key:
+                return dish
+        return name
+    
+    def add_images(self, dish: str, paths_or_bytes: List[Union[str, bytes]],
+                   filenames: Optional[List[str]] = None) -> int:
+        """Adiciona fotos a um prato (novo ou existente) sem reconstruir o índice.
+        
+        Args:
+            dish: Slug ou nome do prato
+            paths_or_bytes: Caminhos de imagem ou bytes já lidos
+            filenames: Nome do arquivo de cada imagem (usado por remove_image).
+                Default: basename do caminho; "" para bytes.
+        
+        Returns:
+            Número de linhas adicionadas
+        """
+        if filenames is None:
+            filenames = [os.path.basename(p) if isinstance(p, str) else '' for p in paths_or_bytes]
+        dim = self.embeddings.shape[1] if self.embeddings is not None else None
+        
+        # Embedding fora do lock: é a parte cara (~300ms por foto)
+        cache = self._embedding_cache()
+        ops = []
+        for item, filename in zip(paths_or_bytes, filenames):
+            try:
+                if isinstance(item, str):
+                    with open(item, 'rb') as f:
+                        item = f.read()
+                embedding, _ = self._embed_bytes(item, cache)
+            except Exception as e:
+                print(f"[index] Erro ao gerar embedding de {filename or 'imagem'}: {e}")
+                continue
+            if embedding is None or getattr(embedding, 'ndim', 0) != 1 or (dim and embedding.shape[0] != dim):
+                print(f"[index] Embedding inválido para {filename or 'imagem'}, pulando")
+                continue
+            emb = np.ascontiguousarray(embedding, dtype=np.float32)
+            ops.append({'op': 'add', 'dish': dish, 'file': filename,
+                        'emb': base64.b64encode(emb.tobytes()).decode('ascii')})
+        if cache is not None:
+            cache.flush()
+        if not ops:
+            return 0
+        with self._lock:
+            resolved = self.resolve_dish(dish)
+            for op in ops:
+                op['dish'] = resolved
+            self._commit_ops(ops)
+        return len(ops)
+    
+    def remove_image(self, dish: str, filename: str) -> int:
+        """Remove do índice as linhas geradas a partir de um arquivo do prato.
+        
+        Returns:
+            Número de linhas removidas (0 se o arquivo não está indexado
+            ou o índice é anterior ao registro de arquivos por linha)
+        """
+        with self._lock:
+            self._sync_delta()
+            dish = self.resolve_dish(dish)
+            if not self._rows_for_file(dish, filename):
+                return 0
+            return self._commit_ops([{'op': 'remove', 'dish': dish, 'file': filename}])
+    
+    def rename_dish(self, old: str, new: str) -> int:
+        """Renomeia um prato; se `new` já existe, as linhas são mescladas nele.
+        
+        Returns:
+            Número de linhas renomeadas
+        """
+        with self._lock:
+            self._sync_delta()
+            old = self.resolve_dish(old)
+            new = self.resolve_dish(new)
+            if old == new or old not in self.dish_to_idx:
+                return 0
+            return self._commit_ops([{'op': 'rename', 'old': old, 'new': new}])
+    
+    def compact(self) -> dict:
+        """Incorpora o delta log ao dish_index.bin e zera o log."""
+        with self._lock, self._delta_log() as log:
+            self._read_delta(log)
+            pending = self._delta_pending
+            if pending == 0:
+                return {'ok': True, 'compacted_ops': 0}
+            if not self._save_index():
+                return {'ok': False, 'error': 'falha ao salvar índice'}
+            self._truncate_delta(log, keep_after=self._delta_seq)
+        self._load_index()
+        print(f"[index] Delta log compactado: {pending} operações")
+        return {'ok': True, 'compacted_ops': pending}
+    
+    def _embedding_cache(self):
+        """Cache de embeddings da versão atual do modelo (reabre se o modelo mudou)."""
+        version = get_embedding_version()
+        if self._embed_cache is None or self._embed_cache.version != version:
+            if self._embed_cache is not None:
+                self._embed_cache.close()
+            self._embed_cache = open_embedding_cache(self.index_file, version)
+        return self._embed_cache
+    
+    def _embed_bytes(self, data: bytes, cache) -> Tuple[Optional[np.ndarray], bool]:
+        """Embedding de uma imagem, consultando o cache por conteúdo. Retorna (embedding, hit)."""
+        key = content_hash(data) if cache is not None else None
+        if key is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached, True
+        embedding = image_embedding_from_bytes(data)
+        if key is not None and embedding is not None and getattr(embedding, 'ndim', 0) == 1:
+            cache.put(key, embedding)
+        return embedding, False
+    
+    def _commit_ops(self, ops: List[dict]) -> int:
+        """Grava as operações no delta log e aplica em memória (chamado com self._lock)."""
+        changed = 0
+        with self._delta_log() as log:
+            self._read_delta(log)  # Operações de outros workers primeiro
+            lines = []
+            for op in ops:
+                self._delta_seq += 1
+                op['seq'] = self._delta_seq
+                lines.append(json.dumps(op, ensure_ascii=False) + '\n')
+            log.seek(0, os.SEEK_END)
+            log.write(''.join(lines).encode('utf-8'))
+            log.flush()
+            os.fsync(log.fileno())
+            self._delta_offset = log.tell()
+            self._delta_pending += len(ops)
+            for op in ops:
+                changed += self._apply_op(op)
+        if self._delta_pending >= COMPACT_EVERY:
+            self.compact()
+        return changed
+    
+    @contextmanager
+    def _delta_log(self):
+        """Abre o delta log com lock exclusivo entre processos (workers uvicorn).
+        
+        Se outro processo trocou o arquivo (compactação) enquanto esperávamos o
+        lock, reabre o novo arquivo — escrever no antigo perderia a operação.
+        """
+        path = self._delta_file()
+        while True:
+            f = open(path, 'a+b')
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                if os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            f.close()
+        try:
+            if os.fstat(f.fileno()).st_ino != self._delta_ino:
+                self._load_index()  # Log substituído: recarrega o .bin compactado
+            yield f
+        finally:
+            f.close()  # Libera o flock
+    
+    def _sync_delta(self):
+        """Aplica operações gravadas por outros workers (um os.stat por busca)."""
+        path = self._delta_file()
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            if self._delta_ino is not None:
+                self._load_index()
+            return
+        if st.st_ino != self._delta_ino or st.st_size < self._delta_offset:
+            self._load_index()
+        elif st.st_size > self._delta_offset:
+            with open(path, 'rb') as f:
+                self._read_delta(f)
+    
+    def _replay_delta(self):
+        """Aplica o delta log inteiro sobre o índice base recém-carregado."""
+        path = self._delta_file()
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as f:
+            self._read_delta(f)
+        if self._delta_pending:
+            print(f"[index] Delta log reaplicado: {self._delta_pending} operações")
+    
+    def _read_delta(self, f):
+        """Lê o log a partir de self._delta_offset e aplica operações com seq novo."""
+        self._delta_ino = os.fstat(f.fileno()).st_ino
+        f.seek(self._delta_offset)
+        data = f.read()
+        # Linha final incompleta (escrita em andamento) fica para a próxima leitura
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                op = json.loads(line)
+            except ValueError:
+                print("[index] Linha inválida no delta log, ignorando")
+                continue
+            self._delta_pending += 1
+            if op.get('seq', 0) > self._delta_seq:
+                self._apply_op(op)
+                self._delta_seq = op['seq']
+        self._delta_offset += end
+    
+    def _truncate_delta(self, log, keep_after: int):
+        """Reescreve o delta log só com operações posteriores a keep_after.
+        
+        `log` é o handle de _delta_log(): o lock continua valendo até o rename.
+        """
+        log.seek(0)
+        kept = [line for line in log.read().splitlines(keepends=True)
+                if line.strip() and json.loads(line).get('seq', 0) > keep_after]
+        atomic_write(self._delta_file(), lambda f: f.write(b''.join(kept)))
+        self._delta_ino = None
+        self._delta_offset = 0
+    
+    def _apply_op(self, op: dict) -> int:
+        """Aplica uma operação do delta log em memória. Retorna linhas afetadas."""
+        kind = op.get('op')
+        if kind == 'add':
+            emb = np.frombuffer(base64.b64decode(op['emb']), dtype=np.float32)
+            return self._apply_add(op['dish'], op.get('file', ''), emb[None, :])
+        if kind == 'remove':
+            return self._apply_remove(op['dish'], op['file'])
+        if kind == 'rename':
+            return self._apply_rename(op['old'], op['new'])
+        print(f"[index] Operação desconhecida no delta log: {kind}")
+        return 0
+    
+    def _apply_add(self, dish: str, filename: str, emb: np.ndarray) -> int:
+        if self.embeddings is not None and len(self.embeddings) and emb.shape[1] != self.embeddings.shape[1]:
+            print(f"[index] Dimensão {emb.shape[1]} incompatível com o índice, ignorando {filename}")
+            return 0
+        n = len(self.dishes)
+        # Concatenar materializa o memmap em RAM até a próxima compactação
+        if self.embeddings is None or len(self.embeddings) == 0:
+            self.embeddings = emb.astype(np.float32)
+        else:
+            self.embeddings = np.concatenate([np.asarray(self.embeddings, dtype=np.float32), emb])
+        self.dishes.append(dish)
+        self.files.append(filename)
+        self.dish_to_idx.setdefault(dish, []).append(n)
+        meta = self.metadata.setdefault(dish, {})
+        meta['image_count'] = meta.get('image_count', 0) + 1
+        self._refresh_backend(np.arange(n))
+        return 1
+    
+    def _apply_remove(self, dish: str, filename: str) -> int:
+        rows = self._rows_for_file(dish, filename)
+        if not rows:
+            return 0
+        keep = np.setdiff1d(np.arange(len(self.dishes)), rows)
+        self.embeddings = np.asarray(self.embeddings, dtype=np.float32)[keep]
+        self.dishes = [self.dishes[i] for i in keep]
+        self.files = [self.files[i] for i in keep]
+        self._rebuild_dish_to_idx()
+        if dish in self.dish_to_idx:
+            self.metadata.setdefault(dish, {})['image_count'] = len(self.dish_to_idx[dish])
+        else:
+            self.metadata.pop(dish, None)
+        self._refresh_backend(keep)
+        return len(rows)
+    
+    def _apply_rename(self, old: str, new: str) -> int:
+        rows = self.dish_to_idx.get(old, [])
+        if not rows:
+            return 0
+        for i in rows:
+            self.dishes[i] = new
+        self._rebuild_dish_to_idx()
+        old_meta = self.metadata.pop(old, {})
+        meta = self.metadata.setdefault(new, dict(old_meta))
+        meta['image_count'] = len(self.dish_to_idx[new])
+        self._build_row_maps()
+        return len(rows)
+    
+    def _rows_for_file(self, dish: str, filename: str) -> List[int]:
+        if not filename:
+            return []
+        return [i for i in self.dish_to_idx.get(dish, []) if i < len(self.files) and self.files[i] == filename]
+    
+    def _rebuild_dish_to_idx(self):
+        self.dish_to_idx = {}
+        for i, dish in enumerate(self.dishes):
+            self.dish_to_idx.setdefault(dish, []).append(i)
+    
+    def _refresh_backend(self, kept_rows: np.ndarray):
+        """Atualiza backend de busca e mapas de linha após add/remove."""
+        if self._search_backend is None or not hasattr(self._search_backend, 'rebase'):
+            self._search_backend = create_backend(self.embeddings, self._embeddings_file())
+        else:
+            self._search_backend = self._search_backend.rebase(self.embeddings, kept_rows)
+        self._build_row_maps()
+    
+    def search(self, image_bytes: bytes, top_k: int = 5, with_dish_scores: bool = False) -> List[Dict]:
         """
         Busca os pratos mais similares a uma imagem.
         
         Args:
             image_bytes: Bytes da imagem de query
             top_k: Número de resultados
+            with_dish_scores: Inclui em results[0]['dish_scores'] o melhor
+                score raw de TODOS os pratos (para detect_family_ambiguity)
         
         Returns:
             Lista de resultados com prato, score e confiança
@@ -199,37 +688,53 @@ class DishIndex:
         if query_embedding is None:
             return [{'error': 'Falha ao gerar embedding da imagem. Tente novamente.'}]
         
-        # Calcular similaridade de cosseno
+        with self._lock:
+            self._sync_delta()
+            return self._rank(query_embedding, top_k, with_dish_scores, start_time)
+    
+    def search_batch(self, images: List[bytes], top_k: int = 5) -> List[List[Dict]]:
+        """search() para varias imagens: embeddings em lote (ONNX em blocos) e
+        ranking de cada uma com o mesmo scoring do caminho unitário."""
+        if self.embeddings is None or len(self.embeddings) == 0:
+            return [[{'error': 'Índice não carregado ou vazio'}] for _ in images]
+        t0 = time.time()
+        query_embeddings = get_image_embeddings(images)
+        logger.info(f"[TIMING] Embedding em lote ({len(images)} imagens): {(time.time() - t0) * 1000:.0f}ms")
+        out = []
+        with self._lock:
+            self._sync_delta()
+            for emb in query_embeddings:
+                if emb is None:
+                    out.append([{'error': 'Falha ao gerar embedding da imagem. Tente novamente.'}])
+                else:
+                    out.append(self._rank(emb, top_k, False, time.time()))
+        return out
+    
+    def _rank(self, query_embedding: np.ndarray, top_k: int, with_dish_scores: bool, start_time: float) -> List[Dict]:
+        """Scoring + agregação por prato (chamado com self._lock)."""
+        # Calcular similaridade de cosseno + melhor score de cada prato
         t0 = time.time()
-        # Como os embeddings já estão normalizados, o dot product = cosine similarity
-        similarities = np.dot(self.embeddings, query_embedding)
+        sims, dish_best, n_valid = self._dish_best_scores(query_embedding)
         t_sim = (time.time() - t0) * 1000
-        logger.info(f"[TIMING] Similaridade ({len(self.embeddings)} embeddings): {t_sim:.1f}ms")
+        observe_stage("similarity", t_sim)
+        logger.info(f"[TIMING] Similaridade ({n_valid}/{len(self.embeddings)} embeddings): {t_sim:.1f}ms")
         
-        # Pegar top-k índices (mais para agregar e medir consistencia)
-        top_indices = np.argsort(similarities)[::-1][:top_k * 10]
+        if n_valid == 0:
+            return [{'error': 'Nenhum candidato encontrado no índice'}]
         
         # Medir consistencia: dos top-15 matches individuais, quantos pratos diferentes?
-        top15_dishes = []
-        for idx in top_indices[:15]:
-            if idx < len(self.dishes):
-                top15_dishes.append(self.dishes[idx])
-        consistency_dishes = len(set(top15_dishes))
+        k15 = min(15, n_valid)
+        top15 = np.argpartition(-sims, k15 - 1)[:k15]
+        consistency_dishes = int(np.unique(self._row_dish[top15]).size)
         # Se top-15 tem 1-3 pratos: alta consistencia. 5+: modelo confuso.
         consistency_penalty = max(0, (consistency_dishes - 3) * 0.02)
         
-        # Agregar por prato (pegar melhor score de cada prato)
-        dish_scores: Dict[str, float] = {}
-        for idx in top_indices:
-            if idx >= len(self.dishes):
-                continue
-            dish = self.dishes[idx]
-            score = float(similarities[idx])
-            if dish not in dish_scores or score > dish_scores[dish]:
-                dish_scores[dish] = score
-        
-        # Ordenar por score
-        sorted_dishes = sorted(dish_scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+        # Agregar por prato: so entram pratos com alguma foto entre os top_k*10 matches
+        depth = min(top_k * 10, n_valid)
+        threshold = -np.partition(-sims, depth - 1)[depth - 1]
+        eligible = np.flatnonzero(dish_best >= threshold)
+        ranked = eligible[np.argsort(-dish_best[eligible], kind='stable')][:top_k]
+        sorted_dishes = [(self._dish_names[d], float(dish_best[d])) for d in ranked]
         
         # Calcular gap entre 1o e 2o lugar
         gap = 0.0
@@ -271,9 +776,69 @@ class DishIndex:
         # Adicionar metadados da busca
         if results:
             results[0]['search_time_ms'] = round(elapsed_ms, 2)
+            if with_dish_scores:
+                results[0]['dish_scores'] = self._dish_scores_dict(dish_best)
         
         return results
     
+    def _build_row_maps(self):
+        """Pre-computa linha -> id do prato e a permutacao agrupada por prato.
+        
+        _row_dish[i]       id inteiro do prato da linha i
+        _dish_order        linhas ordenadas por prato (estavel)
+        _dish_starts       inicio de cada prato em _dish_order (para reduceat)
+        """
+        n = min(len(self.dishes), len(self.embeddings)) if self.embeddings is not None else 0
+        name_to_id: Dict[str, int] = {}
+        self._row_dish = np.fromiter(
+            (name_to_id.setdefault(d, len(name_to_id)) for d in self.dishes[:n]),
+            dtype=np.int32, count=n
+        )
+        self._dish_names = list(name_to_id)
+        self._dish_order = np.argsort(self._row_dish, kind='stable')
+        counts = np.bincount(self._row_dish, minlength=len(self._dish_names))
+        self._dish_starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+    
+    def _dish_best_scores(self, query_embedding: np.ndarray) -> Tuple[np.ndarray, np.ndarray, int]:
+        """Similaridade por linha e melhor score por prato (segment-max), sem loops Python.
+        
+        Linhas fora dos candidatos do backend (IVF) ficam com -inf.
+        Retorna (sims, dish_best, n_validos).
+        """
+        n = len(self._row_dish)
+        rows, cand_sims = self._search_backend.candidates(query_embedding)
+        if rows is None:
+            sims = np.asarray(cand_sims[:n], dtype=np.float32)
+            n_valid = n
+        else:
+            sims = np.full(n, -np.inf, dtype=np.float32)
+            keep = rows < n
+            sims[rows[keep]] = cand_sims[keep]
+            n_valid = int(keep.sum())
+        if n == 0:
+            return sims, np.empty(0, dtype=np.float32), 0
+        dish_best = np.maximum.reduceat(sims[self._dish_order], self._dish_starts)
+        return sims, dish_best, n_valid
+    
+    def _dish_scores_dict(self, dish_best: np.ndarray) -> Dict[str, float]:
+        return {
+            name: round(float(score), 4)
+            for name, score in zip(self._dish_names, dish_best)
+            if np.isfinite(score)
+        }
+    
+    def score_all_dishes(self, query_embedding: np.ndarray) -> Dict[str, float]:
+        """Melhor similaridade (raw) de cada prato do índice para um embedding.
+        
+        Vetor completo para a lógica de ambiguidade (ai/families.py).
+        """
+        if not self.is_ready() or query_embedding is None:
+            return {}
+        with self._lock:
+            self._sync_delta()
+            _, dish_best, _ = self._dish_best_scores(query_embedding)
+            return self._dish_scores_dict(dish_best)
+    
     def search_by_dish(self, dish_name: str) -> List[Dict]:
         """Busca embeddings de um prato específico"""
         if dish_name not in self.dish_to_idx:
@@ -302,9 +867,16 @@ class DishIndex:
         
         return None
     
-    def direct_match(self, dish_name: str) -> List[Dict]:
-        """Retorna match direto para um prato conhecido"""
-        matched_dish = self.find_dish(dish_name)
+    def direct_match(self, dish_name: str, exact: bool = False) -> List[Dict]:
+        """Retorna match direto para um prato conhecido.
+
+        exact=True aceita só um prato presente em dish_to_idx com esse nome
+        exato (sem busca parcial/case-insensitive do find_dish).
+        """
+        if exact:
+            matched_dish = dish_name if dish_name in self.dish_to_idx else None
+        else:
+            matched_dish = self.find_dish(dish_name)
         if not matched_dish:
             return []
         
@@ -337,7 +909,10 @@ class DishIndex:
             'total_dishes': len(self.dish_to_idx),
             'total_embeddings': len(self.dishes),
             'embedding_dim': self.embeddings.shape[1] if self.embeddings is not None else 0,
-            'index_file': self.index_file
+            'index_file': self.index_file,
+            'storage': 'mmap' if isinstance(self.embeddings, np.memmap) else 'ram',
+            'delta_pending': self._delta_pending,
+            'search_backend': self._search_backend.stats() if self._search_backend else None
         }
 
 
@@ -0,0 +1,179 @@
+"""SoulNutri AI - Formato binario do indice (dish_index.bin)
+Um unico arquivo, aberto com np.memmap: varios workers uvicorn
+compartilham a mesma copia no page cache em vez de cada um manter
+uma matriz privada em RAM.
+
+Layout (little-endian):
+    [0:8]    MAGIC  b"SNIDX\\0\\0\\0"
+    [8:12]   uint32 versao do formato
+    [12:16]  uint32 tamanho do header JSON
+    [16:..]  header JSON (utf-8) — dtype, shape, offsets, checksum, metadata
+    ...      matriz de embeddings (float32 ou float16), alinhada em 64 bytes
+    ...      coluna dish-id int32 (uma por linha)
+    ...      tabela de strings (nomes dos pratos, JSON utf-8)
+    ...      tabela de arquivos (nome do arquivo de cada linha, JSON utf-8; opcional)
+
+Escrita atomica: arquivo temporario no mesmo diretorio + fsync + os.replace.
+"""
+
+import os
+import json
+import struct
+import hashlib
+import tempfile
+import logging
+from datetime import datetime, timezone
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SNIDX\x00\x00\x00"
+FORMAT_VERSION = 1
+_ALIGN = 64
+_PREFIX = struct.Struct("<8sII")
+
+# float16 reduz arquivo/RAM pela metade, mas o np.dot converte para float32
+# a cada busca. Manter float32 no Render (2 vCPU); float16 so se RAM apertar.
+INDEX_DTYPE = os.environ.get("SOULNUTRI_INDEX_DTYPE", "float32")
+VERIFY_CHECKSUM = os.environ.get("SOULNUTRI_INDEX_VERIFY", "1") == "1"
+
+
+class IndexFormatError(Exception):
+    """Arquivo binario do indice invalido, corrompido ou de versao desconhecida."""
+
+
+def _align(n: int) -> int:
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def atomic_write(path: str, write_fn: Callable) -> None:
+    """Escreve via arquivo temporario + rename. Leitores nunca veem arquivo parcial."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=".tmp_", suffix=os.path.basename(path), dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write_fn(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, 0o644)  # mkstemp cria 0600; outros processos precisam ler
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _encode(embeddings: np.ndarray, dishes: List[str], dtype: str):
+    """Converte linhas -> (matriz, coluna dish-id, nomes, tabela de strings)."""
+    name_to_id = {}
+    dish_ids = np.fromiter(
+        (name_to_id.setdefault(d, len(name_to_id)) for d in dishes),
+        dtype='<i4', count=len(dishes)
+    )
+    names = list(name_to_id)
+    matrix = np.ascontiguousarray(embeddings, dtype=np.dtype(dtype).newbyteorder('<'))
+    strings = json.dumps(names, ensure_ascii=False).encode('utf-8')
+    return matrix, dish_ids, names, strings
+
+
+def _checksum(matrix_bytes, ids_bytes, strings: bytes, files: bytes = b"") -> str:
+    h = hashlib.sha256()
+    h.update(matrix_bytes)
+    h.update(ids_bytes)
+    h.update(strings)
+    h.update(files)
+    return h.hexdigest()
+
+
+def write_index_file(path: str, embeddings: np.ndarray, dishes: List[str],
+                     metadata: dict, dtype: str = INDEX_DTYPE,
+                     files: Optional[List[str]] = None, delta_seq: int = 0) -> dict:
+    """Grava o indice no formato binario de forma atomica. Retorna o header.
+
+    files: nome do arquivo de origem de cada linha (remove_image incremental).
+    delta_seq: ultima operacao do delta log ja incorporada neste arquivo.
+    """
+    if len(dishes) != len(embeddings):
+        raise ValueError(f"dishes ({len(dishes)}) e embeddings ({len(embeddings)}) com tamanhos diferentes")
+    if files is not None and len(files) != len(dishes):
+        raise ValueError(f"files ({len(files)}) e dishes ({len(dishes)}) com tamanhos diferentes")
+    matrix, dish_ids, names, strings = _encode(embeddings, dishes, dtype)
+    files_bytes = json.dumps(files, ensure_ascii=False).encode('utf-8') if files is not None else b""
+    header = {
+        "format_version": FORMAT_VERSION,
+        "dtype": matrix.dtype.name,
+        "rows": int(matrix.shape[0]),
+        "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "n_dishes": len(names),
+        "checksum": _checksum(matrix.tobytes(), dish_ids.tobytes(), strings, files_bytes),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "delta_seq": int(delta_seq),
+        "metadata": metadata,
+    }
+    # Offsets dependem do tamanho do header, que depende dos offsets:
+    # reservamos os campos e recalculamos ate estabilizar.
+    header.update(matrix_offset=0, ids_offset=0, strings_offset=0, strings_len=len(strings),
+                  files_len=len(files_bytes))
+    for _ in range(3):
+        header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        matrix_offset = _align(_PREFIX.size + len(header_bytes))
+        ids_offset = _align(matrix_offset + matrix.nbytes)
+        strings_offset = ids_offset + dish_ids.nbytes
+        if (header["matrix_offset"], header["ids_offset"], header["strings_offset"]) == (matrix_offset, ids_offset, strings_offset):
+            break
+        header.update(matrix_offset=matrix_offset, ids_offset=ids_offset, strings_offset=strings_offset)
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+
+    def _write(f):
+        f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\0" * (header["matrix_offset"] - f.tell()))
+        f.write(matrix.tobytes())
+        f.write(b"\0" * (header["ids_offset"] - f.tell()))
+        f.write(dish_ids.tobytes())
+        f.write(strings)
+        f.write(files_bytes)
+
+    atomic_write(path, _write)
+    return header
+
+
+def read_header(path: str) -> dict:
+    with open(path, 'rb') as f:
+        prefix = f.read(_PREFIX.size)
+        if len(prefix) < _PREFIX.size:
+            raise IndexFormatError("arquivo truncado")
+        magic, version, header_len = _PREFIX.unpack(prefix)
+        if magic != MAGIC:
+            raise IndexFormatError("magic invalido")
+        if version != FORMAT_VERSION:
+            raise IndexFormatError(f"versao {version} nao suportada (esperado {FORMAT_VERSION})")
+        return json.loads(f.read(header_len).decode('utf-8'))
+
+
+def read_index_file(path: str, verify: bool = VERIFY_CHECKSUM) -> Tuple[np.ndarray, List[str], List[str], dict, dict]:
+    """Abre o indice binario. A matriz e um np.memmap somente-leitura.
+
+    Returns:
+        (embeddings, dishes por linha, arquivos por linha, metadata, header)
+        Arquivos gerados antes da tabela de arquivos devolvem "" em cada linha.
+    """
+    header = read_header(path)
+    rows, dim = header["rows"], header["dim"]
+    embeddings = np.memmap(path, dtype=np.dtype(header["dtype"]).newbyteorder('<'), mode='r',
+                           offset=header["matrix_offset"], shape=(rows, dim))
+    dish_ids = np.memmap(path, dtype='<i4', mode='r', offset=header["ids_offset"], shape=(rows,))
+    with open(path, 'rb') as f:
+        f.seek(header["strings_offset"])
+        strings = f.read(header["strings_len"])
+        files_bytes = f.read(header.get("files_len", 0))
+    if len(strings) != header["strings_len"] or len(files_bytes) != header.get("files_len", 0):
+        raise IndexFormatError("tabela de strings truncada")
+    if verify and _checksum(embeddings, dish_ids, strings, files_bytes) != header["checksum"]:
+        raise IndexFormatError("checksum nao confere")
+    names = json.loads(strings.decode('utf-8'))
+    dishes = [names[i] for i in dish_ids.tolist()]
+    files = json.loads(files_bytes.decode('utf-8')) if files_bytes else [""] * rows
+    return embeddings, dishes, files, header.get("metadata", {}), header
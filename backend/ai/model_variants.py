@@ -0,0 +1,285 @@
+"""
+SoulNutri - Variantes do modelo CLIP ONNX (FP16 / INT8) com gate de acurácia
+=============================================================================
+O modelo de referência (/app/clip_visual_fp16.onnx, exportado em FP32 apesar
+do nome) é convertido offline em variantes menores:
+
+    fp16          pesos FP16, I/O em FP32 (onnxconverter-common)
+    int8_dynamic  pesos INT8, ativações quantizadas em tempo de execução
+    int8_static   pesos + ativações INT8 (QDQ), calibrado com fotos do dataset
+
+scripts/quantize_onnx.py gera as variantes, passa o conjunto de calibração
+por cada uma e grava o relatório (concordância top-1 com a referência,
+cosseno, ms/inferência). O embedder só ativa uma variante aprovada nesse
+relatório para exatamente aquele arquivo; senão usa a referência.
+
+Config:
+    SOULNUTRI_ONNX_VARIANT          reference (padrão) | fp16 | int8_dynamic | int8_static
+    SOULNUTRI_ONNX_VARIANTS_REPORT  relatório da avaliação (default /app/clip_visual_variants.json)
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_VARIANT = "reference"
+VARIANTS = {
+    REFERENCE_VARIANT: "/app/clip_visual_fp16.onnx",
+    "fp16": "/app/clip_visual.fp16.onnx",
+    "int8_dynamic": "/app/clip_visual.int8_dynamic.onnx",
+    "int8_static": "/app/clip_visual.int8_static.onnx",
+}
+REPORT_PATH = os.environ.get("SOULNUTRI_ONNX_VARIANTS_REPORT", "/app/clip_visual_variants.json")
+
+# Gate: variante que muda o prato top-1 em mais de 1% das fotos não é ativada
+MIN_TOP1_AGREEMENT = 0.99
+MIN_MEAN_COSINE = 0.98
+
+_IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def model_fingerprint(path: str) -> Optional[str]:
+    """Tamanho + sha256 do primeiro e último MB (barato para arquivos de ~300MB)."""
+    try:
+        size = os.path.getsize(path)
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            h.update(f.read(1 << 20))
+            if size > 2 << 20:
+                f.seek(-(1 << 20), os.SEEK_END)
+                h.update(f.read())
+        return f"{size}:{h.hexdigest()[:16]}"
+    except OSError:
+        return None
+
+
+def load_report(report_path: str = REPORT_PATH) -> dict:
+    try:
+        with open(report_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def select_model_path(variant: Optional[str] = None, report_path: str = REPORT_PATH) -> Tuple[str, str]:
+    """(variante, caminho) a carregar. Cai para a referência se a variante pedida
+    não existir, não tiver sido avaliada ou tiver sido reprovada no gate."""
+    requested = (variant or os.environ.get("SOULNUTRI_ONNX_VARIANT", REFERENCE_VARIANT)).strip().lower()
+    reference = (REFERENCE_VARIANT, VARIANTS[REFERENCE_VARIANT])
+    if requested == REFERENCE_VARIANT:
+        return reference
+    if requested not in VARIANTS:
+        logger.warning(f"[model_variants] variante desconhecida '{requested}' — usando referência")
+        return reference
+    path = VARIANTS[requested]
+    if not os.path.exists(path):
+        logger.warning(f"[model_variants] {requested}: {path} não encontrado — usando referência")
+        return reference
+    entry = load_report(report_path).get("variants", {}).get(requested)
+    if not entry or not entry.get("approved"):
+        reason = entry.get("reason") if entry else "sem avaliação (rode scripts/quantize_onnx.py)"
+        logger.warning(f"[model_variants] {requested} não aprovada: {reason} — usando referência")
+        return reference
+    if entry.get("fingerprint") != model_fingerprint(path):
+        logger.warning(f"[model_variants] {requested}: arquivo mudou desde a avaliação — usando referência")
+        return reference
+    logger.info(f"[model_variants] variante {requested} ativa (top-1 {entry.get('top1_agreement')}, "
+                f"{entry.get('ms_per_inference')}ms vs {entry.get('reference_ms_per_inference')}ms)")
+    return requested, path
+
+
+# ═══════════════════════════════════════════════════════════════
+# CONJUNTO DE CALIBRAÇÃO
+# ═══════════════════════════════════════════════════════════════
+
+def calibration_set(data_dir: str = "/app/datasets/organized", per_dish: int = 3,
+                    max_images: int = 600, seed: int = 0) -> List[Tuple[str, str]]:
+    """(prato, caminho) — até per_dish fotos por prato, amostra determinística."""
+    rng = random.Random(seed)
+    items = []
+    for dish_dir in sorted(p for p in Path(data_dir).iterdir() if p.is_dir()):
+        files = sorted(str(f) for f in dish_dir.iterdir() if f.suffix.lower() in _IMAGE_EXTENSIONS)
+        rng.shuffle(files)
+        items.extend((dish_dir.name, f) for f in files[:per_dish])
+    rng.shuffle(items)
+    return items[:max_images]
+
+
+def load_calibration_tensors(
+        items: List[Tuple[str, str]]) -> Tuple[np.ndarray, List[str], List[Tuple[str, str]]]:
+    """Preprocessa as fotos com o mesmo caminho do embedder.
+
+    -> ((N,3,224,224), pratos, itens mantidos). Fotos ilegíveis são puladas;
+    os itens mantidos ficam alinhados linha a linha com tensores e pratos.
+    """
+    from .embedder import preprocess_image_bytes
+    tensors, labels, kept = [], [], []
+    for dish, path in items:
+        try:
+            with open(path, "rb") as f:
+                tensors.append(preprocess_image_bytes(f.read())[0])
+            labels.append(dish)
+            kept.append((dish, path))
+        except Exception as e:
+            logger.warning(f"[model_variants] calibração: {path} ignorada ({e})")
+    if not tensors:
+        return np.zeros((0, 3, 224, 224), dtype=np.float32), [], []
+    return np.stack(tensors).astype(np.float32), labels, kept
+
+
+# ═══════════════════════════════════════════════════════════════
+# EXPORTAÇÃO DAS VARIANTES
+# ═══════════════════════════════════════════════════════════════
+
+def export_fp16(src: str, dst: str):
+    import onnx
+    from onnxconverter_common import float16
+    model = float16.convert_float_to_float16(onnx.load(src), keep_io_types=True)
+    onnx.save(model, dst)
+
+
+def export_int8_dynamic(src: str, dst: str):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(src, dst, weight_type=QuantType.QInt8, per_channel=True)
+
+
+def export_int8_static(src: str, dst: str, tensors: np.ndarray):
+    """QDQ INT8 calibrado com os tensores do dataset (mesmo preprocessing do serviço)."""
+    from onnxruntime.quantization import (
+        CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType, quantize_static,
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    class _Reader(CalibrationDataReader):
+        def __init__(self):
+            self._rows = iter(range(len(tensors)))
+
+        def get_next(self):
+            i = next(self._rows, None)
+            return None if i is None else {"image": tensors[i:i + 1]}
+
+        def rewind(self):
+            self._rows = iter(range(len(tensors)))
+
+    prepared = dst + ".pre.onnx"
+    quant_pre_process(src, prepared)
+    try:
+        quantize_static(
+            prepared, dst, _Reader(),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+            calibrate_method=CalibrationMethod.Percentile,
+            extra_options={"CalibPercentile": 99.99},
+        )
+    finally:
+        if os.path.exists(prepared):
+            os.remove(prepared)
+
+
+EXPORTERS = {
+    "fp16": lambda src, dst, tensors: export_fp16(src, dst),
+    "int8_dynamic": lambda src, dst, tensors: export_int8_dynamic(src, dst),
+    "int8_static": export_int8_static,
+}
+
+
+# ═══════════════════════════════════════════════════════════════
+# AVALIAÇÃO + GATE
+# ═══════════════════════════════════════════════════════════════
+
+def _top1_dishes(queries: np.ndarray, gallery: np.ndarray, labels: List[str],
+                 exclude: Optional[np.ndarray] = None) -> List[str]:
+    """Prato do melhor match de cada query (mesma regra do DishIndex: maior cosseno).
+    exclude: máscara (queries, galeria) de linhas ignoradas (a própria foto)."""
+    sims = queries @ gallery.T
+    if exclude is not None:
+        sims[exclude] = -np.inf
+    return [labels[i] for i in np.argmax(sims, axis=1)]
+
+
+def _same_photo_mask(query_keys: List[str], gallery_keys: List[str]) -> np.ndarray:
+    rows = {}
+    for j, key in enumerate(gallery_keys):
+        rows.setdefault(key, []).append(j)
+    mask = np.zeros((len(query_keys), len(gallery_keys)), dtype=bool)
+    for i, key in enumerate(query_keys):
+        mask[i, rows.get(key, [])] = True
+    return mask
+
+
+def embed_all(embed_fn: Callable[[np.ndarray], np.ndarray], tensors: np.ndarray) -> Tuple[np.ndarray, float]:
+    """Embeddings (N,D) uma foto por vez, como no serviço. Retorna (embeddings, ms/inferência mediano)."""
+    rows, times = [], []
+    for i in range(len(tensors)):
+        t0 = time.perf_counter()
+        rows.append(np.asarray(embed_fn(tensors[i:i + 1]))[0])
+        times.append((time.perf_counter() - t0) * 1000)
+    emb = np.stack(rows).astype(np.float32)
+    emb /= np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+    return emb, float(np.median(times)) if times else 0.0
+
+
+def evaluate_variant(reference: np.ndarray, candidate: np.ndarray, labels: List[str],
+                     gallery: Optional[np.ndarray] = None, gallery_labels: Optional[List[str]] = None,
+                     query_keys: Optional[List[str]] = None, gallery_keys: Optional[List[str]] = None) -> dict:
+    """Compara embeddings da variante com os da referência para as mesmas fotos.
+
+    top-1: prato escolhido contra a galeria (índice atual, gerado com a
+    referência), ignorando a linha da própria foto (chave "prato/arquivo").
+    Sem galeria, usa as próprias fotos de calibração (leave-one-out) com os
+    embeddings da referência como galeria.
+    """
+    cos = np.sum(reference * candidate, axis=1)
+    if gallery is None:
+        gallery, gallery_labels = reference, labels
+        exclude = np.eye(len(labels), dtype=bool)
+    else:
+        exclude = _same_photo_mask(query_keys, gallery_keys) if query_keys and gallery_keys else None
+    ref_top1 = _top1_dishes(reference, gallery, gallery_labels, exclude)
+    cand_top1 = _top1_dishes(candidate, gallery, gallery_labels, exclude)
+    agree = sum(a == b for a, b in zip(ref_top1, cand_top1))
+    n = len(labels)
+    return {
+        "images": n,
+        "top1_agreement": round(agree / n, 4) if n else None,
+        "reference_top1_accuracy": round(sum(a == b for a, b in zip(ref_top1, labels)) / n, 4) if n else None,
+        "top1_accuracy": round(sum(a == b for a, b in zip(cand_top1, labels)) / n, 4) if n else None,
+        "mean_cosine": round(float(cos.mean()), 5) if n else None,
+        "min_cosine": round(float(cos.min()), 5) if n else None,
+    }
+
+
+def apply_gate(result: dict, min_agreement: float = MIN_TOP1_AGREEMENT,
+               min_cosine: float = MIN_MEAN_COSINE) -> dict:
+    """Marca approved/reason no resultado. Reprova se piorar a acurácia ou não for mais rápida."""
+    if not result.get("images"):
+        result.update(approved=False, reason="conjunto de calibração vazio")
+    elif result["top1_agreement"] < min_agreement:
+        result.update(approved=False, reason=f"top-1 {result['top1_agreement']} < {min_agreement}")
+    elif result["mean_cosine"] < min_cosine:
+        result.update(approved=False, reason=f"cosseno médio {result['mean_cosine']} < {min_cosine}")
+    elif result.get("top1_accuracy", 0) < result.get("reference_top1_accuracy", 0):
+        result.update(approved=False, reason="acurácia top-1 abaixo da referência")
+    elif result.get("ms_per_inference", 0) >= result.get("reference_ms_per_inference", float("inf")):
+        result.update(approved=False, reason="não é mais rápida que a referência")
+    else:
+        result.update(approved=True, reason="ok")
+    return result
+
+
+def write_report(results: Dict[str, dict], meta: dict, report_path: str = REPORT_PATH):
+    from .index_store import atomic_write
+    payload = {"generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"), **meta, "variants": results}
+    data = json.dumps(payload, indent=2, ensure_ascii=False).encode("utf-8")
+    atomic_write(report_path, lambda f: f.write(data))
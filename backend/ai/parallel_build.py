@@ -0,0 +1,230 @@
+"""SoulNutri AI - Builder paralelo do indice (rebuild offline)
+Decode + preprocessing num pool de processos; tensores em batch para uma
+ou mais sessoes ONNX (threads — o ONNX Runtime libera o GIL).
+
+A ordem das linhas e a do plano de build_index (mesmo resultado do builder
+serial); so muda quem calcula cada embedding. Imagens ja presentes no
+cache de embeddings (ai/embedding_cache.py) nem chegam ao pool.
+
+Progresso (pratos, imagens/s, ETA) em PROGRESS_FILE, lido por
+/api/ai/reindex-status.
+
+Config:
+    SOULNUTRI_BUILD_WORKERS   processos de preprocessing (0/1 = builder serial)
+    SOULNUTRI_BUILD_SESSIONS  sessoes ONNX em paralelo (default 1)
+    SOULNUTRI_BUILD_BATCH     imagens por run ONNX (default 16)
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .index_store import atomic_write
+
+logger = logging.getLogger(__name__)
+
+BUILD_WORKERS = int(os.environ.get("SOULNUTRI_BUILD_WORKERS", "0"))
+BUILD_SESSIONS = max(1, int(os.environ.get("SOULNUTRI_BUILD_SESSIONS", "1")))
+BUILD_BATCH_SIZE = max(1, int(os.environ.get("SOULNUTRI_BUILD_BATCH", "16")))
+PROGRESS_FILE = os.environ.get("SOULNUTRI_BUILD_PROGRESS_FILE", "/tmp/rebuild_index_progress.json")
+
+
+class BuildProgress:
+    """Progresso do build gravado (atomico, no maximo 2x/s) em PROGRESS_FILE."""
+
+    def __init__(self, dishes_total: int, images_total: int, path: Optional[str] = None,
+                 workers: int = 1, sessions: int = 1):
+        self.path = path or PROGRESS_FILE
+        self.dishes_total = dishes_total
+        self.images_total = images_total
+        self.dishes_done = 0
+        self.images_done = 0
+        self.cache_hits = 0
+        self.workers = workers
+        self.sessions = sessions
+        self.phase = "starting"
+        self._started = time.time()
+        self._started_at = datetime.now(timezone.utc).isoformat()
+        self._last_write = 0.0
+
+    def advance(self, images: int = 0, dishes: int = 0, cache_hits: int = 0):
+        self.images_done += images
+        self.dishes_done += dishes
+        self.cache_hits += cache_hits
+        self.write()
+
+    def snapshot(self) -> dict:
+        elapsed = time.time() - self._started
+        # ETA pela taxa de imagens embedadas (cache hits sao instantaneos)
+        embedded = self.images_done - self.cache_hits
+        rate = embedded / elapsed if elapsed > 0 else 0.0
+        remaining = self.images_total - self.images_done
+        return {
+            "phase": self.phase,
+            "dishes_done": self.dishes_done,
+            "dishes_total": self.dishes_total,
+            "images_done": self.images_done,
+            "images_total": self.images_total,
+            "cache_hits": self.cache_hits,
+            "images_per_sec": round(rate, 2),
+            "eta_seconds": round(remaining / rate, 1) if rate > 0 else None,
+            "elapsed_seconds": round(elapsed, 1),
+            "workers": self.workers,
+            "sessions": self.sessions,
+            "started_at": self._started_at,
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+    def write(self, phase: Optional[str] = None, force: bool = False):
+        if phase:
+            self.phase = phase
+            force = True
+        now = time.time()
+        if not force and now - self._last_write < 0.5:
+            return
+        self._last_write = now
+        payload = json.dumps(self.snapshot(), ensure_ascii=False).encode("utf-8")
+        try:
+            atomic_write(self.path, lambda f: f.write(payload))
+        except OSError as e:
+            logger.debug(f"[build] Erro ao gravar progresso: {e}")
+
+
+def read_progress(path: Optional[str] = None) -> Optional[dict]:
+    try:
+        with open(path or PROGRESS_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# ─── Funcoes executadas nos processos do pool (top-level: picklable) ───
+
+def _hash_file(path: str) -> Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def _preprocess_file(path: str) -> Optional[np.ndarray]:
+    from .embedder import preprocess_image_bytes
+    try:
+        with open(path, "rb") as f:
+            return preprocess_image_bytes(f.read())
+    except Exception:
+        return None
+
+
+def default_embed_fns(sessions: int = BUILD_SESSIONS) -> Optional[List[Callable[[np.ndarray], np.ndarray]]]:
+    """Uma funcao de embedding por sessao ONNX. None se o ONNX nao esta disponivel."""
+    from functools import partial
+    from .embedder import ONNX_MODEL_PATH, create_onnx_session, embed_preprocessed_batch
+    if not os.path.exists(ONNX_MODEL_PATH):
+        return None
+    threads = max(1, (os.cpu_count() or 2) // sessions)
+    try:
+        return [partial(embed_preprocessed_batch, create_onnx_session(threads)) for _ in range(sessions)]
+    except Exception as e:
+        logger.warning(f"[build] ONNX indisponivel para build paralelo: {e}")
+        return None
+
+
+def embed_plan(paths: Sequence[str], dish_of: Sequence[int], cache, progress: BuildProgress,
+               workers: int, embed_fns: List[Callable[[np.ndarray], np.ndarray]],
+               batch_size: int = BUILD_BATCH_SIZE) -> Tuple[List[Optional[np.ndarray]], List[bool]]:
+    """Embeddings de todas as imagens do plano, na ordem do plano.
+
+    Args:
+        paths: caminho de cada imagem (ordem do builder serial)
+        dish_of: indice do prato de cada imagem (para contar pratos concluidos)
+        cache: EmbeddingCache ou None
+        embed_fns: uma funcao (N,3,224,224) -> (N,D) normalizado por sessao
+
+    Returns:
+        (embeddings, cache_hit) por imagem; embedding None = imagem invalida
+    """
+    n = len(paths)
+    embeddings: List[Optional[np.ndarray]] = [None] * n
+    hits = [False] * n
+    remaining_per_dish = np.bincount(np.asarray(dish_of, dtype=np.int64), minlength=progress.dishes_total)
+
+    def finish(rows):
+        dishes_done = 0
+        for r in rows:
+            remaining_per_dish[dish_of[r]] -= 1
+            dishes_done += int(remaining_per_dish[dish_of[r]] == 0)
+        return dishes_done
+
+    ctx = multiprocessing.get_context("spawn")  # fork + threads do ONNX nao combinam
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        # 1) Hash em paralelo; cache hits saem direto
+        progress.write("hashing")
+        keys = list(pool.map(_hash_file, paths, chunksize=32)) if cache is not None else [None] * n
+        misses = []
+        for i, key in enumerate(keys):
+            cached = cache.get(key) if key is not None else None
+            if cached is not None:
+                embeddings[i] = cached
+                hits[i] = True
+            else:
+                misses.append(i)
+        hit_rows = [i for i in range(n) if hits[i]]
+        progress.advance(images=len(hit_rows), dishes=finish(hit_rows), cache_hits=len(hit_rows))
+
+        # 2) Preprocessing no pool em janelas (memoria limitada: ~600KB por tensor),
+        #    inferencia em batch nas sessoes enquanto a proxima janela e preprocessada
+        progress.write("embedding")
+        free_fns = deque(embed_fns)
+
+        def run_batch(rows, tensors):
+            fn = free_fns.popleft()
+            try:
+                return rows, fn(np.concatenate(tensors, axis=0))
+            except Exception as e:
+                logger.error(f"[build] Erro no batch ONNX ({len(rows)} imagens): {e}")
+                return rows, [None] * len(rows)
+            finally:
+                free_fns.append(fn)
+
+        def collect(future):
+            rows, result = future.result()
+            for r, emb in zip(rows, result):
+                if emb is None:
+                    continue
+                embeddings[r] = emb
+                if cache is not None and keys[r] is not None:
+                    cache.put(keys[r], emb)
+            progress.advance(images=len(rows), dishes=finish(rows))
+
+        window = max(batch_size, workers * batch_size)
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=len(embed_fns)) as infer:
+            for start in range(0, len(misses), window):
+                rows = misses[start:start + window]
+                tensors = list(pool.map(_preprocess_file, [paths[r] for r in rows], chunksize=4))
+                bad = [r for r, t in zip(rows, tensors) if t is None]
+                if bad:
+                    progress.advance(images=len(bad), dishes=finish(bad))
+                good = [(r, t) for r, t in zip(rows, tensors) if t is not None]
+                for b in range(0, len(good), batch_size):
+                    chunk = good[b:b + batch_size]
+                    in_flight.append(infer.submit(run_batch, [r for r, _ in chunk], [t for _, t in chunk]))
+                while len(in_flight) > 2 * len(embed_fns):
+                    collect(in_flight.popleft())
+            while in_flight:
+                collect(in_flight.popleft())
+
+    if cache is not None:
+        cache.flush()
+    return embeddings, hits
@@ -21,6 +21,8 @@ CIBI SANA - PREMISSAS GASTRONÔMICAS:
 
 from typing import Dict, List, Optional
 
+from ai.dish_catalog import DishCatalog, DishRecord, freeze, thaw
+
 
 # Dicionário de nomes corretos dos pratos
 DISH_NAMES = {
@@ -964,57 +966,32 @@ DISH_INFO = {
 }
 
 
-def get_dish_info(slug: str) -> dict:
-    """Retorna informações completas do prato - busca primeiro no dish_info.json"""
-    import os
-    import json
-    
-    # Primeiro tenta ler do dish_info.json na pasta do prato
-    info_path = f"/app/datasets/organized/{slug}/dish_info.json"
-    if os.path.exists(info_path):
-        try:
-            with open(info_path, 'r', encoding='utf-8') as f:
-                info = json.load(f)
-                # Filtrar benefícios genéricos do Cibi Sana
-                beneficios = info.get('beneficios', [])
-                if isinstance(beneficios, list):
-                    beneficios = [b for b in beneficios if 
-                        'sem aditivos' not in b.lower() and 
-                        'ingredientes frescos' not in b.lower() and
-                        'preparo artesanal' not in b.lower() and
-                        'sem conservantes' not in b.lower()]
-                    info['beneficios'] = beneficios
-                return info
-        except:
-            pass
-    
-    # Fallback para dicionário em memória
-    info = DISH_INFO.get(slug, DISH_INFO.get('default', {})).copy()
-    
-    # Filtrar benefícios genéricos
+# =============================================================================
+# CATÁLOGO EM MEMÓRIA (ai/dish_catalog.py)
+# dish_info.json lidos uma vez; nome/categoria/info resolvidos por slug ficam
+# memorizados. Edições chamam invalidate_dish_catalog(slug).
+# =============================================================================
+_GENERIC_BENEFITS = ('sem aditivos', 'ingredientes frescos', 'preparo artesanal', 'sem conservantes')
+
+# Nomes confiáveis para safe_display: DISH_NAMES + nomes vindos dos dish_info.json
+_TRUSTED_NAMES = set(DISH_NAMES.values())
+
+
+def _filter_beneficios(info: dict) -> dict:
+    """Remove benefícios genéricos do Cibi Sana (valem para todo prato)."""
     beneficios = info.get('beneficios', [])
     if isinstance(beneficios, list):
-        beneficios = [b for b in beneficios if 
-            'sem aditivos' not in b.lower() and 
-            'ingredientes frescos' not in b.lower() and
-            'preparo artesanal' not in b.lower() and
-            'sem conservantes' not in b.lower()]
-        info['beneficios'] = beneficios
-    
+        info['beneficios'] = [b for b in beneficios if not any(g in b.lower() for g in _GENERIC_BENEFITS)]
     return info
 
 
-def get_dish_name(slug: str) -> str:
-    """Retorna o nome correto do prato lendo do dish_info.json"""
-    import os
-    import json
-    import unicodedata
+def _normalize_key(s):
+    # Usa to_canonical_slug para garantir identidade com Camada 1
+    from services.slug_service import to_canonical_slug
+    return to_canonical_slug(s or '').replace('_', '')
 
-    def _normalize_key(s):
-        # Usa to_canonical_slug para garantir identidade com Camada 1
-        from services.slug_service import to_canonical_slug
-        return to_canonical_slug(s or '').replace('_', '')
 
+def _resolve_name(slug: str, file_info) -> str:
     # Primeiro tenta do dicionário em memória (chave exata)
     if slug in DISH_NAMES:
         return DISH_NAMES[slug]
@@ -1023,26 +1000,50 @@ def get_dish_name(slug: str) -> str:
     slug_norm = _normalize_key(slug)
     if slug_norm in DISH_NAMES:
         return DISH_NAMES[slug_norm]
-    
-    # Se não encontrar, tenta ler do dish_info.json
-    info_path = f"/app/datasets/organized/{slug}/dish_info.json"
-    if os.path.exists(info_path):
-        try:
-            with open(info_path, 'r', encoding='utf-8') as f:
-                info = json.load(f)
-                nome = info.get('nome', '')
-                if nome:
-                    # Cachear para próximas consultas
-                    DISH_NAMES[slug] = nome
-                    return nome
-        except:
-            pass
-    
+
+    # Se não encontrar, usa o nome do dish_info.json
+    nome = file_info.get('nome', '') if file_info is not None else ''
+    if nome:
+        _TRUSTED_NAMES.add(nome)
+        return nome
+
     # Fallback final — Camada 2: sem acento, Title Case, sem underscore
     from services.slug_service import to_display_name
     return to_display_name(slug)
 
 
+def _resolve_dish(slug: str, file_info) -> DishRecord:
+    if file_info is not None:
+        info = _filter_beneficios(thaw(file_info))
+        categoria = DISH_CATEGORIES[slug] if slug in DISH_CATEGORIES else file_info.get('categoria', 'não classificado')
+    else:
+        # Fallback para dicionário em memória
+        info = _filter_beneficios(dict(DISH_INFO.get(slug, DISH_INFO.get('default', {}))))
+        categoria = DISH_CATEGORIES.get(slug, 'não classificado')
+    return DishRecord(name=_resolve_name(slug, file_info), category=categoria, info=freeze(info))
+
+
+DISH_CATALOG = DishCatalog(_resolve_dish)
+
+
+def load_dish_catalog() -> int:
+    """Carrega os dish_info.json do dataset (startup)."""
+    return DISH_CATALOG.load()
+
+
+def invalidate_dish_catalog(slug: Optional[str] = None):
+    """Prato editado (admin, auditoria, moderação): próxima decisão relê o arquivo dele."""
+    DISH_CATALOG.invalidate(slug)
+
+
+def get_dish_info(slug: str) -> dict:
+    """Retorna informações completas do prato - dish_info.json, fallback DISH_INFO (cópia mutável)"""
+    return thaw(DISH_CATALOG.get(slug).info)
+
+
+def get_dish_name(slug: str) -> str:
+    """Retorna o nome correto do prato (DISH_NAMES, dish_info.json ou fallback)"""
+    return DISH_CATALOG.get(slug).name
 
 
 def format_dish_name_fallback(slug: str) -> str:
@@ -1131,8 +1132,8 @@ def safe_display(dish: str, dish_display: str) -> str:
     o `dish` canônico (folder name, sem acento, já bem espaçado).
     Caso contrário, retorna `dish_display` como está (sem reacentuar).
     """
-    # Mapeamento explícito em DISH_NAMES é sempre confiável
-    if dish_display in DISH_NAMES.values():
+    # Mapeamento explícito em DISH_NAMES (ou nome do dish_info.json) é sempre confiável
+    if dish_display in _TRUSTED_NAMES:
         return dish_display
     if is_display_suspicious(dish, dish_display):
         return (dish or '').strip()
@@ -1140,28 +1141,8 @@ def safe_display(dish: str, dish_display: str) -> str:
 
 
 def get_category(slug: str) -> str:
-    """Retorna a categoria do prato lendo do dish_info.json"""
-    import os
-    import json
-    
-    # Primeiro tenta do dicionário em memória
-    if slug in DISH_CATEGORIES:
-        return DISH_CATEGORIES[slug]
-    
-    # Se não encontrar, tenta ler do dish_info.json
-    info_path = f"/app/datasets/organized/{slug}/dish_info.json"
-    if os.path.exists(info_path):
-        try:
-            with open(info_path, 'r', encoding='utf-8') as f:
-                info = json.load(f)
-                categoria = info.get('categoria', 'não classificado')
-                # Cachear para próximas consultas
-                DISH_CATEGORIES[slug] = categoria
-                return categoria
-        except:
-            pass
-    
-    return 'não classificado'
+    """Retorna a categoria do prato (DISH_CATEGORIES ou dish_info.json)"""
+    return DISH_CATALOG.get(slug).category
 
 
 def get_category_emoji(category: str) -> str:
@@ -1201,6 +1182,41 @@ def get_nutrition_type(slug: str) -> str:
         return 'default'
 
 
+# =============================================================================
+# THRESHOLDS CALIBRADOS POR PRATO / FAMÍLIA
+# Propostos por services/calibration_service.py (Youden's J das amostras do
+# calibration_log) e aplicados pelo admin; vazio = limites fixos abaixo.
+# =============================================================================
+IDENTIFY_THRESHOLD = 0.72   # abaixo disso: não identificado
+HIGH_THRESHOLD = 0.90       # a partir disso: confiança alta
+
+CALIBRATED_THRESHOLDS = {'dishes': {}, 'families': {}}
+
+
+def set_calibrated_thresholds(dishes: Optional[Dict[str, float]] = None,
+                              families: Optional[Dict[str, float]] = None) -> Dict:
+    """Substitui os thresholds calibrados (slug/família -> score mínimo de identificação)."""
+    global CALIBRATED_THRESHOLDS
+    CALIBRATED_THRESHOLDS = {
+        'dishes': {k: float(v) for k, v in (dishes or {}).items()},
+        'families': {k: float(v) for k, v in (families or {}).items()},
+    }
+    return CALIBRATED_THRESHOLDS
+
+
+def get_identify_threshold(dish: str) -> float:
+    """Score mínimo para identificar o prato: calibrado do prato > da família > fixo."""
+    calibrated = CALIBRATED_THRESHOLDS
+    if dish in calibrated['dishes']:
+        return calibrated['dishes'][dish]
+    if calibrated['families']:
+        from ai.families import get_family
+        family = get_family(dish)
+        if family in calibrated['families']:
+            return calibrated['families'][family]
+    return IDENTIFY_THRESHOLD
+
+
 def analyze_result(results: List[Dict]) -> Dict:
     """
     Analisa os resultados da busca e decide a resposta.
@@ -1273,7 +1289,9 @@ def analyze_result(results: List[Dict]) -> Dict:
                 'alternatives': []
             }
     
-    if score >= 0.90:
+    identify_threshold = get_identify_threshold(dish)
+
+    if score >= max(HIGH_THRESHOLD, identify_threshold):
         return {
             'identified': True,
             'dish': dish,
@@ -1293,7 +1311,7 @@ def analyze_result(results: List[Dict]) -> Dict:
             'alternatives': []
         }
     
-    elif score >= 0.72:
+    elif score >= identify_threshold:
         alternatives = [safe_display(r['dish'], get_dish_name(r['dish'])) for r in results[1:4] if r.get('dish')]
         return {
             'identified': True,
@@ -1095,48 +1095,192 @@ INGREDIENTE_PARA_TACO = {
 }
 
 
+# ═══════════════════════════════════════════════════════════════════════════════
+# MATCHER COMPILADO (TACO + PROPORÇÕES)
+# Normalização das chaves feita uma única vez; busca parcial por índice
+# invertido de tokens; ingredientes já resolvidos ficam num LRU.
+# Mesma ordem de prioridade (e mesmos resultados) da busca linear original.
+# ═══════════════════════════════════════════════════════════════════════════════
+import re
+import unicodedata
+from functools import lru_cache
+
+_RE_PONTUACAO = re.compile(r'[^\w\s]')
+_RE_ESPACOS = re.compile(r'\s+')
+
+
+def _normalizar_ascii(texto: str) -> str:
+    texto = unicodedata.normalize('NFKD', texto.lower().strip())
+    return texto.encode('ASCII', 'ignore').decode('ASCII')
+
+
+class _IndiceParcial:
+    """Candidatos (frase normalizada) em ordem, com índice invertido token -> posições.
+    
+    primeiro(frase) devolve a posição do primeiro candidato que passa em
+    _eh_match_parcial_seguro(frase, candidato), ou None.
+    """
+
+    def __init__(self, frases: list):
+        self.tokens = [set(f.split()) for f in frases]
+        self.postings = {}
+        for pos, toks in enumerate(self.tokens):
+            for tok in toks:
+                self.postings.setdefault(tok, []).append(pos)
+
+    def primeiro(self, frase: str):
+        ing_tokens = set(frase.split())
+        if not ing_tokens:
+            return None
+        listas = []
+        for tok in ing_tokens:
+            lista = self.postings.get(tok)
+            if not lista:
+                return None
+            listas.append(lista)
+        listas.sort(key=len)
+        candidatas = set(listas[0]).intersection(*listas[1:])
+        molho = "molho" in ing_tokens
+        for pos in sorted(candidatas):
+            if molho and "batata" in self.tokens[pos]:
+                continue
+            return pos
+        return None
+
+
+class _TacoMatcher:
+    """Compilação única de TACO_DATABASE / INGREDIENTE_PARA_TACO."""
+
+    def __init__(self):
+        self.frase_exata = {}
+        taco_frases = []
+        for taco_key, data in TACO_DATABASE.items():
+            frase = _normalizar_frase_taco(taco_key.replace('_', ' '))
+            self.frase_exata.setdefault(frase, data)
+            taco_frases.append(frase)
+        self.taco_dados = list(TACO_DATABASE.values())
+        self.taco_parcial = _IndiceParcial(taco_frases)
+        self.mapa_chaves = list(INGREDIENTE_PARA_TACO.values())
+        self.mapa_parcial = _IndiceParcial([_normalizar_frase_taco(t) for t in INGREDIENTE_PARA_TACO])
+
+    def resolver(self, ingrediente: str):
+        # 1. Busca direta no TACO_DATABASE
+        ingrediente_key = _RE_ESPACOS.sub('_', _RE_PONTUACAO.sub(' ', _normalizar_ascii(ingrediente)).strip())
+        if ingrediente_key in TACO_DATABASE:
+            return TACO_DATABASE[ingrediente_key]
+
+        # 2. Busca via mapeamento
+        ingrediente_lower = ingrediente.lower().strip()
+        if ingrediente_lower in INGREDIENTE_PARA_TACO:
+            return TACO_DATABASE.get(INGREDIENTE_PARA_TACO[ingrediente_lower])
+
+        # 3. Busca por frase completa normalizada
+        ingrediente_frase = _normalizar_frase_taco(ingrediente)
+        if ingrediente_frase in self.frase_exata:
+            return self.frase_exata[ingrediente_frase]
+
+        # 4. Busca parcial conservadora
+        pos = self.mapa_parcial.primeiro(ingrediente_frase)
+        if pos is not None:
+            return TACO_DATABASE.get(self.mapa_chaves[pos])
+
+        # 5. Busca parcial direta no TACO_DATABASE, sem substring fraca
+        pos = self.taco_parcial.primeiro(ingrediente_frase)
+        if pos is not None:
+            return self.taco_dados[pos]
+
+        return None
+
+
+_MATCHER = None
+
+
+@lru_cache(maxsize=4096)
+def _resolver_taco(ingrediente: str):
+    global _MATCHER
+    if _MATCHER is None:
+        _MATCHER = _TacoMatcher()
+    return _MATCHER.resolver(ingrediente)
+
+
 def buscar_dados_taco(ingrediente: str) -> dict:
     """Busca dados nutricionais de um ingrediente na Tabela TACO."""
-    import unicodedata
-    import re
-    
-    # Normalizar input
-    ingrediente_norm = unicodedata.normalize('NFKD', ingrediente.lower().strip())
-    ingrediente_norm = ingrediente_norm.encode('ASCII', 'ignore').decode('ASCII')
-    ingrediente_key = re.sub(r'[^\w\s]', ' ', ingrediente_norm)
-    ingrediente_key = re.sub(r'\s+', '_', ingrediente_key.strip())
-    
-    # 1. Busca direta no TACO_DATABASE
-    if ingrediente_key in TACO_DATABASE:
-        return TACO_DATABASE[ingrediente_key]
-    
-    # 2. Busca via mapeamento
-    ingrediente_lower = ingrediente.lower().strip()
-    if ingrediente_lower in INGREDIENTE_PARA_TACO:
-        chave = INGREDIENTE_PARA_TACO[ingrediente_lower]
-        return TACO_DATABASE.get(chave)
-    
-    # 3. Busca por frase completa normalizada
-    ingrediente_frase = _normalizar_frase_taco(ingrediente)
-
-    for taco_key, data in TACO_DATABASE.items():
-        taco_frase = _normalizar_frase_taco(taco_key.replace('_', ' '))
-        if ingrediente_frase == taco_frase:
-            return data
-
-    # 4. Busca parcial conservadora
-    for termo, chave in INGREDIENTE_PARA_TACO.items():
-        termo_frase = _normalizar_frase_taco(termo)
-        if _eh_match_parcial_seguro(ingrediente_frase, termo_frase):
-            return TACO_DATABASE.get(chave)
-
-    # 5. Busca parcial direta no TACO_DATABASE, sem substring fraca
-    for taco_key, data in TACO_DATABASE.items():
-        taco_frase = _normalizar_frase_taco(taco_key.replace('_', ' '))
-        if _eh_match_parcial_seguro(ingrediente_frase, taco_frase):
-            return data
-    
-    return None
+    return _resolver_taco(ingrediente)
+
+
+def buscar_dados_taco_lote(ingredientes: list) -> list:
+    """Resolve uma lista de ingredientes de uma vez (mesma ordem; None = não encontrado)."""
+    return [_resolver_taco(ing) for ing in ingredientes]
+
+
+# Proporções típicas por tipo de ingrediente em receitas comerciais brasileiras
+PROPORCOES = {
+    # Bases / Carboidratos (componente principal: 40-60%)
+    "arroz": 0.50, "macarrao": 0.45, "espaguete": 0.45, "massa": 0.45,
+    "batata": 0.55, "mandioca": 0.50, "inhame": 0.50, "tapioca": 0.50,
+    "farofa": 0.40, "farinha": 0.20, "pao": 0.45, "cuscuz": 0.50,
+    "feijao": 0.45, "lentilha": 0.45, "grao de bico": 0.45,
+    "polenta": 0.50, "risoto": 0.45, "risone": 0.45,
+    "mandioquinha": 0.40,
+    # Proteínas (25-35%)
+    "frango": 0.30, "carne": 0.30, "boi": 0.30, "porco": 0.25,
+    "peixe": 0.30, "file": 0.30, "maminha": 0.35, "costela": 0.35,
+    "camarao": 0.25, "atum": 0.30, "salmao": 0.30, "bacalhau": 0.30,
+    "ovo": 0.15, "sobrecoxa": 0.35, "linguica": 0.30,
+    "kibe": 0.35, "almondega": 0.30, "milanesa": 0.30,
+    "entrecote": 0.85, "lula": 0.85,
+    # Vegetais / Complementos (10-20%)
+    "tomate": 0.10, "cebola": 0.08, "alho": 0.02, "pimentao": 0.08,
+    "brocolis": 0.30, "abobrinha": 0.30, "beringela": 0.30,
+    "repolho": 0.35, "couve": 0.20, "espinafre": 0.20,
+    "cenoura": 0.12, "vagem": 0.35, "jilo": 0.30, "quiabo": 0.30,
+    "abobora": 0.30, "pepino": 0.20, "alface": 0.15,
+    "banana da terra": 0.30, "palmito": 0.15,
+    # Gorduras / Óleos (5-15%)
+    "oleo": 0.08, "azeite": 0.06, "manteiga": 0.05, "banha": 0.06,
+    "bacon": 0.10, "presunto": 0.10,
+    # Laticínios
+    "queijo": 0.15, "creme de leite": 0.10, "leite": 0.15,
+    "gorgonzola": 0.10, "parmesao": 0.05, "mussarela": 0.15,
+    "iogurte": 0.20, "requeijao": 0.10,
+    # Molhos / Condimentos (5-10%)
+    "molho": 0.10, "shoyu": 0.03, "vinagre": 0.03,
+    "limao": 0.03, "laranja": 0.08, "curry": 0.02,
+    "gengibre": 0.02, "pesto": 0.08, "mostarda": 0.03,
+    "maionese": 0.30,
+    # Cereais / Grãos
+    "aveia": 0.20, "granola": 0.20, "quinoa": 0.25,
+    # Frutas secas / Nozes
+    "castanha": 0.05, "nozes": 0.05, "amendoim": 0.05,
+    "frutas secas": 0.08, "uva passa": 0.05, "coco": 0.08,
+    # Doces
+    "chocolate": 0.30, "acucar": 0.15, "leite condensado": 0.20,
+    "gelatina": 0.50, "mousse": 0.40, "creme": 0.20,
+    "figo": 0.15, "morango": 0.20, "frutas vermelhas": 0.20,
+    # Temperos (proporção mínima)
+    "sal": 0.01, "pimenta": 0.01, "oregano": 0.01,
+    "salsa": 0.02, "coentro": 0.02, "cebolinha": 0.02,
+    "ervas": 0.02, "especiarias": 0.02,
+}
+
+# Chaves de PROPORCOES por token: (posição, tokens da chave, valor).
+# Match por tokens inteiros — evita "sal" capturar "salmao"; vale a primeira chave na ordem do dict.
+_PROPORCOES_POR_TOKEN = {}
+for _pos, (_chave, _valor) in enumerate(PROPORCOES.items()):
+    _toks = _chave.split()
+    _PROPORCOES_POR_TOKEN.setdefault(_toks[0], []).append((_pos, _toks, _valor))
+
+
+@lru_cache(maxsize=4096)
+def _proporcao_tabelada(ingrediente: str) -> float:
+    """Proporção de PROPORCOES para o ingrediente (0.0 se nenhuma chave casa)."""
+    ing_tokens = set(_normalizar_frase_taco(ingrediente).split())
+    melhor = None
+    for tok in ing_tokens:
+        for pos, chave_tokens, valor in _PROPORCOES_POR_TOKEN.get(tok, ()):
+            if (melhor is None or pos < melhor[0]) and all(t in ing_tokens for t in chave_tokens):
+                melhor = (pos, valor)
+    return melhor[1] if melhor else 0.0
 
 
 def calcular_nutricao_prato(ingredientes: list, porcao_gramas: int = 200, nome_prato: str = "") -> dict:
@@ -1145,84 +1289,10 @@ def calcular_nutricao_prato(ingredientes: list, porcao_gramas: int = 200, nome_p
     if not ingredientes:
         return None
     
-    # Proporções típicas por tipo de ingrediente em receitas comerciais brasileiras
-    PROPORCOES = {
-        # Bases / Carboidratos (componente principal: 40-60%)
-        "arroz": 0.50, "macarrao": 0.45, "espaguete": 0.45, "massa": 0.45,
-        "batata": 0.55, "mandioca": 0.50, "inhame": 0.50, "tapioca": 0.50,
-        "farofa": 0.40, "farinha": 0.20, "pao": 0.45, "cuscuz": 0.50,
-        "feijao": 0.45, "lentilha": 0.45, "grao de bico": 0.45,
-        "polenta": 0.50, "risoto": 0.45, "risone": 0.45,
-        "mandioquinha": 0.40,
-        # Proteínas (25-35%)
-        "frango": 0.30, "carne": 0.30, "boi": 0.30, "porco": 0.25,
-        "peixe": 0.30, "file": 0.30, "maminha": 0.35, "costela": 0.35,
-        "camarao": 0.25, "atum": 0.30, "salmao": 0.30, "bacalhau": 0.30,
-        "ovo": 0.15, "sobrecoxa": 0.35, "linguica": 0.30,
-        "kibe": 0.35, "almondega": 0.30, "milanesa": 0.30,
-        "entrecote": 0.85, "lula": 0.85,
-        # Vegetais / Complementos (10-20%)
-        "tomate": 0.10, "cebola": 0.08, "alho": 0.02, "pimentao": 0.08,
-        "brocolis": 0.30, "abobrinha": 0.30, "beringela": 0.30,
-        "repolho": 0.35, "couve": 0.20, "espinafre": 0.20,
-        "cenoura": 0.12, "vagem": 0.35, "jilo": 0.30, "quiabo": 0.30,
-        "abobora": 0.30, "pepino": 0.20, "alface": 0.15,
-        "banana da terra": 0.30, "palmito": 0.15,
-        # Gorduras / Óleos (5-15%)
-        "oleo": 0.08, "azeite": 0.06, "manteiga": 0.05, "banha": 0.06,
-        "bacon": 0.10, "presunto": 0.10,
-        # Laticínios
-        "queijo": 0.15, "creme de leite": 0.10, "leite": 0.15,
-        "gorgonzola": 0.10, "parmesao": 0.05, "mussarela": 0.15,
-        "iogurte": 0.20, "requeijao": 0.10,
-        # Molhos / Condimentos (5-10%)
-        "molho": 0.10, "shoyu": 0.03, "vinagre": 0.03,
-        "limao": 0.03, "laranja": 0.08, "curry": 0.02,
-        "gengibre": 0.02, "pesto": 0.08, "mostarda": 0.03,
-        "maionese": 0.30,
-        # Cereais / Grãos
-        "aveia": 0.20, "granola": 0.20, "quinoa": 0.25,
-        # Frutas secas / Nozes
-        "castanha": 0.05, "nozes": 0.05, "amendoim": 0.05,
-        "frutas secas": 0.08, "uva passa": 0.05, "coco": 0.08,
-        # Doces
-        "chocolate": 0.30, "acucar": 0.15, "leite condensado": 0.20,
-        "gelatina": 0.50, "mousse": 0.40, "creme": 0.20,
-        "figo": 0.15, "morango": 0.20, "frutas vermelhas": 0.20,
-        # Temperos (proporção mínima)
-        "sal": 0.01, "pimenta": 0.01, "oregano": 0.01,
-        "salsa": 0.02, "coentro": 0.02, "cebolinha": 0.02,
-        "ervas": 0.02, "especiarias": 0.02,
-    }
-    
     # Calcular proporção para cada ingrediente
-    import unicodedata as _ud, re as _re
-
-    def _norm_prop(s: str) -> str:
-        """Normaliza para ASCII e tokeniza — sem acento, sem pontuação."""
-        s = _ud.normalize('NFKD', s.lower().strip()).encode('ASCII', 'ignore').decode('ASCII')
-        s = _re.sub(r'[^\w\s]', ' ', s)
-        return _re.sub(r'\s+', ' ', s).strip()
-
     proporcoes = []
     for ing in ingredientes:
-        ing_norm = _norm_prop(ing)
-        ing_tokens = set(ing_norm.split())
-        prop = 0.0
-
-        # Match por tokens inteiros — evita "sal" capturar "salmao"
-        for chave, valor in PROPORCOES.items():
-            chave_tokens = chave.split()
-            if len(chave_tokens) > 1:
-                # Multi-token: todos os tokens da chave devem estar no ingrediente
-                if all(t in ing_tokens for t in chave_tokens):
-                    prop = valor
-                    break
-            else:
-                # Single-token: token exato no conjunto de tokens do ingrediente
-                if chave_tokens[0] in ing_tokens:
-                    prop = valor
-                    break
+        prop = _proporcao_tabelada(ing)
 
         if prop == 0:
             prop = estimar_prop_por_classe(ing, ingredientes, nome_prato)
@@ -1245,20 +1315,29 @@ def calcular_nutricao_prato(ingredientes: list, porcao_gramas: int = 200, nome_p
     
     # Import USDA fallback — lazy para não quebrar se serviço não estiver disponível
     try:
-        from services.usda_fallback import buscar_dados_usda as _buscar_usda
+        from services.usda_fallback import prefetch_usda_sync as _prefetch_usda
         _usda_disponivel = True
     except Exception:
         _usda_disponivel = False
 
+    dados_taco = buscar_dados_taco_lote(ingredientes)
+
+    # Fallback USDA quando TACO não cobre o ingrediente: todos os que faltam de uma vez, em paralelo
+    dados_usda = {}
+    faltando = [ing for ing, dados in zip(ingredientes, dados_taco) if dados is None]
+    if faltando and _usda_disponivel:
+        try:
+            dados_usda = _prefetch_usda(faltando)
+        except Exception:
+            dados_usda = {}  # USDA fora do ar: segue só com TACO
+
     for i, ingrediente in enumerate(ingredientes):
-        dados = buscar_dados_taco(ingrediente)
+        dados = dados_taco[i]
 
-        # Fallback USDA quando TACO não cobre o ingrediente
         fonte = "TACO"
-        if dados is None and _usda_disponivel:
-            dados = _buscar_usda(ingrediente)
-            if dados:
-                fonte = "USDA"
+        if dados is None and dados_usda.get(ingrediente):
+            dados = dados_usda[ingrediente]
+            fonte = "USDA"
 
         gramas = porcao_gramas * proporcoes[i]
 
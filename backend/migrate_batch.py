@@ -1,8 +1,9 @@
 #!/usr/bin/env python3
 """Migra imagens locais para Object Storage S3 com retry robusto."""
-import os, sys, time, requests, pymongo, unicodedata
+import os, sys, time, requests, pymongo
 from pathlib import Path
 from dotenv import load_dotenv
+from services.image_service import normalize_slug as normalize  # mesma chave do campo slug_norm
 
 load_dotenv(Path(__file__).parent / '.env')
 
@@ -56,10 +57,6 @@ def upload_with_retry(path, data, content_type):
                 pass
     return None
 
-def normalize(name):
-    n = name.lower().replace('-','').replace('_','').replace(' ','').replace('(','').replace(')','')
-    nfkd = unicodedata.normalize('NFKD', n)
-    return ''.join(c for c in nfkd if not unicodedata.combining(c))
 
 def find_local_folder(slug):
     direct = LOCAL_DIR / slug
@@ -132,7 +129,7 @@ def migrate_dish(slug):
     if uploaded > 0:
         db.dish_storage.update_one(
             {"slug": slug},
-            {"$set": {"images": new_images, "count": len(new_images)}}
+            {"$set": {"images": new_images, "count": len(new_images), "slug_norm": normalize(slug)}}
         )
     
     return uploaded, errors, "3 falhas consecutivas" if consecutive_fails >= 3 else "OK"
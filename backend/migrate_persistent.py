@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 """Migração persistente para S3 - roda em background com retry agressivo."""
-import os, sys, time, requests, pymongo, unicodedata, json
+import os, sys, time, requests, pymongo, json
 from pathlib import Path
 from datetime import datetime
 from dotenv import load_dotenv
+from services.image_service import normalize_slug as normalize  # mesma chave do campo slug_norm
 
 load_dotenv(Path(__file__).parent / '.env')
 
@@ -40,10 +41,6 @@ def try_upload(sk, path, data, ct):
         pass
     return None
 
-def normalize(name):
-    n = name.lower().replace('-','').replace('_','').replace(' ','').replace('(','').replace(')','')
-    nfkd = unicodedata.normalize('NFKD', n)
-    return ''.join(c for c in nfkd if not unicodedata.combining(c))
 
 def find_local_folder(slug):
     direct = LOCAL_DIR / slug
@@ -172,7 +169,7 @@ for dish_idx, slug in enumerate(sorted(local_dishes)):
     if dish_uploaded > 0:
         db.dish_storage.update_one(
             {"slug": slug},
-            {"$set": {"images": new_images, "count": len(new_images)}}
+            {"$set": {"images": new_images, "count": len(new_images), "slug_norm": normalize(slug)}}
         )
         total_session += dish_uploaded
     
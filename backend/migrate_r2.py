@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 """Migra TODAS as imagens locais para Cloudflare R2."""
-import boto3, pymongo, os, json, unicodedata, time
+import boto3, pymongo, os, json, time
 from pathlib import Path
 from datetime import datetime
 from dotenv import load_dotenv
+from services.image_service import normalize_slug as normalize  # mesma chave do campo slug_norm
 
 load_dotenv(Path(__file__).parent / '.env')
 
@@ -22,10 +23,6 @@ s3 = boto3.client('s3',
 client = pymongo.MongoClient(os.environ['MONGO_URL'])
 db = client[os.environ.get('DB_NAME', 'soulnutri')]
 
-def normalize(name):
-    n = name.lower().replace('-','').replace('_','').replace(' ','').replace('(','').replace(')','')
-    nfkd = unicodedata.normalize('NFKD', n)
-    return ''.join(c for c in nfkd if not unicodedata.combining(c))
 
 def find_local_folder(slug):
     slug_norm = normalize(slug)
@@ -113,7 +110,7 @@ for idx, doc in enumerate(sorted(all_dishes, key=lambda x: x['slug'])):
     if new_images:
         db.dish_storage.update_one(
             {"slug": slug},
-            {"$set": {"images": new_images, "count": len(new_images)}}
+            {"$set": {"images": new_images, "count": len(new_images), "slug_norm": normalize(slug)}}
         )
     
     # Save progress every dish
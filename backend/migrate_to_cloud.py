@@ -16,6 +16,7 @@ import requests
 from pathlib import Path
 from datetime import datetime, timezone
 from dotenv import load_dotenv
+from services.image_service import normalize_slug
 
 load_dotenv(Path(__file__).parent / '.env')
 
@@ -283,6 +284,7 @@ def migrate_all():
         if uploaded_images:
             db.dish_storage.insert_one({
                 "slug": slug,
+                "slug_norm": normalize_slug(slug),
                 "name": display_name,
                 "images": uploaded_images,
                 "count": len(uploaded_images),
@@ -4,10 +4,11 @@ SoulNutri - Script de Reconstrução do Índice CLIP
 Executa em background para não bloquear o servidor.
 
 Uso:
-    python rebuild_index.py [max_per_dish]
+    python rebuild_index.py [max_per_dish] [workers]
     
 Exemplo:
     python rebuild_index.py 15  # Usa até 15 imagens por prato
+    python rebuild_index.py 15 8  # Builder paralelo com 8 processos
 """
 
 import os
@@ -40,10 +41,13 @@ logger = logging.getLogger(__name__)
 
 def main():
     max_per_dish = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None  # None = SOULNUTRI_BUILD_WORKERS
     
     logger.info("=" * 60)
     logger.info("INICIANDO RECONSTRUÇÃO DO ÍNDICE CLIP")
     logger.info(f"Máximo de imagens por prato: {max_per_dish}")
+    if workers:
+        logger.info(f"Processos de preprocessing: {workers}")
     logger.info("=" * 60)
     
     start_time = time.time()
@@ -73,12 +77,17 @@ def main():
             shutil.copy(embeddings_file, "/tmp/dish_index_embeddings_backup.npy")
             logger.info("Backup dos embeddings: /tmp/dish_index_embeddings_backup.npy")
         
+        binary_file = "/app/datasets/dish_index.bin"
+        if os.path.exists(binary_file):
+            shutil.copy(binary_file, "/tmp/dish_index_backup.bin")
+            logger.info("Backup do índice binário: /tmp/dish_index_backup.bin")
+        
         # Reconstruir índice
         logger.info("Iniciando reconstrução do índice...")
         from ai.index import DishIndex
         
         index = DishIndex()
-        stats = index.build_index(max_per_dish=max_per_dish)
+        stats = index.build_index(max_per_dish=max_per_dish, workers=workers)
         
         elapsed = time.time() - start_time
         
@@ -91,9 +100,23 @@ def main():
         logger.info(f"Total de pratos: {stats['total_dishes']}")
         logger.info(f"Total de imagens: {stats['total_images']}")
         logger.info(f"Dimensão dos embeddings: {stats.get('embedding_dim', 'N/A')}")
+        cache_stats = stats.get('embedding_cache', {})
+        if cache_stats.get('enabled'):
+            logger.info(f"Cache de embeddings: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+                        f"(hit rate {cache_stats['hit_rate']:.0%})")
         logger.info(f"Tempo total: {elapsed:.2f}s ({elapsed/60:.1f} minutos)")
         logger.info("=" * 60)
-        
+
+        # Índice de hash perceptual (fast path do identify / deduplicação)
+        try:
+            from ai.hash_index import ImageHashIndex
+            hash_index = ImageHashIndex()
+            hash_index.build()
+            stats['total_hashes'] = hash_index.total_hashes
+            logger.info(f"Índice de hash: {hash_index.total_hashes} imagens")
+        except Exception as e:
+            logger.warning(f"Índice de hash não reconstruído: {e}")
+
         # Salvar resultado em arquivo de status
         status_file = "/tmp/rebuild_index_status.json"
         import json
@@ -8,6 +8,7 @@ import pymongo, os, json
 from pathlib import Path
 from datetime import datetime, timezone
 from dotenv import load_dotenv
+from services.image_service import normalize_slug
 import unicodedata
 
 load_dotenv(Path(__file__).parent / '.env')
@@ -113,6 +114,7 @@ for dish in all_dishes:
             })
         dish_storage_docs.append({
             "slug": slug,
+            "slug_norm": normalize_slug(slug),
             "name": name,
             "images": img_entries,
             "count": len(img_entries),
@@ -131,6 +133,7 @@ for dish in all_dishes:
             })
         dish_storage_docs.append({
             "slug": slug,
+            "slug_norm": normalize_slug(slug),
             "name": name,
             "images": img_entries,
             "count": len(img_entries),
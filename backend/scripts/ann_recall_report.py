@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Relatorio de recall: busca aproximada (IVF) vs busca exata do DishIndex.
+
+Rodar ANTES de ativar SOULNUTRI_ANN_BACKEND=ivf em um deploy.
+Criterio sugerido para ligar: dish_top1_agreement >= 0.99 e
+dish_topk_overlap >= 0.98.
+
+Uso:
+    python scripts/ann_recall_report.py [index_file] [--nlist N] [--nprobe N] [--sample N] [--save]
+
+--save persiste o IVF treinado ao lado de dish_index_embeddings.npy.
+"""
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from ai.ann import IVFSearch, IVF_NLIST, IVF_NPROBE, embeddings_fingerprint, ivf_path_for, recall_report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall IVF vs busca exata")
+    parser.add_argument("index_file", nargs="?", default="/app/datasets/dish_index.json")
+    parser.add_argument("--nlist", type=int, default=IVF_NLIST)
+    parser.add_argument("--nprobe", type=int, default=IVF_NPROBE)
+    parser.add_argument("--sample", type=int, default=300)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--save", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.index_file, 'r', encoding='utf-8') as f:
+        dishes = json.load(f)['dishes']
+    emb_file = args.index_file.replace('.json', '_embeddings.npy')
+    embeddings = np.load(emb_file)
+
+    centroids, assign = IVFSearch.train(embeddings, args.nlist)
+    ivf = IVFSearch(embeddings, centroids, assign, args.nprobe)
+    report = recall_report(embeddings, dishes, ivf, sample=args.sample, k=args.k)
+    print(json.dumps(report, indent=2))
+
+    if args.save:
+        ivf.save(ivf_path_for(emb_file), embeddings_fingerprint(embeddings))
+        print(f"IVF salvo em {ivf_path_for(emb_file)}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+SoulNutri — Backfill dos agregados Premium (premium_rollups)
+============================================================
+Recalcula semana/mês/streak de cada usuário a partir dos daily_logs.
+Idempotente: pode ser executado N vezes (cada usuário é reconstruído do zero).
+Usuários não reconstruídos aqui são reconstruídos na primeira leitura do dashboard.
+
+USO:
+    cd /app/backend
+    python scripts/backfill_premium_rollups.py [--user NOME]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from dotenv import load_dotenv
+load_dotenv(ROOT_DIR / ".env")
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from services.premium_rollup_service import ensure_indexes, rebuild_user
+
+MONGO_URL = os.environ.get("MONGO_URL")
+DB_NAME = os.environ.get("DB_NAME", "soulnutri")
+
+
+async def run_backfill(only_user: str = None):
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+    await ensure_indexes(db)
+
+    users = [only_user] if only_user else sorted(await db.daily_logs.distinct("user_nome"))
+    print(f"Usuarios com daily_logs: {len(users)}")
+    total_docs = 0
+    for nome in users:
+        n = await rebuild_user(db, nome)
+        total_docs += n
+        print(f"  {nome}: {n} docs semana/mes")
+    print(f"Backfill concluido: {total_docs} docs em premium_rollups")
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill dos agregados Premium")
+    parser.add_argument("--user", default=None, help="reconstroi so este user_nome")
+    args = parser.parse_args()
+    asyncio.run(run_backfill(args.user))
@@ -12,6 +12,7 @@ from dotenv import load_dotenv
 load_dotenv("/app/backend/.env")
 
 from services.nutrition_3sources import generate_nutrition_3sources, DISH_USDA_QUERY, DISH_OFF_CATEGORY
+from services.norm_key_service import with_norm_keys
 from pymongo import MongoClient
 
 # Conectar MongoDB
@@ -113,7 +114,7 @@ async def process_all():
             }
             db.nutrition_sheets.update_one(
                 {"nome": nome},
-                {"$set": sheet},
+                {"$set": with_norm_keys("nutrition_sheets", sheet)},
                 upsert=True
             )
             
@@ -22,6 +22,7 @@ load_dotenv('/app/backend/.env')
 async def main():
     from motor.motor_asyncio import AsyncIOMotorClient
     from services.nutrition_3sources import query_usda, NUTRIENT_KEYS
+    from services.norm_key_service import with_norm_keys
 
     mongo_url = os.environ.get("MONGO_URL")
     db_name = os.environ.get("DB_NAME", "soulnutri")
@@ -69,14 +70,15 @@ async def main():
 
             await db.nutrition_sheets.update_one(
                 {"nome": nome},
-                {"$set": {
+                {"$set": with_norm_keys("nutrition_sheets", {
+                    "nome": nome,
                     **media,
                     "num_fontes": num_fontes,
                     "fontes_usadas": fontes_usadas,
                     "fonte_principal": f"Media de {num_fontes} fontes ({', '.join(fontes_usadas)})",
                     "detalhes_fontes": existing_sources,
                     "updated_at": datetime.now(timezone.utc).isoformat(),
-                }}
+                })}
             )
             print(f"  ATUALIZADO: {nome} - agora com {num_fontes} fontes")
             print(f"  USDA calorias: {usda_data.get('calorias_kcal')} kcal")
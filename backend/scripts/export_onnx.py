@@ -18,6 +18,8 @@ torch.onnx.export(
     "/app/clip_visual_fp16.onnx",
     input_names=["image"],
     output_names=["embedding"],
+    # Batch dinamico: permite o micro-batching de ai/embedder.py (N,3,224,224)
+    dynamic_axes={"image": {0: "batch"}, "embedding": {0: "batch"}},
     opset_version=14,
     dynamo=False,
 )
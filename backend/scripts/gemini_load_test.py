@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Teste de carga offline do caminho externo (Gemini) com o provider fake.
+
+Dispara N identificacoes simultaneas por identify_dish_gemini_flash e mede
+throughput, latencia (p50/p95) e o maior atraso do event loop — que deve
+ficar perto de zero se nenhuma chamada bloquear o loop.
+
+Uso:
+    python scripts/gemini_load_test.py [--requests N] [--concurrency N] [--latency 200-800] [--image foto.jpg]
+"""
+import os
+import io
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga offline no gateway Gemini (provider fake)")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50, help="requests simultaneos do cliente")
+    parser.add_argument("--latency", default="200-800", help="latencia do fake em ms (ex: 300 ou 200-800)")
+    parser.add_argument("--image", default=None, help="JPEG de teste (default: imagem sintetica 1024x768)")
+    args = parser.parse_args()
+
+    os.environ["SOULNUTRI_GEMINI_PROVIDER"] = "fake"
+    os.environ["SOULNUTRI_FAKE_GEMINI_LATENCY_MS"] = args.latency
+    os.environ.pop("EMERGENT_LLM_KEY", None)
+
+    from services.gemini_flash_service import identify_dish_gemini_flash
+    from services.gemini_gateway import get_gateway_stats
+
+    if args.image:
+        with open(args.image, "rb") as f:
+            image_bytes = f.read()
+    else:
+        from PIL import Image
+        buf = io.BytesIO()
+        Image.new("RGB", (1024, 768), (180, 140, 60)).save(buf, format="JPEG", quality=90)
+        image_bytes = buf.getvalue()
+
+    async def run():
+        lags = []
+        stop = asyncio.Event()
+
+        async def monitor():
+            # Atraso do loop: quanto um sleep de 10ms demora de fato
+            while not stop.is_set():
+                t = time.perf_counter()
+                await asyncio.sleep(0.01)
+                lags.append((time.perf_counter() - t - 0.01) * 1000)
+
+        client_slots = asyncio.Semaphore(args.concurrency)
+        latencies = []
+        failures = 0
+
+        async def one():
+            nonlocal failures
+            async with client_slots:
+                t = time.perf_counter()
+                result = await identify_dish_gemini_flash(image_bytes)
+                latencies.append((time.perf_counter() - t) * 1000)
+                if not result.get("ok"):
+                    failures += 1
+
+        mon = asyncio.create_task(monitor())
+        start = time.perf_counter()
+        await asyncio.gather(*[one() for _ in range(args.requests)])
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await mon
+        return elapsed, sorted(latencies), failures, lags
+
+    elapsed, latencies, failures, lags = asyncio.run(run())
+    pct = lambda p: round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 1)
+    print(json.dumps({
+        "requests": args.requests,
+        "failures": failures,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(args.requests / elapsed, 1),
+        "latency_p50_ms": pct(0.50),
+        "latency_p95_ms": pct(0.95),
+        "event_loop_max_lag_ms": round(max(lags), 1) if lags else None,
+        "gateway": get_gateway_stats(),
+    }, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
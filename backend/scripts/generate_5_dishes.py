@@ -32,6 +32,7 @@ TARGET_DISHES = [
 async def main():
     from motor.motor_asyncio import AsyncIOMotorClient
     from services.nutrition_3sources import generate_nutrition_3sources
+    from services.norm_key_service import with_norm_keys
 
     mongo_url = os.environ.get("MONGO_URL")
     db_name = os.environ.get("DB_NAME", "soulnutri")
@@ -92,7 +93,7 @@ async def main():
                 # Salvar no MongoDB
                 await db.nutrition_sheets.update_one(
                     {"nome": sheet["nome"]},
-                    {"$set": sheet},
+                    {"$set": with_norm_keys("nutrition_sheets", sheet)},
                     upsert=True,
                 )
                 print(f"  SALVO: {sheet['nome']}")
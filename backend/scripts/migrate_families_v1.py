@@ -28,6 +28,8 @@ load_dotenv(ROOT_DIR / ".env")
 
 from motor.motor_asyncio import AsyncIOMotorClient
 
+from services.norm_key_service import with_norm_keys
+
 MONGO_URL = os.environ.get("MONGO_URL")
 DB_NAME = os.environ.get("DB_NAME", "soulnutri")
 
@@ -313,21 +315,30 @@ async def run_migration():
     print("\nPASSO 4 — Marcando fichas nutricionais suspeitas...")
     for flag in SUSPICIOUS_NUTRITION:
         display = DISPLAY_NAME_MAP.get(flag["slug"], flag["slug"].replace("_", " ").title())
-        r = await db.nutrition_sheets.update_one(
+        sheet = await db.nutrition_sheets.find_one(
             {
                 "$or": [
                     {"nome": {"$regex": display, "$options": "i"}},
                     {"slug": flag["slug"]},
                 ]
             },
-            {
-                "$set": {
-                    "nutricao_suspeita": True,
-                    "motivo_suspeita": flag["motivo"],
-                }
-            },
+            {"_id": 1, "nome": 1},
         )
-        status = "MARCADO" if r.modified_count else "NAO ENCONTRADO (nutrition_sheet)"
+        modified = 0
+        if sheet:
+            # nome_norm junto: a ficha pode ter sido gravada depois do backfill do startup
+            r = await db.nutrition_sheets.update_one(
+                {"_id": sheet["_id"]},
+                {
+                    "$set": with_norm_keys("nutrition_sheets", {
+                        **({"nome": sheet["nome"]} if sheet.get("nome") else {}),
+                        "nutricao_suspeita": True,
+                        "motivo_suspeita": flag["motivo"],
+                    })
+                },
+            )
+            modified = r.modified_count
+        status = "MARCADO" if modified else "NAO ENCONTRADO (nutrition_sheet)"
         print(f"  [{status}] {flag['slug']}")
 
     # ── PASSO 5: Verificação final ──────────────────────────────────
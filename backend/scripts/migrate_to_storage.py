@@ -12,6 +12,7 @@ from dotenv import load_dotenv
 load_dotenv("/app/backend/.env")
 
 from services.storage_service import init_storage, upload_dish_image
+from services.image_service import normalize_slug
 from pymongo import MongoClient
 
 # Conectar MongoDB
@@ -86,6 +87,7 @@ def main():
                 {"slug": dish_slug},
                 {"$set": {
                     "slug": dish_slug,
+                    "slug_norm": normalize_slug(dish_slug),
                     "images": uploaded_images,
                     "count": len(uploaded_images),
                     "migrated_at": datetime.now(timezone.utc).isoformat(),
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Gera variantes FP16 / INT8 do modelo CLIP ONNX e avalia cada uma contra a referencia.
+
+Passos:
+1. conjunto de calibracao: ate --per-dish fotos por prato de /app/datasets/organized
+2. exporta as variantes pedidas (int8_static calibrado com esse conjunto)
+3. passa o conjunto pela referencia e por cada variante (1 foto por vez, como no servico)
+4. gate: concordancia do prato top-1 (contra o indice atual) >= --min-agreement,
+   cosseno medio >= --min-cosine, acuracia nao pior e mais rapida que a referencia
+5. grava o relatorio lido pelo embedder (SOULNUTRI_ONNX_VARIANT so ativa aprovada)
+
+Requer onnx, onnxruntime e onnxconverter-common (somente offline, nao no deploy).
+
+Uso:
+    python scripts/quantize_onnx.py [--variants int8_dynamic,int8_static,fp16] [--per-dish 3]
+                                    [--max-images 600] [--force] [--threads 2]
+"""
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai.model_variants import (
+    EXPORTERS, MIN_MEAN_COSINE, MIN_TOP1_AGREEMENT, REFERENCE_VARIANT, REPORT_PATH, VARIANTS,
+    apply_gate, calibration_set, embed_all, evaluate_variant, load_calibration_tensors,
+    model_fingerprint, write_report,
+)
+
+
+def _session(path: str, threads: int):
+    import onnxruntime as ort
+    from ai.embedder import _onnx_session_options
+    return ort.InferenceSession(path, _onnx_session_options(ort, threads))
+
+
+def _gallery():
+    """Indice atual (gerado com a referencia): embeddings, pratos e chaves prato/arquivo."""
+    try:
+        from ai.index import DishIndex
+        index = DishIndex()
+        if not index.is_ready():
+            return None, None, None
+        import numpy as np
+        keys = [f"{d}/{os.path.basename(f)}" for d, f in zip(index.dishes, index.files)]
+        return np.asarray(index.embeddings, dtype=np.float32), list(index.dishes), keys
+    except Exception as e:
+        print(f"Indice indisponivel ({e}): top-1 por leave-one-out no conjunto de calibracao")
+        return None, None, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Variantes FP16/INT8 do CLIP ONNX com gate de acuracia")
+    parser.add_argument("--variants", default="int8_dynamic,int8_static,fp16")
+    parser.add_argument("--data-dir", default="/app/datasets/organized")
+    parser.add_argument("--per-dish", type=int, default=3)
+    parser.add_argument("--max-images", type=int, default=600)
+    parser.add_argument("--threads", type=int, default=2, help="threads ONNX (igual ao deploy)")
+    parser.add_argument("--min-agreement", type=float, default=MIN_TOP1_AGREEMENT)
+    parser.add_argument("--min-cosine", type=float, default=MIN_MEAN_COSINE)
+    parser.add_argument("--force", action="store_true", help="reexporta variantes ja existentes")
+    parser.add_argument("--report", default=REPORT_PATH)
+    args = parser.parse_args()
+
+    names = [v.strip() for v in args.variants.split(",") if v.strip()]
+    unknown = [v for v in names if v not in EXPORTERS]
+    if unknown:
+        print(f"Variantes desconhecidas: {unknown} (opcoes: {sorted(EXPORTERS)})")
+        return 1
+    reference_path = VARIANTS[REFERENCE_VARIANT]
+    if not os.path.exists(reference_path):
+        print(f"Modelo de referencia ausente: {reference_path}")
+        return 1
+
+    items = calibration_set(args.data_dir, args.per_dish, args.max_images)
+    tensors, labels, kept = load_calibration_tensors(items)
+    query_keys = [f"{d}/{os.path.basename(p)}" for d, p in kept]
+    print(f"Calibracao: {len(labels)} fotos de {len(set(labels))} pratos")
+    if not labels:
+        return 1
+
+    gallery, gallery_labels, gallery_keys = _gallery()
+    ref_session = _session(reference_path, args.threads)
+    reference, ref_ms = embed_all(lambda x: ref_session.run(None, {"image": x})[0], tensors)
+
+    results = {}
+    for name in names:
+        path = VARIANTS[name]
+        if args.force or not os.path.exists(path):
+            print(f"Exportando {name} -> {path}")
+            EXPORTERS[name](reference_path, path, tensors)
+        session = _session(path, args.threads)
+        candidate, ms = embed_all(lambda x: session.run(None, {"image": x})[0], tensors)
+        result = evaluate_variant(reference, candidate, labels, gallery, gallery_labels, query_keys, gallery_keys)
+        result.update(
+            path=path,
+            fingerprint=model_fingerprint(path),
+            size_mb=round(os.path.getsize(path) / 1024 / 1024, 1),
+            ms_per_inference=round(ms, 1),
+            reference_ms_per_inference=round(ref_ms, 1),
+        )
+        results[name] = apply_gate(result, args.min_agreement, args.min_cosine)
+        print(f"{name}: {'APROVADA' if result['approved'] else 'REPROVADA'} ({result['reason']}) "
+              f"top-1={result['top1_agreement']} cos={result['mean_cosine']} "
+              f"{result['ms_per_inference']}ms vs {result['reference_ms_per_inference']}ms")
+
+    write_report(results, {
+        "reference": {"path": reference_path, "fingerprint": model_fingerprint(reference_path)},
+        "calibration_images": len(labels),
+        "gallery": "index" if gallery is not None else "leave_one_out",
+        "min_top1_agreement": args.min_agreement,
+        "min_mean_cosine": args.min_cosine,
+    }, args.report)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    print(f"Relatorio salvo em {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -1,10 +1,31 @@
 #!/usr/bin/env python3
-"""Remove exact duplicate images (same size) from R2 and MongoDB."""
-import os, re, boto3
+"""Remove exact duplicate images (same size) from R2 and MongoDB.
+
+--perceptual: also treat a "(n)" copy as duplicate when its local dataset photo is
+a near-duplicate of the base (pHash/dHash, see ai/hash_index.py), even if the size differs.
+"""
+import os, re, sys, boto3
 from dotenv import load_dotenv
 load_dotenv('/app/backend/.env')
 import pymongo
 
+PERCEPTUAL = '--perceptual' in sys.argv
+hashes = {}
+if PERCEPTUAL:
+    sys.path.insert(0, '/app/backend')
+    from ai.hash_index import get_hash_index, hamming, PHASH_MAX_DISTANCE, DHASH_MAX_DISTANCE
+    hashes = {(e['slug'], e['file']): e for e in get_hash_index().entries}
+
+
+def near_dupe(slug, fn, base):
+    a, b = hashes.get((slug, fn)), hashes.get((slug, base))
+    if not a or not b:
+        return None
+    d = hamming(a['phash'], b['phash'])
+    if d <= PHASH_MAX_DISTANCE and hamming(a['dhash'], b['dhash']) <= DHASH_MAX_DISTANCE:
+        return d
+    return None
+
 client = pymongo.MongoClient(os.environ.get('MONGO_URL'))
 db = client[os.environ.get('DB_NAME', 'soulnutri')]
 
@@ -48,12 +69,19 @@ for doc in all_storages:
         continue
     
     to_remove = []
+    reason = {}
     
     for fn in suffix_files:
         base = pattern.sub('', fn)
         if base in r2_items and fn in r2_items:
             if r2_items[fn] == r2_items[base]:
                 to_remove.append(fn)
+                reason[fn] = 'exact dupe'
+            elif PERCEPTUAL:
+                distance = near_dupe(slug, fn, base)
+                if distance is not None:
+                    to_remove.append(fn)
+                    reason[fn] = f'near dupe, distance {distance}'
     
     if not to_remove:
         total_kept += len(suffix_files)
@@ -77,7 +105,7 @@ for doc in all_storages:
         
         base = pattern.sub('', fn)
         total_removed += 1
-        print(f'  [REMOVED] {slug}/{fn} (exact dupe of {base})')
+        print(f'  [REMOVED] {slug}/{fn} ({reason[fn]} of {base})')
     
     # Update count
     updated = db.dish_storage.find_one({'slug': slug}, {'_id': 0, 'images': 1})
@@ -89,7 +117,7 @@ total_images = sum(len(d.get('images', [])) for d in db.dish_storage.find({}, {'
 
 print(f'\n===== RESULTADO =====')
 print(f'Pratos limpos: {dishes_cleaned}')
-print(f'Duplicatas exatas removidas: {total_removed}')
+print(f'Duplicatas removidas: {total_removed}' + (' (inclui quase-identicas)' if PERCEPTUAL else ''))
 print(f'Burst photos mantidas: {total_kept}')
 print(f'Total imagens restantes: {total_images}')
 
@@ -12,6 +12,7 @@ from dotenv import load_dotenv
 load_dotenv("/app/backend/.env")
 
 from services.nutrition_3sources import generate_nutrition_3sources, DISH_USDA_QUERY, DISH_OFF_CATEGORY
+from services.norm_key_service import with_norm_keys
 from pymongo import MongoClient
 
 # Mapeamentos USDA para os novos pratos
@@ -107,7 +108,7 @@ async def main():
         # Salvar no MongoDB - APENAS este prato (upsert por nome)
         db.nutrition_sheets.update_one(
             {"nome": nome},
-            {"$set": sheet},
+            {"$set": with_norm_keys("nutrition_sheets", sheet)},
             upsert=True
         )
         
@@ -13,6 +13,7 @@ from dotenv import load_dotenv
 load_dotenv('/app/backend/.env')
 
 from services.r2_service import r2_upload_image
+from services.image_service import normalize_slug
 import pymongo
 
 SLUG = "cocada"
@@ -70,7 +71,8 @@ def main():
             {
                 "$push": {"images": image_entry},
                 "$inc": {"count": 1},
-                "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
+                "$set": {"updated_at": datetime.now(timezone.utc).isoformat(),
+                         "slug_norm": normalize_slug(SLUG)}
             },
             upsert=True
         )
@@ -59,9 +59,15 @@ logger = logging.getLogger(__name__)
 import re
 import unicodedata
 
-def _norm_nome(nome: str) -> str:
-    """Remove acentos do nome para lookup robusto (teclado mobile adiciona acento automaticamente)."""
-    return unicodedata.normalize('NFD', nome or '').encode('ascii', 'ignore').decode('ascii').strip()
+# Regras de nome normalizado (lookup indexado por *_norm, sem $regex)
+from services.norm_key_service import (  # noqa: E402
+    strip_accents_nome as _norm_nome,
+    canonize_input as _canonize_input,
+    norm_filter as _norm_filter,
+    with_norm_keys as _with_norm_keys,
+)
+# Catalogo de pratos da policy (memoria): edicoes de prato invalidam o slug
+from ai.policy import invalidate_dish_catalog  # noqa: E402
 
 # ═══════════════════════════════════════════════════════
 # DEPLOY VERSION MARKERS — atualizar a cada nova fase para
@@ -310,14 +316,12 @@ async def get_setting(key: str):
     except Exception:
         return False
 
-def save_processing_metrics(data: dict):
-    """Salva métricas de processamento no banco"""
-    try:
-        import asyncio
-        loop = asyncio.get_event_loop()
-        loop.create_task(db.processing_metrics.insert_one(data))
-    except Exception:
-        pass
+async def record_processing_metrics(total_ms: float, engine: str, dish_name: str = "", score: float = 0.0):
+    """Registra o identify nas métricas em memória (histograma + contador por engine).
+    Entrada por prato no relatório admin somente com ENABLE_PROCESSING_METRICS."""
+    from services.metrics_service import metrics
+    keep_entry = bool(await get_setting("ENABLE_PROCESSING_METRICS"))
+    metrics.record_identify(total_ms, engine, dish_name, score, keep_entry=keep_entry)
 
 # CORS
 app.add_middleware(
@@ -455,8 +459,11 @@ async def health():
 # ═══════════════════════════════════════════════════════
 _WARMED_UP = False
 _WARMUP_MS = None
-# Semaforo: ate 2 identify ONNX simultaneos (fila natural, sem rejeicao)
-_identify_semaphore = asyncio.Semaphore(2)
+# Semaforo: identify ONNX simultaneos (fila natural, sem rejeicao).
+# 2 no modo serial; o startup redimensiona depois do preload_model() quando o
+# micro-batcher realmente sobe (ver ai/embedder.py).
+from ai.embedder import get_identify_concurrency
+_identify_semaphore = asyncio.Semaphore(get_identify_concurrency())
 # Contador global de scans (para log de diagnóstico)
 _ROOT_SCAN_COUNTER = 0
 # Cache por nome do prato (pós-ONNX): evita MongoDB para pratos já identificados
@@ -606,22 +613,6 @@ async def ai_status():
         )
 
 
-def _canonize_input(s: str) -> str:
-    """Canonização read-side da string que chega da IA / usuário.
-    Espelha as regras da Fase 1 sem alterar dados; usado APENAS para query.
-    Regras: strip_accents -> lower -> remove ( ) / , -  -> colapsar espaços.
-    """
-    import unicodedata, re as _re
-    if not s:
-        return ""
-    x = "".join(ch for ch in unicodedata.normalize("NFD", str(s)) if unicodedata.category(ch) != "Mn")
-    x = x.lower()
-    for ch in "()/,-":
-        x = x.replace(ch, " ")
-    x = _re.sub(r"\s+", " ", x).strip()
-    return x
-
-
 async def lookup_nutrition_sheet(dish_display: str) -> dict:
     """
     Busca ficha nutricional precisa na colecao nutrition_sheets.
@@ -655,7 +646,7 @@ async def lookup_nutrition_sheet(dish_display: str) -> dict:
                     {"nome": dish_display},
                     {"slug": dish_display},
                     {"nomes_alternativos": dish_display},
-                    {"nome": {"$regex": f"^{dish_display}$", "$options": "i"}}
+                    _norm_filter("nutrition_sheets", dish_display),
                 ]},
                 {"_id": 0}
             )
@@ -753,6 +744,78 @@ async def clear_ai_cache():
         return {"ok": False, "error": str(e)}
 
 
+@api_router.post("/ai/identify-batch", dependencies=[Depends(verify_admin_key)])
+async def identify_batch(
+    files: List[UploadFile] = File(...),
+    confusion: bool = Form(False),
+    top_k: int = Form(5)
+):
+    """
+    Identificação em lote para QA do dataset (admin).
+    Aceita várias imagens e/ou ZIPs; embeddings em blocos ONNX, analyze_result por
+    imagem e resposta NDJSON em streaming (1 linha por imagem, na ordem).
+    confusion=true: última linha traz a matriz esperado x previsto, com o prato
+    esperado tirado do caminho/arquivo (ver services/batch_identify_service.py).
+    """
+    from fastapi.responses import StreamingResponse
+    from ai.index import get_index
+    from ai.policy import analyze_result
+    from services.batch_identify_service import ConfusionMatrix, expand_uploads, expected_dish_from_name
+    import zipfile
+
+    index = get_index()
+    if not index.is_ready():
+        return JSONResponse(status_code=503, content={"ok": False, "error": "Indice nao carregado"})
+    try:
+        uploads = [(f.filename, await f.read()) for f in files]
+        images = await asyncio.to_thread(expand_uploads, uploads)
+    except (ValueError, zipfile.BadZipFile) as e:
+        return JSONResponse(status_code=400, content={"ok": False, "error": str(e)})
+    del uploads
+    top_k = max(1, min(top_k, 10))
+    chunk = 16
+
+    async def stream():
+        matrix = ConfusionMatrix() if confusion else None
+        t_start = time.perf_counter()
+        for start in range(0, len(images), chunk):
+            part = images[start:start + chunk]
+            t0 = time.perf_counter()
+            # Mesmo semaforo do /ai/identify: o lote nao monopoliza o ONNX
+            async with _identify_semaphore:
+                searches = await asyncio.to_thread(index.search_batch, [data for _, data in part], top_k)
+            decisions = await asyncio.to_thread(lambda: [analyze_result(r) for r in searches])
+            ms_each = (time.perf_counter() - t0) * 1000 / len(part)
+            for i, ((name, _), results, decision) in enumerate(zip(part, searches, decisions)):
+                expected = expected_dish_from_name(name)
+                line = {
+                    "type": "result",
+                    "index": start + i,
+                    "file": name,
+                    "expected": expected,
+                    "identified": decision.get("identified", False),
+                    "dish": decision.get("dish"),
+                    "dish_display": decision.get("dish_display"),
+                    "confidence": decision.get("confidence"),
+                    "score": decision.get("score", 0.0),
+                    "alternatives": decision.get("alternatives", []),
+                    "top": [{"dish": r["dish"], "score": r["score"]} for r in results if "dish" in r],
+                    "ms": round(ms_each, 1),
+                }
+                if results and "error" in results[0]:
+                    line["error"] = results[0]["error"]
+                if matrix is not None:
+                    matrix.add(expected, decision.get("dish"), decision.get("identified", False))
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+        summary = {"type": "summary", "images": len(images),
+                   "elapsed_ms": round((time.perf_counter() - t_start) * 1000, 1)}
+        if matrix is not None:
+            summary["confusion"] = matrix.summary()
+        yield json.dumps(summary, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
 @api_router.post("/ai/reindex")
 async def reindex(max_per_dish: int = 10):
     """Reconstroi o indice de embeddings."""
@@ -763,11 +826,15 @@ async def reindex(max_per_dish: int = 10):
         stats = index.build_index(max_per_dish=max_per_dish)
         if 'error' in stats:
             return JSONResponse(status_code=400, content={"ok": False, "error": stats['error']})
+        # Indice de hash do fast path acompanha o dataset reindexado
+        from ai.hash_index import rebuild_hash_index
+        hash_index = await asyncio.to_thread(rebuild_hash_index)
         return {
             "ok": True,
             "total_dishes": stats['total_dishes'],
             "total_images": stats['total_images'],
             "elapsed_seconds": stats['elapsed_seconds'],
+            "total_hashes": hash_index.total_hashes,
             "message": f"Indice reconstruido com {stats['total_dishes']} pratos"
         }
     except Exception as e:
@@ -776,24 +843,29 @@ async def reindex(max_per_dish: int = 10):
 
 
 @api_router.post("/ai/reindex-background")
-async def reindex_background(max_per_dish: int = 10):
-    """Inicia reconstrucao do indice em BACKGROUND."""
+async def reindex_background(max_per_dish: int = 10, workers: int = 0):
+    """Inicia reconstrucao do indice em BACKGROUND.
+    
+    workers > 1 usa o builder paralelo (ai/parallel_build.py); 0 = SOULNUTRI_BUILD_WORKERS.
+    """
     import subprocess
+    from ai.parallel_build import PROGRESS_FILE
     try:
         log_file = "/tmp/rebuild_index.log"
         status_file = "/tmp/rebuild_index_status.json"
-        if os.path.exists(log_file):
-            os.remove(log_file)
-        if os.path.exists(status_file):
-            os.remove(status_file)
+        for old_file in (log_file, status_file, PROGRESS_FILE):
+            if os.path.exists(old_file):
+                os.remove(old_file)
         script_path = "/app/backend/rebuild_index.py"
-        cmd = f"cd /app/backend && /root/.venv/bin/python {script_path} {max_per_dish} &"
+        worker_arg = f" {int(workers)}" if workers > 0 else ""
+        cmd = f"cd /app/backend && /root/.venv/bin/python {script_path} {int(max_per_dish)}{worker_arg} &"
         subprocess.Popen(cmd, shell=True)
         logger.info(f"[REINDEX-BG] Iniciado em background com max_per_dish={max_per_dish}")
         return {
             "ok": True,
             "message": "Reconstrucao iniciada em background",
-            "max_per_dish": max_per_dish
+            "max_per_dish": max_per_dish,
+            "workers": workers
         }
     except Exception as e:
         logger.error(f"Erro ao iniciar reindexacao em background: {e}")
@@ -815,6 +887,12 @@ async def reindex_status():
         "status_file": status_file
     }
     
+    # Progresso estruturado do builder (pratos, imagens/s, ETA)
+    from ai.parallel_build import read_progress
+    progress = read_progress()
+    if progress:
+        result["progress"] = progress
+    
     # Verificar se existe arquivo de status (conclusao)
     if os.path.exists(status_file):
         try:
@@ -844,6 +922,39 @@ async def reindex_status():
     return result
 
 
+def _hash_index_incremental(op: str, *args) -> int:
+    """Mesma operacao no indice de hash carregado (fast path do identify)."""
+    from ai.hash_index import loaded_hash_index
+    hash_index = loaded_hash_index()
+    if hash_index is None:
+        return 0
+    if op == "add_images":
+        dish, images, filenames = args
+        return sum(hash_index.add_image(dish, name, data) for data, name in zip(images, filenames)
+                   if isinstance(data, bytes) and name)
+    return getattr(hash_index, op)(*args)
+
+
+async def _index_incremental(op: str, *args) -> int:
+    """Aplica add_images/remove_image/rename_dish no DishIndex (e no indice de hash)
+    sem reindex completo.
+    
+    A foto/prato ja foi salvo no storage; falha aqui so atrasa o reconhecimento
+    ate o proximo /ai/reindex, entao nunca propaga a excecao.
+    """
+    try:
+        await asyncio.to_thread(_hash_index_incremental, op, *args)
+    except Exception as e:
+        logger.warning(f"[INDEX] Atualizacao incremental '{op}' do indice de hash falhou: {e}")
+    try:
+        from ai.index import get_index
+        index = get_index()
+        return await asyncio.to_thread(getattr(index, op), *args)
+    except Exception as e:
+        logger.warning(f"[INDEX] Atualizacao incremental '{op}' falhou: {e}")
+        return 0
+
+
 @api_router.post("/ai/add-to-index")
 async def add_to_index(
     file: UploadFile = File(...),
@@ -882,8 +993,9 @@ async def add_to_index(
         save_dish_image(dish_slug, filename, content)
         
         existing_images = get_dish_image_count(dish_slug)
+        indexed = await _index_incremental("add_images", dish_slug, [content], [filename])
         
-        logger.info(f"[ADD-INDEX] Foto adicionada: {dish_name} ({existing_images} fotos)")
+        logger.info(f"[ADD-INDEX] Foto adicionada: {dish_name} ({existing_images} fotos, indexada={bool(indexed)})")
         
         return {
             "ok": True,
@@ -893,7 +1005,9 @@ async def add_to_index(
             "total_images": existing_images,
             "weight_grams": weight_grams,
             "message": f"Foto adicionada! {dish_name} agora tem {existing_images} foto(s).",
-            "nota": "Execute /api/ai/reindex para atualizar o indice e ter reconhecimento em ~200ms"
+            "indexed": bool(indexed),
+            "nota": ("Foto ja disponivel para reconhecimento" if indexed
+                     else "Execute /api/ai/reindex para atualizar o indice e ter reconhecimento em ~200ms")
         }
         
     except Exception as e:
@@ -977,6 +1091,7 @@ async def identify_image(
     _ROOT_SCAN_COUNTER += 1
     _diag_on = os.environ.get("IDENTIFY_DEBUG_LOGS", "false").lower() == "true"
     _req_id = request.headers.get("X-Request-ID") or f"srv-{_ROOT_SCAN_COUNTER}-{int(time.time()*1000)}"
+    _flight = None  # single-flight (lider publica o resultado para uploads identicos simultaneos)
     logger.info(f"[IDENTIFY_START] scan_id={_ROOT_SCAN_COUNTER} ts={time.strftime('%H:%M:%S')}")
     if _diag_on:
         logger.info(
@@ -986,11 +1101,13 @@ async def identify_image(
             f"filename={file.filename!r} file_content_type={file.content_type!r}"
         )
 
+    from services.metrics_service import metrics
     try:
         # Ler imagem
         t0 = time.perf_counter()
         content = await file.read()
         t_upload = (time.perf_counter() - t0) * 1000
+        metrics.observe("upload_read", t_upload)
         logger.info(f"[TIMING] Upload/Read: {t_upload:.0f}ms ({len(content)//1024}KB)")
         
         if len(content) == 0:
@@ -1034,31 +1151,36 @@ async def identify_image(
         # ═══════════════════════════════════════════════════════════════════════
         # CACHE: Verificar se ja identificamos esta imagem antes
         # ═══════════════════════════════════════════════════════════════════════
-        from services.cache_service import get_cached_result, cache_result
-        cached = get_cached_result(content, restaurant=restaurant or '')
+        from services.cache_service import get_cached_result, cache_result, get_image_hash
+        from services.singleflight import identify_flights
+        with metrics.timer("cache_lookup"):
+            cached = get_cached_result(content, restaurant=restaurant or '')
+        if not cached:
+            # SINGLE-FLIGHT: upload identico em andamento -> aguarda o resultado do lider
+            _flight = identify_flights.join(get_image_hash(content, restaurant or ''))
+            if not _flight.leader:
+                shared = await _flight.wait()
+                _flight = None  # sem resultado do lider: segue sozinho, sem publicar
+                if shared:
+                    cached = dict(shared)
+                    cached['source'] = shared.get('source', 'unknown') + '_coalesced'
+                    cached['coalesced'] = True
         if cached:
             elapsed_ms = (time.time() - start_time) * 1000
             cached['search_time_ms'] = round(elapsed_ms, 2)
             logger.info(f"[CACHE] ⚡ Resposta do cache em {elapsed_ms:.0f}ms")
             logger.info(f"[IDENTIFY_DIAG] source=cache dish={cached.get('dish_display')} score={cached.get('score')}")
-            if await get_setting("ENABLE_PROCESSING_METRICS"):
-                total_ms = (time.perf_counter() - perf_start) * 1000
-                source = cached.get('source', '')
-                engine = "GEMINI" if source == 'gemini_flash' else "CLIP"
-                save_processing_metrics({
-                    "timestamp": datetime.now().isoformat(),
-                    "processing_time_ms": round(total_ms, 2),
-                    "dish_name": cached.get('dish_display', ''),
-                    "confidence_score": cached.get('score', 0),
-                    "engine_used": f"{engine} (cache)"
-                })
+            engine = "GEMINI" if cached.get('source', '').startswith('gemini_flash') else "CLIP"
+            await record_processing_metrics((time.perf_counter() - perf_start) * 1000, f"{engine} (cache)",
+                                            cached.get('dish_display', ''), cached.get('score', 0))
             # FASE 2A — Hard Gate pos-cache: cache pode ter sido populado por scan Premium
             _cache_is_premium = False
             if pin and nome:
                 try:
                     from services.profile_service import hash_pin, verificar_premium_ativo
                     _ph = hash_pin(pin)
-                    _u = await db.users.find_one({"pin_hash": _ph, "nome": {"$regex": f"^\\s*{_norm_nome(nome)}\\s*$", "$options": "i"}}, {"_id": 0})
+                    with metrics.timer("mongo"):
+                        _u = await db.users.find_one(_norm_filter("users", nome, pin_hash=_ph), {"_id": 0})
                     _cache_is_premium = verificar_premium_ativo(_u)["ativo"] if _u else False
                 except Exception as _e:
                     logger.warning(f"[PREMIUM_GATE] erro check cache: {_e}")
@@ -1107,13 +1229,41 @@ async def identify_image(
             index = get_index()
             
             if index.is_ready():
-                t_clip = time.perf_counter()
-                # CRITICO: ONNX bloqueia o event loop — usar semaforo + to_thread
-                async with _identify_semaphore:
-                    logger.info(f"[IDENTIFY] ONNX adquiriu semaforo ts={time.strftime('%H:%M:%S')}")
-                    results = await asyncio.to_thread(index.search, content, 5)
-                t_clip_ms = (time.perf_counter() - t_clip) * 1000
-                logger.info(f"[TIMING] CLIP search total: {t_clip_ms:.0f}ms")
+                # Fast path: foto quase identica a uma do dataset (pHash/dHash) dispensa o CLIP
+                results = None
+                hash_match = None
+                from ai.hash_index import HASH_FAST_PATH_ENABLED, loaded_hash_index
+                hash_index = loaded_hash_index() if HASH_FAST_PATH_ENABLED else None
+                if hash_index is not None and hash_index.is_ready():
+                    t_hash = time.perf_counter()
+                    hash_match = await asyncio.to_thread(hash_index.lookup, content)
+                    # Foto movida/removida desde o ultimo rebuild (outro worker, script): vai para o CLIP
+                    if hash_match and not await asyncio.to_thread(hash_index.is_current, hash_match):
+                        logger.info(f"[hash] Match desatualizado ignorado: {hash_match['slug']}/{hash_match['file']}")
+                        hash_match = None
+                    if hash_match:
+                        # So o slug exato do indice: nada de match parcial/nome de exibicao,
+                        # que poderia atribuir a foto a outro prato com confianca "alta"
+                        results = index.direct_match(hash_match['slug'], exact=True)
+                        if not results:
+                            logger.info(f"[hash] Slug fora do indice, segue para o CLIP: {hash_match['slug']}")
+                        for r in results:
+                            r['source'] = 'hash_index'
+                            r['hash_distance'] = hash_match['distance']
+                    t_hash_ms = (time.perf_counter() - t_hash) * 1000
+                    metrics.observe("hash_lookup", t_hash_ms)
+                    logger.info(f"[TIMING] Hash lookup: {t_hash_ms:.0f}ms "
+                                f"match={hash_match['slug'] if hash_match else None}")
+
+                if not results:
+                    hash_match = None
+                    t_clip = time.perf_counter()
+                    # CRITICO: ONNX bloqueia o event loop — usar semaforo + to_thread
+                    async with _identify_semaphore:
+                        logger.info(f"[IDENTIFY] ONNX adquiriu semaforo ts={time.strftime('%H:%M:%S')}")
+                        results = await asyncio.to_thread(index.search, content, 5)
+                    t_clip_ms = (time.perf_counter() - t_clip) * 1000
+                    logger.info(f"[TIMING] CLIP search total: {t_clip_ms:.0f}ms")
 
                 # ── [IDENTIFY_DIAG] top_5 real + gap ────────────────────────────
                 if results:
@@ -1126,13 +1276,17 @@ async def identify_image(
                     logger.info(f"[IDENTIFY_DIAG] gap_top1_top2={_gap:.4f} source=local_index")
                 # ────────────────────────────────────────────────────────────────
 
-                clip_decision = await asyncio.to_thread(analyze_result, results)
+                with metrics.timer("policy"):
+                    clip_decision = await asyncio.to_thread(analyze_result, results)
                 clip_score = clip_decision.get('score', 0.0)
                 
                 logger.info(f"[CIBI SANA | CLIP] {clip_decision.get('dish_display', 'N/A')} - Score: {clip_score:.2%}")
                 
                 decision = clip_decision
                 decision["source"] = "local_index"
+                if hash_match:
+                    decision["source"] = "hash_index"
+                    decision["hash_distance"] = hash_match["distance"]
 
                 # 🔴 GARANTIR CATEGORY NO FLUXO LOCAL (CIBI SANA)
 
@@ -1222,10 +1376,11 @@ async def identify_image(
             if pin and nome:
                 from services.profile_service import hash_pin
                 pin_hash = hash_pin(pin)
-                flash_profile = await db.users.find_one(
-                    {"pin_hash": pin_hash, "nome": {"$regex": f"^\\s*{_norm_nome(nome)}\\s*$", "$options": "i"}},
-                    {"_id": 0}
-                )
+                with metrics.timer("mongo"):
+                    flash_profile = await db.users.find_one(
+                        _norm_filter("users", nome, pin_hash=pin_hash),
+                        {"_id": 0}
+                    )
             
             flash_result = await identify_dish_gemini_flash(content, flash_profile, restaurant=restaurant, request_id=_req_id if _diag_on else None)
             
@@ -1342,7 +1497,7 @@ async def identify_image(
 
                 parallel = {
                     'dish': db.dishes.find_one(
-                        {"$or": [{"slug": slug}, {"name": {"$regex": f"^{dish_display_name}$", "$options": "i"}}]},
+                        {"$or": [{"slug": slug}, _norm_filter("dishes", dish_display_name)]},
                         {"_id": 0, "ingredients": 1, "ingredientes": 1, "category": 1}
                     ),
                     'nutrition': lookup_nutrition_sheet(dish_display_name)
@@ -1382,10 +1537,11 @@ async def identify_image(
             if pin and nome:
                 from services.profile_service import hash_pin, verificar_premium_ativo
                 pin_hash = hash_pin(pin)
-                user_profile = await db.users.find_one(
-                    {"pin_hash": pin_hash, "nome": {"$regex": f"^\\s*{_norm_nome(nome)}\\s*$", "$options": "i"}},
-                    {"_id": 0}
-                )
+                with metrics.timer("mongo"):
+                    user_profile = await db.users.find_one(
+                        _norm_filter("users", nome, pin_hash=pin_hash),
+                        {"_id": 0}
+                    )
                 _premium_status = verificar_premium_ativo(user_profile) if user_profile else {"ativo": False}
                 is_premium = _premium_status.get("ativo", False)
                 if not is_premium and user_profile:
@@ -1418,13 +1574,14 @@ async def identify_image(
                 from services.profile_service import hash_pin
                 pin_hash = hash_pin(pin)
                 parallel_tasks['user'] = db.users.find_one(
-                    {"pin_hash": pin_hash, "nome": {"$regex": f"^\\s*{_norm_nome(nome)}\\s*$", "$options": "i"}},
+                    _norm_filter("users", nome, pin_hash=pin_hash),
                     {"_id": 0}
                 )
             
             if parallel_tasks:
                 task_keys = list(parallel_tasks.keys())
-                results = await asyncio.gather(*parallel_tasks.values(), return_exceptions=True)
+                with metrics.timer("mongo"):
+                    results = await asyncio.gather(*parallel_tasks.values(), return_exceptions=True)
                 resolved = dict(zip(task_keys, results))
             else:
                 resolved = {}
@@ -1499,17 +1656,19 @@ async def identify_image(
                     .lower()
                     .strip()
                 )
-                dish_doc = await db.dishes.find_one(
-                    {"slug": dish_slug_norm},
-                    {"_id": 0, "family": 1}
-                )
+                with metrics.timer("mongo"):
+                    dish_doc = await db.dishes.find_one(
+                        {"slug": dish_slug_norm},
+                        {"_id": 0, "family": 1}
+                    )
                 family_tag = dish_doc.get("family") if dish_doc else None
                 if family_tag:
                     family_slug = family_tag.lower().strip()
-                    family_doc = await db.dish_families.find_one(
-                        {"slug": family_slug},
-                        {"_id": 0}
-                    )
+                    with metrics.timer("mongo"):
+                        family_doc = await db.dish_families.find_one(
+                            {"slug": family_slug},
+                            {"_id": 0}
+                        )
                     if family_doc:
                         decision["family_name"] = family_doc.get("name")
                         decision["family_slug"] = family_doc.get("slug")
@@ -1626,6 +1785,8 @@ async def identify_image(
         # CACHE: Salvar resultado COMPLETO (versao Premium); strip pos-cache filtra.
         if response_data.get('identified'):
             cache_result(content, response_data, restaurant=restaurant or '', ttl_seconds=3600)
+            if _flight is not None:
+                _flight.finish(dict(response_data))
 
         # FASE 2A — Strip Premium para requests Free / trial expirado
         if not is_premium:
@@ -1641,17 +1802,9 @@ async def identify_image(
         # ═══════════════════════════════════════════════════════════════════════
         # MÉTRICAS DE PROCESSAMENTO (condicional)
         # ═══════════════════════════════════════════════════════════════════════
-        if await get_setting("ENABLE_PROCESSING_METRICS"):
-            total_ms = (time.perf_counter() - perf_start) * 1000
-            source = response_data.get('source', '')
-            engine = "GEMINI" if source == 'gemini_flash' else "CLIP"
-            save_processing_metrics({
-                "timestamp": datetime.now().isoformat(),
-                "processing_time_ms": round(total_ms, 2),
-                "dish_name": response_data.get('dish_display', ''),
-                "confidence_score": response_data.get('score', 0),
-                "engine_used": engine
-            })
+        engine = "GEMINI" if response_data.get('source', '') == 'gemini_flash' else "CLIP"
+        await record_processing_metrics((time.perf_counter() - perf_start) * 1000, engine,
+                                        response_data.get('dish_display', ''), response_data.get('score', 0))
         
         if _diag_on:
             _total_ms = (time.perf_counter() - perf_start) * 1000
@@ -1680,6 +1833,10 @@ async def identify_image(
             "alternatives": [],
             "search_time_ms": round(elapsed_ms, 2)
         })
+    finally:
+        # Lider que nao publicou (erro, nao identificado, fast-path): seguidores seguem sozinhos
+        if _flight is not None:
+            _flight.finish(None)
 
 
 
@@ -1723,14 +1880,24 @@ async def enrich_dish(request: Request):
         logger.info(f"[ENRICH_START] nome='{nome}' ts={time.strftime('%H:%M:%S')}")
         logger.info(f"[Enrich] Chamando enrich + alertas + nutrition em paralelo para '{nome}'")
         
-        enrich_task = enrich_dish_gemini(nome, ingredientes)
+        # Gemini + ficha nutricional nao dependem do usuario: coalescidos por nome do prato
+        # (varios Premium escaneando o mesmo prato = 1 chamada). Alertas sao por usuario.
+        from services.singleflight import enrich_flights
+
+        async def _shared_enrich():
+            return await _asyncio.gather(
+                enrich_dish_gemini(nome, ingredientes), lookup_nutrition_sheet(nome), return_exceptions=True
+            )
+
+        async def _enrich_and_sheet():
+            return tuple(await enrich_flights.do(_norm_nome(nome).lower(), _shared_enrich))
+
         alert_task = generate_food_alert(nome, ingredientes, db=db, user_nome=user_nome)
-        nutrition_task = lookup_nutrition_sheet(nome)
 
         try:
-            enrichment, alert_data, nutrition_sheet = await _asyncio.wait_for(
+            shared, alert_data = await _asyncio.wait_for(
                 _asyncio.gather(
-                    enrich_task, alert_task, nutrition_task, return_exceptions=True
+                    _enrich_and_sheet(), alert_task, return_exceptions=True
                 ),
                 timeout=20.0
             )
@@ -1742,6 +1909,7 @@ async def enrich_dish(request: Request):
             )
         
         # Tratar exceções do gather
+        enrichment, nutrition_sheet = (shared, shared) if isinstance(shared, Exception) else shared
         if isinstance(enrichment, Exception):
             logger.warning(f"[Enrich] Gemini erro: {enrichment}")
             enrichment = {}
@@ -1865,15 +2033,8 @@ async def identify_with_ai(
                 "creditos_usados": True,
                 "message": "Identificado com IA (creditos consumidos)"
             }
-            if await get_setting("ENABLE_PROCESSING_METRICS"):
-                total_ms = (time.time() - start_time) * 1000
-                save_processing_metrics({
-                    "timestamp": datetime.now().isoformat(),
-                    "processing_time_ms": round(total_ms, 2),
-                    "dish_name": response.get('dish_display', ''),
-                    "confidence_score": response.get('score', 0),
-                    "engine_used": "GEMINI"
-                })
+            await record_processing_metrics((time.time() - start_time) * 1000, "GEMINI",
+                                            response.get('dish_display', ''), response.get('score', 0))
             return response
         else:
             return {
@@ -1907,8 +2068,8 @@ async def revisar_prato_com_taco(request: Request):
         if not ingredientes:
             return {"ok": False, "error": "Ingredientes sao obrigatorios"}
         
-        # Calcular nutricao baseada nos ingredientes
-        nutricao = calcular_nutricao_prato(ingredientes, 100)  # por 100g
+        # Calcular nutricao baseada nos ingredientes (fallback USDA sincrono: fora do event loop)
+        nutricao = await asyncio.to_thread(calcular_nutricao_prato, ingredientes, 100)  # por 100g
         
         # Detectar categoria baseada nos ingredientes
         ing_texto = ' '.join(ingredientes).lower()
@@ -2204,7 +2365,7 @@ Responda APENAS JSON valido."""
                 dish_info['slug'] = slug
                 await db.dishes.update_one(
                     {"slug": slug},
-                    {"$set": dish_info},
+                    {"$set": _with_norm_keys("dishes", dish_info)},
                     upsert=True
                 )
                 
@@ -2530,7 +2691,7 @@ async def identify_with_gemini_flash(
             from services.profile_service import hash_pin
             pin_hash = hash_pin(pin)
             user_profile = await db.users.find_one(
-                {"pin_hash": pin_hash, "nome": {"$regex": f"^\\s*{_norm_nome(nome)}\\s*$", "$options": "i"}},
+                _norm_filter("users", nome, pin_hash=pin_hash),
                 {"_id": 0}
             )
         
@@ -2542,14 +2703,7 @@ async def identify_with_gemini_flash(
         
         if result.get("ok"):
             logger.info(f"[Gemini Flash] ✅ {result.get('nome')} em {elapsed_ms:.0f}ms")
-            if await get_setting("ENABLE_PROCESSING_METRICS"):
-                save_processing_metrics({
-                    "timestamp": datetime.now().isoformat(),
-                    "processing_time_ms": round(elapsed_ms, 2),
-                    "dish_name": result.get('nome', ''),
-                    "confidence_score": result.get('score', 0),
-                    "engine_used": "GEMINI"
-                })
+            await record_processing_metrics(elapsed_ms, "GEMINI", result.get('nome', ''), result.get('score', 0))
         else:
             logger.warning(f"[Gemini Flash] ❌ Erro: {result.get('error')}")
         
@@ -2578,11 +2732,12 @@ async def google_quota_status():
     Útil para saber quando a cota gratuita foi renovada.
     """
     import time
-    from google import genai
+    from services.gemini_gateway import get_gemini_gateway
     
     google_key = os.environ.get('GOOGLE_API_KEY')
+    gateway = get_gemini_gateway()
     
-    if not google_key:
+    if not google_key or gateway is None:
         return {
             "ok": False,
             "google_api_available": False,
@@ -2591,13 +2746,8 @@ async def google_quota_status():
         }
     
     try:
-        client = genai.Client(api_key=google_key)
-        
         start = time.time()
-        response = client.models.generate_content(
-            model='gemini-2.0-flash-lite',
-            contents='Diga apenas: OK'
-        )
+        await gateway.generate('gemini-2.0-flash-lite', 'Diga apenas: OK')
         elapsed_ms = (time.time() - start) * 1000
         
         return {
@@ -2718,7 +2868,7 @@ async def create_new_dish(
                     # Salvar no MongoDB
                     await db.dishes.update_one(
                         {"slug": existing_match},
-                        {"$set": updated_info},
+                        {"$set": _with_norm_keys("dishes", updated_info)},
                         upsert=True
                     )
                     
@@ -2763,7 +2913,7 @@ async def create_new_dish(
         # Salvar no MongoDB
         await db.dishes.update_one(
             {"slug": slug},
-            {"$set": dish_info},
+            {"$set": _with_norm_keys("dishes", dish_info)},
             upsert=True
         )
         
@@ -2847,6 +2997,7 @@ async def create_dish_local(
             
             # Usar local_dish_updater para preencher dados faltantes
             result = atualizar_prato_local(existing_match, novo_nome=dish_name.strip())
+            invalidate_dish_catalog(existing_match)
             
             return {
                 "ok": True,
@@ -2905,7 +3056,7 @@ async def create_dish_local(
         # Salvar no MongoDB em vez de dish_info.json local
         await db.dishes.update_one(
             {"slug": slug},
-            {"$set": dish_info},
+            {"$set": _with_norm_keys("dishes", dish_info)},
             upsert=True
         )
         
@@ -3153,114 +3304,17 @@ async def delete_calibration_sample(sample_id: str):
 @api_router.get("/ai/calibration")
 async def get_calibration_data():
     """
-    Retorna dados de calibracao da colecao calibration_log.
-    Estatisticas, distribuicao de scores e calculo de Youden's J.
+    Retorna dados de calibracao da colecao calibration_log (colecao inteira, lida em blocos).
+    Estatisticas, distribuicao de scores, curva ROC, Youden's J, precisao/recall
+    por prato e thresholds propostos por prato/familia (services/calibration_service.py).
     """
     try:
-        # Buscar todas as amostras
-        pipeline_samples = [
-            {"$project": {
-                "_id": {"$toString": "$_id"},
-                "dish_clip": 1,
-                "dish_real": 1,
-                "is_correct": 1,
-                "score": 1,
-                "confidence": 1,
-                "source": 1,
-                "created_at": 1
-            }},
-            {"$sort": {"created_at": -1}}
-        ]
-        samples = await db.calibration_log.aggregate(pipeline_samples).to_list(1000)
-        
-        # Estatisticas gerais
-        total = len(samples)
-        correct_samples = [s for s in samples if s.get('is_correct')]
-        incorrect_samples = [s for s in samples if not s.get('is_correct')]
+        from services.calibration_service import load_calibration, analyze
+        from ai import policy
         
-        correct_scores = [s['score'] for s in correct_samples if s.get('score', 0) > 0]
-        incorrect_scores = [s['score'] for s in incorrect_samples if s.get('score', 0) > 0]
-        
-        stats = {
-            "total_samples": total,
-            "correct_count": len(correct_samples),
-            "incorrect_count": len(incorrect_samples),
-            "correct_scores": {
-                "min": round(min(correct_scores), 4) if correct_scores else None,
-                "max": round(max(correct_scores), 4) if correct_scores else None,
-                "avg": round(sum(correct_scores) / len(correct_scores), 4) if correct_scores else None,
-                "median": round(sorted(correct_scores)[len(correct_scores)//2], 4) if correct_scores else None
-            },
-            "incorrect_scores": {
-                "min": round(min(incorrect_scores), 4) if incorrect_scores else None,
-                "max": round(max(incorrect_scores), 4) if incorrect_scores else None,
-                "avg": round(sum(incorrect_scores) / len(incorrect_scores), 4) if incorrect_scores else None,
-                "median": round(sorted(incorrect_scores)[len(incorrect_scores)//2], 4) if incorrect_scores else None
-            }
-        }
-        
-        # Calculo de Youden's J para threshold otimo
-        youden_result = None
-        if len(correct_scores) >= 5 and len(incorrect_scores) >= 5:
-            all_scores = correct_scores + incorrect_scores
-            thresholds = sorted(set([round(s, 2) for s in all_scores]))
-            
-            best_j = -1
-            best_threshold = 0.85
-            best_sensitivity = 0
-            best_specificity = 0
-            
-            for t in thresholds:
-                # Sensibilidade: % corretos aceitos (score >= t)
-                tp = sum(1 for s in correct_scores if s >= t)
-                sensitivity = tp / len(correct_scores) if correct_scores else 0
-                
-                # Especificidade: % incorretos rejeitados (score < t)
-                tn = sum(1 for s in incorrect_scores if s < t)
-                specificity = tn / len(incorrect_scores) if incorrect_scores else 0
-                
-                j = sensitivity + specificity - 1
-                if j > best_j:
-                    best_j = j
-                    best_threshold = t
-                    best_sensitivity = sensitivity
-                    best_specificity = specificity
-            
-            youden_result = {
-                "optimal_threshold": round(best_threshold, 4),
-                "j_index": round(best_j, 4),
-                "sensitivity": round(best_sensitivity, 4),
-                "specificity": round(best_specificity, 4),
-                "interpretation": f"Com threshold {best_threshold:.2%}: aceita {best_sensitivity:.0%} dos corretos, rejeita {best_specificity:.0%} dos errados"
-            }
-        
-        # Distribuicao de scores por faixa
-        distribution = {
-            "0.90_1.00": {"correct": 0, "incorrect": 0},
-            "0.85_0.90": {"correct": 0, "incorrect": 0},
-            "0.80_0.85": {"correct": 0, "incorrect": 0},
-            "0.75_0.80": {"correct": 0, "incorrect": 0},
-            "0.70_0.75": {"correct": 0, "incorrect": 0},
-            "0.65_0.70": {"correct": 0, "incorrect": 0},
-            "0.60_0.65": {"correct": 0, "incorrect": 0},
-            "0.50_0.60": {"correct": 0, "incorrect": 0},
-            "0.00_0.50": {"correct": 0, "incorrect": 0}
-        }
-        
-        for s in samples:
-            score_val = s.get('score', 0)
-            is_correct_val = s.get('is_correct', False)
-            key = "correct" if is_correct_val else "incorrect"
-            
-            if score_val >= 0.90: distribution["0.90_1.00"][key] += 1
-            elif score_val >= 0.85: distribution["0.85_0.90"][key] += 1
-            elif score_val >= 0.80: distribution["0.80_0.85"][key] += 1
-            elif score_val >= 0.75: distribution["0.75_0.80"][key] += 1
-            elif score_val >= 0.70: distribution["0.70_0.75"][key] += 1
-            elif score_val >= 0.65: distribution["0.65_0.70"][key] += 1
-            elif score_val >= 0.60: distribution["0.60_0.65"][key] += 1
-            elif score_val >= 0.50: distribution["0.50_0.60"][key] += 1
-            else: distribution["0.00_0.50"][key] += 1
+        data = await load_calibration(db.calibration_log)
+        # Analise vetorizada fora do event loop (colecao pode ter dezenas de milhares de amostras)
+        result = await asyncio.to_thread(lambda: analyze(*data.arrays()))
         
         # Thresholds atuais
         current_thresholds = {
@@ -3269,24 +3323,58 @@ async def get_calibration_data():
             "rejeicao": 0.50
         }
         
-        # Converter datetime para string nos samples
-        for s in samples:
-            if 'created_at' in s and hasattr(s['created_at'], 'isoformat'):
-                s['created_at'] = s['created_at'].isoformat()
-        
         return {
             "ok": True,
-            "stats": stats,
-            "distribution": distribution,
-            "youden": youden_result,
+            "stats": result["stats"],
+            "distribution": result["distribution"],
+            "youden": result["youden"],
+            "roc": result["roc"],
+            "per_dish": result["per_dish"],
+            "proposed_thresholds": result["proposed_thresholds"],
             "current_thresholds": current_thresholds,
-            "samples": samples[:200]
+            "calibrated_thresholds": policy.CALIBRATED_THRESHOLDS,
+            "samples": data.recent
         }
     except Exception as e:
         logger.error(f"Erro ao buscar dados de calibracao: {e}")
         return {"ok": False, "error": str(e)}
 
 
+@api_router.post("/ai/calibration/thresholds/apply", dependencies=[Depends(verify_admin_key)])
+async def apply_calibration_thresholds(data: dict = None):
+    """
+    Aplica thresholds por prato/familia no analyze_result (ai/policy.py) e persiste em settings.
+    Body: {"dishes": {slug: t}, "families": {familia: t}}; sem body aplica os propostos
+    pela analise atual. {"dishes": {}, "families": {}} volta aos limites fixos.
+    """
+    try:
+        from services.calibration_service import load_calibration, analyze
+        from services.cache_service import clear_cache
+        from ai.policy import set_calibrated_thresholds
+        
+        payload = data
+        if payload is None:
+            calibration = await load_calibration(db.calibration_log)
+            proposed = (await asyncio.to_thread(lambda: analyze(*calibration.arrays())))["proposed_thresholds"]
+            payload = {
+                "dishes": {k: v["optimal_threshold"] for k, v in proposed["dishes"].items()},
+                "families": {k: v["optimal_threshold"] for k, v in proposed["families"].items()},
+            }
+        applied = set_calibrated_thresholds(payload.get("dishes"), payload.get("families"))
+        await db.settings.update_one(
+            {"key": "calibration_thresholds"},
+            {"$set": {"key": "calibration_thresholds", "value": applied, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        # Decisoes em cache foram tomadas com os thresholds antigos
+        clear_cache()
+        logger.info(f"[CALIBRATION] Thresholds aplicados: {len(applied['dishes'])} pratos, {len(applied['families'])} familias")
+        return {"ok": True, "applied": applied}
+    except Exception as e:
+        logger.error(f"Erro ao aplicar thresholds de calibracao: {e}")
+        return {"ok": False, "error": str(e)}
+
+
 @api_router.post("/ai/identify-multi")
 async def identify_multiple_items(
     file: UploadFile = File(...),
@@ -3489,7 +3577,7 @@ async def register_user(
         }
         
         # Salvar no MongoDB
-        result = await db.users.insert_one(perfil)
+        result = await db.users.insert_one(_with_norm_keys("users", perfil))
         user_id = str(result.inserted_id)
         
         logger.info(f"[PREMIUM] Novo usuario registrado: {nome}")
@@ -3521,7 +3609,7 @@ async def login_user(pin: str = Form(...), nome: str = Form(...)):
 
         # Buscar por nome E pin_hash
         user = await db.users.find_one(
-            {"pin_hash": pin_hash, "nome": {"$regex": f"^\s*{_norm_nome(nome)}\s*$", "$options": "i"}},
+            _norm_filter("users", nome, pin_hash=pin_hash),
             {"_id": 0, "pin_hash": 0}
         )
 
@@ -3540,7 +3628,7 @@ async def login_user(pin: str = Form(...), nome: str = Form(...)):
                 if agora > expiracao:
                     premium_ativo = False
                     await db.users.update_one(
-                        {"nome": {"$regex": f"^\s*{_norm_nome(nome)}\s*$", "$options": "i"}},
+                        _norm_filter("users", nome),
                         {"$set": {
                             "premium_ativo": False,
                             "premium_expirado": True,
@@ -3622,7 +3710,7 @@ async def get_user_profile(pin: str, nome: str):
         
         pin_hash = hash_pin(pin)
         user = await db.users.find_one(
-            {"pin_hash": pin_hash, "nome": {"$regex": f"^\\s*{_norm_nome(nome)}\\s*$", "$options": "i"}},
+            _norm_filter("users", nome, pin_hash=pin_hash),
             {"_id": 0, "pin_hash": 0}
         )
         
@@ -3672,7 +3760,7 @@ async def update_user_profile(
         
         pin_hash = hash_pin(pin)
         user = await db.users.find_one(
-            {"pin_hash": pin_hash, "nome": {"$regex": f"^\\s*{_norm_nome(nome)}\\s*$", "$options": "i"}}
+            _norm_filter("users", nome, pin_hash=pin_hash)
         )
         
         if not user:
@@ -3726,7 +3814,7 @@ async def save_premium_profile(request: ProfileRequest):
         
         pin_hash = hash_pin(request.pin)
         user = await db.users.find_one(
-            {"pin_hash": pin_hash, "nome": {"$regex": f"^{_norm_nome(request.nome)}$", "$options": "i"}}
+            _norm_filter("users", request.nome, pin_hash=pin_hash)
         )
         
         if not user:
@@ -3815,8 +3903,9 @@ async def log_meal(
             "source": source
         }
         
-        # Atualizar ou criar log diario
-        result = await db.daily_logs.update_one(
+        # Atualizar ou criar log diario (retorna os totais ja atualizados)
+        from pymongo import ReturnDocument
+        daily_log = await db.daily_logs.find_one_and_update(
             {"user_nome": user["nome"], "data": hoje},
             {
                 "$push": {"pratos": prato_entry},
@@ -3828,14 +3917,18 @@ async def log_meal(
                 },
                 "$setOnInsert": {"created_at": agora}
             },
-            upsert=True
+            projection={"_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
         )
         
-        # Buscar totais atualizados
-        daily_log = await db.daily_logs.find_one(
-            {"user_nome": user["nome"], "data": hoje},
-            {"_id": 0}
-        )
+        # Agregados semana/mes + streak do dashboard Premium
+        from services.premium_rollup_service import apply_meal, invalidate_user
+        try:
+            await apply_meal(db, user["nome"], hoje, daily_log, prato_entry)
+        except Exception as e:
+            logger.warning(f"[PREMIUM] Agregados de {user['nome']} serao reconstruidos: {e}")
+            await invalidate_user(db, user["nome"])
         
         meta = user.get("meta_calorica", {}).get("meta_sugerida", 2000)
         consumido = daily_log.get("calorias_total", 0)
@@ -4016,8 +4109,8 @@ async def get_weekly_analysis(pin: str):
                 "restricoes": []
             }
         
-        # Analise semanal
-        analise = analisar_consumo_semanal(refeicoes_semana, perfil)
+        # Analise semanal (fallback USDA sincrono: fora do event loop)
+        analise = await asyncio.to_thread(analisar_consumo_semanal, refeicoes_semana, perfil)
         
         return {
             "ok": True,
@@ -4083,8 +4176,8 @@ async def get_daily_full_analysis(pin: str):
                 "restricoes": []
             }
         
-        # Analise completa
-        analise = analisar_consumo_diario(refeicoes, perfil)
+        # Analise completa (fallback USDA sincrono: fora do event loop)
+        analise = await asyncio.to_thread(analisar_consumo_diario, refeicoes, perfil)
         
         return {
             "ok": True,
@@ -4107,7 +4200,6 @@ async def get_dashboard_premium(pin: str, periodo: str = "semana"):
     """
     try:
         from services.profile_service import hash_pin
-        from datetime import datetime, timedelta
         
         pin_hash = hash_pin(pin)
         user = await db.users.find_one({"pin_hash": pin_hash})
@@ -4115,127 +4207,19 @@ async def get_dashboard_premium(pin: str, periodo: str = "semana"):
         if not user:
             return {"ok": False, "error": "PIN incorreto"}
         
-        # Definir periodo em dias
-        periodos_dias = {"dia": 1, "semana": 7, "mes": 30, "ano": 365}
-        dias = periodos_dias.get(periodo, 7)
-        
-        data_inicio = (datetime.now() - timedelta(days=dias)).strftime("%Y-%m-%d")
-        hoje_str = datetime.now().strftime("%Y-%m-%d")
-        
-        # Buscar logs do periodo (limite maior para ano)
-        limite_logs = 400 if periodo == "ano" else 100
-        cursor = db.daily_logs.find(
-            {"user_nome": user["nome"], "data": {"$gte": data_inicio}},
-            {"_id": 0}
-        ).sort("data", -1)
-        
-        logs = await cursor.to_list(length=limite_logs)
-        
-        # Consumo de hoje
-        log_hoje = next((l for l in logs if l.get("data") == hoje_str), None)
-        hoje = {
-            "calorias": log_hoje.get("calorias_total", 0) if log_hoje else 0,
-            "proteinas": log_hoje.get("proteinas_total", 0) if log_hoje else 0,
-            "carboidratos": log_hoje.get("carboidratos_total", 0) if log_hoje else 0,
-            "gorduras": log_hoje.get("gorduras_total", 0) if log_hoje else 0
-        }
-        
-        # Dados para graficos baseados no periodo
-        dias_grafico = []
-        
-        if periodo == "dia":
-            # Para dia, mostrar as refeicoes individuais
-            if log_hoje and log_hoje.get("pratos"):
-                for i, prato in enumerate(log_hoje.get("pratos", [])[:10]):
-                    dias_grafico.append({
-                        "dia": prato.get("nome", f"Item {i+1}")[:15],
-                        "data": hoje_str,
-                        "calorias": prato.get("calorias", 0),
-                        "proteinas": prato.get("proteinas", 0),
-                        "carboidratos": prato.get("carboidratos", 0),
-                        "gorduras": prato.get("gorduras", 0)
-                    })
-        elif periodo == "semana":
-            # Últimos 7 dias
-            dias_nomes = ["Seg", "Ter", "Qua", "Qui", "Sex", "Sab", "Dom"]
-            for i in range(7):
-                data = (datetime.now() - timedelta(days=6-i)).strftime("%Y-%m-%d")
-                dia_semana = (datetime.now() - timedelta(days=6-i)).weekday()
-                log_dia = next((l for l in logs if l.get("data") == data), None)
-                dias_grafico.append({
-                    "dia": dias_nomes[dia_semana],
-                    "data": data,
-                    "calorias": log_dia.get("calorias_total", 0) if log_dia else 0,
-                    "proteinas": log_dia.get("proteinas_total", 0) if log_dia else 0,
-                    "carboidratos": log_dia.get("carboidratos_total", 0) if log_dia else 0,
-                    "gorduras": log_dia.get("gorduras_total", 0) if log_dia else 0
-                })
-        elif periodo == "mes":
-            # Agrupar por semana (4 semanas)
-            for semana in range(4):
-                inicio_semana = 28 - (semana + 1) * 7
-                fim_semana = 28 - semana * 7
-                calorias_semana = 0
-                proteinas_semana = 0
-                carboidratos_semana = 0
-                gorduras_semana = 0
-                for i in range(inicio_semana, fim_semana):
-                    data = (datetime.now() - timedelta(days=i)).strftime("%Y-%m-%d")
-                    log_dia = next((l for l in logs if l.get("data") == data), None)
-                    if log_dia:
-                        calorias_semana += log_dia.get("calorias_total", 0)
-                        proteinas_semana += log_dia.get("proteinas_total", 0)
-                        carboidratos_semana += log_dia.get("carboidratos_total", 0)
-                        gorduras_semana += log_dia.get("gorduras_total", 0)
-                dias_grafico.append({
-                    "dia": f"Sem {4-semana}",
-                    "calorias": calorias_semana / 7,  # Media diaria da semana
-                    "proteinas": proteinas_semana / 7,
-                    "carboidratos": carboidratos_semana / 7,
-                    "gorduras": gorduras_semana / 7
-                })
-        elif periodo == "ano":
-            # Agrupar por mes (12 meses)
-            meses_nomes = ["Jan", "Fev", "Mar", "Abr", "Mai", "Jun", "Jul", "Ago", "Set", "Out", "Nov", "Dez"]
-            hoje = datetime.now()
-            for i in range(12):
-                mes_data = hoje - timedelta(days=30 * (11 - i))
-                mes_nome = meses_nomes[mes_data.month - 1]
-                mes_str = mes_data.strftime("%Y-%m")
-                
-                logs_mes = [l for l in logs if l.get("data", "").startswith(mes_str)]
-                dias_com_dados = len([l for l in logs_mes if l.get("calorias_total", 0) > 0])
-                
-                calorias_mes = sum(l.get("calorias_total", 0) for l in logs_mes)
-                proteinas_mes = sum(l.get("proteinas_total", 0) for l in logs_mes)
-                carboidratos_mes = sum(l.get("carboidratos_total", 0) for l in logs_mes)
-                gorduras_mes = sum(l.get("gorduras_total", 0) for l in logs_mes)
-                
-                dias_grafico.append({
-                    "dia": mes_nome,
-                    "calorias": calorias_mes / max(dias_com_dados, 1),  # Media diaria
-                    "proteinas": proteinas_mes / max(dias_com_dados, 1),
-                    "carboidratos": carboidratos_mes / max(dias_com_dados, 1),
-                    "gorduras": gorduras_mes / max(dias_com_dados, 1),
-                    "dias_registrados": dias_com_dados
-                })
-        
-        # Estatisticas
-        dias_com_log = len([l for l in logs if l.get("calorias_total", 0) > 0])
-        total_calorias = sum(l.get("calorias_total", 0) for l in logs)
-        total_proteinas = sum(l.get("proteinas_total", 0) for l in logs)
-        total_carboidratos = sum(l.get("carboidratos_total", 0) for l in logs)
-        total_gorduras = sum(l.get("gorduras_total", 0) for l in logs)
-        total_pratos = sum(len(l.get("pratos", [])) for l in logs)
-        
-        # Calcular streak (dias seguidos)
-        streak = 0
-        for i in range(min(dias, 365)):
-            data = (datetime.now() - timedelta(days=i)).strftime("%Y-%m-%d")
-            if any(l.get("data", "") == data for l in logs):
-                streak += 1
-            else:
-                break
+        # Agregados incrementais (premium_rollups) + poucos daily_logs do periodo
+        from services.premium_rollup_service import dashboard_data
+        dados = await dashboard_data(db, user["nome"], periodo)
+        hoje = dados["hoje"]
+        dias_grafico = dados["grafico"]
+        historico = dados["historico"]
+        dias_com_log = dados["dias_com_log"]
+        total_calorias = dados["totais"]["calorias"]
+        total_proteinas = dados["totais"]["proteinas"]
+        total_carboidratos = dados["totais"]["carboidratos"]
+        total_gorduras = dados["totais"]["gorduras"]
+        total_pratos = dados["total_pratos"]
+        streak = dados["streak"]
         
         # Metas do usuario
         metas_default = {
@@ -4279,19 +4263,6 @@ async def get_dashboard_premium(pin: str, periodo: str = "semana"):
             if streak >= 7:
                 alertas.append({"tipo": "success", "msg": f"Parabens! {streak} dias seguidos registrando!"})
         
-        # Historico formatado (ultimas 30 entradas para periodo longo)
-        limite_historico = 30 if periodo in ["mes", "ano"] else 10
-        historico = []
-        for log in logs[:limite_historico]:
-            historico.append({
-                "data": log.get("data", ""),
-                "pratos": log.get("pratos", []),
-                "calorias_total": log.get("calorias_total", 0),
-                "proteinas_total": log.get("proteinas_total", 0),
-                "carboidratos_total": log.get("carboidratos_total", 0),
-                "gorduras_total": log.get("gorduras_total", 0)
-            })
-        
         return {
             "ok": True,
             "hoje": hoje,
@@ -4376,21 +4347,17 @@ async def get_premium_report(pin: str, periodo: str = "semana"):
     """
     try:
         from services.profile_service import hash_pin
-        from datetime import datetime, timedelta
+        from datetime import datetime
 
         pin_hash = hash_pin(pin)
         user = await db.users.find_one({"pin_hash": pin_hash})
         if not user:
             return {"ok": False, "error": "PIN incorreto"}
 
-        periodos_dias = {"dia": 1, "semana": 7, "mes": 30, "ano": 365}
-        dias = periodos_dias.get(periodo, 7)
-        data_inicio = (datetime.now() - timedelta(days=dias)).strftime("%Y-%m-%d")
-
-        logs = await db.daily_logs.find(
-            {"user_nome": user["nome"], "data": {"$gte": data_inicio}},
-            {"_id": 0}
-        ).sort("data", -1).to_list(length=400)
+        # Agregados incrementais (premium_rollups): so dias com calorias > 0
+        from services.premium_rollup_service import report_data
+        dados = await report_data(db, user["nome"], periodo)
+        dias = dados["dias"]
 
         # Metas
         metas = user.get("metas")
@@ -4400,8 +4367,7 @@ async def get_premium_report(pin: str, periodo: str = "semana"):
             if "meta_sugerida" in meta_cal:
                 metas["calorias"] = int(meta_cal["meta_sugerida"])
 
-        dias_com_log = [l for l in logs if l.get("calorias_total", 0) > 0]
-        n_dias = len(dias_com_log)
+        n_dias = dados["n_dias"]
 
         if n_dias == 0:
             return {
@@ -4415,10 +4381,10 @@ async def get_premium_report(pin: str, periodo: str = "semana"):
             }
 
         # === COMPONENTE 1: Aderencia as metas (0-40 pts) ===
-        media_cal = sum(l.get("calorias_total", 0) for l in dias_com_log) / n_dias
-        media_prot = sum(l.get("proteinas_total", 0) for l in dias_com_log) / n_dias
-        media_carb = sum(l.get("carboidratos_total", 0) for l in dias_com_log) / n_dias
-        media_gord = sum(l.get("gorduras_total", 0) for l in dias_com_log) / n_dias
+        media_cal = dados["totais"]["calorias"] / n_dias
+        media_prot = dados["totais"]["proteinas"] / n_dias
+        media_carb = dados["totais"]["carboidratos"] / n_dias
+        media_gord = dados["totais"]["gorduras"] / n_dias
 
         def aderencia_macro(atual, meta):
             if meta == 0:
@@ -4439,22 +4405,12 @@ async def get_premium_report(pin: str, periodo: str = "semana"):
         pts_aderencia = ((ad_cal * 0.4 + ad_prot * 0.3 + ad_carb * 0.15 + ad_gord * 0.15) * 40)
 
         # === COMPONENTE 2: Consistencia (0-20 pts) ===
-        streak = 0
-        for i in range(min(dias, 365)):
-            data = (datetime.now() - timedelta(days=i)).strftime("%Y-%m-%d")
-            if any(l.get("data") == data and l.get("calorias_total", 0) > 0 for l in logs):
-                streak += 1
-            else:
-                break
+        streak = dados["streak"]
         taxa_registro = n_dias / max(dias, 1)
         pts_consistencia = min(taxa_registro * 15 + min(streak / 7, 1) * 5, 20)
 
         # === COMPONENTE 3: Variedade (0-20 pts) ===
-        todos_pratos = set()
-        for l in dias_com_log:
-            for p in l.get("pratos", []):
-                todos_pratos.add(p.get("nome", "").lower())
-        n_pratos_unicos = len(todos_pratos)
+        n_pratos_unicos = dados["pratos_unicos"]
         pts_variedade = min(n_pratos_unicos / max(dias * 0.5, 1) * 20, 20)
 
         # === COMPONENTE 4: Equilibrio macro (0-20 pts) ===
@@ -4489,7 +4445,7 @@ async def get_premium_report(pin: str, periodo: str = "semana"):
 
         # Detalhes dia a dia
         detalhes = []
-        for l in dias_com_log[:15]:
+        for l in dados["detalhes"]:
             detalhes.append({
                 "data": l.get("data", ""),
                 "calorias": round(l.get("calorias_total", 0)),
@@ -4512,7 +4468,7 @@ async def get_premium_report(pin: str, periodo: str = "semana"):
             "resumo": {
                 "dias_registrados": n_dias,
                 "streak": streak,
-                "total_pratos": sum(len(l.get("pratos", [])) for l in dias_com_log),
+                "total_pratos": dados["total_pratos"],
                 "pratos_unicos": n_pratos_unicos,
                 "media_calorias": round(media_cal),
                 "media_proteinas": round(media_prot),
@@ -5010,12 +4966,24 @@ async def admin_dish_images_list(slug: str):
 
 
 @api_router.get("/admin/dish-image/{slug}")
-async def admin_get_dish_image(slug: str, img: str = None, thumb: int = 0):
-    """Retorna uma imagem de um prato. thumb=1 para thumbnail comprimido (rápido)."""
+async def admin_get_dish_image(request: Request, slug: str, img: str = None, thumb: int = 0):
+    """Retorna uma imagem de um prato. thumb=1 (300px), 150, 300 ou 600 para thumbnail
+    pré-gerado (WebP se o navegador aceitar). ETag forte pelo conteúdo -> 304."""
     from fastapi.responses import Response, FileResponse
-    from services.image_service import _find_local_folder
+    from services.image_service import _find_local_folder, representative_image
+    from services import thumbnail_service as thumbs
     import asyncio
-    
+
+    if_none_match = request.headers.get("if-none-match")
+    fmt = thumbs.pick_format(request.headers.get("accept", ""))
+    size = thumbs.pick_size(thumb) if thumb else 0
+    cache_headers = {"Cache-Control": "public, max-age=3600"}
+    if thumb:
+        cache_headers["Vary"] = "Accept"
+
+    def _not_modified(etag):
+        return Response(status_code=304, headers={**cache_headers, "ETag": etag})
+
     try:
         # Fast path: serve directly from local disk (no MongoDB needed)
         local_folder = await asyncio.to_thread(_find_local_folder, slug)
@@ -5027,41 +4995,21 @@ async def admin_get_dish_image(slug: str, img: str = None, thumb: int = 0):
                 if target.exists():
                     target_file = target
             else:
-                # Find first image > 5KB (skip tiny thumbnails)
-                for ext in ("*.jpg", "*.jpeg", "*.png"):
-                    for f in sorted(local_folder.glob(ext)):
-                        if f.stat().st_size > 5000:
-                            target_file = f
-                            break
-                    if target_file:
-                        break
-                # Fallback to any image
-                if not target_file:
-                    for ext in ("*.jpg", "*.jpeg", "*.png"):
-                        found = sorted(local_folder.glob(ext))
-                        if found:
-                            target_file = found[0]
-                            break
+                target_file = await asyncio.to_thread(representative_image, local_folder)
         
         if target_file:
-            # Thumbnail mode: compress and resize for fast loading
             if thumb:
-                from PIL import Image
-                import io
-                def make_thumb():
-                    with Image.open(target_file) as pil_img:
-                        if pil_img.mode in ('RGBA', 'P', 'LA'):
-                            pil_img = pil_img.convert('RGB')
-                        pil_img.thumbnail((300, 300))
-                        buf = io.BytesIO()
-                        pil_img.save(buf, format='JPEG', quality=60)
-                        return buf.getvalue()
-                data = await asyncio.to_thread(make_thumb)
-                return Response(content=data, media_type="image/jpeg",
-                               headers={"Cache-Control": "public, max-age=3600"})
-            else:
-                return FileResponse(str(target_file), media_type="image/jpeg",
-                                   headers={"Cache-Control": "public, max-age=3600"})
+                # Thumbnail pré-gerado: só gera (uma vez) se o upload/varredura ainda não gerou
+                path, etag = await asyncio.to_thread(thumbs.thumbnail_for_file, target_file, size, fmt)
+                if thumbs.etag_matches(if_none_match, etag):
+                    return _not_modified(etag)
+                return FileResponse(str(path), media_type=thumbs.THUMB_FORMATS[fmt][1],
+                                    headers={**cache_headers, "ETag": etag})
+            etag = thumbs.etag_for(await asyncio.to_thread(thumbs.source_hash, target_file))
+            if thumbs.etag_matches(if_none_match, etag):
+                return _not_modified(etag)
+            return FileResponse(str(target_file), media_type="image/jpeg",
+                                headers={**cache_headers, "ETag": etag})
         
         # Slow path: try cloud storage (only if not found locally)
         from services.image_service import get_dish_image_bytes
@@ -5070,21 +5018,15 @@ async def admin_get_dish_image(slug: str, img: str = None, thumb: int = 0):
         if data is None:
             raise HTTPException(status_code=404, detail="Imagem nao encontrada")
         
-        if thumb and data:
-            from PIL import Image
-            import io
-            def make_thumb_from_bytes():
-                with Image.open(io.BytesIO(data)) as pil_img:
-                    if pil_img.mode in ('RGBA', 'P', 'LA'):
-                        pil_img = pil_img.convert('RGB')
-                    pil_img.thumbnail((300, 300))
-                    buf = io.BytesIO()
-                    pil_img.save(buf, format='JPEG', quality=60)
-                    return buf.getvalue()
-            data = await asyncio.to_thread(make_thumb_from_bytes)
-        
+        if thumb:
+            data, etag = await asyncio.to_thread(thumbs.thumbnail_for_bytes, data, size, fmt)
+            content_type = thumbs.THUMB_FORMATS[fmt][1]
+        else:
+            etag = thumbs.etag_for(thumbs.content_hash(data))
+        if thumbs.etag_matches(if_none_match, etag):
+            return _not_modified(etag)
         return Response(content=data, media_type=content_type or "image/jpeg",
-                       headers={"Cache-Control": "public, max-age=3600"})
+                        headers={**cache_headers, "ETag": etag})
         
     except HTTPException:
         raise
@@ -5148,9 +5090,10 @@ async def admin_update_dish(slug: str, dish_data: dict):
         # Salvar no MongoDB
         await db.dishes.update_one(
             {"slug": slug},
-            {"$set": existing_info},
+            {"$set": _with_norm_keys("dishes", existing_info)},
             upsert=True
         )
+        invalidate_dish_catalog(slug)
         
         logger.info(f"[ADMIN] Prato atualizado: {slug}")
         return {"ok": True, "message": "Prato atualizado"}
@@ -5217,9 +5160,10 @@ async def admin_regenerate_dish_info(slug: str, data: dict = None):
             # Salvar no MongoDB
             await db.dishes.update_one(
                 {"slug": slug},
-                {"$set": new_info},
+                {"$set": _with_norm_keys("dishes", new_info)},
                 upsert=True
             )
+            invalidate_dish_catalog(slug)
             
             logger.info(f"[ADMIN] Ficha regenerada com sucesso: {slug}")
             return {
@@ -5240,10 +5184,11 @@ async def admin_delete_dish(slug: str):
     """Exclui um prato e todas suas fotos do S3, MongoDB e disco local."""
     try:
         import shutil
-        from services.image_service import _find_local_folder
+        from services.image_service import _find_local_folder, invalidate_dish_images, invalidate_folder_map
         
         # Remover do dish_storage no MongoDB
         await db.dish_storage.delete_one({"slug": slug})
+        invalidate_dish_images(slug)
         
         # Remover do dishes no MongoDB
         await db.dishes.delete_one({"slug": slug})
@@ -5253,6 +5198,8 @@ async def admin_delete_dish(slug: str):
         local_folder = await asyncio.to_thread(_find_local_folder, slug)
         if local_folder and local_folder.exists():
             shutil.rmtree(local_folder)
+            invalidate_folder_map()
+        invalidate_dish_catalog(slug)
         
         logger.info(f"[ADMIN] Prato excluido: {slug}")
         return {"ok": True, "message": f"Prato {slug} excluido"}
@@ -5282,6 +5229,7 @@ async def admin_update_dish_local(slug: str, data: dict = None):
         
         novo_nome = data.get("new_name") if data else None
         result = atualizar_prato_local(slug, novo_nome)
+        invalidate_dish_catalog(slug)
         
         return result
         
@@ -5391,6 +5339,7 @@ async def admin_apply_ai_suggestions(slug: str, suggestions: dict):
         from services.audit_service import apply_ai_suggestions
         
         result = apply_ai_suggestions(slug, suggestions)
+        invalidate_dish_catalog(slug)
         return result
         
     except Exception as e:
@@ -5429,7 +5378,7 @@ async def admin_fix_single_dish(slug: str):
             
             await db.dishes.update_one(
                 {"slug": slug},
-                {"$set": new_info},
+                {"$set": _with_norm_keys("dishes", new_info)},
                 upsert=True
             )
             
@@ -5456,6 +5405,8 @@ async def admin_batch_fix_dishes(request: dict):
         slugs = slugs[:10]
         
         result = await batch_fix_dishes(slugs, max_concurrent=2)
+        for slug in result.get("fixed", []):
+            invalidate_dish_catalog(slug)
         return {"ok": True, **result}
         
     except Exception as e:
@@ -5480,6 +5431,7 @@ async def delete_dish_image(slug: str, img: str = Query(...)):
                 return JSONResponse(status_code=404, content={"ok": False, "error": f"Imagem '{img}' nao encontrada no prato '{slug}'"})
         result = await asyncio.to_thread(delete_dish_image_from_storage, slug, img)
         if result.get("ok"):
+            await _index_incremental("remove_image", slug, img)
             remaining = await asyncio.to_thread(get_dish_image_count, slug)
             return {"ok": True, "message": f"Imagem {img} removida", "remaining_images": remaining}
         return JSONResponse(status_code=404, content={"ok": False, "error": result.get("error", "Erro ao remover")})
@@ -5517,6 +5469,8 @@ async def move_dish_image(request: Request):
         
         # Remover do prato origem SOMENTE depois de salvar com sucesso
         await asyncio.to_thread(delete_dish_image_from_storage, source_dish, image_name)
+        await _index_incremental("remove_image", source_dish, image_name)
+        await _index_incremental("add_images", target_dish, [image_bytes], [image_name])
         
         remaining = await asyncio.to_thread(get_dish_image_count, source_dish)
         logger.info(f"[MOVE] Imagem '{image_name}' movida de '{source_dish}' para '{target_dish}'")
@@ -5527,13 +5481,16 @@ async def move_dish_image(request: Request):
 
 
 @api_router.get("/admin/duplicates")
-async def get_duplicate_groups():
-    """Retorna grupos de pratos duplicados para consolidacao"""
+async def get_duplicate_groups(by: str = "name"):
+    """Retorna grupos de pratos duplicados para consolidacao
+    
+    by=image: pratos que compartilham fotos quase identicas (hash perceptual)
+    """
     try:
         from services.audit_service import find_duplicate_groups
         
-        grupos = find_duplicate_groups()
-        return {"ok": True, "groups": grupos, "total_groups": len(grupos)}
+        grupos = await asyncio.to_thread(find_duplicate_groups, by == "image")
+        return {"ok": True, "groups": grupos, "total_groups": len(grupos), "by": by}
         
     except Exception as e:
         logger.error(f"Erro ao buscar duplicados: {e}")
@@ -5551,6 +5508,11 @@ async def consolidate_dishes(request: dict):
             return {"ok": False, "error": "Grupo precisa ter pelo menos 2 slugs"}
         
         result = await consolidate_duplicate_dishes(group)
+        if result.get("ok"):
+            invalidate_dish_catalog(result["main_slug"])
+            for slug in result.get("dirs_removed", []):
+                invalidate_dish_catalog(slug)
+                await _index_incremental("rename_dish", slug, result["main_slug"])
         return result
         
     except Exception as e:
@@ -5571,6 +5533,10 @@ async def consolidate_all_duplicates():
             try:
                 result = await consolidate_duplicate_dishes(group)
                 if result.get("ok"):
+                    invalidate_dish_catalog(result["main_slug"])
+                    for slug in result.get("dirs_removed", []):
+                        invalidate_dish_catalog(slug)
+                        await _index_incremental("rename_dish", slug, result["main_slug"])
                     results["consolidated"].append(result["main_slug"])
                 else:
                     results["failed"].append({"group": group, "error": result.get("error")})
@@ -5657,10 +5623,13 @@ async def translate_text_endpoint(
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+    from services.usda_fallback import get_usda_client
+    await asyncio.to_thread(get_usda_client().close)
 
 # Evento de startup - pre-carregar modelo e indice com warm-up completo
 @app.on_event("startup")
 async def startup_event():
+    global _identify_semaphore
     import time as _time
     _t0 = _time.time()
     logger.info("[STARTUP] SoulNutri AI Server iniciando...")
@@ -5671,6 +5640,9 @@ async def startup_event():
         from ai.embedder import preload_model, warmup_inference
         preload_model()
         logger.info("[STARTUP] Model loaded")
+        # Com o modelo carregado sabemos se o micro-batcher subiu
+        _identify_semaphore = asyncio.Semaphore(get_identify_concurrency())
+        logger.info(f"[STARTUP] Identify concurrency: {get_identify_concurrency()}")
     except Exception as e:
         logger.warning(f"[STARTUP] Model load failed: {e}")
 
@@ -5693,6 +5665,70 @@ async def startup_event():
     except Exception as e:
         logger.warning(f"[STARTUP] Index load failed: {e}")
 
+    # 4. Indice de hash perceptual (fast path do identify) em background:
+    #    sem arquivo salvo o build varre o dataset; identify usa CLIP ate terminar
+    try:
+        from ai.hash_index import HASH_FAST_PATH_ENABLED, get_hash_index
+        if HASH_FAST_PATH_ENABLED:
+            async def _load_hash_index():
+                try:
+                    hash_index = await asyncio.to_thread(get_hash_index)
+                    logger.info(f"[STARTUP] Hash index ready — {hash_index.total_hashes} hashes")
+                except Exception as e:
+                    logger.warning(f"[STARTUP] Hash index load failed: {e}")
+            asyncio.create_task(_load_hash_index())
+    except Exception as e:
+        logger.warning(f"[STARTUP] Hash index skipped: {e}")
+
+    # 5. Thumbnails das fotos do dataset em background (só gera os que faltam)
+    try:
+        from services.image_service import LOCAL_DATASET_DIR
+        from services.thumbnail_service import sweep as sweep_thumbnails
+
+        async def _sweep_thumbnails():
+            try:
+                stats = await asyncio.to_thread(sweep_thumbnails, LOCAL_DATASET_DIR)
+                logger.info(f"[STARTUP] Thumbnails ready — {stats['images']} images, {stats['generated']} generated")
+            except Exception as e:
+                logger.warning(f"[STARTUP] Thumbnail sweep failed: {e}")
+        asyncio.create_task(_sweep_thumbnails())
+    except Exception as e:
+        logger.warning(f"[STARTUP] Thumbnail sweep skipped: {e}")
+
+    # 6. Indices declarados em services/index_registry.py (idempotente)
+    try:
+        from services.index_registry import ensure_indexes
+        idx = await ensure_indexes(db)
+        logger.info(f"[STARTUP] Indexes ready — {idx['ok']} ok, {len(idx['failed'])} failed")
+    except Exception as e:
+        logger.warning(f"[STARTUP] Index bootstrap skipped: {e}")
+
+    # 7. Nomes normalizados (*_norm) + indices: lookups por nome sem $regex
+    try:
+        from services.norm_key_service import ensure_norm_keys
+        filled = await ensure_norm_keys(db)
+        logger.info(f"[STARTUP] Normalized name keys ready — backfilled {sum(filled.values())} docs")
+    except Exception as e:
+        logger.warning(f"[STARTUP] Normalized name keys skipped: {e}")
+
+    # 8. Thresholds calibrados por prato/familia aplicados no analyze_result
+    try:
+        from ai.policy import set_calibrated_thresholds
+        doc = await db.settings.find_one({"key": "calibration_thresholds"}, {"_id": 0})
+        if doc and doc.get("value"):
+            applied = set_calibrated_thresholds(doc["value"].get("dishes"), doc["value"].get("families"))
+            logger.info(f"[STARTUP] Calibrated thresholds — {len(applied['dishes'])} dishes, {len(applied['families'])} families")
+    except Exception as e:
+        logger.warning(f"[STARTUP] Calibrated thresholds skipped: {e}")
+
+    # 9. Catalogo de pratos da policy (dish_info.json em memoria, sem I/O por scan)
+    try:
+        from ai.policy import load_dish_catalog
+        n_dishes = await asyncio.to_thread(load_dish_catalog)
+        logger.info(f"[STARTUP] Dish catalog ready — {n_dishes} dish_info.json")
+    except Exception as e:
+        logger.warning(f"[STARTUP] Dish catalog skipped: {e}")
+
     elapsed = _time.time() - _t0
     logger.info(f"[STARTUP] SoulNutri AI Server ready in {elapsed:.1f}s — all assets in memory")
 
@@ -5968,7 +6004,7 @@ async def liberar_premium(request: Request):
             update_fields["premium_expira_em"] = None
         
         result = await db.users.update_many(
-            {"nome": {"$regex": f"^\\s*{_norm_nome(nome)}\\s*$", "$options": "i"}},
+            _norm_filter("users", nome),
             {"$set": update_fields}
         )
         if result.modified_count == 0:
@@ -5999,7 +6035,7 @@ async def bloquear_premium(request: Request):
         if not nome:
             return {"ok": False, "error": "Nome é obrigatório"}
         result = await db.users.update_many(
-            {"nome": {"$regex": f"^\\s*{_norm_nome(nome)}\\s*$", "$options": "i"}},
+            _norm_filter("users", nome),
             {"$set": {
                 "premium_ativo": False,
                 "premium_bloqueado_por": "admin",
@@ -6018,7 +6054,7 @@ async def deletar_usuario_premium(nome: str):
     """Deleta permanentemente um usuário (ativo ou bloqueado)."""
     try:
         result = await db.users.delete_many(
-            {"nome": {"$regex": f"^\\s*{_norm_nome(nome)}\\s*$", "$options": "i"}}
+            _norm_filter("users", nome)
         )
         if result.deleted_count == 0:
             return {"ok": False, "error": "Usuário não encontrado"}
@@ -6090,7 +6126,7 @@ async def toggle_admin_premium(request: Request):
         if not nome:
             return {"ok": False, "error": "Nome é obrigatório"}
         result = await db.users.update_many(
-            {"nome": {"$regex": f"^\\s*{_norm_nome(nome)}\\s*$", "$options": "i"}},
+            _norm_filter("users", nome),
             {"$set": {"is_admin": is_admin, "updated_at": datetime.now(timezone.utc).isoformat()}}
         )
         if result.modified_count == 0:
@@ -6118,7 +6154,7 @@ async def change_user_pin(request: Request):
         new_hash = hash_pin(new_pin)
 
         result = await db.users.update_many(
-            {"nome": {"$regex": f"^\\s*{_norm_nome(nome)}\\s*$", "$options": "i"}},
+            _norm_filter("users", nome),
             {"$set": {"pin_hash": new_hash, "updated_at": datetime.now(timezone.utc).isoformat()}}
         )
         if result.modified_count == 0:
@@ -6166,15 +6202,11 @@ async def get_api_usage():
 
 @api_router.get("/admin/processing-metrics")
 async def get_processing_metrics(date: str = ""):
-    """Retorna métricas de processamento."""
+    """Retorna métricas de processamento (últimos requests em memória, filtro por data YYYY-MM-DD)."""
     try:
-        query = {}
-        if date:
-            query["date"] = date
-        metrics = []
-        async for m in db.processing_metrics.find(query, {"_id": 0}).sort("created_at", -1).limit(50):
-            metrics.append(m)
-        return {"ok": True, "metrics": metrics}
+        from services.metrics_service import metrics
+        report = metrics.recent_report(date)
+        return {"ok": True, **report, "metrics": report["entries"]}
     except Exception as e:
         return {"ok": False, "error": str(e), "metrics": []}
 
@@ -6404,6 +6436,8 @@ async def approve_moderation_item(item_id: str):
             uid = str(uuid.uuid4())[:8]
             filename = f"{doc['original_dish']}_approved_{timestamp}_{uid}.jpg"
             await _asyncio.to_thread(save_dish_image, doc["original_dish"], filename, image_data)
+            await _index_incremental("add_images", doc["original_dish"], [image_data], [filename])
+            invalidate_dish_catalog(doc["original_dish"])
 
         # Atualizar status
         await db.moderation_queue.update_one(
@@ -6664,18 +6698,38 @@ async def debug_performance():
     except Exception:
         embedding_backend = "unknown"
     degraded_mode = embedding_backend != "onnx"
+    try:
+        from services.cache_service import get_cache_stats
+        identify_cache = get_cache_stats()
+    except Exception as e:
+        identify_cache = {"error": str(e)}
+    from services.singleflight import get_coalescing_stats
+    from services.metrics_service import get_metrics_snapshot
     return {
         "onnx_mode": stats.get("onnx_mode"),
+        "onnx_variant": stats.get("onnx_variant"),
         "threads": stats.get("threads"),
         "last_inference_ms": stats.get("last_inference_ms"),
         "avg_inference_ms": stats.get("avg_inference_ms"),
         "inference_count": stats.get("inference_count", 0),
+        "micro_batch": stats.get("micro_batch"),
         "onnx_loaded": onnx_loaded,
         "embedding_backend": embedding_backend,
         "degraded_mode": degraded_mode,
+        "identify_cache": identify_cache,
+        "coalesced_requests": get_coalescing_stats(),
+        "stage_latency": get_metrics_snapshot(),
         "uptime": round(uptime, 1),
     }
 
+
+@app.get("/api/metrics")
+async def prometheus_metrics():
+    """Histogramas de latência por etapa no formato texto do Prometheus. Somente memoria."""
+    from fastapi.responses import Response
+    from services.metrics_service import metrics
+    return Response(content=metrics.prometheus_text(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # ═══════════════════════════════════════════════════════
 # DEPLOY UNIFICADO: FastAPI serve o React Build (SPA)
 # ═══════════════════════════════════════════════════════
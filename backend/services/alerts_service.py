@@ -11,6 +11,8 @@ import logging
 import asyncio
 from datetime import datetime, timezone, timedelta
 
+from services.norm_key_service import norm_filter
+
 logger = logging.getLogger(__name__)
 
 EMERGENT_LLM_KEY = os.environ.get("EMERGENT_LLM_KEY", "")
@@ -107,10 +109,9 @@ async def _check_consumption_alert(db, user_nome: str, prato_nome: str, ingredie
     try:
         seven_days_ago = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
 
-        cursor = db.meal_logs.find({
-            "user_nome": {"$regex": f"^{user_nome}$", "$options": "i"},
-            "timestamp": {"$gte": seven_days_ago}
-        }, {"_id": 0}).sort("timestamp", -1)
+        cursor = db.meal_logs.find(
+            norm_filter("meal_logs", user_nome, timestamp={"$gte": seven_days_ago}),
+            {"_id": 0}).sort("timestamp", -1)
 
         meals = await cursor.to_list(length=100)
 
@@ -118,7 +119,7 @@ async def _check_consumption_alert(db, user_nome: str, prato_nome: str, ingredie
             return None
 
         user = await db.premium_users.find_one(
-            {"nome": {"$regex": f"^{user_nome}$", "$options": "i"}},
+            norm_filter("premium_users", user_nome),
             {"_id": 0, "meta_calorica": 1, "perfil": 1}
         )
         meta_calorica_semanal = (user.get("meta_calorica", 2000) if user else 2000) * 7
@@ -140,7 +141,7 @@ async def _check_consumption_alert(db, user_nome: str, prato_nome: str, ingredie
                 ingredientes_frequentes[ing_lower] = ingredientes_frequentes.get(ing_lower, 0) + 1
 
         nutri_sheet = await db.nutrition_sheets.find_one(
-            {"nome": {"$regex": f"^{prato_nome}$", "$options": "i"}},
+            norm_filter("nutrition_sheets", prato_nome),
             {"_id": 0, "calorias_kcal": 1, "sodio_mg": 1, "gorduras_g": 1}
         )
 
@@ -187,17 +188,16 @@ async def generate_weekly_report(db, user_nome: str) -> dict:
     try:
         seven_days_ago = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
 
-        cursor = db.meal_logs.find({
-            "user_nome": {"$regex": f"^{user_nome}$", "$options": "i"},
-            "timestamp": {"$gte": seven_days_ago}
-        }, {"_id": 0}).sort("timestamp", -1)
+        cursor = db.meal_logs.find(
+            norm_filter("meal_logs", user_nome, timestamp={"$gte": seven_days_ago}),
+            {"_id": 0}).sort("timestamp", -1)
         meals = await cursor.to_list(length=200)
 
         if not meals:
             return {"ok": False, "message": "Nenhuma refeicao registrada esta semana"}
 
         user = await db.premium_users.find_one(
-            {"nome": {"$regex": f"^{user_nome}$", "$options": "i"}},
+            norm_filter("premium_users", user_nome),
             {"_id": 0, "meta_calorica": 1, "nome": 1, "perfil": 1}
         )
         meta_diaria = user.get("meta_calorica", 2000) if user else 2000
@@ -236,7 +236,7 @@ async def generate_weekly_report(db, user_nome: str) -> dict:
             prato = meal.get("prato_nome", "")
             if prato:
                 nutri = await db.nutrition_sheets.find_one(
-                    {"nome": {"$regex": f"^{prato}$", "$options": "i"}},
+                    norm_filter("nutrition_sheets", prato),
                     {"_id": 0, "proteinas_g": 1, "carboidratos_g": 1, "gorduras_g": 1, "fibras_g": 1}
                 )
                 if nutri:
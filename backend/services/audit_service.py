@@ -545,6 +545,9 @@ async def consolidate_duplicate_dishes(group: list) -> dict:
                     removed_dirs.append(slug)
                 except:
                     pass
+    if removed_dirs:
+        from services.image_service import invalidate_folder_map
+        invalidate_folder_map()
     
     return {
         "ok": True,
@@ -556,8 +559,15 @@ async def consolidate_duplicate_dishes(group: list) -> dict:
     }
 
 
-def find_duplicate_groups() -> list:
-    """Encontra grupos de pratos duplicados baseado em similaridade de nome"""
+def find_duplicate_groups(by_image: bool = False) -> list:
+    """Encontra grupos de pratos duplicados baseado em similaridade de nome
+    
+    by_image=True agrupa pratos que compartilham fotos quase identicas
+    (hash perceptual, ver ai/hash_index.py) em vez de comparar nomes.
+    """
+    if by_image:
+        return _find_duplicate_groups_by_image()
+
     from difflib import SequenceMatcher
     
     pratos = []
@@ -598,3 +608,33 @@ def find_duplicate_groups() -> list:
             grupos.append(similares)
     
     return grupos
+
+
+def _find_duplicate_groups_by_image() -> list:
+    """Grupos de slugs ligados por fotos quase identicas (cadeias sao unidas)"""
+    from ai.hash_index import ImageHashIndex, loaded_hash_index
+
+    index = loaded_hash_index()
+    if index is None or not index.is_ready():
+        index = ImageHashIndex()
+        if not index.load():
+            index.build(str(DATASET_DIR))
+
+    parent: Dict[str, str] = {}
+
+    def find(slug):
+        parent.setdefault(slug, slug)
+        while parent[slug] != slug:
+            parent[slug] = parent[parent[slug]]
+            slug = parent[slug]
+        return slug
+
+    for group in index.find_near_duplicates():
+        slugs = sorted({e['slug'] for e in group})
+        for other in slugs[1:]:
+            parent[find(other)] = find(slugs[0])
+
+    grupos: Dict[str, List[str]] = {}
+    for slug in sorted(parent):
+        grupos.setdefault(find(slug), []).append(slug)
+    return [g for g in grupos.values() if len(g) > 1]
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+SoulNutri - Identificação em lote para QA do dataset (admin)
+Usado por POST /api/ai/identify-batch:
+
+- expand_uploads: lista multipart e/ou ZIPs -> [(nome, bytes)] (só imagens,
+  com limites de quantidade e tamanho contra ZIP bomba)
+- expected_dish_from_name: prato esperado a partir do caminho/arquivo
+      "Arroz Integral/001.jpg"      -> "Arroz Integral"  (pasta, como o dataset)
+      "arroz_integral__03.jpg"      -> "arroz_integral"  (prefixo antes de "__")
+      "feijao-tropeiro-2.jpg"       -> "feijao-tropeiro" (sufixo numérico removido)
+- ConfusionMatrix: acurácia top-1, aceitos corretos/errados e matriz esperado x previsto
+
+Config:
+    SOULNUTRI_IDENTIFY_BATCH_MAX         imagens por request (default 500)
+    SOULNUTRI_IDENTIFY_BATCH_MAX_MB      tamanho máximo de cada imagem (default 15)
+"""
+import io
+import os
+import re
+import zipfile
+import logging
+from collections import Counter, defaultdict
+from pathlib import PurePosixPath
+from typing import Dict, List, Optional, Tuple
+
+from services.slug_service import to_canonical_slug
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_IMAGES = int(os.environ.get("SOULNUTRI_IDENTIFY_BATCH_MAX", "500"))
+BATCH_MAX_IMAGE_BYTES = int(float(os.environ.get("SOULNUTRI_IDENTIFY_BATCH_MAX_MB", "15")) * 1024 * 1024)
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+NOT_IDENTIFIED = "(nao identificado)"
+
+
+def _is_image_name(name: str) -> bool:
+    base = PurePosixPath(name).name
+    return not base.startswith(".") and base.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def expand_uploads(uploads: List[Tuple[str, bytes]], max_images: int = BATCH_MAX_IMAGES,
+                   max_bytes: int = BATCH_MAX_IMAGE_BYTES) -> List[Tuple[str, bytes]]:
+    """Arquivos enviados -> [(nome, bytes)] das imagens. ZIPs são expandidos
+    (nome = caminho dentro do ZIP). ValueError se passar de max_images."""
+    images = []
+
+    def add(name, data):
+        if len(images) >= max_images:
+            raise ValueError(f"Máximo de {max_images} imagens por lote")
+        images.append((name, data))
+
+    for filename, data in uploads:
+        filename = (filename or "").replace("\\", "/")
+        if filename.lower().endswith(".zip") or (not _is_image_name(filename) and zipfile.is_zipfile(io.BytesIO(data))):
+            with zipfile.ZipFile(io.BytesIO(data)) as zf:
+                for info in zf.infolist():
+                    name = info.filename.replace("\\", "/")
+                    if info.is_dir() or "__MACOSX/" in name or not _is_image_name(name):
+                        continue
+                    if info.file_size > max_bytes:
+                        logger.warning(f"[BATCH] {name} ignorado ({info.file_size} bytes)")
+                        continue
+                    add(name, zf.read(info))
+        elif _is_image_name(filename) and len(data) <= max_bytes:
+            add(filename, data)
+        else:
+            logger.warning(f"[BATCH] {filename} ignorado (não é imagem ou muito grande)")
+    return images
+
+
+def expected_dish_from_name(name: str) -> Optional[str]:
+    """Prato esperado codificado no caminho/arquivo (None se não der para inferir)."""
+    path = PurePosixPath(name)
+    if len(path.parts) > 1:
+        return path.parent.name or None
+    stem = path.stem
+    if "__" in stem:
+        stem = stem.split("__", 1)[0]
+    else:
+        stem = re.sub(r"[\s_-]*(\(\d+\)|\d+)$", "", stem)
+    stem = stem.strip(" _-")
+    if not stem or not re.search(r"[A-Za-zÀ-ÿ]", stem):
+        return None
+    return stem
+
+
+class ConfusionMatrix:
+    """Esperado x previsto (top-1), comparando por slug canônico."""
+
+    def __init__(self):
+        self._matrix: Dict[str, Counter] = defaultdict(Counter)
+        self.total = 0
+        self.top1_correct = 0
+        self.accepted_correct = 0
+        self.accepted_wrong = 0
+        self.rejected = 0
+        self.without_expected = 0
+
+    def add(self, expected: Optional[str], predicted: Optional[str], identified: bool):
+        if not expected:
+            self.without_expected += 1
+            return
+        exp = to_canonical_slug(expected)
+        pred = to_canonical_slug(predicted) if predicted else NOT_IDENTIFIED
+        self.total += 1
+        self._matrix[exp][pred] += 1
+        correct = pred == exp
+        self.top1_correct += correct
+        if identified:
+            self.accepted_correct += correct
+            self.accepted_wrong += not correct
+        else:
+            self.rejected += 1
+
+    def summary(self, top_confusions: int = 20) -> dict:
+        def rate(n, d):
+            return round(n / d, 4) if d else None
+
+        per_dish = {}
+        confusions = []
+        for exp, row in sorted(self._matrix.items()):
+            n = sum(row.values())
+            per_dish[exp] = {"total": n, "top1_correct": row.get(exp, 0), "accuracy": rate(row.get(exp, 0), n)}
+            confusions.extend({"expected": exp, "predicted": pred, "count": c}
+                              for pred, c in row.items() if pred != exp)
+        confusions.sort(key=lambda c: (-c["count"], c["expected"], c["predicted"]))
+        return {
+            "total": self.total,
+            "without_expected": self.without_expected,
+            "top1_accuracy": rate(self.top1_correct, self.total),
+            "accepted_correct": self.accepted_correct,
+            "accepted_wrong": self.accepted_wrong,
+            "rejected": self.rejected,
+            "precision_accepted": rate(self.accepted_correct, self.accepted_correct + self.accepted_wrong),
+            "per_dish": per_dish,
+            "top_confusions": confusions[:top_confusions],
+            "matrix": {exp: dict(row) for exp, row in sorted(self._matrix.items())},
+        }
@@ -3,80 +3,147 @@
 Provider: curated.
 
 Le da collection Mongo `contextual_breaking_news` (seed manual editorial).
-Sem chamadas externas. Sem cache aqui (Mongo + indices ja sao rapidos).
+Sem chamadas externas.
+
+Os itens ativos ficam num snapshot em memoria com indice invertido
+tag -> itens; o fetch so cruza os termos do prato com esse indice e pontua
+os candidatos (microssegundos, sem round trip ao Mongo no scan).
+
+- Snapshot recarregado (motor, async) a cada BREAKING_NEWS_TTL_S; vencido, o
+  fetch usa o antigo e dispara a recarga em background (uma por vez).
+- Change stream (replica set) invalida o snapshot assim que o seed muda;
+  em Mongo standalone fica so o TTL.
+- Cold start (sem snapshot ainda): consulta async indexada por tags so
+  para esse request, enquanto o snapshot carrega.
+
+Indices da collection: services/index_registry.py (startup).
+
+Config:
+    SOULNUTRI_BREAKING_NEWS_TTL_S   validade do snapshot (default 300)
+    SOULNUTRI_BREAKING_NEWS_WATCH   1 = usar change stream quando disponivel
 """
 
 import os
+import time
+import asyncio
 import logging
+from collections import defaultdict
 from datetime import datetime, timezone, timedelta
-from pathlib import Path
-
-from dotenv import load_dotenv
-import pymongo
 
 from ..ranking import build_term_set, score_item, is_relevant, MAX_AGE_DAYS
 
 logger = logging.getLogger(__name__)
 
-# Lazy/single-process client (server.py compartilha o mesmo padrao).
-load_dotenv(Path(__file__).resolve().parents[3] / '.env')
-_client = pymongo.MongoClient(os.environ['MONGO_URL'])
-_db = _client[os.environ['DB_NAME']]
-_collection = _db.contextual_breaking_news
+BREAKING_NEWS_TTL_S = float(os.environ.get("SOULNUTRI_BREAKING_NEWS_TTL_S", "300"))
+BREAKING_NEWS_WATCH = os.environ.get("SOULNUTRI_BREAKING_NEWS_WATCH", "1") == "1"
 
-_indexes_created = False
+_snapshot = None          # _Snapshot atual (None = cold start)
+_refresh_task = None      # recarga em andamento (single-flight)
+_watch_task = None
+_watch_supported = True
 
 
-def _ensure_indexes():
-    """Cria indices uma unica vez por processo. Idempotente."""
-    global _indexes_created
-    if _indexes_created:
-        return
-    try:
-        _collection.create_index([("tags", 1)], background=True)
-        _collection.create_index([("data", -1)], background=True)
-        _collection.create_index([("ativo", 1)], background=True)
-        _collection.create_index([("id", 1)], unique=True, background=True, sparse=True)
-        _indexes_created = True
-        logger.info("[BREAKING_NEWS][curated] indices garantidos")
-    except Exception as e:
-        # Indices opcionais — nao bloquear leitura por isso.
-        logger.warning(f"[BREAKING_NEWS][curated] falha ao criar indices: {e}")
+def _get_collection():
+    """Collection async (motor) do server.py — mesmo pool de conexoes."""
+    # Importacao tardia para evitar circular
+    from server import db
+    return db.contextual_breaking_news
 
 
-async def fetch(dish_slug, family_slug, ingredientes, category):
-    """
-    Busca melhor item curado para o contexto fornecido.
+def _aware(value):
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
 
-    Retorna dict no schema unificado (com 'score' e 'origem' nao incluidos —
-    api.py os anexa), ou None se nenhum item atingir score minimo.
-    """
-    _ensure_indexes()
 
-    terms = build_term_set(dish_slug, family_slug, ingredientes, category)
-    if not terms:
-        return None
+class _Snapshot:
+    """Itens ativos + indice invertido tag -> posicoes em items."""
 
-    cutoff = datetime.now(timezone.utc) - timedelta(days=MAX_AGE_DAYS)
+    def __init__(self, docs):
+        self.items = list(docs)
+        self.by_tag = defaultdict(list)
+        for i, doc in enumerate(self.items):
+            for tag in set(doc.get('tags') or []):
+                self.by_tag[tag].append(i)
+        self.loaded_at = time.monotonic()
+
+    def candidates(self, terms):
+        seen = set()
+        for term in terms:
+            seen.update(self.by_tag.get(term, ()))
+        return [self.items[i] for i in sorted(seen)]
+
+    def fresh(self):
+        return time.monotonic() - self.loaded_at < BREAKING_NEWS_TTL_S
 
-    # Filtro Mongo: ativo, com tags em comum, dentro da janela de recencia.
-    query = {
-        "ativo": True,
-        "tags": {"$in": list(terms)},
-        "data": {"$gte": cutoff},
-    }
 
+def _cutoff():
+    return datetime.now(timezone.utc) - timedelta(days=MAX_AGE_DAYS)
+
+
+async def _load_snapshot():
+    global _snapshot
+    # Carrega tambem itens perto de sair da janela: o corte fino e feito no fetch.
+    docs = await _get_collection().find(
+        {"ativo": True, "data": {"$gte": _cutoff() - timedelta(seconds=BREAKING_NEWS_TTL_S)}},
+        {"_id": 0},
+    ).to_list(length=None)
+    _snapshot = _Snapshot(docs)
+    logger.info(f"[BREAKING_NEWS][curated] snapshot: {len(docs)} itens, {len(_snapshot.by_tag)} tags")
+    return _snapshot
+
+
+async def _refresh():
     try:
-        cursor = _collection.find(query, {"_id": 0})
+        await _load_snapshot()
     except Exception as e:
-        logger.error(f"[BREAKING_NEWS][curated] erro de leitura Mongo: {e}")
-        return None
+        logger.warning(f"[BREAKING_NEWS][curated] falha ao recarregar snapshot: {e}")
+
+
+def _schedule_refresh():
+    global _refresh_task
+    if _refresh_task is None or _refresh_task.done():
+        _refresh_task = asyncio.get_running_loop().create_task(_refresh())
+    if BREAKING_NEWS_WATCH:
+        _start_watch()
+    return _refresh_task
 
+
+async def _watch_changes():
+    """Change stream: qualquer alteracao no seed recarrega o snapshot."""
+    global _watch_supported
+    try:
+        async with _get_collection().watch() as stream:
+            async for _change in stream:
+                invalidate_snapshot()
+                _schedule_refresh()
+    except Exception as e:
+        # Standalone nao tem change stream: segue so com o TTL.
+        _watch_supported = False
+        logger.info(f"[BREAKING_NEWS][curated] change stream indisponivel ({type(e).__name__}); usando TTL")
+
+
+def _start_watch():
+    global _watch_task
+    if _watch_supported and (_watch_task is None or _watch_task.done()):
+        _watch_task = asyncio.get_running_loop().create_task(_watch_changes())
+
+
+def invalidate_snapshot():
+    """Proximo fetch recarrega o snapshot (seed alterado fora do change stream)."""
+    if _snapshot is not None:
+        _snapshot.loaded_at = float("-inf")
+
+
+def _pick_best(docs, terms, cutoff):
     best = None
     best_score = -1
     best_matched = []
 
-    for doc in cursor:
+    for doc in docs:
+        data = _aware(doc.get('data'))
+        if isinstance(data, datetime) and data < cutoff:
+            continue
         score, matched = score_item(doc, terms)
         if not is_relevant(score):
             continue
@@ -85,12 +152,50 @@ async def fetch(dish_slug, family_slug, ingredientes, category):
             score == best_score
             and isinstance(doc.get('data'), datetime)
             and isinstance((best or {}).get('data'), datetime)
-            and doc['data'] > best['data']
+            and _aware(doc['data']) > _aware(best['data'])
         ):
             best = doc
             best_score = score
             best_matched = matched
+    return best, best_score, best_matched
+
+
+async def _query_cold(terms, cutoff):
+    """Cold start: consulta indexada so com os itens que tem alguma tag do prato."""
+    query = {
+        "ativo": True,
+        "tags": {"$in": list(terms)},
+        "data": {"$gte": cutoff},
+    }
+    return await _get_collection().find(query, {"_id": 0}).to_list(length=None)
+
+
+async def fetch(dish_slug, family_slug, ingredientes, category):
+    """
+    Busca melhor item curado para o contexto fornecido.
+
+    Retorna dict no schema unificado (com 'score' e 'origem' nao incluidos —
+    api.py os anexa), ou None se nenhum item atingir score minimo.
+    """
+    terms = build_term_set(dish_slug, family_slug, ingredientes, category)
+    if not terms:
+        return None
 
+    cutoff = _cutoff()
+    snapshot = _snapshot
+    if snapshot is None:
+        _schedule_refresh()
+        try:
+            docs = await _query_cold(terms, cutoff)
+        except Exception as e:
+            logger.error(f"[BREAKING_NEWS][curated] erro de leitura Mongo: {e}")
+            return None
+    else:
+        if not snapshot.fresh():
+            _schedule_refresh()  # serve o snapshot atual enquanto recarrega
+        docs = snapshot.candidates(terms)
+
+    best, best_score, best_matched = _pick_best(docs, terms, cutoff)
     if not best:
         return None
 
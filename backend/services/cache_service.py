@@ -1,9 +1,20 @@
 """
 SoulNutri - Sistema de Cache para Identificação de Pratos
 Reduz tempo de resposta para pratos já identificados de ~4s para ~0ms
+
+Config:
+    SOULNUTRI_IDENTIFY_CACHE_ENTRIES   máximo de entradas em memória (default 500)
+    SOULNUTRI_IDENTIFY_CACHE_MAX_MB    máximo de MB em memória (default 32)
+    SOULNUTRI_IDENTIFY_CACHE_BACKEND   "sqlite" compartilha entre workers/restarts
+    SOULNUTRI_IDENTIFY_CACHE_PATH      arquivo do backend sqlite
 """
 
+import os
+import json
+import heapq
+import sqlite3
 import hashlib
+import threading
 import time
 import unicodedata
 from typing import Optional
@@ -24,68 +35,255 @@ def _normalize_confidence(value) -> str:
     text = unicodedata.normalize('NFKD', text)
     return ''.join(ch for ch in text if not unicodedata.combining(ch))
 
-# Cache em memória com LRU (Least Recently Used)
-class LRUCache:
-    """Cache LRU simples em memória"""
+# Configuração (env)
+CACHE_MAX_ENTRIES = int(os.environ.get("SOULNUTRI_IDENTIFY_CACHE_ENTRIES", "500"))
+CACHE_MAX_BYTES = int(os.environ.get("SOULNUTRI_IDENTIFY_CACHE_MAX_MB", "32")) * 1024 * 1024
+# Backend compartilhado entre workers do uvicorn e restarts: "memory" (padrão) ou "sqlite"
+CACHE_BACKEND = os.environ.get("SOULNUTRI_IDENTIFY_CACHE_BACKEND", "memory").strip().lower()
+CACHE_SQLITE_PATH = os.environ.get("SOULNUTRI_IDENTIFY_CACHE_PATH", "/tmp/soulnutri_identify_cache.sqlite")
+
+
+def _public_view(value: dict) -> dict:
+    """Resultado como devolvido num hit (sem metadados internos, source *_cached)."""
+    view = {k: v for k, v in value.items() if not k.startswith('_')}
+    view['source'] = value.get('source', 'unknown') + '_cached'
+    view['from_cache'] = True
+    return view
+
+
+class SQLiteCacheBackend:
+    """Entradas do cache num arquivo SQLite (WAL) compartilhado entre processos.
+    
+    Cada worker mantém seu cache em memória na frente; um miss local consulta
+    o arquivo, e todo set grava nele. Expirados e excesso são apagados a cada
+    _PURGE_EVERY gravações.
+    """
+
+    _PURGE_EVERY = 64
+
+    def __init__(self, path: str, max_entries: int, max_bytes: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS identify_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " cached_at REAL NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_identify_cache_expires ON identify_cache(expires_at)")
+
+    def get(self, key: str, now: float) -> Optional[tuple]:
+        """(value_json, cached_at, expires_at) ou None."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT value, cached_at, expires_at FROM identify_cache WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+
+    def set(self, key: str, payload: str, cached_at: float, expires_at: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO identify_cache VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), cached_at, expires_at),
+            )
+            self._writes += 1
+            if self._writes % self._PURGE_EVERY == 0:
+                self._purge(cached_at)
+
+    def _purge(self, now: float):
+        c = self._conn
+        c.execute("DELETE FROM identify_cache WHERE expires_at <= ?", (now,))
+        count, total = c.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM identify_cache").fetchone()
+        if count > self.max_entries or total > self.max_bytes:
+            # Mantém as mais recentes dentro dos dois limites
+            keep, size = [], 0
+            for key, s in c.execute("SELECT key, size FROM identify_cache ORDER BY cached_at DESC"):
+                if len(keep) >= self.max_entries or size + s > self.max_bytes:
+                    break
+                keep.append(key)
+                size += s
+            c.execute("CREATE TEMP TABLE IF NOT EXISTS _keep (key TEXT PRIMARY KEY)")
+            c.execute("DELETE FROM _keep")
+            c.executemany("INSERT INTO _keep VALUES (?)", [(k,) for k in keep])
+            c.execute("DELETE FROM identify_cache WHERE key NOT IN (SELECT key FROM _keep)")
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM identify_cache")
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM identify_cache WHERE expires_at > ?", (time.time(),)
+            ).fetchone()
+        return {"type": "sqlite", "path": self.path, "entries": count, "bytes": total}
+
+
+class TTLCache:
+    """Cache LRU em memória com expiração por heap e limite em bytes.
     
-    def __init__(self, max_size: int = 500):
-        self.cache = OrderedDict()
+    - Expiração O(log n): heap de (expires_at, key); entradas substituídas
+      ficam no heap e são descartadas ao sair (lazy delete).
+    - Tamanho contado em bytes (JSON serializado) além do número de entradas.
+    - backend opcional (SQLiteCacheBackend) compartilhado entre workers.
+    """
+
+    def __init__(self, max_size: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES, backend=None):
+        self.cache: "OrderedDict[str, dict]" = OrderedDict()
         self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self._sizes: dict = {}
+        self._views: dict = {}
+        self._heap: list = []
+        self.bytes = 0
         self.hits = 0
         self.misses = 0
-    
-    def get(self, key: str) -> Optional[dict]:
-        """Busca item no cache. Move para o final se encontrado (mais recente)."""
+        self.shared_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._lock = threading.RLock()
+
+    def _drop(self, key: str):
+        del self.cache[key]
+        self._views.pop(key, None)
+        self.bytes -= self._sizes.pop(key, 0)
+
+    def _expire(self, now: float):
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            expires_at, key = heapq.heappop(heap)
+            entry = self.cache.get(key)
+            if entry is not None and entry['_expires_at'] == expires_at:
+                self._drop(key)
+                self.expirations += 1
+        # Muitas entradas substituídas acumuladas no heap: reconstrói
+        if len(heap) > 2 * len(self.cache) + 64:
+            self._heap = [(v['_expires_at'], k) for k, v in self.cache.items()]
+            heapq.heapify(self._heap)
+
+    def _insert(self, key: str, value: dict, size: int):
         if key in self.cache:
-            # Move para o final (mais recente)
-            self.cache.move_to_end(key)
-            self.hits += 1
+            self._drop(key)
+        while self.cache and (len(self.cache) >= self.max_size or self.bytes + size > self.max_bytes):
+            self._drop(next(iter(self.cache)))
+            self.evictions += 1
+        self.cache[key] = value
+        self._sizes[key] = size
+        self.bytes += size
+        heapq.heappush(self._heap, (value['_expires_at'], key))
+
+    def get_view(self, key: str) -> Optional[dict]:
+        """Visão pública (somente leitura) do item, ou None. Move para o final se encontrado."""
+        with self._lock:
+            now = time.time()
+            self._expire(now)
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                view = self._views.get(key)
+                if view is None:
+                    view = self._views[key] = _public_view(self.cache[key])
+                return view
+            if self.backend is not None:
+                row = self.backend.get(key, now)
+                if row is not None:
+                    payload, cached_at, expires_at = row
+                    value = json.loads(payload)
+                    value['_cached_at'] = cached_at
+                    value['_expires_at'] = expires_at
+                    self._insert(key, value, len(payload))
+                    self.hits += 1
+                    self.shared_hits += 1
+                    view = self._views[key] = _public_view(value)
+                    return view
+            self.misses += 1
+            return None
+
+    def get(self, key: str) -> Optional[dict]:
+        """Busca item no cache (com metadados internos)."""
+        with self._lock:
+            if self.get_view(key) is None:
+                return None
             return self.cache[key]
-        self.misses += 1
-        return None
-    
+
     def set(self, key: str, value: dict, ttl_seconds: int = 3600):
-        """Adiciona item ao cache com TTL opcional."""
-        # Remove itens expirados e mais antigos se necessário
+        """Adiciona item ao cache com TTL."""
         current_time = time.time()
-        
-        # Limpar expirados
-        expired_keys = [
-            k for k, v in self.cache.items() 
-            if v.get('_expires_at', float('inf')) < current_time
-        ]
-        for k in expired_keys:
-            del self.cache[k]
-        
-        # Se ainda estiver cheio, remove o mais antigo
-        while len(self.cache) >= self.max_size:
-            self.cache.popitem(last=False)
-        
-        # Adiciona com timestamp de expiração
+        payload = json.dumps(value, default=str, ensure_ascii=False)
+        if len(payload) > self.max_bytes:
+            logger.info(f"[CACHE] ignorado: {len(payload)} bytes excede o limite")
+            return
         value['_expires_at'] = current_time + ttl_seconds
         value['_cached_at'] = current_time
-        self.cache[key] = value
-    
+        with self._lock:
+            self._expire(current_time)
+            self._insert(key, value, len(payload))
+        if self.backend is not None:
+            try:
+                self.backend.set(key, payload, current_time, value['_expires_at'])
+            except sqlite3.Error as e:
+                logger.warning(f"[CACHE] Erro no backend compartilhado: {e}")
+
     def stats(self) -> dict:
         """Retorna estatísticas do cache."""
-        total = self.hits + self.misses
-        return {
-            "size": len(self.cache),
-            "max_size": self.max_size,
-            "hits": self.hits,
-            "misses": self.misses,
-            "hit_rate": f"{(self.hits / total * 100):.1f}%" if total > 0 else "N/A"
-        }
-    
+        with self._lock:
+            self._expire(time.time())
+            total = self.hits + self.misses
+            stats = {
+                "size": len(self.cache),
+                "max_size": self.max_size,
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": f"{(self.hits / total * 100):.1f}%" if total > 0 else "N/A",
+                "shared_hits": self.shared_hits,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "backend": {"type": "memory"},
+            }
+        if self.backend is not None:
+            try:
+                stats["backend"] = self.backend.stats()
+            except sqlite3.Error as e:
+                stats["backend"] = {"type": "sqlite", "error": str(e)}
+        return stats
+
     def clear(self):
-        """Limpa o cache."""
-        self.cache.clear()
-        self.hits = 0
-        self.misses = 0
+        """Limpa o cache (inclusive o backend compartilhado)."""
+        with self._lock:
+            self.cache.clear()
+            self._sizes.clear()
+            self._views.clear()
+            self._heap = []
+            self.bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.shared_hits = 0
+            self.evictions = 0
+            self.expirations = 0
+        if self.backend is not None:
+            self.backend.clear()
+
+
+def _create_backend():
+    if CACHE_BACKEND != "sqlite":
+        return None
+    try:
+        return SQLiteCacheBackend(CACHE_SQLITE_PATH, CACHE_MAX_ENTRIES * 4, CACHE_MAX_BYTES * 4)
+    except sqlite3.Error as e:
+        logger.warning(f"[CACHE] Backend SQLite indisponível ({e}); usando só memória")
+        return None
 
 
 # Instância global do cache
-_dish_cache = LRUCache(max_size=500)
+_dish_cache = TTLCache(backend=_create_backend())
 
 
 def get_image_hash(image_bytes: bytes, restaurant: str = '') -> str:
@@ -101,13 +299,11 @@ def get_image_hash(image_bytes: bytes, restaurant: str = '') -> str:
 def get_cached_result(image_bytes: bytes, restaurant: str = '') -> Optional[dict]:
     """Busca resultado em cache baseado no hash da imagem + restaurant."""
     image_hash = get_image_hash(image_bytes, restaurant)
-    result = _dish_cache.get(image_hash)
+    view = _dish_cache.get_view(image_hash)
     
-    if result:
-        # Remove metadados internos do cache antes de retornar
-        result_copy = {k: v for k, v in result.items() if not k.startswith('_')}
-        result_copy['source'] = result.get('source', 'unknown') + '_cached'
-        result_copy['from_cache'] = True
+    if view:
+        # Visão pública pré-montada; cópia rasa porque o chamador altera o resultado
+        result_copy = dict(view)
         logger.info(f"[CACHE] ✓ Hit! Prato: {result_copy.get('dish_display', 'N/A')} (restaurant={restaurant or 'external'})")
         return result_copy
     
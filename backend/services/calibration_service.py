@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+SoulNutri - Análise de calibração do CLIP (coleção calibration_log)
+
+Lê a coleção inteira em blocos (cursor ordenado por created_at, índice do
+registro) e acumula só os vetores score, is_correct, dish_clip e dish_real. A
+análise é vetorizada com NumPy sobre UMA ordenação por score:
+
+- estatísticas e histograma por faixa (mesmas faixas do painel admin)
+- curva ROC completa + AUC e Youden's J (mesma semântica do endpoint antigo:
+  thresholds = scores arredondados a 2 casas, aceita score >= t)
+- precisão/recall por prato (dish_clip = predição, dish_real = verdade)
+- thresholds propostos por prato e por família (Youden do subconjunto),
+  só onde há amostras suficientes das duas classes
+
+Os thresholds propostos podem ser aplicados em ai.policy.analyze_result
+(set_calibrated_thresholds) — o endpoint de apply persiste em settings.
+
+Config:
+    SOULNUTRI_CALIBRATION_CHUNK        documentos por bloco do cursor (default 5000)
+    SOULNUTRI_CALIBRATION_MIN_SAMPLES  mínimo por classe p/ propor threshold (default 5)
+"""
+import logging
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CALIBRATION_CHUNK = int(os.environ.get("SOULNUTRI_CALIBRATION_CHUNK", "5000"))
+CALIBRATION_MIN_SAMPLES = int(os.environ.get("SOULNUTRI_CALIBRATION_MIN_SAMPLES", "5"))
+
+# Faixa aceitável para um threshold proposto (evita extremos com poucas amostras)
+THRESHOLD_MIN = 0.50
+THRESHOLD_MAX = 0.95
+
+# Faixas do histograma: (chave, limite inferior), da maior para a menor
+DISTRIBUTION_BINS = [
+    ("0.90_1.00", 0.90),
+    ("0.85_0.90", 0.85),
+    ("0.80_0.85", 0.80),
+    ("0.75_0.80", 0.75),
+    ("0.70_0.75", 0.70),
+    ("0.65_0.70", 0.65),
+    ("0.60_0.65", 0.60),
+    ("0.50_0.60", 0.50),
+    ("0.00_0.50", 0.0),
+]
+_BIN_EDGES = np.array([lo for _, lo in reversed(DISTRIBUTION_BINS[:-1])])  # 0.50 ... 0.90
+
+SAMPLE_PROJECTION = {
+    "dish_clip": 1, "dish_real": 1, "is_correct": 1, "score": 1,
+    "confidence": 1, "source": 1, "created_at": 1,
+}
+
+
+# ═══════════════════════════════════════════════════════════
+# LEITURA EM BLOCOS
+# ═══════════════════════════════════════════════════════════
+
+class CalibrationData:
+    """Vetores de calibração acumulados bloco a bloco."""
+
+    def __init__(self):
+        self._scores: List[np.ndarray] = []
+        self._correct: List[np.ndarray] = []
+        self._dishes: List[str] = []
+        self._real: List[str] = []
+        self.recent: List[dict] = []   # amostras mais recentes (para a tabela do admin)
+
+    def add(self, docs: List[dict]):
+        self._scores.append(np.fromiter((float(d.get("score") or 0) for d in docs), dtype=np.float64, count=len(docs)))
+        self._correct.append(np.fromiter((bool(d.get("is_correct")) for d in docs), dtype=bool, count=len(docs)))
+        self._dishes.extend(d.get("dish_clip") or "" for d in docs)
+        self._real.extend(d.get("dish_real") or d.get("dish_clip") or "" for d in docs)
+
+    def arrays(self):
+        """(scores, is_correct, dish_clip, dish_real) — entrada de analyze()."""
+        if not self._scores:
+            return np.zeros(0), np.zeros(0, dtype=bool), np.zeros(0, dtype=object), np.zeros(0, dtype=object)
+        return (np.concatenate(self._scores), np.concatenate(self._correct),
+                np.array(self._dishes, dtype=object), np.array(self._real, dtype=object))
+
+
+def _serialize_sample(doc: dict) -> dict:
+    doc = dict(doc)
+    doc["_id"] = str(doc.get("_id"))
+    if hasattr(doc.get("created_at"), "isoformat"):
+        doc["created_at"] = doc["created_at"].isoformat()
+    return doc
+
+
+async def load_calibration(collection, chunk_size: int = None, keep_recent: int = 200) -> CalibrationData:
+    """Percorre a coleção inteira (mais recentes primeiro) em blocos de chunk_size."""
+    chunk_size = chunk_size or CALIBRATION_CHUNK
+    data = CalibrationData()
+    cursor = collection.find({}, SAMPLE_PROJECTION, sort=[("created_at", -1)])
+    while True:
+        docs = await cursor.to_list(chunk_size)
+        if not docs:
+            break
+        if len(data.recent) < keep_recent:
+            data.recent.extend(_serialize_sample(d) for d in docs[:keep_recent - len(data.recent)])
+        data.add(docs)
+        if len(docs) < chunk_size:
+            break
+    return data
+
+
+# ═══════════════════════════════════════════════════════════
+# ANÁLISE VETORIZADA
+# ═══════════════════════════════════════════════════════════
+
+def _score_stats(values: np.ndarray) -> dict:
+    if values.size == 0:
+        return {"min": None, "max": None, "avg": None, "median": None}
+    # values já vem ordenado (ascendente); mediana = elemento n//2, como antes
+    return {
+        "min": round(float(values[0]), 4),
+        "max": round(float(values[-1]), 4),
+        "avg": round(float(values.mean()), 4),
+        "median": round(float(values[values.size // 2]), 4),
+    }
+
+
+def _distribution(scores: np.ndarray, correct: np.ndarray) -> dict:
+    # searchsorted 'right': score == limite cai na faixa de cima (>=), como o if/elif antigo
+    bins = len(DISTRIBUTION_BINS) - 1 - np.searchsorted(_BIN_EDGES, scores, side="right")
+    n = len(DISTRIBUTION_BINS)
+    ok = np.bincount(bins[correct], minlength=n)
+    bad = np.bincount(bins[~correct], minlength=n)
+    return {key: {"correct": int(ok[i]), "incorrect": int(bad[i])} for i, (key, _) in enumerate(DISTRIBUTION_BINS)}
+
+
+def _sweep(pos: np.ndarray, neg: np.ndarray, thresholds: np.ndarray):
+    """Sensibilidade/especificidade em cada threshold (pos/neg ordenados ascendentes)."""
+    tp = pos.size - np.searchsorted(pos, thresholds, side="left")   # corretos com score >= t
+    tn = np.searchsorted(neg, thresholds, side="left")               # errados com score < t
+    return tp / pos.size, tn / neg.size
+
+
+def youden(pos: np.ndarray, neg: np.ndarray, min_samples: int = CALIBRATION_MIN_SAMPLES) -> Optional[dict]:
+    """Threshold ótimo de Youden's J entre scores corretos (pos) e errados (neg), já ordenados."""
+    if pos.size < min_samples or neg.size < min_samples:
+        return None
+    thresholds = np.unique(np.round(np.concatenate([pos, neg]), 2))
+    sensitivity, specificity = _sweep(pos, neg, thresholds)
+    j = sensitivity + specificity - 1
+    best = int(np.argmax(j))  # primeiro máximo, como o loop antigo
+    t, sens, spec = float(thresholds[best]), float(sensitivity[best]), float(specificity[best])
+    return {
+        "optimal_threshold": round(t, 4),
+        "j_index": round(float(j[best]), 4),
+        "sensitivity": round(sens, 4),
+        "specificity": round(spec, 4),
+        "interpretation": f"Com threshold {t:.2%}: aceita {sens:.0%} dos corretos, rejeita {spec:.0%} dos errados",
+        "samples": {"correct": int(pos.size), "incorrect": int(neg.size)},
+    }
+
+
+def roc_curve(pos: np.ndarray, neg: np.ndarray) -> Optional[dict]:
+    """Curva ROC nos thresholds distintos (2 casas) + AUC da curva em resolução total."""
+    if pos.size == 0 or neg.size == 0:
+        return None
+    thresholds = np.unique(np.round(np.concatenate([pos, neg]), 2))[::-1]
+    tpr, spec = _sweep(pos, neg, thresholds)
+    # AUC = P(score correto > score errado), empates valem 1/2 (Mann-Whitney)
+    below = np.searchsorted(neg, pos, side="left")
+    ties = np.searchsorted(neg, pos, side="right") - below
+    auc = float((below + 0.5 * ties).sum() / (pos.size * neg.size))
+    return {
+        "thresholds": [round(float(t), 2) for t in thresholds],
+        "tpr": [round(float(v), 4) for v in tpr],
+        "fpr": [round(float(v), 4) for v in 1 - spec],
+        "auc": round(auc, 4),
+    }
+
+
+def _group_thresholds(scores, correct, keys, min_samples) -> Dict[str, dict]:
+    """Youden por grupo (prato ou família). scores/correct/keys ordenados por score."""
+    proposals = {}
+    names, inverse = np.unique(keys, return_inverse=True)
+    for g, name in enumerate(names):
+        if not name:
+            continue
+        mask = inverse == g
+        result = youden(scores[mask & correct], scores[mask & ~correct], min_samples)
+        if result:
+            result["optimal_threshold"] = round(min(max(result["optimal_threshold"], THRESHOLD_MIN), THRESHOLD_MAX), 4)
+            proposals[str(name)] = result
+    return proposals
+
+
+def analyze(scores: np.ndarray, correct: np.ndarray, dishes: np.ndarray, real: np.ndarray = None,
+            min_samples: int = CALIBRATION_MIN_SAMPLES, family_of=None) -> dict:
+    """
+    Estatísticas, histograma, ROC, Youden, precisão/recall por prato e thresholds
+    propostos. family_of(dish) -> família ou None (default: ai.families.get_family).
+    """
+    if family_of is None:
+        from ai.families import get_family as family_of
+
+    order = np.argsort(scores, kind="stable")
+    scores, correct, dishes = scores[order], correct[order], dishes[order]
+
+    scored = scores > 0
+    pos = scores[correct & scored]
+    neg = scores[~correct & scored]
+
+    stats = {
+        "total_samples": int(scores.size),
+        "correct_count": int(correct.sum()),
+        "incorrect_count": int((~correct).sum()),
+        "correct_scores": _score_stats(pos),
+        "incorrect_scores": _score_stats(neg),
+    }
+
+    # Precisão/recall por prato: dish_clip é a predição; nos acertos dish_real == dish_clip
+    real = dishes if real is None else real
+    names, inverse = np.unique(np.concatenate([dishes, real]), return_inverse=True)
+    pred_idx, real_idx = inverse[:dishes.size], inverse[dishes.size:]
+    predicted = np.bincount(pred_idx, minlength=names.size)
+    actual = np.bincount(real_idx, minlength=names.size)
+    hits = np.bincount(pred_idx[correct], minlength=names.size)
+    per_dish = {
+        str(name): {
+            "predicted": int(predicted[i]),
+            "actual": int(actual[i]),
+            "correct": int(hits[i]),
+            "precision": round(float(hits[i] / predicted[i]), 4) if predicted[i] else None,
+            "recall": round(float(hits[i] / actual[i]), 4) if actual[i] else None,
+        }
+        for i, name in enumerate(names) if name
+    }
+
+    dish_keys = np.where(scored, dishes, "")
+    family_names = {d: family_of(d) or "" for d in names}
+    family_names[""] = ""
+    family_keys = np.array([family_names[d] for d in dish_keys], dtype=object)
+
+    return {
+        "stats": stats,
+        "distribution": _distribution(scores, correct),
+        "youden": youden(pos, neg, min_samples),
+        "roc": roc_curve(pos, neg),
+        "per_dish": per_dish,
+        "proposed_thresholds": {
+            "min_samples": min_samples,
+            "dishes": _group_thresholds(scores, correct, dish_keys, min_samples),
+            "families": _group_thresholds(scores, correct, family_keys, min_samples),
+        },
+    }
+
@@ -8,6 +8,8 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from typing import Optional, Dict, List
 from dotenv import load_dotenv
 
+from services.norm_key_service import with_norm_keys
+
 load_dotenv()
 
 # Cliente MongoDB global
@@ -61,7 +63,7 @@ async def update_dish(slug: str, data: Dict) -> bool:
     db = get_db()
     from datetime import datetime
     data['updated_at'] = datetime.utcnow()
-    result = await db.dishes.update_one({'slug': slug}, {'$set': data})
+    result = await db.dishes.update_one({'slug': slug}, {'$set': with_norm_keys('dishes', data)})
     return result.modified_count > 0
 
 async def add_dish(dish_data: Dict) -> bool:
@@ -71,7 +73,7 @@ async def add_dish(dish_data: Dict) -> bool:
     dish_data['created_at'] = datetime.utcnow()
     dish_data['updated_at'] = datetime.utcnow()
     dish_data['ativo'] = True
-    result = await db.dishes.insert_one(dish_data)
+    result = await db.dishes.insert_one(with_norm_keys('dishes', dish_data))
     return result.inserted_id is not None
 
 # =============================================
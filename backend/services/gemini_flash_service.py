@@ -7,15 +7,18 @@ import os
 def is_gemini_flash_available() -> bool:
     """Verifica se o Gemini Flash está disponível"""
     try:
+        from services.gemini_gateway import is_fake_provider
         api_key = os.environ.get("GOOGLE_API_KEY") or os.environ.get("EMERGENT_LLM_KEY")
-        return bool(api_key)
+        return bool(api_key) or is_fake_provider()
     except Exception:
         return False
 
 def get_gemini_flash_status() -> dict:
     """Retorna status do Gemini Flash"""
+    from services.gemini_gateway import get_gateway_stats
     available = is_gemini_flash_available()
-    return {"available": available, "model": "gemini-2.5-flash-lite" if available else None}
+    return {"available": available, "model": "gemini-2.5-flash-lite" if available else None,
+            "gateway": get_gateway_stats()}
 
 """
 OBJETIVO: Identificar pratos com alta precisão e retornar dados completos
@@ -31,7 +34,9 @@ FREE TIER: 1.500 requisições/dia grátis
 """
 
 import os
+import io
 import json
+import asyncio
 import tempfile
 import time
 import logging
@@ -42,6 +47,9 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Deadline do fallback Emergent (mais lento: 3-8s)
+EMERGENT_TIMEOUT_S = float(os.environ.get("SOULNUTRI_EMERGENT_TIMEOUT_S", "15"))
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # PROMPT OTIMIZADO PARA GEMINI 2.5 FLASH
 # Foco: Precisão, velocidade e dados completos em UM único request
@@ -100,6 +108,38 @@ RETORNE JSON:
 }"""
 
 
+def _prepare_image(image_bytes: bytes, request_id: Optional[str] = None):
+    """Reduz para 384px e recodifica em JPEG q65. Retorna (imagem PIL, bytes JPEG)."""
+    from PIL import Image
+    
+    img = Image.open(io.BytesIO(image_bytes))
+    
+    if request_id is not None:
+        try:
+            _exif_orientation = img.getexif().get(274, 'n/a')
+        except Exception:
+            _exif_orientation = 'n/a'
+        logger.info(
+            f"[IDENTIFY_GEMINI] request_id={request_id} etapa=image_open "
+            f"formato_detectado={img.format} mode={img.mode} size={img.size} "
+            f"bytes_recebidos={len(image_bytes)} exif_orientation={_exif_orientation}"
+        )
+    
+    # 384px é suficiente para identificação e mais rápido que 512px
+    max_size = 384
+    ratio = max_size / max(img.size)
+    if ratio < 1:
+        img = img.resize((int(img.size[0] * ratio), int(img.size[1] * ratio)), Image.LANCZOS)
+    
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    
+    # JPEG quality 65 é suficiente para identificação
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=65)
+    return img, buffer.getvalue()
+
+
 async def identify_dish_gemini_flash(
     image_bytes: bytes,
     user_profile: Optional[Dict] = None,
@@ -114,9 +154,7 @@ async def identify_dish_gemini_flash(
     - Google API: 200-500ms ✅
     - Emergent Key: 3000-8000ms (fallback)
     """
-    from PIL import Image
-    from google import genai
-    import io
+    from services.gemini_gateway import get_gemini_gateway, is_fake_provider
     
     start_time = time.time()
     _diag_on = os.environ.get("IDENTIFY_DEBUG_LOGS", "false").lower() == "true"
@@ -126,32 +164,8 @@ async def identify_dish_gemini_flash(
         # OTIMIZAÇÃO DE IMAGEM: Balanço entre qualidade e velocidade
         # Imagem menor = upload mais rápido = resposta mais rápida
         # ═══════════════════════════════════════════════════════════════════
-        img = Image.open(io.BytesIO(image_bytes))
-        
-        if _diag_on:
-            try:
-                _exif_orientation = img.getexif().get(274, 'n/a')
-            except Exception:
-                _exif_orientation = 'n/a'
-            logger.info(
-                f"[IDENTIFY_GEMINI] request_id={request_id} etapa=image_open "
-                f"formato_detectado={img.format} mode={img.mode} size={img.size} "
-                f"bytes_recebidos={len(image_bytes)} exif_orientation={_exif_orientation}"
-            )
-        
-        # 384px é suficiente para identificação e mais rápido que 512px
-        max_size = 384
-        ratio = max_size / max(img.size)
-        if ratio < 1:
-            img = img.resize((int(img.size[0] * ratio), int(img.size[1] * ratio)), Image.LANCZOS)
-        
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        # JPEG quality 65 é suficiente para identificação
-        buffer = io.BytesIO()
-        img.save(buffer, format='JPEG', quality=65)
-        img_bytes = buffer.getvalue()
+        # Decode/resize/encode fora do event loop
+        img, img_bytes = await asyncio.to_thread(_prepare_image, image_bytes, request_id if _diag_on else None)
         
         prep_time = (time.time() - start_time) * 1000
         logger.info(f"[GeminiFlash] Imagem preparada em {prep_time:.0f}ms ({len(img_bytes)/1024:.1f}KB)")
@@ -174,24 +188,18 @@ Identifique este prato. O que você vê na imagem? Seja preciso."""
         # OPÇÃO 1: Google API direta (PREFERIDO - rápido e barato)
         # Esperado: 200-500ms
         # ═══════════════════════════════════════════════════════════════════
-        google_key = os.environ.get('GOOGLE_API_KEY')
-        if google_key:
-            # Usar apenas o modelo mais rápido primeiro
+        gateway = get_gemini_gateway()
+        if gateway is not None:
+            # Usar apenas o modelo mais rápido primeiro (cliente reutilizado, async, com deadline)
             try:
-                client = genai.Client(api_key=google_key)
-                
                 api_start = time.time()
-                response = client.models.generate_content(
-                    model='gemini-2.5-flash-lite',
-                    contents=[
-                        prompt,
-                        genai.types.Part.from_bytes(data=img_bytes, mime_type="image/jpeg")
-                    ]
-                )
+                response_text = (await gateway.generate(
+                    'gemini-2.5-flash-lite',
+                    [prompt, gateway.image_part(img_bytes, "image/jpeg")]
+                )).strip()
                 api_time_ms = (time.time() - api_start) * 1000
                 
-                response_text = response.text.strip()
-                source_used = "google_api"
+                source_used = gateway.provider.name
                 logger.info(f"[GeminiFlash] ✅ GOOGLE API respondeu em {api_time_ms:.0f}ms")
                 if _diag_on:
                     logger.info(f"[IDENTIFY_GEMINI] request_id={request_id} provider=google_api etapa=response_ok latency_ms={api_time_ms:.0f}")
@@ -210,7 +218,7 @@ Identifique este prato. O que você vê na imagem? Seja preciso."""
         # OPÇÃO 2: Emergent LLM Key (FALLBACK - mais lento mas confiável)
         # Esperado: 3000-8000ms
         # ═══════════════════════════════════════════════════════════════════
-        if response_text is None:
+        if response_text is None and not is_fake_provider():
             emergent_key = os.environ.get('EMERGENT_LLM_KEY')
             if emergent_key:
                 try:
@@ -242,7 +250,7 @@ Identifique este prato. O que você vê na imagem? Seja preciso."""
                         )
                         
                         api_start = time.time()
-                        response = await chat.send_message(user_message)
+                        response = await asyncio.wait_for(chat.send_message(user_message), timeout=EMERGENT_TIMEOUT_S)
                         api_time_ms = (time.time() - api_start) * 1000
                         
                         response_text = response.strip()
@@ -394,21 +402,16 @@ async def enrich_dish_gemini(nome: str, ingredientes: list) -> Dict:
     response_text = None
     
     # Tentar Google API primeiro
-    google_key = os.environ.get('GOOGLE_API_KEY')
-    if google_key:
+    from services.gemini_gateway import get_gemini_gateway, is_fake_provider
+    gateway = get_gemini_gateway()
+    if gateway is not None:
         try:
-            from google import genai
-            client = genai.Client(api_key=google_key)
-            response = client.models.generate_content(
-                model='gemini-2.5-flash-lite',
-                contents=[prompt]
-            )
-            response_text = response.text.strip()
+            response_text = (await gateway.generate('gemini-2.5-flash-lite', [prompt])).strip()
         except Exception as e:
             logger.warning(f"[Enrich] Google API erro: {str(e)[:60]}")
     
     # Fallback: Emergent Key
-    if response_text is None:
+    if response_text is None and not is_fake_provider():
         emergent_key = os.environ.get('EMERGENT_LLM_KEY')
         if emergent_key:
             try:
@@ -419,7 +422,7 @@ async def enrich_dish_gemini(nome: str, ingredientes: list) -> Dict:
                     system_message="Retorne apenas JSON válido."
                 ).with_model("gemini", "gemini-2.5-flash")
                 msg = UserMessage(text=prompt)
-                resp = await chat.send_message(msg)
+                resp = await asyncio.wait_for(chat.send_message(msg), timeout=EMERGENT_TIMEOUT_S)
                 response_text = resp.strip() if resp else None
             except Exception as e:
                 logger.warning(f"[Enrich] Emergent erro: {str(e)[:60]}")
@@ -0,0 +1,234 @@
+"""
+SoulNutri - Gateway assíncrono para o Gemini (Google API)
+=========================================================
+Um único cliente reutilizado por processo, chamadas async (client.aio) ou,
+se o SDK não tiver API async, num executor limitado — nunca no event loop.
+Toda chamada passa por um limite de concorrência e um deadline (espera na
+fila + resposta), então scans externos não travam o servidor.
+
+Provider "fake" responde localmente (latência configurável, JSON no formato
+dos prompts) para testes de carga offline.
+
+Config:
+    SOULNUTRI_GEMINI_PROVIDER        "google" (padrão) ou "fake"
+    SOULNUTRI_GEMINI_CONCURRENCY     chamadas simultâneas por processo (default 8)
+    SOULNUTRI_GEMINI_TIMEOUT_S       deadline por chamada (default 10)
+    SOULNUTRI_FAKE_GEMINI_LATENCY_MS latência do fake, "300" ou faixa "200-800"
+    SOULNUTRI_FAKE_GEMINI_ERROR_RATE fração de chamadas do fake que falham (default 0)
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Optional
+
+from services.metrics_service import observe as observe_stage
+
+logger = logging.getLogger(__name__)
+
+GEMINI_PROVIDER = os.environ.get("SOULNUTRI_GEMINI_PROVIDER", "google").strip().lower()
+GEMINI_MAX_CONCURRENCY = max(1, int(os.environ.get("SOULNUTRI_GEMINI_CONCURRENCY", "8")))
+GEMINI_TIMEOUT_S = float(os.environ.get("SOULNUTRI_GEMINI_TIMEOUT_S", "10"))
+FAKE_LATENCY_MS = os.environ.get("SOULNUTRI_FAKE_GEMINI_LATENCY_MS", "300")
+FAKE_ERROR_RATE = float(os.environ.get("SOULNUTRI_FAKE_GEMINI_ERROR_RATE", "0"))
+
+
+class GeminiTimeoutError(Exception):
+    """Deadline estourado (fila de concorrência ou resposta da API)."""
+
+
+class GoogleGenAIProvider:
+    """google-genai com um cliente por processo."""
+
+    name = "google_api"
+
+    def __init__(self, api_key: str, max_workers: int = GEMINI_MAX_CONCURRENCY):
+        self._api_key = api_key
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._max_workers = max_workers
+        self._executor = None
+
+    def _get_client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from google import genai
+                    self._client = genai.Client(api_key=self._api_key)
+        return self._client
+
+    def image_part(self, data: bytes, mime_type: str = "image/jpeg"):
+        from google import genai
+        return genai.types.Part.from_bytes(data=data, mime_type=mime_type)
+
+    async def generate(self, model: str, contents: Any) -> str:
+        client = self._get_client()
+        aio = getattr(client, "aio", None)
+        if aio is not None:
+            response = await aio.models.generate_content(model=model, contents=contents)
+        else:
+            # SDK sem API async: executor limitado (fora do event loop)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="gemini")
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(
+                self._executor, partial(client.models.generate_content, model=model, contents=contents)
+            )
+        return response.text
+
+
+class FakeGeminiProvider:
+    """Provider local para testes de carga: responde JSON no formato dos prompts."""
+
+    name = "fake"
+
+    IDENTIFY_RESPONSE = {
+        "nome": "Arroz com Feijão", "cat": "veg", "kcal": 180, "prot": 7, "carb": 30, "gord": 3,
+        "alerg": [], "score": 0.9, "ing": ["arroz", "feijão", "cebola"],
+    }
+    ENRICH_RESPONSE = {
+        "benef": [{"texto": "Combinação completa de aminoácidos", "fonte": "USP"}],
+        "riscos": [{"texto": "Porções grandes elevam a carga glicêmica", "fonte": "OMS"}],
+        "curios": "Arroz com feijão é consumido diariamente pela maioria dos brasileiros.",
+        "combo": ["salada verde", "laranja"],
+        "noticias": [{"texto": "Leguminosas ajudam no controle glicêmico", "fonte": "Harvard"}],
+        "mito": {"mito": "Feijão engorda", "resposta": "MITO. É rico em fibras", "fonte": "Embrapa"},
+    }
+
+    def __init__(self, latency_ms: str = FAKE_LATENCY_MS, error_rate: float = FAKE_ERROR_RATE, seed: Optional[int] = None):
+        low, _, high = str(latency_ms).partition("-")
+        self.latency_range = (float(low) / 1000, float(high or low) / 1000)
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self.calls = 0
+
+    def image_part(self, data: bytes, mime_type: str = "image/jpeg"):
+        return {"mime_type": mime_type, "size": len(data)}
+
+    async def generate(self, model: str, contents: Any) -> str:
+        self.calls += 1
+        await asyncio.sleep(self._rng.uniform(*self.latency_range))
+        if self.error_rate and self._rng.random() < self.error_rate:
+            raise RuntimeError("503 UNAVAILABLE (fake)")
+        parts = contents if isinstance(contents, list) else [contents]
+        if any(isinstance(p, dict) and "mime_type" in p for p in parts):
+            return json.dumps(self.IDENTIFY_RESPONSE, ensure_ascii=False)
+        text = " ".join(p for p in parts if isinstance(p, str))
+        if '"benef"' in text:
+            return json.dumps(self.ENRICH_RESPONSE, ensure_ascii=False)
+        return "OK"
+
+
+class GeminiGateway:
+    """Limite de concorrência + deadline + métricas em volta de um provider."""
+
+    def __init__(self, provider, max_concurrency: int = GEMINI_MAX_CONCURRENCY, timeout_s: float = GEMINI_TIMEOUT_S):
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.timeout_s = timeout_s
+        self._semaphore = None
+        self._semaphore_loop = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.queue_timeouts = 0
+        self._latency_total_ms = 0.0
+        self.max_latency_ms = 0.0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    def image_part(self, data: bytes, mime_type: str = "image/jpeg"):
+        return self.provider.image_part(data, mime_type)
+
+    async def generate(self, model: str, contents: Any, timeout_s: Optional[float] = None) -> str:
+        """Texto da resposta. GeminiTimeoutError se o deadline estourar; erros da API propagam."""
+        deadline = timeout_s if timeout_s is not None else self.timeout_s
+        semaphore = self._get_semaphore()
+        start = time.perf_counter()
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=deadline)
+        except asyncio.TimeoutError:
+            self.queue_timeouts += 1
+            raise GeminiTimeoutError(f"Gemini: fila cheia por {deadline:.1f}s ({self.max_concurrency} em andamento)")
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            remaining = max(0.0, deadline - (time.perf_counter() - start))
+            text = await asyncio.wait_for(self.provider.generate(model, contents), timeout=remaining)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise GeminiTimeoutError(f"Gemini: sem resposta em {deadline:.1f}s")
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            semaphore.release()
+            observe_stage("gemini", (time.perf_counter() - start) * 1000)
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.calls += 1
+        self._latency_total_ms += elapsed_ms
+        self.max_latency_ms = max(self.max_latency_ms, elapsed_ms)
+        return text
+
+    def stats(self) -> dict:
+        return {
+            "provider": self.provider.name,
+            "max_concurrency": self.max_concurrency,
+            "timeout_s": self.timeout_s,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "queue_timeouts": self.queue_timeouts,
+            "avg_latency_ms": round(self._latency_total_ms / self.calls, 1) if self.calls else None,
+            "max_latency_ms": round(self.max_latency_ms, 1) if self.calls else None,
+        }
+
+
+_GATEWAY: Optional[GeminiGateway] = None
+_GATEWAY_KEY = None
+
+
+def get_gemini_gateway() -> Optional[GeminiGateway]:
+    """Gateway global; None sem GOOGLE_API_KEY (e provider não-fake)."""
+    global _GATEWAY, _GATEWAY_KEY
+    if GEMINI_PROVIDER == "fake":
+        key = "fake"
+    else:
+        key = os.environ.get("GOOGLE_API_KEY")
+        if not key:
+            return None
+    if _GATEWAY is None or _GATEWAY_KEY != key:
+        provider = FakeGeminiProvider() if key == "fake" else GoogleGenAIProvider(key)
+        _GATEWAY = GeminiGateway(provider)
+        _GATEWAY_KEY = key
+        logger.info(f"[GeminiGateway] provider={provider.name} concurrency={GEMINI_MAX_CONCURRENCY} timeout={GEMINI_TIMEOUT_S}s")
+    return _GATEWAY
+
+
+def is_fake_provider() -> bool:
+    return GEMINI_PROVIDER == "fake"
+
+
+def get_gateway_stats() -> Optional[dict]:
+    return _GATEWAY.stats() if _GATEWAY is not None else None
@@ -5,7 +5,10 @@ Camada de abstração para operações com imagens de pratos.
 Usa Object Storage (S3) como fonte primária, disco local como fallback.
 """
 import os
+import time
 import logging
+import threading
+import unicodedata
 from pathlib import Path
 from typing import Optional
 from datetime import datetime, timezone
@@ -14,14 +17,96 @@ logger = logging.getLogger(__name__)
 
 LOCAL_DATASET_DIR = Path("/app/datasets/organized")
 
+# Cache por processo slug -> imagens (dish_storage). Escritas deste módulo
+# invalidam na hora; o TTL cobre escritas de outros workers/scripts.
+IMAGES_CACHE_TTL_S = float(os.environ.get("SOULNUTRI_DISH_IMAGES_CACHE_TTL_S", "300"))
+IMAGES_CACHE_MAX_ENTRIES = 2048
+
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+_SLUG_NORM_READY = False
+_SLUG_NORM_TRIED_AT = None
+_IMAGES_CACHE = {}  # slug -> (slug_norm, imagens, expira_em)
+_IMAGES_CACHE_LOCK = threading.Lock()
+_FOLDER_MAP = None  # slug_norm -> [pastas locais]
+_FOLDER_MAP_MTIME = None  # (diretório, mtime_ns) do mapa atual
+_FOLDER_MAP_LOCK = threading.Lock()
+_REPRESENTATIVE = {}  # pasta -> (mtime_ns, imagem representativa)
+
+
+def normalize_slug(name: str) -> str:
+    """Chave de prato: sem acento, minúsculo, sem espaços/-/_/parênteses (campo slug_norm).
+    Scripts que gravam em dish_storage usam esta mesma função para o slug_norm."""
+    n = (name or '').lower().replace('-', '').replace('_', '').replace(' ', '').replace('(', '').replace(')', '')
+    nfkd = unicodedata.normalize('NFKD', n)
+    return ''.join(c for c in nfkd if not unicodedata.combining(c))
+
 
 def _get_db():
-    """Obtém conexão síncrona com MongoDB."""
-    import pymongo
-    from dotenv import load_dotenv
-    load_dotenv(Path(__file__).parent.parent / '.env')
-    client = pymongo.MongoClient(os.environ.get("MONGO_URL"))
-    return client[os.environ.get("DB_NAME", "soulnutri")]
+    """Obtém o db síncrono (MongoClient único por processo, com pool — thread-safe)."""
+    global _CLIENT
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                import pymongo
+                from dotenv import load_dotenv
+                load_dotenv(Path(__file__).parent.parent / '.env')
+                _CLIENT = pymongo.MongoClient(
+                    os.environ.get("MONGO_URL"),
+                    maxPoolSize=int(os.environ.get("SOULNUTRI_SYNC_MONGO_POOL", "10")),
+                    serverSelectionTimeoutMS=5000,
+                )
+    db = _CLIENT[os.environ.get("DB_NAME", "soulnutri")]
+    if not _SLUG_NORM_READY:
+        _ensure_slug_norm(db)
+    return db
+
+
+def _ensure_slug_norm(db):
+    """Índice em dish_storage.slug_norm + preenche documentos antigos sem o campo.
+    Uma vez por processo (nova tentativa a cada 60s se o Mongo estiver fora)."""
+    global _SLUG_NORM_READY, _SLUG_NORM_TRIED_AT
+    with _CLIENT_LOCK:
+        if _SLUG_NORM_READY or (_SLUG_NORM_TRIED_AT is not None and time.monotonic() - _SLUG_NORM_TRIED_AT < 60):
+            return
+        _SLUG_NORM_TRIED_AT = time.monotonic()
+    try:
+        db.dish_storage.create_index("slug_norm", name="slug_norm_1")
+        _backfill_slug_norm(db)
+        _SLUG_NORM_READY = True
+    except Exception as e:
+        logger.warning(f"[IMG] slug_norm não inicializado: {e}")
+
+
+def _backfill_slug_norm(db) -> int:
+    """Preenche slug_norm dos documentos de dish_storage gravados sem o campo."""
+    legacy = list(db.dish_storage.find({"slug_norm": {"$exists": False}}, {"_id": 1, "slug": 1}))
+    for d in legacy:
+        db.dish_storage.update_one({"_id": d["_id"]}, {"$set": {"slug_norm": normalize_slug(d.get("slug", ""))}})
+    if legacy:
+        logger.info(f"[IMG] slug_norm preenchido em {len(legacy)} documentos de dish_storage")
+    return len(legacy)
+
+
+def _find_by_slug_norm(db, query: dict, projection: dict):
+    """find_one em dish_storage pelo índice slug_norm. Se não achar e existirem
+    documentos sem o campo (gravados depois do backfill por outro processo ou
+    script antigo), preenche esses documentos e tenta de novo."""
+    doc = db.dish_storage.find_one(query, projection)
+    if doc is None and _backfill_slug_norm(db):
+        doc = db.dish_storage.find_one(query, projection)
+    return doc
+
+
+def invalidate_dish_images(slug: str = None):
+    """Descarta o cache de imagens do prato (todas as grafias do mesmo slug) ou tudo."""
+    with _IMAGES_CACHE_LOCK:
+        if slug is None:
+            _IMAGES_CACHE.clear()
+            return
+        norm = normalize_slug(slug)
+        for key in [k for k, v in _IMAGES_CACHE.items() if v[0] == norm]:
+            del _IMAGES_CACHE[key]
 
 
 def _get_async_db():
@@ -33,6 +118,11 @@ def _get_async_db():
 
 def get_dish_images_from_db(slug: str) -> list:
     """Retorna lista de imagens de um prato a partir do MongoDB dish_storage."""
+    now = time.monotonic()
+    cached = _IMAGES_CACHE.get(slug)
+    if cached and cached[2] > now:
+        return list(cached[1])
+    norm = normalize_slug(slug)
     try:
         db = _get_db()
         # Try exact match first
@@ -40,58 +130,84 @@ def get_dish_images_from_db(slug: str) -> list:
             {"slug": slug},
             {"_id": 0, "images": 1}
         )
-        if doc and doc.get("images"):
-            return doc["images"]
-        
-        # Try normalized match
-        norm = slug.lower().replace(' ', '_').replace('-', '_')
-        for d in db.dish_storage.find({}, {"_id": 0, "slug": 1, "images": 1}):
-            s = d.get("slug", "")
-            if s.lower().replace(' ', '_').replace('-', '_') == norm:
-                return d.get("images", [])
+        if not (doc and doc.get("images")):
+            # Normalized match (indice slug_norm)
+            doc = _find_by_slug_norm(
+                db,
+                {"slug_norm": norm, "images.0": {"$exists": True}},
+                {"_id": 0, "images": 1}
+            )
     except Exception as e:
         logger.warning(f"[IMG] MongoDB indisponivel para {slug}: {e}")
-    
-    return []
+        return []
+
+    images = (doc or {}).get("images") or []
+    with _IMAGES_CACHE_LOCK:
+        if len(_IMAGES_CACHE) >= IMAGES_CACHE_MAX_ENTRIES:
+            _IMAGES_CACHE.clear()
+        _IMAGES_CACHE[slug] = (norm, images, now + IMAGES_CACHE_TTL_S)
+    return list(images)
+
+
+def _count_images(folder: Path) -> int:
+    count = 0
+    for ext in ("*.jpg", "*.jpeg", "*.png", "*.webp"):
+        count += len(list(folder.glob(ext)))
+    return count
+
+
+def _folder_map() -> dict:
+    """Mapa slug_norm -> [pastas] do dataset local, reconstruído quando o mtime do
+    diretório muda (pasta criada/removida/renomeada) ou após invalidate_folder_map()."""
+    global _FOLDER_MAP, _FOLDER_MAP_MTIME
+    try:
+        mtime = (LOCAL_DATASET_DIR, LOCAL_DATASET_DIR.stat().st_mtime_ns)
+    except OSError:
+        return {}
+    if _FOLDER_MAP is not None and _FOLDER_MAP_MTIME == mtime:
+        return _FOLDER_MAP
+    with _FOLDER_MAP_LOCK:
+        if _FOLDER_MAP is not None and _FOLDER_MAP_MTIME == mtime:
+            return _FOLDER_MAP
+        folders = {}
+        try:
+            for folder in LOCAL_DATASET_DIR.iterdir():
+                if folder.is_dir():
+                    folders.setdefault(normalize_slug(folder.name), []).append(folder)
+        except OSError:
+            return {}
+        _FOLDER_MAP, _FOLDER_MAP_MTIME = folders, mtime
+    return folders
+
+
+def invalidate_folder_map():
+    """Chamar após criar/remover/renomear pastas em LOCAL_DATASET_DIR."""
+    global _FOLDER_MAP
+    with _FOLDER_MAP_LOCK:
+        _FOLDER_MAP = None
 
 
 def _find_local_folder(slug: str) -> Optional[Path]:
     """Encontra a pasta local correspondente ao slug, testando variações.
     Retorna a pasta com MAIS imagens quando há múltiplas correspondências."""
-    import unicodedata
-    
-    def _normalize(name):
-        n = name.lower().replace('-', '').replace('_', '').replace(' ', '').replace('(', '').replace(')', '')
-        nfkd = unicodedata.normalize('NFKD', n)
-        return ''.join(c for c in nfkd if not unicodedata.combining(c))
-    
-    def _count_images(folder):
-        count = 0
-        for ext in ("*.jpg", "*.jpeg", "*.png", "*.webp"):
-            count += len(list(folder.glob(ext)))
-        return count
-    
     if not LOCAL_DATASET_DIR.exists():
         return None
 
-    slug_norm = _normalize(slug)
-    best_folder = None
-    best_count = 0
+    candidates = [f for f in _folder_map().get(normalize_slug(slug), []) if f.is_dir()]
+    if len(candidates) == 1:
+        folder = candidates[0]
+        if any(next(folder.glob(ext), None) for ext in ("*.jpg", "*.jpeg", "*.png", "*.webp")):
+            return folder
+    elif candidates:
+        # Pastas duplicadas (ex.: "Arroz_Integral" e "arroz-integral"): a com mais imagens
+        best_folder, best_count = None, 0
+        for folder in candidates:
+            count = _count_images(folder)
+            if count > best_count:
+                best_folder, best_count = folder, count
+        if best_folder:
+            return best_folder
 
-    # Check ALL matching folders and pick the one with most images
-    try:
-        for folder in LOCAL_DATASET_DIR.iterdir():
-            if folder.is_dir() and _normalize(folder.name) == slug_norm:
-                count = _count_images(folder)
-                if count > best_count:
-                    best_count = count
-                    best_folder = folder
-    except OSError:
-        return None
-    
-    if best_folder:
-        return best_folder
-    
     # Direct match as last resort (for write operations)
     direct = LOCAL_DATASET_DIR / slug
     if direct.exists():
@@ -99,6 +215,37 @@ def _find_local_folder(slug: str) -> Optional[Path]:
     return None
 
 
+def representative_image(folder: Path) -> Optional[Path]:
+    """Primeira imagem > 5KB da pasta (ignora miniaturas); senão a primeira imagem.
+    Cache por mtime da pasta (upload/remoção de foto altera o mtime)."""
+    try:
+        mtime = folder.stat().st_mtime_ns
+    except OSError:
+        return None
+    cached = _REPRESENTATIVE.get(folder)
+    if cached and cached[0] == mtime and cached[1].exists():
+        return cached[1]
+    chosen = None
+    for ext in ("*.jpg", "*.jpeg", "*.png"):
+        for f in sorted(folder.glob(ext)):
+            if f.stat().st_size > 5000:
+                chosen = f
+                break
+        if chosen:
+            break
+    if not chosen:
+        for ext in ("*.jpg", "*.jpeg", "*.png"):
+            found = sorted(folder.glob(ext))
+            if found:
+                chosen = found[0]
+                break
+    if chosen:
+        if len(_REPRESENTATIVE) >= IMAGES_CACHE_MAX_ENTRIES:
+            _REPRESENTATIVE.clear()
+        _REPRESENTATIVE[folder] = (mtime, chosen)
+    return chosen
+
+
 def get_dish_image_bytes(slug: str, filename: str = None) -> tuple:
     """
     Retorna (bytes, content_type) de uma imagem.
@@ -178,11 +325,21 @@ def save_dish_image(slug: str, filename: str, content: bytes) -> dict:
     try:
         local_folder = _find_local_folder(canonical_slug)
         local_dir = local_folder if local_folder else LOCAL_DATASET_DIR / canonical_slug
-        local_dir.mkdir(parents=True, exist_ok=True)
-        (local_dir / filename).write_bytes(content)
+        if not local_dir.exists():
+            local_dir.mkdir(parents=True, exist_ok=True)
+            invalidate_folder_map()
+        local_path = local_dir / filename
+        local_path.write_bytes(content)
         result["ok"] = True
     except Exception as e:
         logger.error(f"[IMG] Erro local {canonical_slug}/{filename}: {e}")
+    else:
+        # Thumbnails na hora do upload: o grid admin nunca abre o PIL
+        try:
+            from services.thumbnail_service import register_source
+            register_source(local_path, content)
+        except Exception as e:
+            logger.warning(f"[THUMB] {canonical_slug}/{filename}: {e}")
 
     # 2. Upload para R2 (background-safe)
     try:
@@ -205,12 +362,15 @@ def save_dish_image(slug: str, filename: str, content: bytes) -> dict:
             {
                 "$push": {"images": image_entry},
                 "$inc": {"count": 1},
-                "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
+                "$set": {"updated_at": datetime.now(timezone.utc).isoformat(),
+                         "slug_norm": normalize_slug(canonical_slug)}
             },
             upsert=True
         )
     except Exception as e:
         logger.error(f"[IMG] MongoDB update {canonical_slug}: {e}")
+    finally:
+        invalidate_dish_images(canonical_slug)
 
     return result
 
@@ -221,22 +381,14 @@ def _resolve_canonical_slug(slug: str) -> str:
     Prioridade: dish_storage > dishes collection > pasta local > slug original.
     Retorna slug do DB (com hifens) para evitar duplicatas no dish_storage.
     """
-    import unicodedata
-    
-    def _normalize(name):
-        n = name.lower().replace('-', '').replace('_', '').replace(' ', '').replace('(', '').replace(')', '')
-        nfkd = unicodedata.normalize('NFKD', n)
-        return ''.join(c for c in nfkd if not unicodedata.combining(c))
-    
-    slug_norm = _normalize(slug)
+    slug_norm = normalize_slug(slug)
     
-    # 1. Verificar dish_storage no MongoDB (fonte da verdade para R2)
+    # 1. Verificar dish_storage no MongoDB (fonte da verdade para R2) — indice slug_norm
     try:
         db = _get_db()
-        for doc in db.dish_storage.find({}, {"_id": 0, "slug": 1}):
-            s = doc.get("slug", "")
-            if _normalize(s) == slug_norm:
-                return s
+        doc = _find_by_slug_norm(db, {"slug_norm": slug_norm}, {"_id": 0, "slug": 1})
+        if doc and doc.get("slug"):
+            return doc["slug"]
     except Exception:
         pass
     
@@ -245,15 +397,15 @@ def _resolve_canonical_slug(slug: str) -> str:
         db = _get_db()
         for doc in db.dishes.find({}, {"_id": 0, "slug": 1}):
             s = doc.get("slug", "")
-            if _normalize(s) == slug_norm:
+            if normalize_slug(s) == slug_norm:
                 return s
     except Exception:
         pass
     
     # 3. Verificar pasta local existente (fallback)
-    for folder in LOCAL_DATASET_DIR.iterdir():
-        if folder.is_dir() and _normalize(folder.name) == slug_norm:
-            return folder.name
+    folders = _folder_map().get(slug_norm)
+    if folders:
+        return folders[0].name
     
     # 4. Fallback: canonizar o slug de entrada (Camada 1)
     #    Garante que novos documentos em dish_storage usem formato canonico.
@@ -272,6 +424,7 @@ def delete_dish_image_from_storage(slug: str, filename: str) -> dict:
                 "$inc": {"count": -1}
             }
         )
+        invalidate_dish_images(slug)
         # Remover localmente usando _find_local_folder (resolve slug vs nome real da pasta)
         local_folder = _find_local_folder(slug)
         if local_folder:
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+SoulNutri - Registro declarativo de índices do MongoDB
+Todo índice de que uma consulta do server/serviços depende fica declarado
+aqui (ou nos registros dos serviços que são donos da coleção, importados
+abaixo) e é aplicado no startup por ensure_indexes(), de forma idempotente:
+create_index com a mesma especificação não faz nada.
+
+Nomes explícitos = os que o MongoDB geraria (ex.: "slug_1"), para não
+conflitar com índices criados antes por scripts/providers.
+
+tests/query_plan_harness.py roda as consultas de cada endpoint contra estes
+índices e falha se o plano vencedor for COLLSCAN.
+"""
+import logging
+from typing import Dict, List, Tuple
+
+from services.norm_key_service import NORM_INDEXES
+from services.premium_rollup_service import ROLLUP_INDEXES
+
+logger = logging.getLogger(__name__)
+
+IndexSpec = Tuple[List[Tuple[str, int]], str, dict]  # (chaves, nome, opções do create_index)
+
+
+def _idx(*keys, **options) -> IndexSpec:
+    """_idx(("user_pin", 1), ("date", 1)) -> (chaves, "user_pin_1_date_1", opções)."""
+    return list(keys), "_".join(f"{field}_{direction}" for field, direction in keys), options
+
+
+INDEXES: Dict[str, List[IndexSpec]] = {
+    # login / premium por PIN (log_meal, metas, notificações, admin)
+    "users": [_idx(("pin_hash", 1)), _idx(("created_at", -1))],
+    # notification_service: 1 por dia por usuário + listagem mais recentes
+    "daily_logs": [_idx(("user_pin", 1), ("timestamp", -1))],
+    "notifications": [_idx(("user_pin", 1), ("date", 1)), _idx(("user_pin", 1), ("created_at", -1))],
+    # identify: família do prato (dishes / nutrition_sheets por slug e nome: NORM_INDEXES)
+    "dish_families": [_idx(("slug", 1))],
+    "dish_storage": [_idx(("slug", 1)), _idx(("slug_norm", 1))],
+    # admin: calibração, moderação, feedback, auditoria, novidades, uso de APIs
+    "calibration_log": [_idx(("created_at", -1))],
+    "moderation_queue": [_idx(("status", 1), ("created_at", -1)), _idx(("created_at", -1))],
+    "feedback": [_idx(("is_correct", 1))],
+    "nutrition_audit_log": [_idx(("dish_slug", 1), ("timestamp", -1)), _idx(("timestamp", -1))],
+    "novidades": [_idx(("dish_slug", 1), ("ativa", 1)), _idx(("ativa", 1), ("data_criacao", -1))],
+    "settings": [_idx(("key", 1))],
+    "api_usage": [_idx(("service", 1), ("month", -1)), _idx(("type", 1))],
+    # breaking news (providers também garantem os seus, com os mesmos nomes)
+    "contextual_breaking_news": [_idx(("tags", 1)), _idx(("data", -1)), _idx(("ativo", 1)),
+                                 _idx(("id", 1), unique=True, sparse=True)],
+    "breaking_news_cache": [_idx(("expires_at", 1), expireAfterSeconds=0)],
+}
+
+
+def _merge(registry: Dict[str, List[IndexSpec]]):
+    for collection, specs in registry.items():
+        known = {name for _, name, _ in INDEXES.setdefault(collection, [])}
+        INDEXES[collection].extend(spec for spec in specs if spec[1] not in known)
+
+
+# Registros dos serviços donos das coleções
+_merge(ROLLUP_INDEXES)
+_merge({collection: [(keys, name, {}) for keys, name in specs] for collection, specs in NORM_INDEXES.items()})
+
+
+async def ensure_indexes(db, registry: Dict[str, List[IndexSpec]] = None) -> dict:
+    """Aplica o registro. Um índice que falha (ex.: conflito com um antigo de mesmo
+    nome e opções diferentes) é logado e não impede os demais."""
+    registry = INDEXES if registry is None else registry
+    ok, failed = 0, []
+    for collection, specs in registry.items():
+        for keys, name, options in specs:
+            try:
+                await db[collection].create_index(keys, name=name, **options)
+                ok += 1
+            except Exception as e:
+                failed.append(f"{collection}.{name}")
+                logger.warning(f"[INDEX] {collection}.{name} não criado: {e}")
+    return {"ok": ok, "failed": failed}
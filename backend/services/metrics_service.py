@@ -0,0 +1,305 @@
+"""
+SoulNutri - Métricas de latência por etapa (em memória)
+=======================================================
+Histogramas de buckets fixos (log, estilo HDR: 4 buckets por oitava, erro
+relativo ≤ 19%) para cada etapa do pipeline de identificação. Observar custa
+um bisect + incremento sob lock — sem alocação, sem MongoDB.
+
+Cada histograma guarda:
+- contagem acumulada (exposição Prometheus em /api/metrics)
+- janelas deslizantes de 1 slot por minuto → p50/p95/p99 em 1m / 5m / 15m
+  (exposição JSON em /api/debug/performance)
+
+Os últimos requests identificados (prato, engine, tempo) ficam num buffer
+circular para o relatório do painel admin quando ENABLE_PROCESSING_METRICS
+está ligado — substitui o insert em db.processing_metrics por request.
+
+Config:
+    SOULNUTRI_METRICS_SLOT_S       duração de cada slot da janela (default 60)
+    SOULNUTRI_METRICS_RECENT       requests guardados para o relatório admin (default 500)
+"""
+
+import os
+import math
+import time
+import bisect
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+METRICS_SLOT_S = float(os.environ.get("SOULNUTRI_METRICS_SLOT_S", "60"))
+METRICS_RECENT_REQUESTS = int(os.environ.get("SOULNUTRI_METRICS_RECENT", "500"))
+
+# Janelas reportadas (em slots de METRICS_SLOT_S)
+WINDOWS = {"1m": 1, "5m": 5, "15m": 15}
+QUANTILES = (0.50, 0.95, 0.99)
+
+# Etapas do identify (ordem = ordem de exibição)
+STAGES = {
+    "upload_read": "Leitura do upload",
+    "cache_lookup": "Hash da imagem + cache de resultados",
+    "hash_lookup": "Fast path pHash/dHash",
+    "decode": "Decode JPEG/PNG -> PIL",
+    "enhance": "Realce (autocontrast/sharpness/color)",
+    "preprocess": "Resize + normalização CLIP",
+    "onnx_run": "Forward ONNX (inclui espera do micro-batch)",
+    "similarity": "Similaridade de cosseno (melhor score por prato)",
+    "policy": "Política de decisão (analyze_result)",
+    "mongo": "Consultas MongoDB do identify",
+    "gemini": "Chamada ao Gemini (fila + resposta)",
+    "identify_total": "Identify de ponta a ponta",
+}
+
+
+def _bucket_bounds(min_ms: float = 0.05, max_ms: float = 120_000.0, per_octave: int = 4) -> List[float]:
+    """Limites superiores dos buckets: min_ms * 2^(i/per_octave) até max_ms."""
+    bounds = []
+    i = 0
+    while True:
+        b = min_ms * 2 ** (i / per_octave)
+        bounds.append(round(b, 4))
+        if b >= max_ms:
+            return bounds
+        i += 1
+
+
+BUCKET_BOUNDS = _bucket_bounds()
+# Prometheus: 1 limite por oitava (subconjunto exato dos buckets internos)
+PROMETHEUS_BOUNDS_IDX = list(range(0, len(BUCKET_BOUNDS), 4))
+
+
+class _Slot:
+    __slots__ = ("start", "counts", "count", "total", "max")
+
+    def __init__(self, n_buckets: int):
+        self.start = None
+        self.counts = [0] * n_buckets
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def reset(self, start: int):
+        self.start = start
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+class LatencyHistogram:
+    """Histograma de latência (ms) com buckets fixos e janelas deslizantes."""
+
+    def __init__(self, name: str, slot_s: float = METRICS_SLOT_S, n_slots: int = max(WINDOWS.values()),
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.slot_s = slot_s
+        self._clock = clock
+        self._lock = threading.Lock()
+        n = len(BUCKET_BOUNDS) + 1  # último = overflow (> max_ms)
+        self._counts = [0] * n
+        self._count = 0
+        self._total = 0.0
+        self._slots = [_Slot(n) for _ in range(n_slots)]
+
+    def _slot_index(self) -> int:
+        return int(self._clock() // self.slot_s)
+
+    def observe(self, ms: float):
+        if ms < 0:
+            ms = 0.0
+        b = bisect.bisect_left(BUCKET_BOUNDS, ms)
+        idx = self._slot_index()
+        with self._lock:
+            slot = self._slots[idx % len(self._slots)]
+            if slot.start != idx:
+                slot.reset(idx)
+            slot.counts[b] += 1
+            slot.count += 1
+            slot.total += ms
+            if ms > slot.max:
+                slot.max = ms
+            self._counts[b] += 1
+            self._count += 1
+            self._total += ms
+
+    def window(self, n_slots: int) -> dict:
+        """Contagem, média, máximo e p50/p95/p99 dos últimos n_slots slots (inclui o atual)."""
+        idx = self._slot_index()
+        merged = [0] * len(self._counts)
+        count, total, peak = 0, 0.0, 0.0
+        with self._lock:
+            for slot in self._slots:
+                if slot.start is None or not (idx - n_slots < slot.start <= idx):
+                    continue
+                for i, c in enumerate(slot.counts):
+                    if c:
+                        merged[i] += c
+                count += slot.count
+                total += slot.total
+                peak = max(peak, slot.max)
+        out = {"count": count, "avg_ms": round(total / count, 2) if count else None,
+               "max_ms": round(peak, 2) if count else None}
+        for q in QUANTILES:
+            out[f"p{int(q * 100)}_ms"] = _quantile(merged, count, q, peak)
+        return out
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            count, total = self._count, self._total
+        data = {"count": count, "avg_ms": round(total / count, 2) if count else None}
+        for label, n in WINDOWS.items():
+            data[label] = self.window(n)
+        return data
+
+    def prometheus_lines(self, metric: str, labels: str) -> List[str]:
+        with self._lock:
+            counts = list(self._counts)
+            count, total = self._count, self._total
+        lines = []
+        cumulative = 0
+        prev = 0
+        for i in PROMETHEUS_BOUNDS_IDX:
+            cumulative += sum(counts[prev:i + 1])
+            prev = i + 1
+            lines.append(f'{metric}_bucket{{{labels},le="{BUCKET_BOUNDS[i]:g}"}} {cumulative}')
+        lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {count}')
+        lines.append(f"{metric}_sum{{{labels}}} {round(total, 3)}")
+        lines.append(f"{metric}_count{{{labels}}} {count}")
+        return lines
+
+
+def _quantile(counts: List[int], count: int, q: float, peak: float) -> Optional[float]:
+    """Limite superior do bucket que contém o quantil (limitado ao máximo observado)."""
+    if not count:
+        return None
+    rank = max(1, math.ceil(q * count))
+    seen = 0
+    for i, c in enumerate(counts):
+        seen += c
+        if seen >= rank:
+            bound = BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else peak
+            return round(min(bound, peak), 2)
+    return round(peak, 2)
+
+
+class MetricsRegistry:
+    """Histogramas por etapa + contadores + buffer dos últimos requests."""
+
+    def __init__(self, slot_s: float = METRICS_SLOT_S, clock: Callable[[], float] = time.monotonic,
+                 recent: int = METRICS_RECENT_REQUESTS):
+        self.slot_s = slot_s
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._counters: Dict[tuple, int] = {}
+        self._recent = deque(maxlen=recent)
+        self.started_at = time.time()
+
+    def histogram(self, stage: str) -> LatencyHistogram:
+        h = self._histograms.get(stage)
+        if h is None:
+            with self._lock:
+                h = self._histograms.get(stage)
+                if h is None:
+                    h = LatencyHistogram(stage, self.slot_s, clock=self._clock)
+                    self._histograms[stage] = h
+        return h
+
+    def observe(self, stage: str, ms: float):
+        self.histogram(stage).observe(ms)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """with metrics.timer("mongo"): ... — funciona também em volta de await."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, (time.perf_counter() - t0) * 1000)
+
+    def incr(self, name: str, value: int = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def record_identify(self, total_ms: float, engine: str, dish_name: str = "",
+                        score: float = 0.0, keep_entry: bool = False):
+        """Fim de um identify: histograma total, contador por engine e (opcional) entrada do relatório."""
+        self.observe("identify_total", total_ms)
+        self.incr("identify_requests", engine=engine)
+        if keep_entry:
+            self._recent.append({
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "processing_time_ms": round(total_ms, 2),
+                "dish_name": dish_name or "",
+                "confidence_score": score or 0,
+                "engine_used": engine,
+            })
+
+    def recent_report(self, date: str = "") -> dict:
+        """Relatório do painel admin (mesmos campos do antigo processing_metrics)."""
+        entries = [e for e in reversed(self._recent) if not date or e["timestamp"].startswith(date)]
+        times = [e["processing_time_ms"] for e in entries]
+        return {
+            "total": len(entries),
+            "average_ms": round(sum(times) / len(times), 2) if times else 0,
+            "min_ms": min(times) if times else 0,
+            "max_ms": max(times) if times else 0,
+            "entries": entries[:50],
+        }
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            histograms = dict(self._histograms)
+        stages = {}
+        for stage in list(STAGES) + sorted(set(histograms) - set(STAGES)):
+            h = histograms.get(stage)
+            if h is not None:
+                stages[stage] = h.snapshot()
+        with self._lock:
+            counters = {}
+            for (name, labels), value in self._counters.items():
+                key = name + "".join(f"[{v}]" for _, v in labels)
+                counters[key] = value
+        return {"slot_s": self.slot_s, "windows": list(WINDOWS), "stages": stages, "counters": counters}
+
+    def prometheus_text(self) -> str:
+        """Formato de exposição texto do Prometheus (0.0.4)."""
+        lines = [
+            "# HELP soulnutri_stage_latency_ms Latencia por etapa do pipeline de identificacao (ms)",
+            "# TYPE soulnutri_stage_latency_ms histogram",
+        ]
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        for stage, h in histograms:
+            lines.extend(h.prometheus_lines("soulnutri_stage_latency_ms", f'stage="{stage}"'))
+        seen = set()
+        for (name, labels), value in counters:
+            metric = f"soulnutri_{name}_total"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} counter")
+                seen.add(metric)
+            label_txt = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{metric}{{{label_txt}}} {value}" if label_txt else f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+def observe(stage: str, ms: float):
+    metrics.observe(stage, ms)
+
+
+def timer(stage: str):
+    return metrics.timer(stage)
+
+
+def get_metrics_snapshot() -> dict:
+    return metrics.snapshot()
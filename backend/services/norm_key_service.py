@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+SoulNutri - Chaves normalizadas para lookup por nome
+Substitui {"nome": {"$regex": "^...$", "$options": "i"}} (sempre COLLSCAN) por
+igualdade num campo *_norm indexado, gravado junto com o nome original.
+
+Regras (as mesmas que o server já usava só no lado da query):
+    usuários   norm_nome_key   "  José Silva " -> "jose silva"  (sem acento, minúsculo)
+    pratos     canonize_input  "Arroz (7 Grãos)" -> "arroz 7 graos" (+ sem ( ) / , -)
+
+NORM_FIELDS: coleção -> campo original, campo normalizado e regra
+NORM_INDEXES: índices criados no startup (ensure_norm_keys), que também
+preenche documentos antigos sem o campo.
+
+Uso:
+    await db.users.find_one(norm_filter("users", nome, pin_hash=pin_hash))
+    await db.dishes.update_one({"slug": slug}, {"$set": with_norm_keys("dishes", dish_info)})
+"""
+import re
+import logging
+import unicodedata
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def strip_accents_nome(nome: str) -> str:
+    """Remove acentos do nome para lookup robusto (teclado mobile adiciona acento automaticamente)."""
+    return unicodedata.normalize('NFD', nome or '').encode('ascii', 'ignore').decode('ascii').strip()
+
+
+def norm_nome_key(nome: str) -> str:
+    """Chave de nome de usuário: sem acento, minúsculo, espaços colapsados."""
+    return " ".join(strip_accents_nome(nome).lower().split())
+
+
+def canonize_input(s: str) -> str:
+    """Canonização da string que chega da IA / usuário (regras da Fase 1).
+    Regras: strip_accents -> lower -> remove ( ) / , -  -> colapsar espaços.
+    """
+    if not s:
+        return ""
+    x = "".join(ch for ch in unicodedata.normalize("NFD", str(s)) if unicodedata.category(ch) != "Mn")
+    x = x.lower()
+    for ch in "()/,-":
+        x = x.replace(ch, " ")
+    return re.sub(r"\s+", " ", x).strip()
+
+
+# coleção -> (campos de origem em ordem de preferência, campo normalizado, regra)
+NORM_FIELDS = {
+    "users":            (("nome",), "nome_norm", norm_nome_key),
+    "premium_users":    (("nome",), "nome_norm", norm_nome_key),
+    "meal_logs":        (("user_nome",), "user_nome_norm", norm_nome_key),
+    "dishes":           (("name", "nome"), "name_norm", canonize_input),
+    "nutrition_sheets": (("nome",), "nome_norm", canonize_input),
+}
+
+# coleção -> [(chaves, nome do índice)]
+NORM_INDEXES = {
+    "users":            [([("nome_norm", 1), ("pin_hash", 1)], "nome_norm_1_pin_hash_1")],
+    "premium_users":    [([("nome_norm", 1)], "nome_norm_1")],
+    "meal_logs":        [([("user_nome_norm", 1), ("timestamp", -1)], "user_nome_norm_1_timestamp_-1")],
+    "dishes":           [([("name_norm", 1)], "name_norm_1"), ([("slug", 1)], "slug_1")],
+    "nutrition_sheets": [([("nome_norm", 1)], "nome_norm_1"), ([("nome", 1)], "nome_1"),
+                         ([("slug", 1)], "slug_1"), ([("nomes_alternativos", 1)], "nomes_alternativos_1"),
+                         ([("canonical_name", 1)], "canonical_name_1"), ([("slug_v2", 1)], "slug_v2_1")],
+}
+
+
+def norm_key(collection: str, value: str) -> str:
+    return NORM_FIELDS[collection][2](value or "")
+
+
+def norm_filter(collection: str, value: str, **extra) -> dict:
+    """Filtro de igualdade no campo normalizado (+ condições extras, ex.: pin_hash)."""
+    _, field, rule = NORM_FIELDS[collection]
+    return {field: rule(value or ""), **extra}
+
+
+def _source_value(collection: str, doc: dict) -> Optional[str]:
+    for src in NORM_FIELDS[collection][0]:
+        if doc.get(src):
+            return doc[src]
+    return None
+
+
+def with_norm_keys(collection: str, doc: dict) -> dict:
+    """Acrescenta o campo normalizado a um documento ou $set que grava o nome."""
+    value = _source_value(collection, doc)
+    if value is not None:
+        _, field, rule = NORM_FIELDS[collection]
+        doc[field] = rule(value)
+    return doc
+
+
+async def ensure_norm_keys(db, batch_size: int = 500) -> dict:
+    """Startup: cria os índices e preenche *_norm nos documentos que ainda não têm.
+    Retorna {coleção: documentos preenchidos}."""
+    filled = {}
+    for collection, (sources, field, rule) in NORM_FIELDS.items():
+        coll = db[collection]
+        try:
+            for keys, name in NORM_INDEXES.get(collection, []):
+                await coll.create_index(keys, name=name)
+            projection = {"_id": 1, **{src: 1 for src in sources}}
+            query = {field: {"$exists": False}, "$or": [{src: {"$exists": True}} for src in sources]}
+            count = 0
+            cursor = coll.find(query, projection)
+            while True:
+                batch = await cursor.to_list(length=batch_size)
+                if not batch:
+                    break
+                for doc in batch:
+                    value = _source_value(collection, doc)
+                    if value is None:
+                        continue
+                    await coll.update_one({"_id": doc["_id"]}, {"$set": {field: rule(value)}})
+                    count += 1
+            filled[collection] = count
+            if count:
+                logger.info(f"[NORM] {field} preenchido em {count} documentos de {collection}")
+        except Exception as e:
+            logger.warning(f"[NORM] {collection}.{field} não inicializado: {e}")
+    return filled
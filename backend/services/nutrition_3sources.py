@@ -206,7 +206,7 @@ async def generate_nutrition_3sources(nome: str, ingredientes: list) -> dict:
     """
     logger.info(f"[NUTRI] Processando: {nome}")
 
-    taco_data = query_taco(ingredientes)
+    taco_data = await asyncio.to_thread(query_taco, ingredientes)  # fallback USDA sincrono
     usda_data = await query_usda(nome)
     off_data = await query_off(nome)
 
@@ -28,7 +28,7 @@ def generate_taco_nutrition(ingredientes: list, porcao_g: int = 100) -> dict:
     Retorna valores por 100g do prato pronto.
     NOTA: Usa divisao igual de peso - so e preciso para itens simples.
     """
-    from data.taco_database import buscar_dados_taco
+    from data.taco_database import buscar_dados_taco_lote
 
     if not ingredientes:
         return None
@@ -44,8 +44,7 @@ def generate_taco_nutrition(ingredientes: list, porcao_g: int = 100) -> dict:
     encontrados = []
     nao_encontrados = []
 
-    for ing in ingredientes:
-        dados = buscar_dados_taco(ing)
+    for ing, dados in zip(ingredientes, buscar_dados_taco_lote(ingredientes)):
         if dados:
             fator = gramas_cada / 100
             totais["calorias_kcal"] += dados.get("calorias", 0) * fator
@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+"""
+SoulNutri - Agregados incrementais do Premium (dashboard / relatório)
+=====================================================================
+Em vez de ler até 400 daily_logs por chamada e refazer somas/streak com
+varreduras aninhadas, o log_meal mantém por usuário (collection premium_rollups):
+
+- 1 doc por semana ISO   {periodo: "semana", chave: "2026-W42"}
+- 1 doc por mês          {periodo: "mes",    chave: "2026-10"}
+- 1 doc geral com os dois streaks (qualquer registro / dias com calorias > 0)
+
+Cada doc de semana/mês guarda:
+    totais  calorias/proteinas/carboidratos/gorduras/pratos de todos os dias
+    ativos  o mesmo (+ dias) só dos dias com calorias_total > 0
+    nomes   pratos distintos (minúsculo) dos dias ativos
+
+Um intervalo [início, hoje] vira meses inteiros + semanas inteiras + dias
+soltos (bordas), então o dashboard anual lê ~12 docs de mês e algumas
+dezenas de daily_logs sem a lista de pratos. Os valores são os mesmos do
+cálculo antigo (ver tests/test_premium_rollups.py).
+
+Usuário sem doc geral (ou com ROLLUP_VERSION antigo) é reconstruído a partir
+dos daily_logs na primeira leitura; o backfill de todos os usuários é
+scripts/backfill_premium_rollups.py.
+"""
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_VERSION = 1
+MACROS = ("calorias", "proteinas", "carboidratos", "gorduras")
+PERIODOS_DIAS = {"dia": 1, "semana": 7, "mes": 30, "ano": 365}
+DIAS_NOMES = ["Seg", "Ter", "Qua", "Qui", "Sex", "Sab", "Dom"]
+MESES_NOMES = ["Jan", "Fev", "Mar", "Abr", "Mai", "Jun", "Jul", "Ago", "Set", "Out", "Nov", "Dez"]
+# Projeção dos dias soltos: totais + nomes dos pratos (sem o resto de cada prato)
+_DAY_PROJECTION = {"_id": 0, "data": 1, "calorias_total": 1, "proteinas_total": 1,
+                   "carboidratos_total": 1, "gorduras_total": 1, "pratos.nome": 1}
+_TOTALS_PROJECTION = {"_id": 0, "data": 1, "calorias_total": 1, "proteinas_total": 1,
+                      "carboidratos_total": 1, "gorduras_total": 1}
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CHAVES E INTERVALOS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def week_key(d: date) -> str:
+    year, week, _ = d.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def month_key(d: date) -> str:
+    return d.strftime("%Y-%m")
+
+
+def _next_month(d: date) -> date:
+    return date(d.year + (d.month == 12), d.month % 12 + 1, 1)
+
+
+def split_range(start: date, hoje: date) -> Tuple[List[str], List[str], List[str]]:
+    """[start, hoje] -> (meses, semanas, dias) sem sobreposição.
+
+    Meses/semanas que terminam depois de hoje entram inteiros: não há log no
+    futuro. Uma semana só é usada se não invade um mês que também será usado."""
+    months, weeks, days = [], [], []
+    d = start
+    while d <= hoje:
+        next_month = _next_month(d)
+        if d.day == 1:
+            months.append(month_key(d))
+            d = next_month
+        elif d.weekday() == 0 and (d + timedelta(days=6) < next_month or next_month > hoje):
+            weeks.append(week_key(d))
+            d += timedelta(days=7)
+        else:
+            days.append(d.isoformat())
+            d += timedelta(days=1)
+    return months, weeks, days
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# ATUALIZAÇÃO INCREMENTAL (log_meal)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _day_totals(log: dict) -> Dict[str, float]:
+    return {m: log.get(f"{m}_total", 0) for m in MACROS}
+
+
+def meal_increments(day_after: dict, meal: dict) -> Tuple[Dict[str, float], List[str]]:
+    """$inc e nomes ($addToSet) de semana/mês para uma refeição já somada ao daily_log.
+
+    O dia vira "ativo" (calorias_total > 0) na refeição que cruza o zero: nesse
+    momento entra o dia inteiro em ativos.*; depois, só a refeição."""
+    inc = {f"totais.{m}": meal.get(m, 0) for m in MACROS}
+    inc["totais.pratos"] = 1
+    names = []
+    cal_after = day_after.get("calorias_total", 0)
+    if cal_after > 0:
+        if cal_after - meal.get("calorias", 0) <= 0:
+            for m, v in _day_totals(day_after).items():
+                inc[f"ativos.{m}"] = v
+            pratos = day_after.get("pratos", [])
+            inc["ativos.pratos"] = len(pratos)
+            inc["ativos.dias"] = 1
+            names = [p.get("nome", "").lower() for p in pratos]
+        else:
+            for m in MACROS:
+                inc[f"ativos.{m}"] = meal.get(m, 0)
+            inc["ativos.pratos"] = 1
+            names = [meal.get("nome", "").lower()]
+    return inc, sorted(set(names))
+
+
+async def _advance_streak(col, user_nome: str, prefix: str, hoje: str, ontem: str):
+    """Streak terminando hoje: +1 se o último dia foi ontem, senão recomeça em 1."""
+    base = {"user_nome": user_nome, "periodo": "geral"}
+    r = await col.update_one({**base, f"{prefix}_ultimo": ontem},
+                             {"$set": {f"{prefix}_ultimo": hoje}, "$inc": {f"{prefix}_dias": 1}})
+    if not r.matched_count:
+        await col.update_one({**base, f"{prefix}_ultimo": {"$ne": hoje}},
+                             {"$set": {f"{prefix}_ultimo": hoje, f"{prefix}_dias": 1}})
+
+
+async def apply_meal(db, user_nome: str, hoje: str, day_after: dict, meal: dict):
+    """Chamado pelo log_meal depois do $inc no daily_log (day_after = doc atualizado)."""
+    col = db.premium_rollups
+    geral = await col.find_one({"user_nome": user_nome, "periodo": "geral"}, {"_id": 0})
+    if not geral or geral.get("versao") != ROLLUP_VERSION:
+        # Sem agregados ainda: reconstrói (o daily_log já inclui esta refeição)
+        await rebuild_user(db, user_nome)
+        return
+    d = date.fromisoformat(hoje)
+    inc, names = meal_increments(day_after, meal)
+    update = {"$inc": inc}
+    if names:
+        update["$addToSet"] = {"nomes": {"$each": names}}
+    for periodo, chave in (("semana", week_key(d)), ("mes", month_key(d))):
+        await col.update_one({"user_nome": user_nome, "periodo": periodo, "chave": chave}, update, upsert=True)
+    ontem = (d - timedelta(days=1)).isoformat()
+    if geral.get("registro_ultimo") != hoje:
+        await _advance_streak(col, user_nome, "registro", hoje, ontem)
+    if day_after.get("calorias_total", 0) > 0 and geral.get("ativo_ultimo") != hoje:
+        await _advance_streak(col, user_nome, "ativo", hoje, ontem)
+
+
+async def invalidate_user(db, user_nome: str):
+    """Força reconstrução na próxima leitura (ex.: falha no meio do apply_meal)."""
+    await db.premium_rollups.delete_one({"user_nome": user_nome, "periodo": "geral"})
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# RECONSTRUÇÃO / BACKFILL
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _empty_rollup() -> dict:
+    return {"totais": {m: 0 for m in MACROS + ("pratos",)},
+            "ativos": {m: 0 for m in MACROS + ("pratos", "dias")},
+            "nomes": set()}
+
+
+def _streak_end(dates: List[date]) -> Tuple[Optional[str], int]:
+    """(último dia, tamanho da sequência de dias consecutivos que termina nele)."""
+    if not dates:
+        return None, 0
+    dates = sorted(set(dates))
+    n = 1
+    for i in range(len(dates) - 1, 0, -1):
+        if dates[i] - dates[i - 1] != timedelta(days=1):
+            break
+        n += 1
+    return dates[-1].isoformat(), n
+
+
+def _add_day(r: dict, log: dict):
+    totals = _day_totals(log)
+    pratos = log.get("pratos", [])
+    for m, v in totals.items():
+        r["totais"][m] += v
+    r["totais"]["pratos"] += len(pratos)
+    if totals["calorias"] > 0:
+        for m, v in totals.items():
+            r["ativos"][m] += v
+        r["ativos"]["pratos"] += len(pratos)
+        r["ativos"]["dias"] += 1
+        r["nomes"].update(p.get("nome", "").lower() for p in pratos)
+
+
+def build_rollups(logs: Iterable[dict]) -> Tuple[Dict[Tuple[str, str], dict], dict]:
+    """Agregados de semana/mês e streaks a partir dos daily_logs de um usuário."""
+    rollups: Dict[Tuple[str, str], dict] = {}
+    registro, ativo = [], []
+    for log in logs:
+        try:
+            d = date.fromisoformat(log.get("data", ""))
+        except (TypeError, ValueError):
+            continue
+        registro.append(d)
+        if log.get("calorias_total", 0) > 0:
+            ativo.append(d)
+        for key in (("semana", week_key(d)), ("mes", month_key(d))):
+            _add_day(rollups.setdefault(key, _empty_rollup()), log)
+    registro_ultimo, registro_dias = _streak_end(registro)
+    ativo_ultimo, ativo_dias = _streak_end(ativo)
+    geral = {"versao": ROLLUP_VERSION,
+             "registro_ultimo": registro_ultimo, "registro_dias": registro_dias,
+             "ativo_ultimo": ativo_ultimo, "ativo_dias": ativo_dias}
+    return rollups, geral
+
+
+async def rebuild_user(db, user_nome: str) -> int:
+    """Recalcula todos os agregados de um usuário a partir dos daily_logs. Idempotente."""
+    logs = await db.daily_logs.find({"user_nome": user_nome}, _DAY_PROJECTION).to_list(length=None)
+    rollups, geral = build_rollups(logs)
+    col = db.premium_rollups
+    await col.delete_many({"user_nome": user_nome})
+    docs = [{"user_nome": user_nome, "periodo": periodo, "chave": chave,
+             "totais": r["totais"], "ativos": r["ativos"], "nomes": sorted(r["nomes"])}
+            for (periodo, chave), r in rollups.items()]
+    if docs:
+        await col.insert_many(docs)
+    await col.update_one({"user_nome": user_nome, "periodo": "geral"},
+                         {"$set": {**geral, "rebuilt_at": datetime.now().isoformat()}}, upsert=True)
+    return len(docs)
+
+
+# coleção -> [(chaves, nome, opções)] — aplicados no startup pelo index_registry
+ROLLUP_INDEXES = {
+    "premium_rollups": [([("user_nome", 1), ("periodo", 1), ("chave", 1)], "user_periodo_chave", {"unique": True})],
+    "daily_logs": [([("user_nome", 1), ("data", -1)], "user_nome_data", {})],
+}
+
+
+async def ensure_indexes(db):
+    for collection, specs in ROLLUP_INDEXES.items():
+        for keys, name, options in specs:
+            await db[collection].create_index(keys, name=name, **options)
+
+
+async def _geral(db, user_nome: str) -> dict:
+    geral = await db.premium_rollups.find_one({"user_nome": user_nome, "periodo": "geral"}, {"_id": 0})
+    if not geral or geral.get("versao") != ROLLUP_VERSION:
+        await rebuild_user(db, user_nome)
+        geral = await db.premium_rollups.find_one({"user_nome": user_nome, "periodo": "geral"}, {"_id": 0})
+    return geral or {}
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# LEITURA
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def streak_on(geral: dict, prefix: str, hoje: date) -> int:
+    """Sequência de dias que termina hoje (0 se hoje ainda não tem registro)."""
+    return geral.get(f"{prefix}_dias", 0) if geral.get(f"{prefix}_ultimo") == hoje.isoformat() else 0
+
+
+async def summary_since(db, user_nome: str, start: date, hoje: date) -> dict:
+    """Soma de [start, hoje] = meses + semanas inteiros (rollups) + dias soltos (daily_logs)."""
+    months, weeks, days = split_range(start, hoje)
+    total = _empty_rollup()
+    segments = []
+    if months or weeks:
+        segments = await db.premium_rollups.find(
+            {"user_nome": user_nome, "$or": [{"periodo": "mes", "chave": {"$in": months}},
+                                             {"periodo": "semana", "chave": {"$in": weeks}}]},
+            {"_id": 0}).to_list(length=None)
+    for seg in segments:
+        for group in ("totais", "ativos"):
+            for k, v in seg.get(group, {}).items():
+                total[group][k] = total[group].get(k, 0) + v
+        total["nomes"].update(seg.get("nomes", []))
+    if days:
+        for log in await db.daily_logs.find({"user_nome": user_nome, "data": {"$in": days}},
+                                            _DAY_PROJECTION).to_list(length=None):
+            _add_day(total, log)
+    return total
+
+
+async def dashboard_data(db, user_nome: str, periodo: str, hoje: Optional[date] = None) -> dict:
+    """Partes do /premium/dashboard que dependiam dos daily_logs do período."""
+    hoje = hoje or date.today()
+    dias = PERIODOS_DIAS.get(periodo, 7)
+    hoje_str = hoje.isoformat()
+    data_inicio = hoje - timedelta(days=dias)
+    geral = await _geral(db, user_nome)
+
+    log_hoje = await db.daily_logs.find_one({"user_nome": user_nome, "data": hoje_str}, {"_id": 0})
+    hoje_totais = _day_totals(log_hoje or {})
+
+    grafico = []
+    if periodo == "dia":
+        for i, prato in enumerate((log_hoje or {}).get("pratos", [])[:10]):
+            grafico.append({
+                "dia": prato.get("nome", f"Item {i+1}")[:15],
+                "data": hoje_str,
+                **{m: prato.get(m, 0) for m in MACROS},
+            })
+    elif periodo in ("semana", "mes"):
+        n = 7 if periodo == "semana" else 28
+        datas = [(hoje - timedelta(days=i)).isoformat() for i in range(n)]
+        por_data = {l["data"]: l for l in await db.daily_logs.find(
+            {"user_nome": user_nome, "data": {"$in": datas}}, _TOTALS_PROJECTION).to_list(length=None)}
+        if periodo == "semana":
+            for i in range(7):
+                d = hoje - timedelta(days=6 - i)
+                grafico.append({"dia": DIAS_NOMES[d.weekday()], "data": d.isoformat(),
+                                **_day_totals(por_data.get(d.isoformat(), {}))})
+        else:
+            # 4 semanas móveis (média diária de cada janela de 7 dias)
+            for semana in range(4):
+                soma = {m: 0 for m in MACROS}
+                for i in range(28 - (semana + 1) * 7, 28 - semana * 7):
+                    log_dia = por_data.get((hoje - timedelta(days=i)).isoformat())
+                    if log_dia:
+                        for m, v in _day_totals(log_dia).items():
+                            soma[m] += v
+                grafico.append({"dia": f"Sem {4-semana}", **{m: v / 7 for m, v in soma.items()}})
+    elif periodo == "ano":
+        meses = [hoje - timedelta(days=30 * (11 - i)) for i in range(12)]
+        por_mes = {r["chave"]: r for r in await db.premium_rollups.find(
+            {"user_nome": user_nome, "periodo": "mes", "chave": {"$in": sorted({month_key(m) for m in meses})}},
+            {"_id": 0}).to_list(length=None)}
+        for mes_data in meses:
+            r = por_mes.get(month_key(mes_data), {})
+            totais, n_dias = r.get("totais", {}), r.get("ativos", {}).get("dias", 0)
+            grafico.append({"dia": MESES_NOMES[mes_data.month - 1],
+                            **{m: totais.get(m, 0) / max(n_dias, 1) for m in MACROS},
+                            "dias_registrados": n_dias})
+
+    resumo = await summary_since(db, user_nome, data_inicio, hoje)
+    limite_historico = 30 if periodo in ["mes", "ano"] else 10
+    logs = await db.daily_logs.find(
+        {"user_nome": user_nome, "data": {"$gte": data_inicio.isoformat()}}, {"_id": 0}
+    ).sort("data", -1).to_list(length=limite_historico)
+    historico = [{"data": l.get("data", ""), "pratos": l.get("pratos", []),
+                  **{f"{m}_total": l.get(f"{m}_total", 0) for m in MACROS}} for l in logs]
+
+    return {
+        "hoje": hoje_totais,
+        "grafico": grafico,
+        "historico": historico,
+        "dias_com_log": resumo["ativos"]["dias"],
+        "totais": {m: resumo["totais"][m] for m in MACROS},
+        "total_pratos": resumo["totais"]["pratos"],
+        "streak": min(streak_on(geral, "registro", hoje), dias, 365),
+    }
+
+
+async def report_data(db, user_nome: str, periodo: str, hoje: Optional[date] = None) -> dict:
+    """Partes do /premium/report que dependiam dos daily_logs do período (só dias ativos)."""
+    hoje = hoje or date.today()
+    dias = PERIODOS_DIAS.get(periodo, 7)
+    data_inicio = hoje - timedelta(days=dias)
+    geral = await _geral(db, user_nome)
+    resumo = await summary_since(db, user_nome, data_inicio, hoje)
+    detalhes = await db.daily_logs.find(
+        {"user_nome": user_nome, "data": {"$gte": data_inicio.isoformat()}, "calorias_total": {"$gt": 0}},
+        {"_id": 0, "pratos.nome": 1, **_TOTALS_PROJECTION},
+    ).sort("data", -1).to_list(length=15)
+    return {
+        "dias": dias,
+        "n_dias": resumo["ativos"]["dias"],
+        "totais": {m: resumo["ativos"][m] for m in MACROS},
+        "total_pratos": resumo["ativos"]["pratos"],
+        "pratos_unicos": len(resumo["nomes"]),
+        "streak": min(streak_on(geral, "ativo", hoje), dias, 365),
+        "detalhes": detalhes,
+    }
@@ -0,0 +1,115 @@
+"""
+SoulNutri - Coalescência de requests idênticos em andamento (single-flight)
+===========================================================================
+Uploads byte-idênticos simultâneos (mesa fotografando a mesma bandeja, retry
+do PWA após timeout) erram o cache ao mesmo tempo; sem coalescência cada um
+roda CLIP/Gemini. Aqui o primeiro request de uma chave vira líder e os
+seguintes aguardam o resultado dele.
+
+Dois estilos:
+- do(key, fn): o trabalho roda numa task própria e o resultado (ou exceção)
+  é entregue a todos — cancelar um request não cancela os outros.
+- join(key) -> Flight: para fluxos longos em que o líder publica o resultado
+  no meio do caminho (flight.finish); sem resultado publicado os seguidores
+  recebem None e seguem sozinhos.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Espera máxima de um seguidor pelo líder (depois disso roda sozinho)
+FOLLOWER_TIMEOUT_S = 30.0
+
+
+class Flight:
+    """Participação num request em andamento (líder ou seguidor)."""
+
+    def __init__(self, group: "SingleFlight", key: str, future: asyncio.Future, leader: bool):
+        self._group = group
+        self.key = key
+        self.future = future
+        self.leader = leader
+
+    def finish(self, result: Optional[Any]):
+        """Líder publica o resultado (None = nada a compartilhar). Idempotente."""
+        if self.leader and not self.future.done():
+            self.future.set_result(result)
+        if self._group._flights.get(self.key) is self.future:
+            del self._group._flights[self.key]
+
+    async def wait(self, timeout: float = FOLLOWER_TIMEOUT_S) -> Optional[Any]:
+        """Seguidor: resultado publicado pelo líder, ou None (falhou / sem resultado / timeout)."""
+        try:
+            result = await asyncio.wait_for(asyncio.shield(self.future), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._group.follower_timeouts += 1
+            return None
+        if result is None:
+            self._group.follower_misses += 1
+        return result
+
+
+class SingleFlight:
+    """Grupo de requests coalescidos por chave (um por tipo de request)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.follower_misses = 0
+        self.follower_timeouts = 0
+
+    def join(self, key: str) -> Flight:
+        future = self._flights.get(key)
+        if future is not None and not future.done():
+            self.coalesced += 1
+            logger.info(f"[SINGLEFLIGHT] {self.name}: aguardando request em andamento key={key[:16]}")
+            return Flight(self, key, future, leader=False)
+        future = asyncio.get_running_loop().create_future()
+        self._flights[key] = future
+        self.leaders += 1
+        return Flight(self, key, future, leader=True)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Executa fn uma única vez por chave em andamento; todos recebem o mesmo resultado."""
+        flight = self.join(key)
+        if flight.leader:
+            task = asyncio.ensure_future(fn())
+
+            def _publish(t: asyncio.Future):
+                if self._flights.get(key) is flight.future:
+                    del self._flights[key]
+                if t.cancelled():
+                    flight.future.cancel()
+                elif t.exception() is not None:
+                    flight.future.set_exception(t.exception())
+                else:
+                    flight.future.set_result(t.result())
+
+            task.add_done_callback(_publish)
+        # shield: cancelar este request não cancela o trabalho compartilhado
+        return await asyncio.shield(flight.future)
+
+    def in_flight(self) -> int:
+        return sum(1 for f in self._flights.values() if not f.done())
+
+    def stats(self) -> dict:
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "follower_misses": self.follower_misses,
+            "follower_timeouts": self.follower_timeouts,
+            "in_flight": self.in_flight(),
+        }
+
+
+identify_flights = SingleFlight("identify")
+enrich_flights = SingleFlight("enrich")
+
+
+def get_coalescing_stats() -> dict:
+    return {"identify": identify_flights.stats(), "enrich": enrich_flights.stats()}
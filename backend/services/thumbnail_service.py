@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+SoulNutri - Thumbnails pré-gerados das fotos de pratos
+Gerados uma vez por conteúdo (upload, varredura em background ou primeiro
+acesso) em vários tamanhos, WebP e JPEG, e gravados em disco indexados pelo
+hash do arquivo original. Servir um thumbnail não abre o PIL: é ler um
+arquivo pequeno, com ETag forte (hash + tamanho + formato) e 304.
+
+Layout: THUMB_DIR/<hash[:2]>/<hash>_<tamanho>.<webp|jpg>
+        THUMB_DIR/manifest.json   caminho -> (bytes, mtime_ns, hash) das fotos já vistas
+
+Config:
+    SOULNUTRI_THUMB_DIR   diretório dos thumbnails (default /app/datasets/thumbs)
+"""
+import os
+import io
+import json
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+THUMB_DIR = Path(os.environ.get("SOULNUTRI_THUMB_DIR", "/app/datasets/thumbs"))
+THUMB_SIZES = (150, 300, 600)
+DEFAULT_THUMB_SIZE = 300
+THUMB_FORMATS = {"webp": ("WEBP", "image/webp", 70), "jpg": ("JPEG", "image/jpeg", 70)}
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+_MANIFEST = {}  # caminho -> [bytes, mtime_ns, sha1]
+_MANIFEST_LOCK = threading.Lock()
+_MANIFEST_LOADED = False
+_MANIFEST_DIRTY = 0
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+def pick_size(requested: int) -> int:
+    """thumb=1 (legado) -> tamanho padrão; senão o menor tamanho pré-gerado >= pedido."""
+    if requested <= 1:
+        return DEFAULT_THUMB_SIZE
+    for size in THUMB_SIZES:
+        if size >= requested:
+            return size
+    return THUMB_SIZES[-1]
+
+
+def pick_format(accept: str) -> str:
+    return "webp" if "image/webp" in (accept or "") else "jpg"
+
+
+def thumb_path(digest: str, size: int, fmt: str) -> Path:
+    return THUMB_DIR / digest[:2] / f"{digest}_{size}.{fmt}"
+
+
+def etag_for(digest: str, size: int = 0, fmt: str = "orig") -> str:
+    return f'"{digest[:20]}-{size}-{fmt}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match: lista de ETags ou '*'. ETags fracos (W/) comparam pelo valor."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def _write_atomic(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".tmp_{os.getpid()}_{threading.get_ident()}_{path.name}")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def generate_thumbnails(data: bytes, digest: Optional[str] = None) -> str:
+    """Gera todos os tamanhos/formatos que faltam para o conteúdo. Retorna o hash."""
+    digest = digest or content_hash(data)
+    missing = [(s, f) for s in THUMB_SIZES for f in THUMB_FORMATS if not thumb_path(digest, s, f).exists()]
+    if not missing:
+        return digest
+    from PIL import Image, ImageOps
+    with Image.open(io.BytesIO(data)) as img:
+        img.draft("RGB", (max(THUMB_SIZES), max(THUMB_SIZES)))
+        img = ImageOps.exif_transpose(img)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        # Do maior para o menor: cada tamanho reduz a partir do anterior
+        for size in sorted({s for s, _ in missing}, reverse=True):
+            img.thumbnail((size, size))
+            for fmt in (f for s, f in missing if s == size):
+                pil_format, _, quality = THUMB_FORMATS[fmt]
+                buf = io.BytesIO()
+                img.save(buf, format=pil_format, quality=quality)
+                _write_atomic(thumb_path(digest, size, fmt), buf.getvalue())
+    return digest
+
+
+def _load_manifest():
+    global _MANIFEST_LOADED
+    if _MANIFEST_LOADED:
+        return
+    with _MANIFEST_LOCK:
+        if _MANIFEST_LOADED:
+            return
+        try:
+            with open(THUMB_DIR / "manifest.json", "r", encoding="utf-8") as f:
+                _MANIFEST.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+        _MANIFEST_LOADED = True
+
+
+def save_manifest():
+    global _MANIFEST_DIRTY
+    with _MANIFEST_LOCK:
+        if not _MANIFEST_DIRTY:
+            return
+        data = json.dumps(_MANIFEST).encode("utf-8")
+        _MANIFEST_DIRTY = 0
+    try:
+        _write_atomic(THUMB_DIR / "manifest.json", data)
+    except OSError as e:
+        logger.warning(f"[THUMB] manifest não salvo: {e}")
+
+
+def _remember(path: Path, st: os.stat_result, digest: str):
+    global _MANIFEST_DIRTY
+    with _MANIFEST_LOCK:
+        _MANIFEST[str(path)] = [st.st_size, st.st_mtime_ns, digest]
+        _MANIFEST_DIRTY += 1
+        dirty = _MANIFEST_DIRTY
+    if dirty >= 200:
+        save_manifest()
+
+
+def source_hash(path: Path) -> str:
+    """Hash do conteúdo da foto (manifest por bytes+mtime: só relê arquivos alterados)."""
+    _load_manifest()
+    st = path.stat()
+    entry = _MANIFEST.get(str(path))
+    if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+        return entry[2]
+    digest = content_hash(path.read_bytes())
+    _remember(path, st, digest)
+    return digest
+
+
+def register_source(path: Path, data: bytes) -> str:
+    """Upload: grava o hash no manifest e gera os thumbnails na hora."""
+    digest = generate_thumbnails(data)
+    try:
+        _remember(path, path.stat(), digest)
+    except OSError:
+        pass
+    return digest
+
+
+def thumbnail_for_file(path: Path, size: int, fmt: str) -> Tuple[Path, str]:
+    """(arquivo do thumbnail, ETag) para uma foto local; gera se ainda não existir."""
+    digest = source_hash(path)
+    target = thumb_path(digest, size, fmt)
+    if not target.exists():
+        generate_thumbnails(path.read_bytes(), digest)
+    return target, etag_for(digest, size, fmt)
+
+
+def thumbnail_for_bytes(data: bytes, size: int, fmt: str) -> Tuple[bytes, str]:
+    """(bytes do thumbnail, ETag) para uma foto vinda do R2/S3."""
+    digest = generate_thumbnails(data)
+    return thumb_path(digest, size, fmt).read_bytes(), etag_for(digest, size, fmt)
+
+
+def sweep(dataset_dir: Path) -> dict:
+    """Varredura em background: gera thumbnails de todas as fotos do dataset que ainda não têm."""
+    seen = generated = errors = 0
+    if not dataset_dir.exists():
+        return {"images": 0, "generated": 0, "errors": 0}
+    for folder in sorted(p for p in dataset_dir.iterdir() if p.is_dir()):
+        for path in sorted(folder.iterdir()):
+            if path.suffix.lower() not in IMAGE_EXTENSIONS:
+                continue
+            seen += 1
+            try:
+                digest = source_hash(path)
+                if not all(thumb_path(digest, s, f).exists() for s in THUMB_SIZES for f in THUMB_FORMATS):
+                    generate_thumbnails(path.read_bytes(), digest)
+                    generated += 1
+            except Exception as e:
+                errors += 1
+                logger.warning(f"[THUMB] {path}: {e}")
+    save_manifest()
+    logger.info(f"[THUMB] varredura: {seen} fotos, {generated} geradas, {errors} erros")
+    return {"images": seen, "generated": generated, "errors": errors}
@@ -3,19 +3,49 @@
 USDA Ingredient Fallback — SoulNutri
 Chamado apenas quando buscar_dados_taco() retorna None.
 Busca por ingrediente individual no USDA FoodData Central.
-Cache em memória evita chamadas repetidas na mesma sessão.
+
+- Cliente assíncrono (httpx.AsyncClient) com UM pool de conexões, num event
+  loop próprio (thread daemon), limite de concorrência e rate limiter
+  (requisições/s) compartilhado. Chamadas síncronas reaproveitam esse loop.
+- Cache persistente em SQLite (sobrevive a restart, compartilhado entre
+  workers) com TTL; "não encontrado" também é cacheado (TTL menor).
+  Erros de rede / 429 / 5xx NÃO são cacheados.
+- prefetch_usda(): busca todos os ingredientes que faltam de um prato em
+  paralelo — calcular_nutricao_prato() faz 1 rodada em vez de N chamadas seriais.
+
+Config:
+    USDA_API_KEY                        chave da API (default DEMO_KEY)
+    USDA_BASE_URL                       base da API (testes: servidor fixture local)
+    SOULNUTRI_USDA_CACHE_PATH           arquivo SQLite do cache ("" = só memória)
+    SOULNUTRI_USDA_CACHE_TTL_DAYS       validade de um resultado (default 30)
+    SOULNUTRI_USDA_NEGATIVE_TTL_HOURS   validade de "não encontrado" (default 24)
+    SOULNUTRI_USDA_RPS                  requisições/s ao USDA (default 5)
+    SOULNUTRI_USDA_CONCURRENCY          requisições simultâneas (default 4)
 """
 import os
+import re
+import json
+import time
+import asyncio
+import concurrent.futures
 import logging
+import sqlite3
+import threading
+import unicodedata
+from typing import Dict, Iterable, Optional
+
 import httpx
 
 logger = logging.getLogger(__name__)
 
 USDA_API_KEY = os.environ.get("USDA_API_KEY", "DEMO_KEY")
-USDA_BASE_URL = "https://api.nal.usda.gov/fdc/v1"
-
-# ── Cache em memória (reseta no restart — suficiente para batch e sessões) ──
-_CACHE: dict = {}
+USDA_BASE_URL = os.environ.get("USDA_BASE_URL", "https://api.nal.usda.gov/fdc/v1")
+USDA_CACHE_PATH = os.environ.get("SOULNUTRI_USDA_CACHE_PATH", "/app/datasets/usda_cache.sqlite")
+USDA_CACHE_TTL_S = float(os.environ.get("SOULNUTRI_USDA_CACHE_TTL_DAYS", "30")) * 86400
+USDA_NEGATIVE_TTL_S = float(os.environ.get("SOULNUTRI_USDA_NEGATIVE_TTL_HOURS", "24")) * 3600
+USDA_RPS = float(os.environ.get("SOULNUTRI_USDA_RPS", "5"))
+USDA_CONCURRENCY = int(os.environ.get("SOULNUTRI_USDA_CONCURRENCY", "4"))
+USDA_TIMEOUT_S = 10.0
 
 # ── Tradução PT → EN para ingredientes comuns em restaurantes do Brasil ──────
 # Apenas os que o TACO definitivamente não cobre
@@ -174,88 +204,315 @@ USDA_NUTRIENT_MAP = {
 }
 
 
-def _query_usda_sync(query: str) -> dict | None:
+# ═══════════════════════════════════════════════════════════════════════════════
+# CACHE PERSISTENTE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+_MISSING = object()
+
+
+class UsdaCache:
+    """ingrediente -> dados (ou None = não encontrado), com expiração.
+
+    Memória na frente; SQLite (WAL) atrás, compartilhado entre processos.
+    Sem arquivo (path vazio ou sem permissão) funciona só em memória.
     """
-    Busca síncrona no USDA FoodData Central.
-    Retorna dados nutricionais por 100g ou None.
+
+    def __init__(self, path: str = USDA_CACHE_PATH, ttl_s: float = USDA_CACHE_TTL_S,
+                 negative_ttl_s: float = USDA_NEGATIVE_TTL_S):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.negative_ttl_s = negative_ttl_s
+        self._lock = threading.Lock()
+        self._memory: Dict[str, tuple] = {}  # chave -> (dados, expira_em)
+        self._conn = None
+        if path:
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS usda_cache ("
+                    " key TEXT PRIMARY KEY, value TEXT, cached_at REAL NOT NULL, expires_at REAL NOT NULL)"
+                )
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"[USDA] Cache em disco indisponível ({path}): {e} — usando só memória")
+                self._conn = None
+
+    def get(self, key: str, now: Optional[float] = None):
+        """Dados, None (negativo cacheado) ou _MISSING."""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[1] > now:
+                return entry[0]
+            if self._conn is None:
+                return _MISSING
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM usda_cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return _MISSING
+            value = json.loads(row[0]) if row[0] is not None else None
+            self._memory[key] = (value, row[1])
+            return value
+
+    def set(self, key: str, value: Optional[dict], now: Optional[float] = None):
+        now = time.time() if now is None else now
+        expires = now + (self.ttl_s if value is not None else self.negative_ttl_s)
+        with self._lock:
+            self._memory[key] = (value, expires)
+            if self._conn is not None:
+                try:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO usda_cache VALUES (?, ?, ?, ?)",
+                        (key, json.dumps(value) if value is not None else None, now, expires),
+                    )
+                except sqlite3.Error as e:
+                    logger.warning(f"[USDA] Falha ao gravar cache '{key}': {e}")
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM usda_cache")
+
+    def stats(self) -> dict:
+        with self._lock:
+            disk = None
+            if self._conn is not None:
+                disk = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(value IS NULL), 0) FROM usda_cache WHERE expires_at > ?",
+                    (time.time(),),
+                ).fetchone()
+            return {"memory_entries": len(self._memory), "path": self.path if self._conn else None,
+                    "disk_entries": disk[0] if disk else None, "disk_negative": disk[1] if disk else None}
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CLIENTE ASSÍNCRONO
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class _RateLimiter:
+    """Espaçamento mínimo entre requisições (1/rps), válido entre event loops e threads."""
+
+    def __init__(self, rps: float):
+        self.interval = 1.0 / rps if rps > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+def _parse_foods(query: str, foods: list) -> Optional[dict]:
+    """Primeiro alimento com energia em KCAL plausível (0-950 kcal/100g)."""
+    for food in foods:
+        nutrients = {}
+        kcal_unit_ok = False
+        for fn in food.get("foodNutrients", []):
+            name  = fn.get("nutrientName", "")
+            unit  = fn.get("unitName", "").upper()
+            value = fn.get("value") or 0
+            if name == "Energy":
+                if unit == "KCAL":
+                    nutrients["calorias"] = value
+                    kcal_unit_ok = True
+            elif name in USDA_NUTRIENT_MAP:
+                nutrients[USDA_NUTRIENT_MAP[name]] = value
+
+        cal = nutrients.get("calorias", 0)
+        if kcal_unit_ok and 0 < cal < 950:
+            desc = food.get("description", "?")
+            logger.info(f"[USDA] '{query}' → '{desc}' ({cal} kcal)")
+            result = {k: round(float(nutrients.get(k, 0)), 2) for k in USDA_NUTRIENT_MAP.values()}
+            result["nome"] = f"(USDA) {desc}"
+            return result
+    return None
+
+
+class UsdaClient:
+    """Cliente do FoodData Central com pool de conexões e rate limit.
+
+    httpx.AsyncClient e o semáforo pertencem a um event loop; o cliente roda
+    num loop PRÓPRIO, numa thread daemon de longa duração. Um único pool de
+    conexões serve o servidor (search() de outro loop é encaminhado) e os
+    chamadores síncronos (run_sync()), sem loop temporário por chamada.
     """
-    try:
-        with httpx.Client(timeout=10) as client:
-            resp = client.get(
-                f"{USDA_BASE_URL}/foods/search",
-                params={
-                    "api_key": USDA_API_KEY,
-                    "query": query,
-                    "pageSize": 5,
-                },
+
+    def __init__(self, base_url: str = USDA_BASE_URL, api_key: str = USDA_API_KEY,
+                 rps: float = USDA_RPS, concurrency: int = USDA_CONCURRENCY, timeout: float = USDA_TIMEOUT_S):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self._limiter = _RateLimiter(rps)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=loop.run_forever, name="usda-client", daemon=True)
+                self._thread.start()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """Agenda a corrotina no loop do cliente (qualquer thread)."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def run_sync(self, coro):
+        """Roda a corrotina no loop do cliente e espera (bloqueia a thread chamadora).
+
+        Não chamar de dentro de um handler async: lá use await ou asyncio.to_thread.
+        """
+        return self.submit(coro).result()
+
+    async def search(self, query: str):
+        """(dados ou None, cacheável). cacheável=False para erro transitório (rede/429/5xx)."""
+        loop = self._ensure_loop()
+        if asyncio.get_running_loop() is not loop:
+            return await asyncio.wrap_future(self.submit(self._search(query)))
+        return await self._search(query)
+
+    async def _search(self, query: str):
+        if self._http is None:  # só roda no loop do cliente: sem corrida
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url, timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.concurrency,
+                                    max_keepalive_connections=self.concurrency),
             )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            await self._limiter.wait()
+            self.requests += 1
+            try:
+                resp = await self._http.get("/foods/search",
+                                            params={"api_key": self.api_key, "query": query, "pageSize": 5})
+            except httpx.HTTPError as e:
+                logger.warning(f"[USDA] Exceção para '{query}': {e}")
+                return None, False
         if resp.status_code == 429:
             logger.warning(f"[USDA] Rate limit para '{query}'")
-            return None
+            return None, False
         if resp.status_code != 200:
             logger.warning(f"[USDA] HTTP {resp.status_code} para '{query}'")
-            return None
-
-        foods = resp.json().get("foods", [])
-        if not foods:
-            return None
-
-        for food in foods:
-            nutrients = {}
-            kcal_unit_ok = False
-            for fn in food.get("foodNutrients", []):
-                name  = fn.get("nutrientName", "")
-                unit  = fn.get("unitName", "").upper()
-                value = fn.get("value") or 0
-                if name == "Energy":
-                    if unit == "KCAL":
-                        nutrients["calorias"] = value
-                        kcal_unit_ok = True
-                elif name in USDA_NUTRIENT_MAP:
-                    nutrients[USDA_NUTRIENT_MAP[name]] = value
-
-            cal = nutrients.get("calorias", 0)
-            if kcal_unit_ok and 0 < cal < 950:
-                desc = food.get("description", "?")
-                logger.info(f"[USDA] '{query}' → '{desc}' ({cal} kcal)")
-                result = {k: round(float(nutrients.get(k, 0)), 2) for k in USDA_NUTRIENT_MAP.values()}
-                result["nome"] = f"(USDA) {desc}"
-                return result
-
-        return None
-
-    except Exception as e:
-        logger.warning(f"[USDA] Exceção para '{query}': {e}")
-        return None
-
-
-def buscar_dados_usda(ingrediente: str) -> dict | None:
-    """
-    Ponto de entrada principal.
-    1. Verifica cache.
-    2. Traduz PT→EN se disponível.
-    3. Chama USDA.
-    4. Guarda no cache.
-    Retorna dict compatível com o formato do TACO_DATABASE ou None.
-    """
-    key = ingrediente.lower().strip()
+            return None, resp.status_code < 500
+        try:
+            foods = resp.json().get("foods", [])
+        except ValueError:
+            return None, False
+        return _parse_foods(query, foods), True
+
+    async def _aclose_http(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def close(self):
+        """Fecha o pool de conexões e encerra o loop do cliente (shutdown)."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._aclose_http(), loop).result(timeout=5)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout=5)
+            loop.close()
+
+
+_cache: Optional[UsdaCache] = None
+_client: Optional[UsdaClient] = None
+_singleton_lock = threading.Lock()
+
+
+def get_usda_cache() -> UsdaCache:
+    global _cache
+    if _cache is None:
+        with _singleton_lock:
+            if _cache is None:
+                _cache = UsdaCache()
+    return _cache
+
+
+def get_usda_client() -> UsdaClient:
+    global _client
+    if _client is None:
+        with _singleton_lock:
+            if _client is None:
+                _client = UsdaClient()
+    return _client
 
-    if key in _CACHE:
-        return _CACHE[key]
 
-    # Tradução PT → EN
+# ═══════════════════════════════════════════════════════════════════════════════
+# API
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _cache_key(ingrediente: str) -> str:
+    return ingrediente.lower().strip()
+
+
+def _query_for(key: str) -> str:
+    """Tradução PT→EN (com e sem acentos) e limpeza do que a API não aceita."""
     query_en = TRADUCAO_PT_EN.get(key)
     if not query_en:
-        # Tentar sem acentos também
-        import unicodedata
         key_ascii = unicodedata.normalize("NFKD", key).encode("ASCII", "ignore").decode()
         query_en = TRADUCAO_PT_EN.get(key_ascii, key)  # Fallback: nome original
+    query_en = re.sub(r'[()\/]', ' ', query_en)
+    return re.sub(r'\s+', ' ', query_en).strip()[:80]  # max 80 chars
 
-    # Limpar caracteres especiais que a API USDA não aceita (parênteses, barras)
-    import re as _re
-    query_en = _re.sub(r'[()\/]', ' ', query_en)
-    query_en = _re.sub(r'\s+', ' ', query_en).strip()[:80]  # max 80 chars
 
-    result = _query_usda_sync(query_en)
-    _CACHE[key] = result  # None também cacheado — evita re-tentativa
+async def buscar_dados_usda_async(ingrediente: str) -> Optional[dict]:
+    """Cache -> tradução PT→EN -> USDA -> cache. Formato do TACO_DATABASE ou None."""
+    key = _cache_key(ingrediente)
+    cache = get_usda_cache()
+    cached = cache.get(key)
+    if cached is not _MISSING:
+        return cached
+    result, cacheable = await get_usda_client().search(_query_for(key))
+    if cacheable:
+        cache.set(key, result)
     return result
+
+
+async def prefetch_usda(ingredientes: Iterable[str]) -> Dict[str, Optional[dict]]:
+    """Busca em paralelo (sob o rate limiter) todos os ingredientes ainda fora do cache."""
+    unique = list(dict.fromkeys(i for i in ingredientes if i and i.strip()))
+    results = await asyncio.gather(*(buscar_dados_usda_async(i) for i in unique))
+    return dict(zip(unique, results))
+
+
+def prefetch_usda_sync(ingredientes: Iterable[str]) -> Dict[str, Optional[dict]]:
+    """prefetch_usda() para chamadores síncronos (calcular_nutricao_prato).
+
+    Bloqueia até o USDA responder: handlers async chamam via asyncio.to_thread.
+    """
+    ingredientes = list(ingredientes)
+    cache = get_usda_cache()
+    if all(cache.get(_cache_key(i)) is not _MISSING for i in ingredientes):
+        return {i: cache.get(_cache_key(i)) for i in ingredientes}
+    return get_usda_client().run_sync(prefetch_usda(ingredientes))
+
+
+def buscar_dados_usda(ingrediente: str) -> Optional[dict]:
+    """
+    Ponto de entrada síncrono (compatível com a versão anterior).
+    Retorna dict compatível com o formato do TACO_DATABASE ou None.
+    """
+    return prefetch_usda_sync([ingrediente]).get(ingrediente)
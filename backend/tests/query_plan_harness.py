@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Harness de plano de consulta: aplica um registro de índices
+(services/index_registry.py) num banco descartável e devolve os estágios do
+plano vencedor de cada consulta, para os testes falharem em COLLSCAN.
+
+- SOULNUTRI_TEST_MONGO_URL definido -> mongod real, explain() do servidor
+- senão -> mongomock; o plano é simulado a partir dos índices que o
+  ensure_indexes criou de fato (regra de prefixo do planner: um ramo usa
+  índice se o primeiro campo do índice tem predicado no ramo, ou se não há
+  filtro e o sort começa pelo primeiro campo do índice)
+
+Uso:
+    with QueryPlanHarness() as h:
+        h.apply(INDEXES)
+        assert "COLLSCAN" not in h.stages("users", {"pin_hash": "x"})
+"""
+
+import asyncio
+import itertools
+import os
+import uuid
+
+# predicados que o planner não resolve com o índice (exigem varrer tudo)
+_NON_SARGABLE = {"$ne", "$nin", "$not", "$exists"}
+
+
+# ── adaptador assincrono minimo sobre mongomock (interface do motor usada pelos servicos) ──
+
+class _Cursor:
+    def __init__(self, cursor):
+        self._it = iter(cursor)
+
+    async def to_list(self, length=None):
+        return list(itertools.islice(self._it, length))
+
+
+class _Collection:
+    def __init__(self, col):
+        self._col = col
+
+    def find(self, *args, **kwargs):
+        return _Cursor(self._col.find(*args, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self._col, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+class AsyncMongomockDB:
+    def __init__(self, database):
+        self._db = database
+
+    def __getitem__(self, name):
+        return _Collection(self._db[name])
+
+    __getattr__ = __getitem__
+
+
+def plan_stages(plan: dict):
+    """Estágios de um winningPlan (classic: inputStage(s); SBE: queryPlan)."""
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if isinstance(plan.get(key), dict):
+            yield from plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from plan_stages(child)
+
+
+def _sargable_fields(flt: dict) -> set:
+    fields = set()
+    for field, cond in flt.items():
+        if field.startswith("$"):
+            continue
+        if isinstance(cond, dict) and cond and all(op.startswith("$") for op in cond):
+            if set(cond) <= _NON_SARGABLE:
+                continue
+        fields.add(field)
+    return fields
+
+
+def simulate_plan(index_keys: list, flt: dict, sort=None) -> set:
+    """Plano aproximado do planner para mongomock. index_keys: [[(campo, dir), ...], ...]."""
+    first = {keys[0][0] for keys in index_keys}
+    top = _sargable_fields(flt)
+    if "$or" in flt and not top & first:
+        branches = [top | _sargable_fields(b) for b in flt["$or"]]
+        if all(b & first for b in branches):
+            return {"FETCH", "OR", "IXSCAN"}
+        return {"COLLSCAN"}
+    if top & first:
+        return {"FETCH", "IXSCAN"}
+    if not top and "$or" not in flt and sort and sort[0][0] in first:
+        return {"FETCH", "IXSCAN"}
+    return {"COLLSCAN"}
+
+
+class QueryPlanHarness:
+    def __init__(self, mongo_url: str = None):
+        self.mongo_url = mongo_url or os.environ.get("SOULNUTRI_TEST_MONGO_URL")
+        self.db_name = f"soulnutri_plan_test_{uuid.uuid4().hex[:12]}"
+        if self.mongo_url:
+            from pymongo import MongoClient
+            self.backend = "mongod"
+            self.client = MongoClient(self.mongo_url)
+        else:
+            import mongomock
+            self.backend = "mongomock"
+            self.client = mongomock.MongoClient()
+        self.db = self.client[self.db_name]
+
+    def apply(self, registry) -> dict:
+        """Roda services.index_registry.ensure_indexes com o registro dado."""
+        from services.index_registry import ensure_indexes
+
+        if self.backend == "mongomock":
+            return asyncio.run(ensure_indexes(AsyncMongomockDB(self.db), registry))
+
+        async def run():
+            from motor.motor_asyncio import AsyncIOMotorClient
+            client = AsyncIOMotorClient(self.mongo_url)
+            try:
+                return await ensure_indexes(client[self.db_name], registry)
+            finally:
+                client.close()
+        return asyncio.run(run())
+
+    def stages(self, collection: str, flt: dict, sort=None) -> set:
+        coll = self.db[collection]
+        if self.backend == "mongomock":
+            keys = [info["key"] for info in coll.index_information().values()]
+            return simulate_plan(keys, flt, sort)
+        cursor = coll.find(flt)
+        if sort:
+            cursor = cursor.sort(sort)
+        return set(plan_stages(cursor.explain()["queryPlanner"]["winningPlan"]))
+
+    def close(self):
+        if self.backend == "mongod":
+            self.client.drop_database(self.db_name)
+        self.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Backends de busca do DishIndex (ai/ann.py).
+
+Cobre os casos:
+- ExactSearch devolve todas as linhas (rows=None)
+- IVF com nprobe == nlist equivale a busca exata
+- IVF treinado e deterministico (mesmo seed)
+- IVF persistido e recarregado quando o fingerprint bate; re-treinado quando muda
+- falha no meio da gravacao do IVF nao trunca o arquivo anterior
+- recall_report mede concordancia top-5 em dados com clusters
+- backend desconhecido cai para busca exata
+
+Executar:
+    python3 -m pytest backend/tests/test_ann_backend.py -v
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np  # noqa: E402
+
+from ai.ann import (  # noqa: E402
+    ExactSearch,
+    IVFSearch,
+    create_backend,
+    load_or_build_ivf,
+    recall_report,
+)
+
+
+def _clustered(n_dishes=30, per_dish=8, dim=64, seed=1):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_dishes, dim))
+    rows, dishes = [], []
+    for d in range(n_dishes):
+        pts = centers[d] + 0.3 * rng.normal(size=(per_dish, dim))
+        rows.append(pts)
+        dishes += [f"prato_{d}"] * per_dish
+    emb = np.vstack(rows).astype(np.float32)
+    emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+    return emb, dishes
+
+
+def test_exact_devolve_todas_as_linhas():
+    emb, _ = _clustered()
+    rows, sims = ExactSearch(emb).candidates(emb[0])
+    assert rows is None
+    assert sims.shape == (len(emb),)
+
+
+def test_ivf_com_todas_as_listas_equivale_ao_exato():
+    emb, _ = _clustered()
+    centroids, assign = IVFSearch.train(emb, nlist=10)
+    ivf = IVFSearch(emb, centroids, assign, nprobe=10)
+    rows, sims = ivf.candidates(emb[3])
+    assert sorted(rows.tolist()) == list(range(len(emb)))
+    assert np.allclose(sims, emb[rows] @ emb[3])
+
+
+def test_ivf_treino_deterministico():
+    emb, _ = _clustered()
+    c1, a1 = IVFSearch.train(emb, nlist=8, seed=0)
+    c2, a2 = IVFSearch.train(emb, nlist=8, seed=0)
+    assert np.array_equal(a1, a2)
+    assert np.allclose(c1, c2)
+
+
+def test_ivf_persistido_e_recarregado(tmp_path):
+    emb, _ = _clustered()
+    emb_file = str(tmp_path / "dish_index_embeddings.npy")
+    first = load_or_build_ivf(emb, emb_file, nlist=8, nprobe=2)
+    assert (tmp_path / "dish_index_ivf.npz").exists()
+    again = load_or_build_ivf(emb, emb_file, nlist=8, nprobe=2)
+    assert np.array_equal(first.assign, again.assign)
+
+    # Embeddings mudaram -> IVF re-treinado para o novo tamanho
+    grown = np.vstack([emb, emb[:5]])
+    rebuilt = load_or_build_ivf(grown, emb_file, nlist=8, nprobe=2)
+    assert len(rebuilt.assign) == len(grown)
+
+
+def test_ivf_gravacao_interrompida_mantem_arquivo(tmp_path, monkeypatch):
+    import ai.ann as ann
+
+    emb, _ = _clustered()
+    emb_file = str(tmp_path / "dish_index_embeddings.npy")
+    first = load_or_build_ivf(emb, emb_file, nlist=8, nprobe=2)
+    saved = (tmp_path / "dish_index_ivf.npz").read_bytes()
+
+    def crash(f, **arrays):
+        f.write(b"PK\x03\x04 parcial")
+        raise OSError("disco cheio")
+    monkeypatch.setattr(ann.np, "savez", crash)
+    load_or_build_ivf(np.vstack([emb, emb[:5]]), emb_file, nlist=8, nprobe=2)  # re-treina, falha ao salvar
+    assert (tmp_path / "dish_index_ivf.npz").read_bytes() == saved
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["dish_index_ivf.npz"]
+
+    monkeypatch.undo()
+    again = load_or_build_ivf(emb, emb_file, nlist=8, nprobe=2)
+    assert np.array_equal(first.assign, again.assign)
+
+
+def test_recall_report_em_dados_com_clusters():
+    emb, dishes = _clustered()
+    centroids, assign = IVFSearch.train(emb, nlist=6)
+    ivf = IVFSearch(emb, centroids, assign, nprobe=3)
+    report = recall_report(emb, dishes, ivf, sample=100, k=5)
+    assert report["queries"] == 100
+    assert report["dish_top1_agreement"] >= 0.95
+    assert 0 < report["avg_candidate_fraction"] <= 1
+
+
+def test_backend_desconhecido_cai_para_exato(tmp_path):
+    emb, _ = _clustered()
+    backend = create_backend(emb, str(tmp_path / "x_embeddings.npy"), backend="faiss-gpu")
+    assert isinstance(backend, ExactSearch)
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Provider curated do breaking_news_service com snapshot em memoria.
+
+Cobre os casos:
+- cold start: consulta async indexada por tags e carrega o snapshot em background
+- snapshot quente: nenhum round trip ao Mongo; mesmo resultado do calculo antigo
+- indice invertido tag -> itens so devolve candidatos com tag em comum
+- TTL vencido / invalidate_snapshot: serve o snapshot antigo e recarrega
+- itens fora da janela de recencia sao descartados mesmo no snapshot
+
+Executar:
+    python3 -m pytest backend/tests/test_breaking_news_curated.py -v
+"""
+
+import asyncio
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import pytest  # noqa: E402
+
+from services.breaking_news_service.providers import curated  # noqa: E402
+from services.breaking_news_service.ranking import build_term_set, is_relevant, score_item  # noqa: E402
+
+mongomock = pytest.importorskip("mongomock")
+from query_plan_harness import AsyncMongomockDB  # noqa: E402
+
+AGORA = datetime.now(timezone.utc).replace(tzinfo=None)  # Mongo devolve datetime naive (UTC)
+
+SEED = [
+    {"id": "n1", "titulo": "Sodio em embutidos", "tags": ["bacon", "linguica", "sodio"], "polaridade": "alerta",
+     "data": AGORA - timedelta(days=10), "ativo": True, "url": "https://x/1", "fonte": "ANVISA"},
+    {"id": "n2", "titulo": "Feijao e fibras", "tags": ["feijao", "fibras"], "polaridade": "beneficio",
+     "data": AGORA - timedelta(days=200), "ativo": True, "url": "https://x/2", "fonte": "USP"},
+    {"id": "n3", "titulo": "Feijao tropeiro", "tags": ["feijao", "tropeiro", "bacon"], "polaridade": "neutro",
+     "data": AGORA - timedelta(days=30), "ativo": True, "url": "https://x/3", "fonte": "Embrapa"},
+    {"id": "n4", "titulo": "Inativo", "tags": ["feijao", "bacon", "tropeiro"], "polaridade": "alerta",
+     "data": AGORA - timedelta(days=1), "ativo": False, "url": "https://x/4", "fonte": "X"},
+    {"id": "n5", "titulo": "Antigo", "tags": ["arroz", "integral"], "polaridade": "alerta",
+     "data": AGORA - timedelta(days=400), "ativo": True, "url": "https://x/5", "fonte": "X"},
+    {"id": "n6", "titulo": "Arroz integral", "tags": ["arroz", "integral"], "polaridade": "beneficio",
+     "data": AGORA - timedelta(days=100), "ativo": True, "url": "https://x/6", "fonte": "Fiocruz"},
+]
+
+CONTEXTOS = [
+    ("feijao_tropeiro", "feijoes", ["feijao", "bacon", "linguica calabresa"], "proteina"),
+    ("arroz_integral", None, ["arroz integral"], "carboidrato"),
+    ("salada_verde", None, ["alface"], "salada"),
+    ("linguica_acebolada", None, ["linguica", "cebola"], "proteina"),
+]
+
+
+class _CountingCollection:
+    def __init__(self, col):
+        self._col = col
+        self.finds = []
+
+    def find(self, query, *args, **kwargs):
+        self.finds.append(query)
+        return self._col.find(query, *args, **kwargs)
+
+
+@pytest.fixture
+def coll(monkeypatch):
+    raw = mongomock.MongoClient()["soulnutri_test"]
+    raw.contextual_breaking_news.insert_many([dict(d) for d in SEED])
+    counting = _CountingCollection(AsyncMongomockDB(raw).contextual_breaking_news)
+    counting.raw = raw.contextual_breaking_news
+    monkeypatch.setattr(curated, "_get_collection", lambda: counting)
+    monkeypatch.setattr(curated, "BREAKING_NEWS_WATCH", False)
+    monkeypatch.setattr(curated, "_snapshot", None)
+    monkeypatch.setattr(curated, "_refresh_task", None)
+    return counting
+
+
+def _legacy_fetch(raw, dish_slug, family_slug, ingredientes, category):
+    """Calculo antigo: find por tags no Mongo + score de cada documento."""
+    terms = build_term_set(dish_slug, family_slug, ingredientes, category)
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=365)).replace(tzinfo=None)
+    best, best_score = None, -1
+    for doc in raw.find({"ativo": True, "tags": {"$in": list(terms)}, "data": {"$gte": cutoff}}, {"_id": 0}):
+        score, _ = score_item(doc, terms)
+        if not is_relevant(score):
+            continue
+        if score > best_score or (score == best_score and doc["data"] > best["data"]):
+            best, best_score = doc, score
+    return best and (best["titulo"], best_score)
+
+
+async def _fetch(ctx):
+    item = await curated.fetch(*ctx)
+    return item and (item["titulo"], item["score"])
+
+
+def test_cold_start_consulta_e_carrega_snapshot(coll):
+    async def run():
+        first = await _fetch(CONTEXTOS[0])
+        assert "tags" in coll.finds[0]  # consulta indexada por tags
+        await curated._refresh_task
+        return first
+    assert asyncio.run(run()) == _legacy_fetch(coll.raw, *CONTEXTOS[0])
+    assert curated._snapshot is not None
+    assert sorted(d["id"] for d in curated._snapshot.items) == ["n1", "n2", "n3", "n6"]
+
+
+def test_snapshot_quente_sem_mongo_e_igual_ao_antigo(coll):
+    asyncio.run(curated._load_snapshot())
+    coll.finds.clear()
+
+    async def run():
+        return [await _fetch(ctx) for ctx in CONTEXTOS]
+    results = asyncio.run(run())
+    assert coll.finds == []
+    assert results == [_legacy_fetch(coll.raw, *ctx) for ctx in CONTEXTOS]
+    assert results[0][0] == "Feijao tropeiro" and results[2] is None
+
+
+def test_indice_invertido_candidatos():
+    snap = curated._Snapshot([dict(d) for d in SEED if d["ativo"]])
+    assert [d["id"] for d in snap.candidates({"bacon"})] == ["n1", "n3"]
+    assert [d["id"] for d in snap.candidates({"feijao", "sodio"})] == ["n1", "n2", "n3"]
+    assert snap.candidates({"quinoa"}) == []
+
+
+def test_ttl_vencido_serve_antigo_e_recarrega(coll):
+    asyncio.run(curated._load_snapshot())
+    coll.raw.insert_one({"id": "n7", "titulo": "Salada e folhas", "tags": ["salada", "alface"],
+                         "polaridade": "beneficio", "data": AGORA, "ativo": True})
+
+    async def run():
+        curated.invalidate_snapshot()
+        stale = await _fetch(CONTEXTOS[2])     # snapshot antigo: ainda sem n7
+        await curated._refresh_task
+        fresh = await _fetch(CONTEXTOS[2])
+        return stale, fresh
+    stale, fresh = asyncio.run(run())
+    assert stale is None
+    assert fresh[0] == "Salada e folhas"
+    assert curated._snapshot.fresh()
+
+
+def test_janela_de_recencia_no_snapshot(coll):
+    old = dict(SEED[5], id="n8", titulo="Quase vencido", data=AGORA - timedelta(days=366), polaridade="alerta")
+    curated._snapshot = curated._Snapshot([old])
+    assert asyncio.run(_fetch(CONTEXTOS[1])) is None
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
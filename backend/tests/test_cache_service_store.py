@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Cache de identificacao (services/cache_service.TTLCache).
+
+Cobre os casos:
+- expiracao pelo heap (get apos o TTL e miss; contagem de expirations)
+- regravar a mesma chave nao deixa a entrada antiga expirar a nova
+- limite em bytes e em entradas: despeja o menos recente (LRU) e conta evictions
+- hit devolve copia: alterar o resultado nao altera o cache
+- backend SQLite compartilhado: outro "worker" (outra instancia) reaproveita, clear limpa os dois
+- get_cache_stats com hit rate, bytes e backend
+
+Executar:
+    python3 -m pytest backend/tests/test_cache_service_store.py -v
+"""
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import services.cache_service as cache_service  # noqa: E402
+from services.cache_service import SQLiteCacheBackend, TTLCache  # noqa: E402
+
+
+def _result(dish="Ceviche", extra=""):
+    return {"ok": True, "identified": True, "dish_display": dish, "confidence": "alta",
+            "source": "local_index", "nutrition": {"kcal": 120}, "extra": extra}
+
+
+def test_expiracao_pelo_heap(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_service.time, "time", lambda: now[0])
+    cache = TTLCache(max_size=10)
+    cache.set("a", _result(), ttl_seconds=10)
+    cache.set("b", _result(), ttl_seconds=100)
+    now[0] += 50
+    assert cache.get("a") is None
+    assert cache.get("b")["dish_display"] == "Ceviche"
+    stats = cache.stats()
+    assert stats["expirations"] == 1
+    assert stats["size"] == 1
+
+
+def test_regravar_renova_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_service.time, "time", lambda: now[0])
+    cache = TTLCache(max_size=10)
+    cache.set("a", _result(), ttl_seconds=10)
+    now[0] += 5
+    cache.set("a", _result("Pudim"), ttl_seconds=100)
+    now[0] += 10
+    assert cache.get("a")["dish_display"] == "Pudim"
+    assert cache.stats()["expirations"] == 0
+
+
+def test_limite_em_bytes_e_entradas():
+    cache = TTLCache(max_size=3, max_bytes=1000)
+    cache.set("a", _result(extra="x" * 300))
+    cache.set("b", _result(extra="x" * 300))
+    cache.get("a")  # a fica mais recente que b
+    cache.set("c", _result(extra="x" * 300))
+    assert list(cache.cache) == ["a", "c"]
+    assert cache.bytes <= 1000
+    cache.set("d", _result())
+    cache.set("e", _result())
+    assert len(cache.cache) == 3
+    stats = cache.stats()
+    assert stats["evictions"] == 2
+    assert stats["bytes"] == cache.bytes == sum(cache._sizes.values())
+
+    cache.set("grande", _result(extra="x" * 2000))  # maior que o limite: nao cacheia
+    assert "grande" not in cache.cache
+
+
+def test_hit_devolve_copia(monkeypatch):
+    monkeypatch.setattr(cache_service, "_dish_cache", TTLCache())
+    cache_service.cache_result(b"img", _result(), restaurant="cibi_sana")
+    first = cache_service.get_cached_result(b"img", "cibi_sana")
+    assert first["source"] == "local_index_cached"
+    assert first["from_cache"] is True
+    assert not any(k.startswith("_") for k in first)
+    first["dish_display"] = "Alterado"
+    first["source"] = "x"
+    again = cache_service.get_cached_result(b"img", "cibi_sana")
+    assert again["dish_display"] == "Ceviche"
+    assert again["source"] == "local_index_cached"
+
+
+def test_backend_compartilhado_entre_workers(tmp_path):
+    path = str(tmp_path / "identify.sqlite")
+    worker_a = TTLCache(backend=SQLiteCacheBackend(path, 100, 10 ** 6))
+    worker_b = TTLCache(backend=SQLiteCacheBackend(path, 100, 10 ** 6))
+    worker_a.set("k", _result(), ttl_seconds=60)
+
+    hit = worker_b.get_view("k")
+    assert hit["dish_display"] == "Ceviche"
+    assert hit["nutrition"] == {"kcal": 120}
+    stats = worker_b.stats()
+    assert stats["shared_hits"] == 1
+    assert stats["backend"]["entries"] == 1
+
+    # Restart: nova instancia, mesmo arquivo
+    restarted = TTLCache(backend=SQLiteCacheBackend(path, 100, 10 ** 6))
+    assert restarted.get("k")["_expires_at"] > time.time()
+
+    worker_a.set("expirado", _result(), ttl_seconds=-1)
+    assert worker_b.get_view("expirado") is None
+
+    worker_b.clear()
+    assert worker_a.backend.stats()["entries"] == 0
+
+
+def test_backend_respeita_limites(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / "identify.sqlite"), max_entries=5, max_bytes=10 ** 6)
+    backend._PURGE_EVERY = 1
+    cache = TTLCache(backend=backend)
+    for i in range(12):
+        cache.set(f"k{i}", _result())
+    assert backend.stats()["entries"] == 5
+    assert cache.get_view("k11") is not None
+
+
+def test_get_cache_stats(monkeypatch):
+    monkeypatch.setattr(cache_service, "_dish_cache", TTLCache())
+    cache_service.cache_result(b"img", _result(), restaurant="")
+    cache_service.get_cached_result(b"img")
+    cache_service.get_cached_result(b"outra")
+    stats = cache_service.get_cache_stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["hit_rate"] == "50.0%"
+    assert stats["bytes"] > 0
+    assert stats["backend"] == {"type": "memory"}
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Analise de calibracao vetorizada (services/calibration_service.py).
+
+Cobre os casos:
+- stats, distribuicao e Youden iguais ao calculo antigo do endpoint (loop por threshold)
+- AUC da curva ROC igual a contagem par a par
+- precisao/recall por prato
+- thresholds propostos por prato/familia so com amostras suficientes
+- leitura da colecao inteira em blocos (sem o limite de 1000), mais recentes primeiro
+- analyze_result usa o threshold calibrado do prato / da familia
+
+Executar:
+    python3 -m pytest backend/tests/test_calibration_service.py -v
+"""
+
+import asyncio
+import random
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import numpy as np  # noqa: E402
+import pytest  # noqa: E402
+
+from ai import policy  # noqa: E402
+from services import calibration_service as cal  # noqa: E402
+
+DISHES = ["arrozbranco", "feijaocariocasemcarne", "bolobrownie", "cocada"]
+
+
+def _samples(n=1000, seed=7):
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        dish = rng.choice(DISHES)
+        ok = rng.random() < 0.7
+        score = round(min(0.99, max(0.0, rng.gauss(0.86 if ok else 0.7, 0.08))), 4)
+        if i % 97 == 0:
+            score = 0.0
+        out.append({"dish_clip": dish, "dish_real": dish if ok else rng.choice(DISHES),
+                    "is_correct": ok, "score": score})
+    return out
+
+
+def _legacy(samples):
+    """Calculo antigo do GET /ai/calibration (loop por threshold + if/elif)."""
+    correct_scores = [s["score"] for s in samples if s["is_correct"] and s["score"] > 0]
+    incorrect_scores = [s["score"] for s in samples if not s["is_correct"] and s["score"] > 0]
+    thresholds = sorted(set(round(s, 2) for s in correct_scores + incorrect_scores))
+    best = (-1, 0.85, 0, 0)
+    for t in thresholds:
+        sens = sum(1 for s in correct_scores if s >= t) / len(correct_scores)
+        spec = sum(1 for s in incorrect_scores if s < t) / len(incorrect_scores)
+        if sens + spec - 1 > best[0]:
+            best = (sens + spec - 1, t, sens, spec)
+    dist = {key: {"correct": 0, "incorrect": 0} for key, _ in cal.DISTRIBUTION_BINS}
+    for s in samples:
+        key = next(k for k, lo in cal.DISTRIBUTION_BINS if s["score"] >= lo)
+        dist[key]["correct" if s["is_correct"] else "incorrect"] += 1
+    return {
+        "median_correct": round(sorted(correct_scores)[len(correct_scores) // 2], 4),
+        "avg_incorrect": round(sum(incorrect_scores) / len(incorrect_scores), 4),
+        "youden": (round(best[1], 4), round(best[0], 4), round(best[2], 4), round(best[3], 4)),
+        "distribution": dist,
+    }
+
+
+def _arrays(samples):
+    data = cal.CalibrationData()
+    data.add(samples)
+    return data.arrays()
+
+
+def test_igual_ao_calculo_antigo():
+    samples = _samples()
+    result = cal.analyze(*_arrays(samples), family_of=lambda d: None)
+    legacy = _legacy(samples)
+    y = result["youden"]
+    assert (y["optimal_threshold"], y["j_index"], y["sensitivity"], y["specificity"]) == legacy["youden"]
+    assert result["distribution"] == legacy["distribution"]
+    assert result["stats"]["correct_scores"]["median"] == legacy["median_correct"]
+    assert result["stats"]["incorrect_scores"]["avg"] == legacy["avg_incorrect"]
+    assert result["stats"]["total_samples"] == len(samples)
+
+
+def test_roc_auc_par_a_par():
+    samples = _samples(400, seed=3)
+    result = cal.analyze(*_arrays(samples), family_of=lambda d: None)
+    pos = [s["score"] for s in samples if s["is_correct"] and s["score"] > 0]
+    neg = [s["score"] for s in samples if not s["is_correct"] and s["score"] > 0]
+    pairs = sum(1.0 if p > n else 0.5 if p == n else 0.0 for p in pos for n in neg)
+    roc = result["roc"]
+    assert roc["auc"] == round(pairs / (len(pos) * len(neg)), 4)
+    assert roc["thresholds"] == sorted(roc["thresholds"], reverse=True)
+    assert roc["tpr"] == sorted(roc["tpr"]) and roc["fpr"] == sorted(roc["fpr"])
+
+
+def test_precisao_recall_por_prato():
+    samples = [
+        {"dish_clip": "cocada", "dish_real": "cocada", "is_correct": True, "score": 0.9},
+        {"dish_clip": "cocada", "dish_real": "bolobrownie", "is_correct": False, "score": 0.8},
+        {"dish_clip": "bolobrownie", "dish_real": "cocada", "is_correct": False, "score": 0.7},
+        {"dish_clip": "bolobrownie", "dish_real": "bolobrownie", "is_correct": True, "score": 0.95},
+        {"dish_clip": "cocada", "dish_real": "cocada", "is_correct": True, "score": 0.91},
+    ]
+    per_dish = cal.analyze(*_arrays(samples), family_of=lambda d: None)["per_dish"]
+    assert per_dish["cocada"] == {"predicted": 3, "actual": 3, "correct": 2, "precision": 0.6667, "recall": 0.6667}
+    assert per_dish["bolobrownie"]["precision"] == 0.5 and per_dish["bolobrownie"]["recall"] == 0.5
+
+
+def test_thresholds_propostos_por_prato_e_familia():
+    samples = []
+    for i in range(8):
+        samples.append({"dish_clip": "cocada", "is_correct": True, "score": round(0.80 + i * 0.01, 2)})
+        samples.append({"dish_clip": "cocada", "is_correct": False, "score": round(0.60 + i * 0.01, 2)})
+        samples.append({"dish_clip": "bolobrownie", "is_correct": True, "score": 0.93 + i * 0.005})
+    samples.append({"dish_clip": "bolobrownie", "is_correct": False, "score": 0.85})
+    families = {"cocada": "doces", "bolobrownie": "doces"}
+    proposed = cal.analyze(*_arrays(samples), family_of=families.get, min_samples=5)["proposed_thresholds"]
+    assert proposed["dishes"]["cocada"]["optimal_threshold"] == 0.80  # primeiro score observado com J = 1
+    assert proposed["dishes"]["cocada"]["j_index"] == 1.0
+    assert "bolobrownie" not in proposed["dishes"]  # so 1 erro: amostras insuficientes
+    assert set(proposed["families"]) == {"doces"}
+    assert cal.THRESHOLD_MIN <= proposed["families"]["doces"]["optimal_threshold"] <= cal.THRESHOLD_MAX
+
+
+def test_leitura_em_blocos_da_colecao_inteira():
+    mongomock = pytest.importorskip("mongomock")
+    from query_plan_harness import AsyncMongomockDB
+
+    raw = mongomock.MongoClient()["soulnutri_test"]
+    base = datetime(2026, 1, 1)
+    raw.calibration_log.insert_many(
+        [dict(s, created_at=base + timedelta(minutes=i)) for i, s in enumerate(_samples(2500))])
+    data = asyncio.run(cal.load_calibration(AsyncMongomockDB(raw).calibration_log, chunk_size=400))
+    scores, correct, dishes, real = data.arrays()
+    assert scores.size == correct.size == dishes.size == real.size == 2500
+    assert len(data.recent) == 200
+    assert data.recent[0]["created_at"] == (base + timedelta(minutes=2499)).isoformat()
+    assert isinstance(data.recent[0]["_id"], str)
+    assert np.isclose(scores.sum(), sum(s["score"] for s in _samples(2500)))
+
+
+def test_colecao_vazia():
+    result = cal.analyze(*cal.CalibrationData().arrays(), family_of=lambda d: None)
+    assert result["stats"]["total_samples"] == 0
+    assert result["youden"] is None and result["roc"] is None and result["per_dish"] == {}
+
+
+@pytest.fixture
+def calibrated():
+    yield policy.set_calibrated_thresholds
+    policy.set_calibrated_thresholds()
+
+
+def _decide(dish, score):
+    return policy.analyze_result([{"dish": dish, "score": score}, {"dish": "cocada", "score": score - 0.2}])
+
+
+def test_analyze_result_threshold_calibrado(calibrated):
+    assert _decide("arrozbranco", 0.75)["identified"] is True
+    assert _decide("arrozbranco", 0.70)["identified"] is False
+
+    calibrated(dishes={"arrozbranco": 0.80})
+    assert _decide("arrozbranco", 0.75)["identified"] is False
+    assert _decide("arrozbranco", 0.82)["confidence"] == "média"
+    assert _decide("arrozintegral", 0.75)["identified"] is True  # sem calibracao: limite fixo
+
+    calibrated(dishes={"arrozbranco": 0.93})
+    assert _decide("arrozbranco", 0.92)["identified"] is False
+    assert _decide("arrozbranco", 0.94)["confidence"] == "alta"  # alta exige max(0.90, calibrado)
+
+
+def test_analyze_result_threshold_da_familia(calibrated):
+    from ai.families import DISH_TO_FAMILY
+
+    dish, family = next(iter(DISH_TO_FAMILY.items()))
+    calibrated(families={family: 0.60})
+    assert policy.get_identify_threshold(dish) == 0.60
+    calibrated(dishes={dish: 0.85}, families={family: 0.60})
+    assert policy.get_identify_threshold(dish) == 0.85
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
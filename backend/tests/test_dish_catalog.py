@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Catalogo de pratos em memoria da policy (ai/dish_catalog.py).
+
+Cobre os casos:
+- nome/categoria/info vindos do dish_info.json (beneficios genericos filtrados)
+- fallback para DISH_NAMES / DISH_INFO / to_display_name sem arquivo
+- analyze_result sem nenhum I/O de arquivo depois do load
+- copia mutavel por chamada; registros imutaveis
+- invalidate(slug) rele so o prato editado; invalidate() recarrega tudo
+- pasta criada depois do load: achada na primeira consulta; slug sem arquivo e rebuscado apos o intervalo
+
+Executar:
+    python3 -m pytest backend/tests/test_dish_catalog.py -v
+"""
+
+import builtins
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest  # noqa: E402
+
+from ai import policy  # noqa: E402
+from ai.dish_catalog import DishCatalog  # noqa: E402
+
+TORTA = {
+    "nome": "Torta de Palmito da Casa",
+    "categoria": "vegetariano",
+    "descricao": "Torta de palmito",
+    "ingredientes": ["palmito", "massa"],
+    "beneficios": ["Fibras do palmito", "Sem aditivos quimicos", "Ingredientes frescos"],
+    "riscos": ["Contem gluten"],
+    "nutricao": {"calorias": "~220 kcal", "proteinas": "~6g"},
+}
+
+
+def _write(root, slug, info):
+    (root / slug).mkdir(parents=True, exist_ok=True)
+    (root / slug / "dish_info.json").write_text(json.dumps(info), encoding="utf-8")
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    _write(tmp_path, "tortadepalmito", TORTA)
+    _write(tmp_path, "arrozbranco", {"nome": "Arroz do Arquivo", "categoria": "vegano", "beneficios": []})
+    (tmp_path / "semficha").mkdir()
+    cat = DishCatalog(policy._resolve_dish, tmp_path)
+    monkeypatch.setattr(policy, "DISH_CATALOG", cat)
+    assert cat.load() == 2
+    return cat
+
+
+def test_info_do_arquivo(catalog):
+    assert policy.get_dish_name("tortadepalmito") == "Torta de Palmito da Casa"
+    assert policy.get_category("tortadepalmito") == "vegetariano"
+    info = policy.get_dish_info("tortadepalmito")
+    assert info["beneficios"] == ["Fibras do palmito"]
+    assert info["nutricao"] == {"calorias": "~220 kcal", "proteinas": "~6g"}
+    assert policy.safe_display("tortadepalmito", "Torta de Palmito da Casa") == "Torta de Palmito da Casa"
+
+
+def test_fallbacks_sem_arquivo(catalog):
+    # DISH_NAMES tem prioridade sobre o nome do arquivo
+    assert policy.get_dish_name("arrozbranco") == policy.DISH_NAMES["arrozbranco"]
+    assert policy.get_dish_name("semficha") == "Semficha"
+    assert policy.get_category("semficha") == "não classificado"
+    default = policy.get_dish_info("semficha")
+    assert default["descricao"] == policy.DISH_INFO["default"]["descricao"]
+    assert default["beneficios"] == []  # os dois do default sao genericos
+    assert policy.DISH_INFO["default"]["beneficios"]  # dicionario original intacto
+
+
+def test_analyze_result_sem_io(catalog, monkeypatch):
+    results = [{"dish": "tortadepalmito", "score": 0.8}, {"dish": "arrozbranco", "score": 0.7},
+               {"dish": "semficha", "score": 0.6}]
+    first = policy.analyze_result(results)
+
+    def no_io(*args, **kwargs):
+        raise AssertionError(f"I/O de arquivo no analyze_result: {args}")
+    monkeypatch.setattr(builtins, "open", no_io)
+    monkeypatch.setattr("os.path.exists", no_io)
+    again = policy.analyze_result(results)
+    assert again == first
+    assert again["dish_display"] == "Torta de Palmito da Casa"
+    assert again["alternatives"] == [policy.DISH_NAMES["arrozbranco"], "Semficha"]
+
+
+def test_copia_mutavel_e_registro_imutavel(catalog):
+    info = policy.get_dish_info("tortadepalmito")
+    info["ingredientes"].append("queijo")
+    info["nutricao"]["calorias"] = "0"
+    assert policy.get_dish_info("tortadepalmito")["ingredientes"] == ["palmito", "massa"]
+    assert policy.get_dish_info("tortadepalmito")["nutricao"]["calorias"] == "~220 kcal"
+    with pytest.raises(TypeError):
+        catalog.get("tortadepalmito").info["nome"] = "x"
+
+
+def test_invalidate_rele_o_prato(catalog, tmp_path):
+    assert policy.get_category("tortadepalmito") == "vegetariano"
+    assert policy.get_dish_name("semficha") == "Semficha"
+    _write(tmp_path, "tortadepalmito", dict(TORTA, nome="Torta de Palmito", categoria="vegano"))
+    _write(tmp_path, "semficha", {"nome": "Prato Novo", "categoria": "vegano"})
+    assert policy.get_category("tortadepalmito") == "vegetariano"  # cache ate invalidar
+
+    policy.invalidate_dish_catalog("tortadepalmito")
+    assert policy.get_dish_name("tortadepalmito") == "Torta de Palmito"
+    assert policy.get_category("tortadepalmito") == "vegano"
+    assert policy.get_dish_name("semficha") == "Semficha"  # outro prato nao foi relido
+
+    policy.invalidate_dish_catalog()
+    assert policy.get_dish_name("semficha") == "Prato Novo"
+
+
+def test_invalidate_prato_removido(catalog, tmp_path):
+    (tmp_path / "tortadepalmito" / "dish_info.json").unlink()
+    policy.invalidate_dish_catalog("tortadepalmito")
+    assert policy.get_dish_name("tortadepalmito") == "Tortadepalmito"
+    assert "tortadepalmito" not in catalog.files()
+
+
+
+def test_prato_criado_depois_do_load(catalog, tmp_path, monkeypatch):
+    import ai.dish_catalog as dish_catalog
+
+    _write(tmp_path, "boloderolo", {"nome": "Bolo de Rolo", "categoria": "vegetariano"})
+    assert policy.get_dish_name("boloderolo") == "Bolo de Rolo"  # fora do snapshot: lido do disco
+    assert "boloderolo" in catalog.files()
+
+    assert policy.get_dish_name("semficha") == "Semficha"
+    _write(tmp_path, "semficha", {"nome": "Prato Novo", "categoria": "vegano"})
+    assert policy.get_dish_name("semficha") == "Semficha"  # dentro do intervalo: memo
+    monkeypatch.setattr(dish_catalog, "MISSING_RECHECK_S", 0.0)
+    assert policy.get_dish_name("semficha") == "Prato Novo"
+    assert policy.get_category("semficha") == "vegano"
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-batching do ONNX em ai/embedder.py.
+
+Cobre os casos:
+- chamadas concorrentes sao agrupadas num unico run (N,3,224,224)
+- cada chamador recebe a SUA linha do resultado
+- batch nunca excede max_batch_size
+- erro do run propaga para todos os chamadores do batch
+- modelo com batch fixo (dim 0 = 1) nao ativa o batcher
+- get_image_embeddings (lote do identify-batch): blocos ONNX, imagem corrompida -> None
+- concorrencia do identify so admite batch cheio com o batcher rodando
+
+Executar:
+    python3 -m pytest backend/tests/test_embedder_microbatch.py -v
+"""
+
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np  # noqa: E402
+
+from ai.embedder import _MicroBatcher, _onnx_supports_batching  # noqa: E402
+
+
+class _FakeInput:
+    def __init__(self, shape):
+        self.shape = shape
+
+
+class _FakeSession:
+    """Simula o InferenceSession: embedding = media dos pixels repetida em 4 dims."""
+
+    def __init__(self, batch_dim="batch", fail=False):
+        self.batch_dim = batch_dim
+        self.fail = fail
+        self.batch_sizes = []
+        self.lock = threading.Lock()
+
+    def get_inputs(self):
+        return [_FakeInput([self.batch_dim, 3, 224, 224])]
+
+    def run(self, _outputs, feeds):
+        arr = feeds['image']
+        with self.lock:
+            self.batch_sizes.append(arr.shape[0])
+        if self.fail:
+            raise RuntimeError("onnx boom")
+        means = arr.reshape(arr.shape[0], -1).mean(axis=1)
+        return [np.repeat(means[:, None], 4, axis=1)]
+
+
+def _tensor(value):
+    return np.full((1, 3, 224, 224), value, dtype=np.float32)
+
+
+def _submit_concurrently(batcher, values):
+    results = {}
+    errors = {}
+    barrier = threading.Barrier(len(values))
+
+    def worker(v):
+        barrier.wait()
+        try:
+            results[v] = batcher.submit(_tensor(v))
+        except Exception as e:
+            errors[v] = e
+
+    threads = [threading.Thread(target=worker, args=(v,)) for v in values]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=5)
+    return results, errors
+
+
+def test_chamadas_concorrentes_sao_agrupadas():
+    session = _FakeSession()
+    batcher = _MicroBatcher(session, max_batch_size=4, max_wait_ms=200)
+    results, errors = _submit_concurrently(batcher, [1.0, 2.0, 3.0, 4.0])
+    assert not errors
+    assert sum(session.batch_sizes) == 4
+    assert max(session.batch_sizes) > 1
+
+
+def test_cada_chamador_recebe_sua_linha():
+    session = _FakeSession()
+    batcher = _MicroBatcher(session, max_batch_size=4, max_wait_ms=50)
+    results, _ = _submit_concurrently(batcher, [1.0, 2.0, 3.0])
+    for v, emb in results.items():
+        assert emb.shape == (4,)
+        assert np.allclose(emb, v)
+
+
+def test_batch_respeita_max_batch_size():
+    session = _FakeSession()
+    batcher = _MicroBatcher(session, max_batch_size=2, max_wait_ms=200)
+    results, _ = _submit_concurrently(batcher, [float(i) for i in range(5)])
+    assert len(results) == 5
+    assert max(session.batch_sizes) <= 2
+
+
+def test_erro_propaga_para_todos():
+    session = _FakeSession(fail=True)
+    batcher = _MicroBatcher(session, max_batch_size=4, max_wait_ms=50)
+    results, errors = _submit_concurrently(batcher, [1.0, 2.0])
+    assert not results
+    assert len(errors) == 2
+    assert all(isinstance(e, RuntimeError) for e in errors.values())
+
+
+def test_modelo_batch_fixo_nao_suporta_batching():
+    assert _onnx_supports_batching(_FakeSession(batch_dim="batch")) is True
+    assert _onnx_supports_batching(_FakeSession(batch_dim=1)) is False
+
+
+def test_get_image_embeddings_em_blocos(monkeypatch):
+    import io
+    from PIL import Image
+    import ai.embedder as embedder
+
+    def jpeg(color):
+        buf = io.BytesIO()
+        Image.new("RGB", (320, 240), color).save(buf, format="JPEG")
+        return buf.getvalue()
+
+    session = _FakeSession()
+    monkeypatch.setattr(embedder, "_USE_ONNX", True)
+    monkeypatch.setattr(embedder, "_ONNX_SESSION", session)
+    images = [jpeg((200, 10, 10)), b"nao e imagem", jpeg((10, 200, 10)), jpeg((10, 10, 200))]
+    out = embedder.get_image_embeddings(images, chunk_size=2)
+    assert session.batch_sizes == [1, 2]
+    assert out[1] is None
+    for image, emb in zip(images, out):
+        if emb is not None:
+            expected = embedder.embed_preprocessed_batch(session, embedder.preprocess_image_bytes(image))[0]
+            assert np.allclose(emb, expected)
+
+
+def test_concorrencia_so_com_batcher_rodando(monkeypatch):
+    import ai.embedder as embedder
+
+    monkeypatch.setattr(embedder, "MICRO_BATCH_ENABLED", True)
+    monkeypatch.setattr(embedder, "BATCH_MAX_SIZE", 8)
+    monkeypatch.setattr(embedder, "_BATCHER", None)
+    # habilitado mas modelo de batch fixo: o batcher nao sobe
+    monkeypatch.setattr(embedder, "_ONNX_SESSION", _FakeSession(batch_dim=1))
+    assert embedder._start_micro_batcher() is False
+    assert embedder.get_identify_concurrency() == 2
+
+    monkeypatch.setattr(embedder, "_BATCHER", object())
+    assert embedder.get_identify_concurrency() == 8
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Cache persistente de embeddings (ai/embedding_cache.py) + build_index.
+
+Cobre os casos:
+- round-trip float32 e persistencia entre instancias (outro processo/rebuild)
+- versao do modelo/preprocessing diferente nao reaproveita embedding
+- rebuild apos renomear pasta so consulta o cache (0 chamadas ao modelo)
+- aumentar max_per_dish so embeda as imagens novas; stats com hits/misses
+- SOULNUTRI_EMBED_CACHE=0 desliga sem quebrar o build
+
+Executar:
+    python3 -m pytest backend/tests/test_embedding_cache.py -v
+"""
+
+import sys
+import hashlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np  # noqa: E402
+import pytest  # noqa: E402
+
+import ai.embedding_cache as cache_module  # noqa: E402
+import ai.index as index_module  # noqa: E402
+from ai.embedding_cache import EmbeddingCache, content_hash  # noqa: E402
+
+
+@pytest.fixture
+def model_calls(monkeypatch):
+    calls = []
+
+    def fake_embedding(data: bytes) -> np.ndarray:
+        calls.append(data)
+        seed = int(hashlib.md5(data).hexdigest()[:8], 16)
+        v = np.random.default_rng(seed).normal(size=512).astype(np.float32)
+        return v / np.linalg.norm(v)
+
+    monkeypatch.setattr(index_module, "image_embedding_from_bytes", fake_embedding)
+    return calls
+
+
+def _dataset(tmp_path, per_dish=4):
+    organized = tmp_path / "organized"
+    for dish in ("arroz", "feijao"):
+        (organized / dish).mkdir(parents=True)
+        for i in range(per_dish):
+            (organized / dish / f"{dish}_{i}.jpg").write_bytes(f"{dish}-{i}".encode())
+    return organized
+
+
+def _index(tmp_path, organized):
+    return index_module.DishIndex(data_dir=str(organized), index_file=str(tmp_path / "dish_index.json"))
+
+
+def test_round_trip_e_persistencia(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    emb = np.linspace(-1, 1, 512, dtype=np.float32)
+    cache = EmbeddingCache(path, "onnx:a/pp1")
+    assert cache.get(content_hash(b"img")) is None
+    cache.put(content_hash(b"img"), emb)
+    cache.close()
+
+    again = EmbeddingCache(path, "onnx:a/pp1")
+    loaded = again.get(content_hash(b"img"))
+    assert loaded.dtype == np.float32
+    assert np.array_equal(loaded, emb)
+    assert again.stats()["entries"] == 1
+
+
+def test_versao_diferente_nao_reaproveita(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    EmbeddingCache(path, "onnx:a/pp1").put(content_hash(b"img"), np.ones(512, dtype=np.float32))
+    other = EmbeddingCache(path, "onnx:a/pp2")
+    assert other.get(content_hash(b"img")) is None
+    assert other.stats()["misses"] == 1
+
+
+def test_rebuild_apos_renomear_pasta_usa_cache(tmp_path, model_calls):
+    organized = _dataset(tmp_path)
+    stats = _index(tmp_path, organized).build_index()
+    assert len(model_calls) == 8
+    assert stats["embedding_cache"]["misses"] == 8
+
+    (organized / "feijao").rename(organized / "feijao_preto")
+    model_calls.clear()
+    stats = _index(tmp_path, organized).build_index()
+    assert model_calls == []
+    assert stats["embedding_cache"] == {"enabled": True, "hits": 8, "misses": 0, "hit_rate": 1.0}
+    assert stats["total_dishes"] == 2
+
+
+def test_max_per_dish_maior_so_embeda_novas(tmp_path, model_calls):
+    organized = _dataset(tmp_path, per_dish=6)
+    idx = _index(tmp_path, organized)
+    idx.build_index(max_per_dish=3)
+    model_calls.clear()
+    stats = idx.build_index(max_per_dish=6)
+    assert len(model_calls) == 6
+    assert stats["embedding_cache"]["hits"] == 6
+    assert stats["embedding_cache"]["misses"] == 6
+
+
+def test_cache_desligado(tmp_path, model_calls, monkeypatch):
+    monkeypatch.setattr(cache_module, "EMBED_CACHE_ENABLED", False)
+    organized = _dataset(tmp_path)
+    _index(tmp_path, organized).build_index()
+    stats = _index(tmp_path, organized).build_index()
+    assert len(model_calls) == 16
+    assert stats["embedding_cache"]["enabled"] is False
+    assert not (tmp_path / "dish_index_embcache.sqlite").exists()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Preprocessing rapido do CLIP (ai/embedder.py: _decode_image_reduced + _fast_preprocess).
+
+Cobre os casos:
+- paridade com o caminho PIL (_enhance_and_preprocess) em fotos de 224px a 12MP:
+  cosseno do tensor de entrada >= 0.999 (tolerancia declarada)
+- com o modelo ONNX disponivel: cosseno do embedding >= 0.995 (senao: skip)
+- JPEG decodificado reduzido (draft) com menor lado >= DRAFT_MIN_SIDE
+- buffers por thread: resultados identicos em paralelo, saida nao reaproveitada
+
+Executar:
+    python3 -m pytest backend/tests/test_fast_preprocess.py -v
+"""
+
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np  # noqa: E402
+import pytest  # noqa: E402
+from PIL import Image, ImageDraw  # noqa: E402
+
+from ai import embedder  # noqa: E402
+
+TENSOR_COSINE_MIN = 0.999
+EMBEDDING_COSINE_MIN = 0.995
+
+
+def _photo(seed: int, w: int, h: int, fmt: str = "JPEG") -> bytes:
+    """Foto sintetica: fundo de baixa frequencia + textura + ruido + 'alimentos' (elipses)."""
+    rng = np.random.default_rng(seed)
+    base = Image.fromarray((rng.random((6, 8, 3)) * 255).astype(np.uint8)).resize((w, h), Image.BICUBIC)
+    tex = Image.fromarray((rng.random((max(1, h // 8), max(1, w // 8), 3)) * 255).astype(np.uint8))
+    tex = tex.resize((w, h), Image.BILINEAR)
+    arr = np.asarray(base, np.float32) * 0.7 + np.asarray(tex, np.float32) * 0.3 + rng.normal(0, 6, (h, w, 3))
+    img = Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8))
+    draw = ImageDraw.Draw(img)
+    for _ in range(25):
+        x, y = rng.integers(0, w), rng.integers(0, h)
+        r = int(rng.integers(max(2, w // 60), max(3, w // 6)))
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=tuple(int(c) for c in rng.integers(0, 255, 3)))
+    buf = io.BytesIO()
+    img.save(buf, format=fmt, quality=88)
+    return buf.getvalue()
+
+
+def _cos(a: np.ndarray, b: np.ndarray) -> float:
+    a, b = a.ravel().astype(np.float64), b.ravel().astype(np.float64)
+    return float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+def _pil_path(data: bytes) -> np.ndarray:
+    return embedder._enhance_and_preprocess(embedder._decode_image(data))
+
+
+def _fast_path(data: bytes) -> np.ndarray:
+    return embedder._fast_preprocess(*embedder._decode_image_reduced(data))
+
+
+@pytest.mark.parametrize("size", [(4000, 3000), (3000, 4000), (1600, 1200), (640, 480), (300, 260), (224, 224)])
+def test_paridade_tensor_com_caminho_pil(size):
+    data = _photo(sum(size), *size)
+    ref, fast = _pil_path(data), _fast_path(data)
+    assert fast.shape == ref.shape == (1, 3, 224, 224)
+    assert fast.dtype == np.float32
+    assert _cos(ref, fast) >= TENSOR_COSINE_MIN
+
+
+def test_png_sem_draft():
+    data = _photo(11, 800, 600, fmt="PNG")
+    assert _cos(_pil_path(data), _fast_path(data)) >= TENSOR_COSINE_MIN
+
+
+def test_jpeg_decodificado_reduzido():
+    img, orig_size = embedder._decode_image_reduced(_photo(3, 4000, 3000))
+    assert orig_size == (4000, 3000)
+    assert embedder.DRAFT_MIN_SIDE <= min(img.size) < 3000
+    assert img.mode == "RGB"
+
+
+def test_buffers_por_thread():
+    datas = [_photo(seed, 1200, 900) for seed in range(6)]
+    sequential = [_fast_path(d) for d in datas]
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        parallel = list(pool.map(_fast_path, datas * 3))
+    for i, out in enumerate(parallel):
+        np.testing.assert_array_equal(out, sequential[i % len(datas)])
+    # saida e um array novo por chamada (o micro-batcher guarda referencias)
+    assert not np.shares_memory(sequential[0], sequential[1])
+
+
+def test_paridade_embedding_onnx():
+    ort = pytest.importorskip("onnxruntime")
+    if not os.path.exists(embedder.ONNX_MODEL_PATH):
+        pytest.skip(f"modelo ONNX ausente: {embedder.ONNX_MODEL_PATH}")
+    session = ort.InferenceSession(embedder.ONNX_MODEL_PATH, providers=["CPUExecutionProvider"])
+    for seed, size in enumerate([(4000, 3000), (1600, 1200), (640, 480)]):
+        data = _photo(seed, *size)
+        ref = embedder.embed_preprocessed_batch(session, _pil_path(data))[0]
+        fast = embedder.embed_preprocessed_batch(session, _fast_path(data))[0]
+        assert _cos(ref, fast) >= EMBEDDING_COSINE_MIN
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
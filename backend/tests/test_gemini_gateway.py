@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Gateway assincrono do Gemini (services/gemini_gateway.py) com o provider fake.
+
+Cobre os casos:
+- chamadas concorrentes nao bloqueiam o event loop (heartbeat continua batendo)
+- limite de concorrencia respeitado; excedente espera na fila
+- deadline: resposta lenta e fila cheia viram GeminiTimeoutError e contam nas stats
+- erro do provider propaga e conta em errors
+- identify_dish_gemini_flash ponta a ponta com o fake (sem rede)
+
+Executar:
+    python3 -m pytest backend/tests/test_gemini_gateway.py -v
+"""
+
+import io
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest  # noqa: E402
+from PIL import Image  # noqa: E402
+
+import services.gemini_gateway as gateway_module  # noqa: E402
+from services.gemini_gateway import FakeGeminiProvider, GeminiGateway, GeminiTimeoutError  # noqa: E402
+
+
+class _CountingProvider(FakeGeminiProvider):
+    def __init__(self, latency_ms="50"):
+        super().__init__(latency_ms=latency_ms, seed=1)
+        self.active = 0
+        self.peak = 0
+
+    async def generate(self, model, contents):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            return await super().generate(model, contents)
+        finally:
+            self.active -= 1
+
+
+def test_event_loop_livre_e_limite_de_concorrencia():
+    provider = _CountingProvider(latency_ms="50")
+    gateway = GeminiGateway(provider, max_concurrency=3, timeout_s=5)
+
+    async def main():
+        ticks = 0
+        done = asyncio.Event()
+
+        async def heartbeat():
+            nonlocal ticks
+            while not done.is_set():
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        hb = asyncio.create_task(heartbeat())
+        start = time.perf_counter()
+        results = await asyncio.gather(*[gateway.generate("m", ["oi"]) for _ in range(9)])
+        elapsed = time.perf_counter() - start
+        done.set()
+        await hb
+        return results, ticks, elapsed
+
+    results, ticks, elapsed = asyncio.run(main())
+    assert results == ["OK"] * 9
+    assert provider.peak == 3
+    assert 0.14 < elapsed < 1.0  # 3 ondas de 50ms
+    assert ticks >= 10
+    stats = gateway.stats()
+    assert stats["calls"] == 9 and stats["in_flight"] == 0 and stats["waiting"] == 0
+
+
+def test_deadline_resposta_e_fila():
+    gateway = GeminiGateway(FakeGeminiProvider(latency_ms="300"), max_concurrency=1, timeout_s=0.1)
+
+    async def main():
+        return await asyncio.gather(
+            gateway.generate("m", ["oi"]),
+            gateway.generate("m", ["oi"], timeout_s=0.05),
+            return_exceptions=True,
+        )
+
+    first, second = asyncio.run(main())
+    assert isinstance(first, GeminiTimeoutError)
+    assert isinstance(second, GeminiTimeoutError)
+    stats = gateway.stats()
+    assert stats["timeouts"] == 1
+    assert stats["queue_timeouts"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_erro_do_provider_propaga():
+    gateway = GeminiGateway(FakeGeminiProvider(latency_ms="1", error_rate=1.0), max_concurrency=2, timeout_s=1)
+    with pytest.raises(RuntimeError, match="503"):
+        asyncio.run(gateway.generate("m", ["oi"]))
+    assert gateway.stats()["errors"] == 1
+
+
+def test_identify_ponta_a_ponta_com_fake(monkeypatch):
+    from services import gemini_flash_service
+
+    monkeypatch.setattr(gateway_module, "GEMINI_PROVIDER", "fake")
+    monkeypatch.setattr(gateway_module, "_GATEWAY", GeminiGateway(FakeGeminiProvider(latency_ms="5")))
+    monkeypatch.setattr(gateway_module, "_GATEWAY_KEY", "fake")
+    monkeypatch.delenv("EMERGENT_LLM_KEY", raising=False)
+
+    buf = io.BytesIO()
+    Image.new("RGB", (800, 600), (200, 120, 40)).save(buf, format="JPEG")
+    assert gemini_flash_service.is_gemini_flash_available()
+
+    result = asyncio.run(gemini_flash_service.identify_dish_gemini_flash(buf.getvalue()))
+    assert result["ok"] is True
+    assert result["nome"] == "Arroz com Feijão"
+    assert result["categoria"] == "vegetariano"
+    assert result["nutricao"]["calorias"] == "180 kcal"
+
+    enrich = asyncio.run(gemini_flash_service.enrich_dish_gemini("Arroz com Feijão", ["arroz", "feijão"]))
+    assert enrich["curiosidade"]
+    assert gemini_flash_service.get_gemini_flash_status()["gateway"]["calls"] == 2
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Indice de hash perceptual (ai/hash_index.py).
+
+Cobre os casos:
+- recompressao JPEG, redimensionamento, pequeno corte e rotacao EXIF: mesmo prato, distancia baixa
+- fotos diferentes nao casam
+- BK-tree devolve o mesmo que a busca por forca bruta
+- persistencia v2 (hex) e formato antigo (SHA de thumbnail) pede rebuild
+- grupos de quase-duplicatas entre pratos do dataset
+- add/remove/rename incrementais (foto movida deixa de casar com o prato antigo)
+- arquivo regravado por outro processo e recarregado; match de arquivo movido nao e atual
+- fast path so aceita o slug exato do DishIndex (sem match parcial)
+- dois processos atualizando o mesmo arquivo ao mesmo tempo: nenhuma atualizacao perdida
+
+Executar:
+    python3 -m pytest backend/tests/test_hash_index.py -v
+"""
+
+import io
+import sys
+import json
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np  # noqa: E402
+import pytest  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from ai.hash_index import BKTree, ImageHashIndex, compute_hashes, hamming  # noqa: E402
+
+
+def _photo(seed: int, size=(320, 240)) -> Image.Image:
+    """Imagem 'fotografica' suave: ruido de baixa frequencia ampliado."""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 255, size=(6, 8, 3), dtype=np.uint8)
+    return Image.fromarray(small).resize(size, Image.BICUBIC)
+
+
+def _jpeg(img: Image.Image, quality=90, exif=None) -> bytes:
+    buf = io.BytesIO()
+    kwargs = {"exif": exif} if exif is not None else {}
+    img.save(buf, format="JPEG", quality=quality, **kwargs)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def index(tmp_path):
+    organized = tmp_path / "organized"
+    for d, dish in enumerate(("arroz", "feijao", "pudim")):
+        (organized / dish).mkdir(parents=True)
+        (organized / dish / "dish_info.json").write_text(json.dumps({"nome": dish.title()}))
+        for i in range(3):
+            _photo(10 * d + i).save(organized / dish / f"{dish}_{i}.jpg", quality=95)
+    idx = ImageHashIndex(index_file=str(tmp_path / "image_hash_index.json"))
+    idx.build(str(organized))
+    return idx
+
+
+def test_variantes_da_mesma_foto_casam(index):
+    original = _photo(11)  # feijao_1.jpg
+    variants = [
+        _jpeg(original, quality=40),
+        _jpeg(original.resize((160, 120), Image.LANCZOS)),
+        _jpeg(original.crop((6, 5, 314, 235))),
+    ]
+    # Rotacao EXIF: pixels gravados girados + orientacao 6 (exibir girado 90 graus horario)
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    variants.append(_jpeg(original.transpose(Image.ROTATE_90), exif=exif))
+
+    for data in variants:
+        match = index.lookup(data)
+        assert match is not None
+        assert match["slug"] == "feijao"
+        assert match["display_name"] == "Feijao"
+        assert match["file"] == "feijao_1.jpg"
+        assert match["distance"] <= 16
+        assert match["dhash_distance"] <= 6
+
+
+def test_fotos_diferentes_nao_casam(index):
+    for seed in (100, 101, 102, 103):
+        assert index.lookup(_jpeg(_photo(seed))) is None
+    assert index.lookup(b"nao e uma imagem") is None
+
+
+def test_bktree_igual_forca_bruta():
+    rng = np.random.default_rng(3)
+    base = [int(x) for x in rng.integers(0, 2**63, size=50, dtype=np.int64)]
+    # vizinhos proximos de alguns codigos: 1 a 4 bits trocados
+    codes = base + [c ^ (1 << int(b)) ^ (1 << int(b2)) for c, b, b2 in zip(base[:20], rng.integers(0, 64, 20), rng.integers(0, 64, 20))]
+    tree = BKTree()
+    for i, c in enumerate(codes):
+        tree.add(c, i)
+    assert tree.size == len(codes)
+    for q in codes[:30]:
+        for radius in (0, 3, 10):
+            expected = sorted((hamming(q, c), i) for i, c in enumerate(codes) if hamming(q, c) <= radius)
+            assert tree.search(q, radius) == expected
+
+
+def test_persistencia_e_formato_antigo(index, tmp_path):
+    again = ImageHashIndex(index_file=str(index.index_file))
+    assert again.load()
+    assert again.total_hashes == index.total_hashes == 9
+    assert again.entries == index.entries
+    assert again.lookup(_jpeg(_photo(20)))["slug"] == "pudim"
+
+    legacy = tmp_path / "legacy.json"
+    legacy.write_text(json.dumps({"abc123": "Arroz"}))
+    assert not ImageHashIndex(index_file=str(legacy)).load()
+
+
+def test_grupos_de_quase_duplicatas(index, tmp_path):
+    # mesma foto gravada em outro prato (recomprimida) + uma identica
+    organized = tmp_path / "organized"
+    (organized / "pudim" / "copia.jpg").write_bytes(_jpeg(_photo(1), quality=60))
+    (organized / "arroz" / "arroz_1_dup.jpg").write_bytes((organized / "arroz" / "arroz_1.jpg").read_bytes())
+    index.build(str(organized))
+
+    groups = index.find_near_duplicates()
+    as_sets = sorted(sorted((e["slug"], e["file"]) for e in g) for g in groups)
+    assert as_sets == [[("arroz", "arroz_1.jpg"), ("arroz", "arroz_1_dup.jpg"), ("pudim", "copia.jpg")]]
+
+
+def test_incremental_foto_movida(index, tmp_path):
+    organized = tmp_path / "organized"
+    data = (organized / "feijao" / "feijao_1.jpg").read_bytes()
+    assert index.lookup(data)["slug"] == "feijao"
+
+    # move-image: remove do prato origem e adiciona no destino (mesmo arquivo)
+    assert index.remove_image("feijao", "feijao_1.jpg") == 1
+    assert index.add_image("pudim", "feijao_1.jpg", data) == 1
+    match = index.lookup(data)
+    assert (match["slug"], match["display_name"], match["file"]) == ("pudim", "Pudim", "feijao_1.jpg")
+    assert index.total_hashes == 9
+    assert index.remove_image("feijao", "feijao_1.jpg") == 0
+
+    # consolidacao: pratos do grupo passam para o principal
+    assert index.rename_dish("arroz", "pudim") == 3
+    assert index.lookup(_jpeg(_photo(1)))["slug"] == "pudim"
+
+    # persistido: outro processo carrega o estado atualizado
+    again = ImageHashIndex(index_file=str(index.index_file))
+    assert again.load() and again.entries == index.entries
+
+
+def test_refresh_apos_rebuild_em_outro_processo(index, tmp_path):
+    organized = tmp_path / "organized"
+    other = ImageHashIndex(index_file=str(index.index_file))
+    (organized / "feijao" / "feijao_1.jpg").rename(organized / "pudim" / "feijao_1.jpg")
+    other.build(str(organized))  # rebuild_index.py regrava o arquivo
+
+    data = (organized / "pudim" / "feijao_1.jpg").read_bytes()
+    assert index.lookup(data)["slug"] == "pudim"  # lookup recarrega o arquivo novo
+    assert not index.refresh()  # sem mudanca: nao recarrega de novo
+
+
+def test_escritas_concorrentes_nao_se_sobrescrevem(index):
+    import threading
+
+    # Duas instancias = dois workers com o mesmo arquivo (flock por descritor)
+    workers = [index, ImageHashIndex(index_file=str(index.index_file))]
+    assert workers[1].load()
+    photos = {w: [_jpeg(_photo(100 + 10 * w + i)) for i in range(6)] for w in range(2)}
+
+    def run(w):
+        for i, data in enumerate(photos[w]):
+            workers[w].add_image("pudim", f"novo_{w}_{i}.jpg", data)
+
+    threads = [threading.Thread(target=run, args=(w,)) for w in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    final = ImageHashIndex(index_file=str(index.index_file))
+    assert final.load() and final.total_hashes == 9 + 12
+    assert not list(index.index_file.parent.glob("*.tmp*"))  # escrita atomica sem sobras
+
+
+def test_match_de_arquivo_movido_nao_e_atual(index, tmp_path):
+    organized = tmp_path / "organized"
+    data = (organized / "arroz" / "arroz_2.jpg").read_bytes()
+    match = index.lookup(data)
+    assert index.is_current(match)
+    (organized / "arroz" / "arroz_2.jpg").unlink()  # movido por outro worker/script
+    assert not index.is_current(index.lookup(data))
+
+
+def test_fast_path_so_com_slug_exato(tmp_path):
+    from ai.index import DishIndex
+
+    dish_index = DishIndex(data_dir=str(tmp_path), index_file=str(tmp_path / "nao_existe.json"))
+    dish_index.dish_to_idx = {"arrozbranco": [0], "Arroz": [1]}
+    assert dish_index.direct_match("arrozbranco", exact=True)[0]["dish"] == "arrozbranco"
+    assert dish_index.direct_match("arroz", exact=True) == []  # find_dish acharia "Arroz"
+    assert dish_index.direct_match("arrozbranco2", exact=True) == []
+    assert dish_index.direct_match("arroz")[0]["dish"] == "Arroz"
+
+
+def test_hashes_estaveis():
+    data = _jpeg(_photo(7))
+    assert compute_hashes(data) == compute_hashes(data)
+    assert compute_hashes(b"") is None
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Identificacao em lote (/api/ai/identify-batch): services/batch_identify_service.py
+e DishIndex.search_batch.
+
+Cobre os casos:
+- ZIP expandido (pastas, __MACOSX, nao-imagens e arquivos grandes ignorados) + limite por lote
+- prato esperado a partir de pasta, prefixo "__" ou sufixo numerico
+- matriz de confusao: acuracia top-1, aceitos certos/errados, confusoes mais frequentes
+- search_batch devolve o mesmo ranking que search() imagem a imagem
+
+Executar:
+    python3 -m pytest backend/tests/test_identify_batch.py -v
+"""
+
+import io
+import sys
+import zipfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np  # noqa: E402
+import pytest  # noqa: E402
+
+import ai.index as index_module  # noqa: E402
+from ai.ann import ExactSearch  # noqa: E402
+from services.batch_identify_service import (  # noqa: E402
+    NOT_IDENTIFIED, ConfusionMatrix, expand_uploads, expected_dish_from_name,
+)
+
+
+def _zip(entries):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, data in entries:
+            zf.writestr(name, data)
+    return buf.getvalue()
+
+
+def test_expande_zip_e_arquivos_soltos():
+    data = _zip([
+        ("Arroz Integral/001.jpg", b"a" * 10),
+        ("Arroz Integral/", b""),
+        ("__MACOSX/Arroz Integral/._001.jpg", b"x"),
+        ("Feijao/notas.txt", b"x"),
+        ("Feijao/grande.png", b"g" * 100),
+        ("Feijao/.oculto.jpg", b"x"),
+    ])
+    images = expand_uploads([("lote.zip", data), ("salada__1.webp", b"s"), ("leia.md", b"x")], max_bytes=50)
+    assert [n for n, _ in images] == ["Arroz Integral/001.jpg", "salada__1.webp"]
+    # ZIP sem extensao .zip tambem e reconhecido
+    assert [n for n, _ in expand_uploads([("upload", data)], max_bytes=50)] == ["Arroz Integral/001.jpg"]
+    with pytest.raises(ValueError):
+        expand_uploads([(f"p{i}.jpg", b"x") for i in range(4)], max_images=3)
+
+
+@pytest.mark.parametrize("name,expected", [
+    ("Arroz Integral/001.jpg", "Arroz Integral"),
+    ("lote/Feijão Tropeiro/a.jpg", "Feijão Tropeiro"),
+    ("arroz_integral__03.jpg", "arroz_integral"),
+    ("feijao-tropeiro-2.jpg", "feijao-tropeiro"),
+    ("Salada Verde (3).png", "Salada Verde"),
+    ("pudim.jpg", "pudim"),
+    ("12345.jpg", None),
+])
+def test_prato_esperado_pelo_nome(name, expected):
+    assert expected_dish_from_name(name) == expected
+
+
+def test_matriz_de_confusao():
+    m = ConfusionMatrix()
+    m.add("Arroz Integral", "arroz_integral", True)
+    m.add("arroz-integral", "Arroz Branco", True)
+    m.add("Arroz Integral", "arroz_integral", False)
+    m.add("Feijão", None, False)
+    m.add(None, "arroz_integral", True)
+    s = m.summary()
+    assert s["total"] == 4 and s["without_expected"] == 1
+    assert s["top1_accuracy"] == 0.5
+    assert (s["accepted_correct"], s["accepted_wrong"], s["rejected"]) == (1, 1, 2)
+    assert s["precision_accepted"] == 0.5
+    assert s["per_dish"]["arroz_integral"] == {"total": 3, "top1_correct": 2, "accuracy": 0.6667}
+    assert s["matrix"]["feijao"] == {NOT_IDENTIFIED: 1}
+    assert s["top_confusions"][0] == {"expected": "arroz_integral", "predicted": "arroz_branco", "count": 1}
+
+
+def test_search_batch_igual_a_search(tmp_path, monkeypatch):
+    rng = np.random.default_rng(5)
+    dishes = [f"Prato {d}" for d in range(12) for _ in range(4)]
+    emb = rng.normal(size=(len(dishes), 16))
+    emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+    idx = index_module.DishIndex(data_dir=str(tmp_path), index_file=str(tmp_path / "nao_existe.json"))
+    idx.dishes = dishes
+    idx.embeddings = emb.astype(np.float32)
+    idx.dish_to_idx = {}
+    for i, d in enumerate(dishes):
+        idx.dish_to_idx.setdefault(d, []).append(i)
+    idx._search_backend = ExactSearch(idx.embeddings)
+    idx._build_row_maps()
+
+    queries = {}
+    for i in range(6):
+        q = emb[i * 7] + rng.normal(scale=0.3, size=16)
+        queries[f"img{i}".encode()] = (q / np.linalg.norm(q)).astype(np.float32)
+    queries[b"corrompida"] = None
+    monkeypatch.setattr(index_module, "image_embedding_from_bytes", lambda b: queries[b])
+    monkeypatch.setattr(index_module, "get_image_embeddings", lambda images: [queries[b] for b in images])
+
+    batch = idx.search_batch(list(queries), top_k=5)
+    assert len(batch) == len(queries)
+    for image, results in zip(queries, batch):
+        single = idx.search(image, top_k=5)
+        strip = lambda rs: [{k: v for k, v in r.items() if k != "search_time_ms"} for r in rs]  # noqa: E731
+        assert strip(results) == strip(single)
+    assert "error" in batch[-1][0]
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
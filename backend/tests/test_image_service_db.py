@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Acesso ao MongoDB do services/image_service.py.
+
+Cobre os casos:
+- um MongoClient por processo (pool), nao um por chamada
+- documentos antigos ganham slug_norm (indexado) e o match normalizado usa o indice
+- cache slug -> imagens por processo, invalidado por save/delete
+- _resolve_canonical_slug via slug_norm
+- documento gravado sem slug_norm depois do backfill (script de migracao) ainda e achado
+
+Executar:
+    python3 -m pytest backend/tests/test_image_service_db.py -v
+"""
+
+import sys
+import types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest  # noqa: E402
+
+import services.image_service as image_service  # noqa: E402
+
+mongomock = pytest.importorskip("mongomock")
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(image_service, "_CLIENT", client)
+    monkeypatch.setattr(image_service, "_SLUG_NORM_READY", False)
+    monkeypatch.setattr(image_service, "_SLUG_NORM_TRIED_AT", None)
+    monkeypatch.setattr(image_service, "LOCAL_DATASET_DIR", tmp_path / "organized")
+    monkeypatch.setattr("services.thumbnail_service.THUMB_DIR", tmp_path / "thumbs")
+    monkeypatch.setenv("DB_NAME", "soulnutri_test")
+    monkeypatch.setitem(sys.modules, "services.r2_service",
+                        types.SimpleNamespace(r2_upload_image=lambda *a, **k: None))
+    image_service.invalidate_dish_images()
+    (tmp_path / "organized").mkdir()
+    database = client["soulnutri_test"]
+    database.dish_storage.insert_many([
+        {"slug": "arroz-integral", "images": [{"filename": "a1.jpg", "storage_path": "r2:dishes/arroz-integral/a1.jpg"}]},
+        {"slug": "Feijão_Tropeiro", "images": [{"filename": "f1.jpg"}, {"filename": "f2.jpg"}]},
+    ])
+    yield database
+    image_service.invalidate_dish_images()
+
+
+def test_cliente_unico_por_processo(monkeypatch):
+    monkeypatch.setattr(image_service, "_CLIENT", None)
+    monkeypatch.setattr(image_service, "_SLUG_NORM_READY", True)
+    monkeypatch.setenv("MONGO_URL", "mongodb://localhost:1")
+    first = image_service._get_db()
+    assert image_service._get_db().client is first.client
+    first.client.close()
+
+
+def test_slug_norm_preenchido_e_indexado(db):
+    assert image_service.get_dish_images_from_db("Arroz Integral")[0]["filename"] == "a1.jpg"
+    assert [i["filename"] for i in image_service.get_dish_images_from_db("feijao tropeiro")] == ["f1.jpg", "f2.jpg"]
+    assert all(d.get("slug_norm") for d in db.dish_storage.find())
+    assert "slug_norm_1" in db.dish_storage.index_information()
+    assert image_service.get_dish_images_from_db("nao-existe") == []
+
+
+def test_cache_invalidado_por_escrita(db):
+    assert len(image_service.get_dish_images_from_db("arroz-integral")) == 1
+    # escrita externa: cache segue valido ate o TTL
+    db.dish_storage.update_one({"slug": "arroz-integral"}, {"$push": {"images": {"filename": "x.jpg"}}})
+    assert len(image_service.get_dish_images_from_db("arroz-integral")) == 1
+
+    # escrita pelo servico: invalida todas as grafias do prato
+    assert len(image_service.get_dish_images_from_db("Arroz Integral")) == 2  # grafia nova: busca no db
+    image_service.save_dish_image("arroz_integral", "a3.jpg", b"jpeg")
+    assert len(image_service.get_dish_images_from_db("arroz-integral")) == 3
+    assert len(image_service.get_dish_images_from_db("Arroz Integral")) == 3
+
+    image_service.delete_dish_image_from_storage("arroz-integral", "x.jpg")
+    assert [i["filename"] for i in image_service.get_dish_images_from_db("arroz-integral")] == ["a1.jpg", "a3.jpg"]
+
+
+def test_slug_canonico_pelo_indice(db):
+    assert image_service._resolve_canonical_slug("ARROZ_INTEGRAL") == "arroz-integral"
+    image_service.save_dish_image("Feijao Tropeiro", "f3.jpg", b"jpeg")
+    doc = db.dish_storage.find_one({"slug": "Feijão_Tropeiro"})
+    assert [i["filename"] for i in doc["images"]][-1] == "f3.jpg"
+    assert doc["slug_norm"] == "feijaotropeiro"
+    assert db.dish_storage.count_documents({}) == 2  # nenhum documento duplicado
+
+
+
+def test_documento_sem_slug_norm_depois_do_backfill(db):
+    assert image_service._resolve_canonical_slug("arroz integral") == "arroz-integral"  # backfill feito
+    # script antigo (migrate_r2 / rebuild_mongo_clean) grava sem slug_norm
+    db.dish_storage.insert_one({"slug": "Bolo_de_Cenoura", "images": [{"filename": "b1.jpg"}]})
+    assert [i["filename"] for i in image_service.get_dish_images_from_db("bolo de cenoura")] == ["b1.jpg"]
+    assert db.dish_storage.find_one({"slug": "Bolo_de_Cenoura"})["slug_norm"] == "bolodecenoura"
+
+    db.dish_storage.insert_one({"slug": "Pudim-de-Leite", "images": [{"filename": "p1.jpg"}]})
+    image_service.save_dish_image("pudim de leite", "p2.jpg", b"jpeg")
+    doc = db.dish_storage.find_one({"slug": "Pudim-de-Leite"})
+    assert [i["filename"] for i in doc["images"]] == ["p1.jpg", "p2.jpg"]
+    assert db.dish_storage.count_documents({}) == 4  # nenhum slug duplicado
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
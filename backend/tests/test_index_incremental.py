@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Atualizacao incremental do DishIndex (add_images / remove_image / rename_dish).
+
+Cobre os casos:
+- add_images em prato existente e novo, sem rebuild; dish_to_idx consistente
+- remove_image por nome de arquivo; arquivo desconhecido nao remove nada
+- rename_dish mescla no prato destino (slug ou nome de exibicao)
+- delta log reaplicado por uma nova instancia (restart / outro worker)
+- outro worker enxerga as operacoes na proxima busca
+- compactacao incorpora o log ao .bin (volta a memmap) e zera o log
+- build_index registra o arquivo de cada linha
+- IVF rebase: novas linhas entram nas listas sem re-treinar
+
+Executar:
+    python3 -m pytest backend/tests/test_index_incremental.py -v
+"""
+
+import sys
+import hashlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np  # noqa: E402
+import pytest  # noqa: E402
+
+import ai.index as index_module  # noqa: E402
+from ai.ann import IVFSearch  # noqa: E402
+
+
+def _fake_embedding(data: bytes) -> np.ndarray:
+    seed = int(hashlib.md5(data).hexdigest()[:8], 16)
+    v = np.random.default_rng(seed).normal(size=512).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+
+@pytest.fixture
+def fake_embedder(monkeypatch):
+    monkeypatch.setattr(index_module, "image_embedding_from_bytes", _fake_embedding)
+
+
+def _built_index(tmp_path):
+    organized = tmp_path / "organized"
+    for dish in ("arroz_branco", "feijao_preto", "pudim"):
+        (organized / dish).mkdir(parents=True)
+        for i in range(3):
+            (organized / dish / f"{dish}_{i}.jpg").write_bytes(f"{dish}-{i}".encode())
+    idx = index_module.DishIndex(data_dir=str(organized), index_file=str(tmp_path / "dish_index.json"))
+    idx.build_index()
+    return idx
+
+
+def _reopen(idx):
+    return index_module.DishIndex(data_dir=idx.data_dir, index_file=idx.index_file)
+
+
+def _assert_consistent(idx):
+    assert len(idx.dishes) == len(idx.files) == len(idx.embeddings)
+    for dish, rows in idx.dish_to_idx.items():
+        assert all(idx.dishes[i] == dish for i in rows)
+    assert sum(len(r) for r in idx.dish_to_idx.values()) == len(idx.dishes)
+
+
+def _top1(idx, data: bytes) -> str:
+    return idx.search(data, top_k=3)[0]["dish"]
+
+
+def test_build_registra_arquivos(tmp_path, fake_embedder):
+    idx = _built_index(tmp_path)
+    assert idx.files[idx.dish_to_idx["pudim"][0]] == "pudim_0.jpg"
+    assert idx.get_stats()["storage"] == "mmap"
+
+
+def test_add_em_prato_existente_e_novo(tmp_path, fake_embedder):
+    idx = _built_index(tmp_path)
+    assert idx.add_images("pudim", [b"pudim-novo"], filenames=["pudim_novo.jpg"]) == 1
+    assert idx.add_images("bolo_de_cenoura", [b"bolo-1", b"bolo-2"], filenames=["b1.jpg", "b2.jpg"]) == 2
+    _assert_consistent(idx)
+    assert len(idx.dish_to_idx["pudim"]) == 4
+    assert idx.metadata["bolo_de_cenoura"]["image_count"] == 2
+    assert _top1(idx, b"bolo-2") == "bolo_de_cenoura"
+    assert _top1(idx, b"pudim-novo") == "pudim"
+    assert Path(idx._delta_file()).exists()
+
+
+def test_remove_image(tmp_path, fake_embedder):
+    idx = _built_index(tmp_path)
+    assert idx.remove_image("pudim", "pudim_1.jpg") == 1
+    assert idx.remove_image("pudim", "nao_existe.jpg") == 0
+    _assert_consistent(idx)
+    assert [idx.files[i] for i in idx.dish_to_idx["pudim"]] == ["pudim_0.jpg", "pudim_2.jpg"]
+    assert idx.metadata["pudim"]["image_count"] == 2
+    for i in range(3):
+        idx.remove_image("arroz_branco", f"arroz_branco_{i}.jpg")
+    assert "arroz_branco" not in idx.dish_to_idx
+    assert _top1(idx, b"pudim-1") != "arroz_branco"
+
+
+def test_rename_mescla_pratos(tmp_path, fake_embedder):
+    idx = _built_index(tmp_path)
+    assert idx.rename_dish("feijao_preto", "Pudim") == 3  # nome de exibicao resolve para o slug
+    _assert_consistent(idx)
+    assert "feijao_preto" not in idx.dish_to_idx
+    assert len(idx.dish_to_idx["pudim"]) == 6
+    assert idx.metadata["pudim"]["image_count"] == 6
+    assert _top1(idx, b"feijao_preto-0") == "pudim"
+
+
+def test_delta_reaplicado_em_nova_instancia(tmp_path, fake_embedder):
+    idx = _built_index(tmp_path)
+    idx.add_images("pudim", [b"pudim-novo"], filenames=["pudim_novo.jpg"])
+    idx.remove_image("arroz_branco", "arroz_branco_0.jpg")
+    idx.rename_dish("feijao_preto", "feijao")
+    again = _reopen(idx)
+    assert again.dishes == idx.dishes
+    assert again.files == idx.files
+    assert again.dish_to_idx == idx.dish_to_idx
+    assert np.allclose(np.asarray(again.embeddings), np.asarray(idx.embeddings))
+    assert again.get_stats()["delta_pending"] == 3
+
+
+def test_outro_worker_ve_operacoes_na_busca(tmp_path, fake_embedder):
+    worker_a = _built_index(tmp_path)
+    worker_b = _reopen(worker_a)
+    worker_a.add_images("bolo", [b"bolo-1"], filenames=["b1.jpg"])
+    assert _top1(worker_b, b"bolo-1") == "bolo"
+
+    # Compactacao no worker A troca o log; B recarrega o .bin compactado
+    worker_a.compact()
+    worker_a.add_images("torta", [b"torta-1"], filenames=["t1.jpg"])
+    assert _top1(worker_b, b"torta-1") == "torta"
+    assert worker_b.dishes == worker_a.dishes
+
+
+def test_compactacao(tmp_path, fake_embedder, monkeypatch):
+    monkeypatch.setattr(index_module, "COMPACT_EVERY", 3)
+    idx = _built_index(tmp_path)
+    idx.add_images("pudim", [b"p1"], filenames=["p1.jpg"])
+    idx.add_images("pudim", [b"p2"], filenames=["p2.jpg"])
+    assert idx.get_stats()["storage"] == "ram"
+    idx.remove_image("pudim", "p1.jpg")  # 3a operacao dispara a compactacao
+    stats = idx.get_stats()
+    assert stats["delta_pending"] == 0
+    assert stats["storage"] == "mmap"
+    assert Path(idx._delta_file()).read_bytes() == b""
+    again = _reopen(idx)
+    assert again.files == idx.files
+    assert "p2.jpg" in again.files and "p1.jpg" not in again.files
+
+
+def test_ivf_rebase_sem_retreinar():
+    rng = np.random.default_rng(0)
+    emb = rng.normal(size=(60, 16)).astype(np.float32)
+    emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+    centroids, assign = IVFSearch.train(emb, nlist=5)
+    ivf = IVFSearch(emb, centroids, assign, nprobe=5)
+
+    keep = np.delete(np.arange(60), [3, 10])
+    grown = np.vstack([emb[keep], emb[:2]])
+    rebased = ivf.rebase(grown, keep)
+    assert np.array_equal(rebased.centroids, ivf.centroids)
+    assert len(rebased.assign) == len(grown)
+    rows, sims = rebased.candidates(grown[-1])
+    assert sorted(rows.tolist()) == list(range(len(grown)))
+    assert np.allclose(sims, grown[rows] @ grown[-1])
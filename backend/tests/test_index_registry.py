@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Registro de indices (services/index_registry.py) + regressao de plano de consulta.
+
+Cobre os casos:
+- nomes do registro unicos por colecao e iguais aos que o MongoDB geraria
+- ensure_indexes idempotente; indice em conflito e logado sem bloquear os demais
+- a consulta de cada endpoint/servico usa indice (falha se o plano for COLLSCAN)
+- o harness detecta COLLSCAN (nao e um teste vazio)
+
+Executar:
+    python3 -m pytest backend/tests/test_index_registry.py -v
+    SOULNUTRI_TEST_MONGO_URL=mongodb://localhost:27017 python3 -m pytest backend/tests/test_index_registry.py -v
+"""
+
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import pytest  # noqa: E402
+
+from services.index_registry import INDEXES  # noqa: E402
+from services.norm_key_service import norm_filter  # noqa: E402
+
+pytest.importorskip("mongomock")
+from query_plan_harness import QueryPlanHarness, simulate_plan  # noqa: E402
+
+DESDE = "2026-01-01"
+ANTES = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+# (onde, colecao, filtro, sort) — copias das consultas do server.py e servicos
+ENDPOINT_QUERIES = [
+    # usuarios
+    ("identify/login premium (nome+PIN)", "users", norm_filter("users", "Ana", pin_hash="h"), None),
+    ("log_meal / metas / premium por PIN", "users", {"pin_hash": "h"}, None),
+    ("admin premium: lista", "users", {}, [("created_at", -1)]),
+    ("admin premium: por PIN", "users", {"pin_hash": "h"}, [("created_at", -1)]),
+    ("admin premium: remover bloqueados", "users", {"pin_hash": "h", "premium_ativo": False}, None),
+    ("admin premium: is_admin", "users", {"pin_hash": "h", "is_admin": True}, None),
+    ("admin premium: por nome", "users", norm_filter("users", "Ana"), None),
+    # daily_logs
+    ("log_meal / dashboard hoje", "daily_logs", {"user_nome": "Ana", "data": "2026-01-02"}, None),
+    ("premium history/analise", "daily_logs", {"user_nome": "Ana", "data": {"$gte": DESDE}}, [("data", -1)]),
+    ("premium_rollup_service dias soltos", "daily_logs", {"user_nome": "Ana", "data": {"$in": [DESDE]}}, None),
+    ("notification_service consumo recente", "daily_logs",
+     {"user_pin": "1234", "timestamp": {"$gte": DESDE}}, [("timestamp", -1)]),
+    ("premium_rollups geral", "premium_rollups", {"user_nome": "Ana", "periodo": "geral"}, None),
+    ("premium_rollups segmentos", "premium_rollups",
+     {"user_nome": "Ana", "$or": [{"periodo": "mes", "chave": {"$in": ["2026-01"]}},
+                                  {"periodo": "semana", "chave": {"$in": ["2026-W01"]}}]}, None),
+    # notificacoes
+    ("notificacao do dia", "notifications", {"user_pin": "1234", "date": "2026-01-02"}, None),
+    ("notificacoes do usuario", "notifications", {"user_pin": "1234"}, [("created_at", -1)]),
+    # pratos e fichas
+    ("ficha: canonical_name", "nutrition_sheets", {"canonical_name": "arroz integral"}, None),
+    ("ficha: slug_v2", "nutrition_sheets", {"slug_v2": "arroz-integral"}, None),
+    ("ficha: legado", "nutrition_sheets",
+     {"$or": [{"nome": "Arroz"}, {"slug": "Arroz"}, {"nomes_alternativos": "Arroz"},
+              norm_filter("nutrition_sheets", "Arroz")]}, None),
+    ("identify: prato", "dishes", {"$or": [{"slug": "arroz"}, norm_filter("dishes", "Arroz")]}, None),
+    ("admin: prato por slug", "dishes", {"slug": "arroz"}, None),
+    ("identify: familia", "dish_families", {"slug": "arroz"}, None),
+    ("imagens por slug", "dish_storage", {"slug": "arroz"}, None),
+    ("imagens por slug_norm", "dish_storage", {"slug_norm": "arroz", "images.0": {"$exists": True}}, None),
+    ("alertas: refeicoes da semana", "meal_logs",
+     norm_filter("meal_logs", "Ana", timestamp={"$gte": DESDE}), [("timestamp", -1)]),
+    ("alertas: meta do usuario", "premium_users", norm_filter("premium_users", "Ana"), None),
+    # admin
+    ("calibracao: amostras", "calibration_log", {}, [("created_at", -1)]),
+    ("moderacao: fila por status", "moderation_queue", {"status": "pending"}, [("created_at", -1)]),
+    ("moderacao: fila completa", "moderation_queue", {}, [("created_at", -1)]),
+    ("feedback: acertos/erros", "feedback", {"is_correct": False}, None),
+    ("auditoria por prato", "nutrition_audit_log", {"dish_slug": "arroz"}, [("timestamp", -1)]),
+    ("auditoria geral", "nutrition_audit_log", {}, [("timestamp", -1)]),
+    ("novidade do prato", "novidades", {"dish_slug": "arroz", "ativa": True}, None),
+    ("novidades ativas", "novidades", {"ativa": True}, [("data_criacao", -1)]),
+    ("settings por chave", "settings", {"key": "gemini_enabled"}, None),
+    ("uso google vision no mes", "api_usage", {"service": "google_vision", "month": "2026-01"}, None),
+    ("uso google vision historico", "api_usage", {"service": "google_vision"}, [("month", -1)]),
+    ("uso de APIs resumo", "api_usage", {"type": "summary"}, None),
+    # breaking news
+    ("breaking news curado", "contextual_breaking_news",
+     {"ativo": True, "tags": {"$in": ["arroz"]}, "data": {"$gte": ANTES}}, None),
+]
+
+
+@pytest.fixture(scope="module")
+def harness():
+    with QueryPlanHarness() as h:
+        result = h.apply(INDEXES)
+        assert result["failed"] == []
+        yield h
+
+
+def test_nomes_unicos_e_padrao_mongo():
+    for collection, specs in INDEXES.items():
+        names = [name for _, name, _ in specs]
+        assert len(names) == len(set(names)), collection
+        keys = [tuple(k) for k, _, _ in specs]
+        assert len(keys) == len(set(keys)), collection
+    for keys, name, _ in INDEXES["notifications"]:
+        assert name == "_".join(f"{f}_{d}" for f, d in keys)
+
+
+def test_ensure_indexes_idempotente(harness):
+    before = {c: sorted(harness.db[c].index_information()) for c in INDEXES}
+    assert harness.apply(INDEXES)["failed"] == []
+    assert {c: sorted(harness.db[c].index_information()) for c in INDEXES} == before
+    for collection, specs in INDEXES.items():
+        assert {name for _, name, _ in specs} <= set(before[collection])
+
+
+def test_conflito_nao_bloqueia_demais():
+    with QueryPlanHarness() as h:
+        h.db.dishes.create_index([("slug", 1)], name="slug_1", unique=True)  # criado antes por script
+        result = h.apply(INDEXES)
+        assert result["failed"] == ["dishes.slug_1"]
+        assert "name_norm_1" in h.db.dishes.index_information()
+        assert "COLLSCAN" not in h.stages("dishes", {"slug": "arroz"})
+
+
+@pytest.mark.parametrize("where,collection,flt,sort", ENDPOINT_QUERIES, ids=[q[0] for q in ENDPOINT_QUERIES])
+def test_consulta_sem_collscan(harness, where, collection, flt, sort):
+    assert collection in INDEXES, f"{collection} fora do registro"
+    stages = harness.stages(collection, flt, sort)
+    assert "COLLSCAN" not in stages, f"{where}: {collection}.find({flt}) -> {stages}"
+
+
+def test_harness_detecta_collscan(harness):
+    assert "COLLSCAN" in harness.stages("users", {"email": "x"})
+    assert "COLLSCAN" in harness.stages("moderation_queue", {}, [("updated_at", -1)])
+    assert "COLLSCAN" in harness.stages("nutrition_sheets", {"$or": [{"slug": "a"}, {"descricao": "a"}]})
+    assert simulate_plan([[("_id", 1)], [("a", 1)]], {"a": {"$exists": False}}) == {"COLLSCAN"}
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
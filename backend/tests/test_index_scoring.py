@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Scoring vetorizado do DishIndex.search (argpartition + segment-max por prato).
+
+Cobre os casos:
+- mesmos pratos/scores/gap/consistency que a agregacao antiga em loop Python
+- linhas de um prato nao contiguas (apos add incremental) continuam corretas
+- dish_scores traz o melhor score de TODOS os pratos
+- detect_family_ambiguity usa dish_scores para achar membros fora do top-5
+
+Executar:
+    python3 -m pytest backend/tests/test_index_scoring.py -v
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np  # noqa: E402
+
+import ai.index as index_module  # noqa: E402
+from ai.ann import ExactSearch  # noqa: E402
+from ai.families import detect_family_ambiguity  # noqa: E402
+
+
+def _make_index(tmp_path, dishes, embeddings):
+    idx = index_module.DishIndex(data_dir=str(tmp_path), index_file=str(tmp_path / "nao_existe.json"))
+    idx.dishes = list(dishes)
+    idx.embeddings = embeddings.astype(np.float32)
+    idx.dish_to_idx = {}
+    for i, d in enumerate(dishes):
+        idx.dish_to_idx.setdefault(d, []).append(i)
+    idx._search_backend = ExactSearch(idx.embeddings)
+    idx._build_row_maps()
+    return idx
+
+
+def _random_index(tmp_path, n_dishes=40, per_dish=6, dim=32, seed=3, shuffle=False):
+    rng = np.random.default_rng(seed)
+    dishes = [f"Prato {d}" for d in range(n_dishes) for _ in range(per_dish)]
+    emb = rng.normal(size=(len(dishes), dim))
+    emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+    if shuffle:
+        perm = rng.permutation(len(dishes))
+        dishes = [dishes[i] for i in perm]
+        emb = emb[perm]
+    return _make_index(tmp_path, dishes, emb), rng
+
+
+def _legacy_aggregate(idx, query, top_k=5):
+    """Agregacao original (loop Python) para comparacao."""
+    sims = idx.embeddings @ query
+    top = np.argsort(sims)[::-1][:top_k * 10]
+    consistency = len({idx.dishes[i] for i in top[:15]})
+    best = {}
+    for i in top:
+        d = idx.dishes[i]
+        if d not in best or sims[i] > best[d]:
+            best[d] = float(sims[i])
+    ranked = sorted(best.items(), key=lambda x: x[1], reverse=True)[:top_k]
+    return ranked, consistency
+
+
+def _search(idx, query, monkeypatch, **kwargs):
+    monkeypatch.setattr(index_module, "image_embedding_from_bytes", lambda _b: query)
+    return idx.search(b"img", 5, **kwargs)
+
+
+def _check_equivalence(idx, rng, monkeypatch, n_queries=50):
+    for _ in range(n_queries):
+        q = rng.normal(size=idx.embeddings.shape[1]).astype(np.float32)
+        q /= np.linalg.norm(q)
+        ranked, consistency = _legacy_aggregate(idx, q)
+        results = _search(idx, q, monkeypatch)
+        raw = sorted(((r['dish'], r['raw_score']) for r in results), key=lambda x: -x[1])
+        assert [d for d, _ in raw] == [d for d, _ in ranked]
+        assert [s for _, s in raw] == [round(s, 4) for _, s in ranked]
+        assert all(r['consistency'] == consistency for r in results)
+        gap = ranked[0][1] - ranked[1][1]
+        assert results[0]['gap'] == round(gap, 4)
+
+
+def test_equivale_a_agregacao_antiga(tmp_path, monkeypatch):
+    idx, rng = _random_index(tmp_path)
+    _check_equivalence(idx, rng, monkeypatch)
+
+
+def test_linhas_nao_contiguas(tmp_path, monkeypatch):
+    idx, rng = _random_index(tmp_path, shuffle=True)
+    _check_equivalence(idx, rng, monkeypatch)
+
+
+def test_dish_scores_cobre_todos_os_pratos(tmp_path, monkeypatch):
+    idx, rng = _random_index(tmp_path)
+    q = idx.embeddings[7]
+    results = _search(idx, q, monkeypatch, with_dish_scores=True)
+    scores = results[0]['dish_scores']
+    assert len(scores) == 40
+    expected = max(float(idx.embeddings[i] @ q) for i in idx.dish_to_idx["Prato 25"])
+    assert scores["Prato 25"] == round(expected, 4)
+    assert idx.score_all_dishes(q) == scores
+
+
+def test_familia_usa_membros_fora_do_top5():
+    results = [
+        {"dish": "Gelatina de Uva", "raw_score": 0.80},
+        {"dish": "Gelatina de Limao", "raw_score": 0.79},
+        {"dish": "Pudim", "raw_score": 0.785},
+        {"dish": "Mousse de Limao", "raw_score": 0.78},
+        {"dish": "Tiramisu", "raw_score": 0.775},
+    ]
+    dish_scores = {r["dish"]: r["raw_score"] for r in results}
+    dish_scores["Gelatina de Cereja"] = 0.77  # fora do top-5, dentro da janela
+    dish_scores["Gelatina de Abacaxi"] = 0.60  # longe demais
+
+    sem = detect_family_ambiguity(results)
+    com = detect_family_ambiguity(results, dish_scores=dish_scores)
+    assert sem["candidates"] == ["Gelatina de Uva", "Gelatina de Limao"]
+    assert com["candidates"] == ["Gelatina de Uva", "Gelatina de Limao", "Gelatina de Cereja"]
+    assert com["family_name"] == "Gelatinas"
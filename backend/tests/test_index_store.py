@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Formato binario do indice (ai/index_store.py) + carga no DishIndex.
+
+Cobre os casos:
+- round-trip float32 exato e float16 aproximado
+- tabela de arquivos por linha e delta_seq no header
+- matriz aberta como np.memmap somente-leitura
+- checksum detecta corrupcao; versao desconhecida e rejeitada
+- escrita atomica nao deixa arquivos temporarios
+- DishIndex converte o formato legado (JSON + .npy) para .bin e passa a usar memmap
+- .bin corrompido cai para o formato legado
+
+Executar:
+    python3 -m pytest backend/tests/test_index_store.py -v
+"""
+
+import sys
+import json
+import struct
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np  # noqa: E402
+import pytest  # noqa: E402
+
+from ai.index_store import (  # noqa: E402
+    FORMAT_VERSION,
+    IndexFormatError,
+    read_index_file,
+    write_index_file,
+)
+from ai.index import DishIndex  # noqa: E402
+
+
+def _data(n=12, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    emb = rng.normal(size=(n, dim)).astype(np.float32)
+    emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+    dishes = [["Feijão do Chef", "Pudim", "Arroz 7 Grãos"][i % 3] for i in range(n)]
+    return emb, dishes
+
+
+def test_round_trip_float32(tmp_path):
+    emb, dishes = _data()
+    path = str(tmp_path / "dish_index.bin")
+    header = write_index_file(path, emb, dishes, {"Pudim": {"image_count": 4}})
+    loaded, loaded_dishes, files, metadata, h2 = read_index_file(path)
+    assert isinstance(loaded, np.memmap)
+    assert not loaded.flags.writeable
+    assert np.array_equal(loaded, emb)
+    assert loaded_dishes == dishes
+    assert files == [""] * len(dishes)
+    assert metadata == {"Pudim": {"image_count": 4}}
+    assert h2["checksum"] == header["checksum"]
+    assert h2["format_version"] == FORMAT_VERSION
+    assert h2["matrix_offset"] % 64 == 0
+
+
+def test_round_trip_float16(tmp_path):
+    emb, dishes = _data()
+    path = str(tmp_path / "dish_index.bin")
+    write_index_file(path, emb, dishes, {}, dtype="float16")
+    loaded, _, _, _, header = read_index_file(path)
+    assert header["dtype"] == "float16"
+    assert np.allclose(loaded, emb, atol=1e-3)
+
+
+def test_round_trip_arquivos_e_delta_seq(tmp_path):
+    emb, dishes = _data()
+    files = [f"img_{i}.jpg" for i in range(len(dishes))]
+    path = str(tmp_path / "dish_index.bin")
+    write_index_file(path, emb, dishes, {}, files=files, delta_seq=7)
+    _, loaded_dishes, loaded_files, _, header = read_index_file(path)
+    assert loaded_dishes == dishes
+    assert loaded_files == files
+    assert header["delta_seq"] == 7
+
+
+def test_checksum_detecta_corrupcao(tmp_path):
+    emb, dishes = _data()
+    path = tmp_path / "dish_index.bin"
+    header = write_index_file(str(path), emb, dishes, {})
+    raw = bytearray(path.read_bytes())
+    raw[header["matrix_offset"] + 5] ^= 0xFF
+    path.write_bytes(bytes(raw))
+    with pytest.raises(IndexFormatError):
+        read_index_file(str(path))
+
+
+def test_versao_desconhecida_rejeitada(tmp_path):
+    emb, dishes = _data()
+    path = tmp_path / "dish_index.bin"
+    write_index_file(str(path), emb, dishes, {})
+    raw = bytearray(path.read_bytes())
+    raw[8:12] = struct.pack("<I", FORMAT_VERSION + 1)
+    path.write_bytes(bytes(raw))
+    with pytest.raises(IndexFormatError):
+        read_index_file(str(path))
+
+
+def test_escrita_atomica_sem_temporarios(tmp_path):
+    emb, dishes = _data()
+    write_index_file(str(tmp_path / "dish_index.bin"), emb, dishes, {})
+    write_index_file(str(tmp_path / "dish_index.bin"), emb[:6], dishes[:6], {})
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["dish_index.bin"]
+    loaded, _, _, _, _ = read_index_file(str(tmp_path / "dish_index.bin"))
+    assert loaded.shape == (6, 8)
+
+
+def _write_legacy(tmp_path, emb, dishes):
+    dish_to_idx = {}
+    for i, d in enumerate(dishes):
+        dish_to_idx.setdefault(d, []).append(i)
+    index_file = tmp_path / "dish_index.json"
+    index_file.write_text(json.dumps({
+        "dishes": dishes, "dish_to_idx": dish_to_idx, "metadata": {"Pudim": {"image_count": 4}},
+    }), encoding="utf-8")
+    np.save(tmp_path / "dish_index_embeddings.npy", emb)
+    return str(index_file)
+
+
+def test_dish_index_migra_legado_para_binario(tmp_path):
+    emb, dishes = _data()
+    index_file = _write_legacy(tmp_path, emb, dishes)
+    idx = DishIndex(data_dir=str(tmp_path), index_file=index_file)
+    assert (tmp_path / "dish_index.bin").exists()
+    assert isinstance(idx.embeddings, np.memmap)
+    assert idx.get_stats()["storage"] == "mmap"
+    assert idx.dishes == dishes
+    assert idx.metadata == {"Pudim": {"image_count": 4}}
+    assert sorted(idx.dish_to_idx["Pudim"]) == [i for i, d in enumerate(dishes) if d == "Pudim"]
+
+
+def test_binario_corrompido_cai_para_legado(tmp_path):
+    emb, dishes = _data()
+    index_file = _write_legacy(tmp_path, emb, dishes)
+    (tmp_path / "dish_index.bin").write_bytes(b"lixo")
+    idx = DishIndex(data_dir=str(tmp_path), index_file=index_file)
+    assert idx.is_ready()
+    assert np.array_equal(np.asarray(idx.embeddings), emb)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Histogramas de latencia por etapa (services/metrics_service.py).
+
+Cobre os casos:
+- p50/p95/p99 dos buckets fixos ficam dentro do erro relativo do bucket (<= 19%)
+- janelas deslizantes: observacoes antigas saem da janela de 1m/5m/15m
+- exposicao Prometheus: buckets cumulativos, +Inf == count, sum
+- timer() mede o bloco; contadores por engine; relatorio admin por data
+
+Executar:
+    python3 -m pytest backend/tests/test_metrics_service.py -v
+"""
+
+import sys
+import time
+import random
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np  # noqa: E402
+
+from services.metrics_service import LatencyHistogram, MetricsRegistry  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_quantis_dentro_do_erro_do_bucket():
+    rng = random.Random(7)
+    samples = [rng.lognormvariate(3.5, 0.8) for _ in range(5000)]
+    h = LatencyHistogram("onnx_run", clock=FakeClock())
+    for v in samples:
+        h.observe(v)
+    window = h.window(1)
+    assert window["count"] == 5000
+    for q in (50, 95, 99):
+        exact = float(np.percentile(samples, q))
+        approx = window[f"p{q}_ms"]
+        assert exact * 0.99 <= approx <= exact * 1.19 + 0.01, (q, exact, approx)
+    assert window["max_ms"] == round(max(samples), 2)
+
+
+def test_janela_deslizante_descarta_slots_antigos():
+    clock = FakeClock()
+    h = LatencyHistogram("mongo", slot_s=60, clock=clock)
+    for _ in range(10):
+        h.observe(500.0)
+    clock.now += 120  # 2 minutos depois
+    for _ in range(4):
+        h.observe(5.0)
+    snap = h.snapshot()
+    assert snap["count"] == 14
+    assert snap["1m"]["count"] == 4 and snap["1m"]["p99_ms"] == 5.0
+    assert snap["5m"]["count"] == 14 and snap["5m"]["p99_ms"] == 500.0
+    clock.now += 20 * 60  # slots reaproveitados no anel
+    h.observe(1.0)
+    assert h.window(15)["count"] == 1
+
+
+def test_prometheus_cumulativo():
+    reg = MetricsRegistry(clock=FakeClock())
+    for v in (0.3, 2.0, 40.0, 40.0, 250_000.0):
+        reg.observe("similarity", v)
+    reg.incr("identify_requests", engine="CLIP")
+    text = reg.prometheus_text()
+    buckets = [line for line in text.splitlines() if line.startswith('soulnutri_stage_latency_ms_bucket{stage="similarity"')]
+    values = [int(line.rsplit(" ", 1)[1]) for line in buckets]
+    assert values == sorted(values)
+    assert buckets[-1].endswith('le="+Inf"} 5')
+    assert values[-2] == 4  # 250s fica acima do ultimo limite
+    assert 'soulnutri_stage_latency_ms_count{stage="similarity"} 5' in text
+    assert 'soulnutri_identify_requests_total{engine="CLIP"} 1' in text
+
+
+def test_timer_contadores_e_relatorio_admin():
+    reg = MetricsRegistry(clock=FakeClock())
+    with reg.timer("policy"):
+        time.sleep(0.01)
+    assert reg.snapshot()["stages"]["policy"]["count"] == 1
+    assert reg.snapshot()["stages"]["policy"]["avg_ms"] >= 10
+
+    reg.record_identify(120.0, "CLIP", "Arroz", 0.9, keep_entry=True)
+    reg.record_identify(80.0, "CLIP (cache)", "Arroz", 0.9, keep_entry=True)
+    reg.record_identify(900.0, "GEMINI")  # sem ENABLE_PROCESSING_METRICS: so histograma
+    snap = reg.snapshot()
+    assert snap["stages"]["identify_total"]["count"] == 3
+    assert snap["counters"]["identify_requests[CLIP]"] == 1
+
+    report = reg.recent_report(time.strftime("%Y-%m-%d"))
+    assert report["total"] == 2 and report["min_ms"] == 80.0 and report["max_ms"] == 120.0
+    assert report["entries"][0]["engine_used"] == "CLIP (cache)"  # mais recente primeiro
+    assert reg.recent_report("1999-01-01")["total"] == 0
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-v"]))
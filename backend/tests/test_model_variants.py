@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Variantes FP16/INT8 do modelo ONNX (ai/model_variants.py).
+
+Cobre os casos:
+- seletor: referencia por padrao; variante ausente, sem avaliacao, reprovada
+  ou com arquivo alterado cai para a referencia; aprovada e ativada
+- avaliacao: concordancia top-1 contra a galeria ignorando a propria foto
+- gate: reprova variante que muda o top-1, piora a acuracia ou nao e mais rapida
+- conjunto de calibracao deterministico e limitado por prato
+- foto ilegivel pulada sem desalinhar tensores, pratos e chaves
+
+Executar:
+    python3 -m pytest backend/tests/test_model_variants.py -v
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np  # noqa: E402
+import pytest  # noqa: E402
+
+import ai.model_variants as mv  # noqa: E402
+
+
+@pytest.fixture
+def variants(tmp_path, monkeypatch):
+    ref = tmp_path / "ref.onnx"
+    int8 = tmp_path / "int8.onnx"
+    ref.write_bytes(b"ref" * 1000)
+    int8.write_bytes(b"int8" * 500)
+    monkeypatch.setattr(mv, "VARIANTS", {"reference": str(ref), "int8_dynamic": str(int8),
+                                         "fp16": str(tmp_path / "nao_existe.onnx")})
+    monkeypatch.delenv("SOULNUTRI_ONNX_VARIANT", raising=False)
+    report = tmp_path / "report.json"
+    return ref, int8, report
+
+
+def _report(report, entry):
+    mv.write_report({"int8_dynamic": entry}, {}, str(report))
+
+
+def test_seletor_cai_para_referencia(variants):
+    ref, int8, report = variants
+    assert mv.select_model_path(report_path=str(report)) == ("reference", str(ref))
+    assert mv.select_model_path("desconhecida", str(report))[0] == "reference"
+    assert mv.select_model_path("fp16", str(report))[0] == "reference"  # arquivo ausente
+    assert mv.select_model_path("int8_dynamic", str(report))[0] == "reference"  # sem avaliacao
+
+    _report(report, {"approved": False, "reason": "top-1 0.9", "fingerprint": mv.model_fingerprint(str(int8))})
+    assert mv.select_model_path("int8_dynamic", str(report))[0] == "reference"
+
+    _report(report, {"approved": True, "fingerprint": "0:outro-arquivo"})
+    assert mv.select_model_path("int8_dynamic", str(report))[0] == "reference"
+
+
+def test_seletor_ativa_variante_aprovada(variants, monkeypatch):
+    ref, int8, report = variants
+    _report(report, {"approved": True, "fingerprint": mv.model_fingerprint(str(int8))})
+    monkeypatch.setenv("SOULNUTRI_ONNX_VARIANT", "INT8_dynamic")
+    assert mv.select_model_path(report_path=str(report)) == ("int8_dynamic", str(int8))
+
+
+def _clusters(seed=0, dishes=8, per_dish=5, dim=32):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(dishes, dim))
+    emb, labels = [], []
+    for d in range(dishes):
+        for _ in range(per_dish):
+            emb.append(centers[d] + rng.normal(scale=0.35, size=dim))
+            labels.append(f"prato_{d}")
+    emb = np.asarray(emb, dtype=np.float32)
+    return emb / np.linalg.norm(emb, axis=1, keepdims=True), labels
+
+
+def _perturb(emb, scale, seed=1):
+    out = emb + np.random.default_rng(seed).normal(scale=scale, size=emb.shape).astype(np.float32)
+    return out / np.linalg.norm(out, axis=1, keepdims=True)
+
+
+def test_avaliacao_e_gate():
+    reference, labels = _clusters()
+    close = mv.evaluate_variant(reference, _perturb(reference, 0.01), labels)
+    assert close["top1_agreement"] == 1.0 and close["mean_cosine"] > 0.99
+    close.update(ms_per_inference=40.0, reference_ms_per_inference=90.0)
+    assert mv.apply_gate(close)["approved"] is True
+
+    far = mv.evaluate_variant(reference, _perturb(reference, 0.5), labels)
+    far.update(ms_per_inference=20.0, reference_ms_per_inference=90.0)
+    assert far["top1_agreement"] < mv.MIN_TOP1_AGREEMENT
+    assert mv.apply_gate(far)["approved"] is False
+
+    slow = mv.evaluate_variant(reference, reference.copy(), labels)
+    slow.update(ms_per_inference=95.0, reference_ms_per_inference=90.0)
+    gated = mv.apply_gate(slow)
+    assert gated["approved"] is False and "rápida" in gated["reason"]
+
+
+def test_galeria_ignora_a_propria_foto():
+    gallery, labels = _clusters(dishes=4, per_dish=3)
+    keys = [f"{d}/{i}.jpg" for i, d in enumerate(labels)]
+    queries = gallery[[0, 5]]
+    q_labels = [labels[0], labels[5]]
+    # Query identica a uma linha da galeria: sem exclusao o top-1 e trivial (ela mesma)
+    excl = mv._same_photo_mask([keys[0], keys[5]], keys)
+    assert excl.sum() == 2 and excl[0, 0] and excl[1, 5]
+    result = mv.evaluate_variant(queries, queries.copy(), q_labels, gallery, labels, [keys[0], keys[5]], keys)
+    assert result["images"] == 2 and result["top1_agreement"] == 1.0
+
+
+def test_conjunto_de_calibracao(tmp_path):
+    for d in ("arroz", "feijao"):
+        (tmp_path / d).mkdir()
+        for i in range(5):
+            (tmp_path / d / f"{i}.jpg").write_bytes(b"x")
+        (tmp_path / d / "notas.txt").write_text("x")
+    first = mv.calibration_set(str(tmp_path), per_dish=2, seed=3)
+    assert first == mv.calibration_set(str(tmp_path), per_dish=2, seed=3)
+    assert len(first) == 4 and all(p.endswith(".jpg") for _, p in first)
+    assert sorted(d for d, _ in first) == ["arroz", "arroz", "feijao", "feijao"]
+    assert len(mv.calibration_set(str(tmp_path), per_dish=5, max_images=3)) == 3
+
+
+
+def test_tensores_alinhados_apos_foto_ilegivel(tmp_path):
+    import io
+    from PIL import Image
+
+    def jpeg(color):
+        buf = io.BytesIO()
+        Image.new("RGB", (64, 48), color).save(buf, format="JPEG")
+        return buf.getvalue()
+
+    items = []
+    for dish, data in (("arroz", jpeg((200, 10, 10))), ("feijao", b"corrompida"), ("cocada", jpeg((10, 10, 200)))):
+        path = tmp_path / f"{dish}.jpg"
+        path.write_bytes(data)
+        items.append((dish, str(path)))
+    tensors, labels, kept = mv.load_calibration_tensors(items)
+    assert tensors.shape[0] == len(labels) == len(kept) == 2
+    assert labels == ["arroz", "cocada"] and [d for d, _ in kept] == labels
+    assert kept[1][1].endswith("cocada.jpg")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Chaves normalizadas (services/norm_key_service.py) no lugar de $regex ^...$ /i.
+
+Cobre os casos:
+- regras: usuario (sem acento, minusculo) e prato (canonize_input)
+- with_norm_keys em inserts/$set (dishes usa name ou nome)
+- ensure_norm_keys: indices + backfill de documentos antigos; lookup por igualdade
+- nenhum $regex ancorado sobrou em server.py / alerts_service.py
+- plano de consulta (tests/query_plan_harness.py): nenhuma consulta por nome em
+  COLLSCAN — explain de um MongoDB real em SOULNUTRI_TEST_MONGO_URL, senao mongomock
+
+Executar:
+    python3 -m pytest backend/tests/test_norm_keys.py -v
+    SOULNUTRI_TEST_MONGO_URL=mongodb://localhost:27017 python3 -m pytest backend/tests/test_norm_keys.py -v
+"""
+
+import asyncio
+import re
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import pytest  # noqa: E402
+
+from services.norm_key_service import (  # noqa: E402
+    NORM_FIELDS, NORM_INDEXES, canonize_input, ensure_norm_keys, norm_filter, norm_nome_key, with_norm_keys,
+)
+from query_plan_harness import AsyncMongomockDB, QueryPlanHarness  # noqa: E402
+
+BACKEND = Path(__file__).resolve().parents[1]
+
+# Formas de consulta usadas pelo server/alerts_service
+QUERY_SHAPES = [
+    ("users", norm_filter("users", "Jose", pin_hash="h1")),
+    ("users", norm_filter("users", "Jose")),
+    ("premium_users", norm_filter("premium_users", "Jose")),
+    ("meal_logs", norm_filter("meal_logs", "Jose", timestamp={"$gte": "2026-01-01"})),
+    ("dishes", {"$or": [{"slug": "arroz_7_graos"}, norm_filter("dishes", "Arroz 7 Graos")]}),
+    ("nutrition_sheets", norm_filter("nutrition_sheets", "Arroz 7 Graos")),
+    ("nutrition_sheets", {"$or": [{"nome": "Arroz"}, {"slug": "Arroz"}, {"nomes_alternativos": "Arroz"},
+                                  norm_filter("nutrition_sheets", "Arroz")]}),
+]
+
+
+def test_regras_de_normalizacao():
+    assert norm_nome_key("  José   Silva ") == "jose silva"
+    assert norm_nome_key("JOSÉ SILVA") == norm_nome_key("jose silva")
+    assert canonize_input("Arroz (7 Grãos)") == "arroz 7 graos"
+    assert canonize_input("Frango/Legumes, Assados-no-Forno") == "frango legumes assados no forno"
+    assert norm_filter("users", "Zé", pin_hash="x") == {"nome_norm": "ze", "pin_hash": "x"}
+    assert norm_filter("users", None) == {"nome_norm": ""}
+
+
+def test_with_norm_keys():
+    assert with_norm_keys("dishes", {"name": "Pão de Queijo"})["name_norm"] == "pao de queijo"
+    assert with_norm_keys("dishes", {"nome": "Pão-de-Queijo"})["name_norm"] == "pao de queijo"
+    assert "name_norm" not in with_norm_keys("dishes", {"slug": "x", "nutrition": {}})
+    assert with_norm_keys("users", {"nome": "Ana Lúcia", "pin_hash": "h"})["nome_norm"] == "ana lucia"
+
+
+def test_backfill_e_lookup_por_igualdade():
+    mongomock = pytest.importorskip("mongomock")
+    raw = mongomock.MongoClient()["soulnutri_test"]
+    raw.users.insert_many([{"nome": "José Silva", "pin_hash": "h1"}, {"nome": "ana", "pin_hash": "h2"},
+                           {"pin_hash": "h3"}])
+    raw.dishes.insert_many([{"slug": "arroz_7_graos", "name": "Arroz 7 Grãos"}, {"slug": "moqueca", "nome": "Moqueca"}])
+    raw.nutrition_sheets.insert_one({"nome": "Moqueca de Peixe", "calorias_kcal": 150})
+    raw.meal_logs.insert_many([{"user_nome": "JOSE SILVA", "timestamp": "2026-01-02"} for _ in range(3)])
+
+    filled = asyncio.run(ensure_norm_keys(AsyncMongomockDB(raw), batch_size=2))
+    assert filled == {"users": 2, "premium_users": 0, "meal_logs": 3, "dishes": 2, "nutrition_sheets": 1}
+    assert asyncio.run(ensure_norm_keys(AsyncMongomockDB(raw)))["users"] == 0  # idempotente
+
+    for collection, indexes in NORM_INDEXES.items():
+        assert {name for _, name in indexes} <= set(raw[collection].index_information())
+
+    assert raw.users.find_one(norm_filter("users", "jose silva", pin_hash="h1"))["nome"] == "José Silva"
+    assert raw.users.find_one(norm_filter("users", "JOSE SILVA", pin_hash="h2")) is None
+    assert raw.dishes.find_one({"$or": [{"slug": "x"}, norm_filter("dishes", "arroz 7 graos")]})["slug"] == "arroz_7_graos"
+    assert raw.dishes.find_one(norm_filter("dishes", "MOQUECA"))["slug"] == "moqueca"
+    assert raw.nutrition_sheets.find_one(norm_filter("nutrition_sheets", "moqueca de peixe"))["calorias_kcal"] == 150
+    assert raw.meal_logs.count_documents(norm_filter("meal_logs", "José Silva", timestamp={"$gte": "2026-01-01"})) == 3
+
+
+def test_sem_regex_ancorado_nos_lookups():
+    anchored = re.compile(r'"\$regex":\s*f?"\^')
+    for rel in ("server.py", "services/alerts_service.py"):
+        src = (BACKEND / rel).read_text(encoding="utf-8")
+        assert not anchored.search(src), rel
+
+
+def test_plano_das_consultas_por_nome():
+    """Com SOULNUTRI_TEST_MONGO_URL: explain de um mongod real; senao plano simulado no mongomock."""
+    registry = {c: [(keys, name, {}) for keys, name in specs] for c, specs in NORM_INDEXES.items()}
+    with QueryPlanHarness() as h:
+        assert h.apply(registry)["failed"] == []
+        for collection, flt in QUERY_SHAPES:
+            assert collection in NORM_FIELDS
+            assert "COLLSCAN" not in h.stages(collection, flt), (collection, flt)
+        assert "COLLSCAN" in h.stages("nutrition_sheets", {"$or": [{"nome_norm": "x"}, {"descricao": "x"}]})
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
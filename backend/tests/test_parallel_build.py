@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Builder paralelo do indice (ai/parallel_build.py).
+
+Cobre os casos:
+- mesmas linhas, na mesma ordem, que o builder serial (pratos, arquivos, dish_to_idx)
+- embeddings identicos aos do serial com o mesmo "modelo"
+- imagem corrompida e pulada nos dois builders
+- varias sessoes de inferencia em paralelo
+- cache hits nao passam pelo pool; progresso final gravado (pratos, imagens, ETA)
+- sem ONNX disponivel cai para o builder serial
+
+Executar:
+    python3 -m pytest backend/tests/test_parallel_build.py -v
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np  # noqa: E402
+import pytest  # noqa: E402
+from PIL import Image  # noqa: E402
+
+import ai.index as index_module  # noqa: E402
+import ai.parallel_build as parallel_build  # noqa: E402
+import ai.embedding_cache as cache_module  # noqa: E402
+from ai.embedder import preprocess_image_bytes  # noqa: E402
+
+
+def _fake_row(x: np.ndarray) -> np.ndarray:
+    x = np.ascontiguousarray(x)  # como o ONNX Runtime: layout nao muda o resultado
+    out = np.concatenate([
+        x.mean(axis=(0, 1)),
+        x.mean(axis=(0, 2)),
+        x.std(axis=(1, 2)),
+        np.full(61, x[:, ::4, ::4].mean()),
+    ]).astype(np.float32)
+    return out / np.linalg.norm(out)
+
+
+def _fake_batch(inputs: np.ndarray) -> np.ndarray:
+    """'Modelo' deterministico linha a linha: (N,3,224,224) -> (N,512) normalizado."""
+    return np.stack([_fake_row(x) for x in inputs])
+
+
+def _fake_single(data: bytes) -> np.ndarray:
+    return _fake_batch(preprocess_image_bytes(data))[0]
+
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    monkeypatch.setattr(index_module, "image_embedding_from_bytes", _fake_single)
+    monkeypatch.setattr(parallel_build, "PROGRESS_FILE", str(tmp_path / "progress.json"))
+    rng = np.random.default_rng(5)
+    organized = tmp_path / "organized"
+    for d, dish in enumerate(("arroz", "feijao", "pudim", "salada")):
+        (organized / dish).mkdir(parents=True)
+        for i in range(3 + d):
+            pixels = rng.integers(0, 255, size=(40 + 7 * i, 56, 3), dtype=np.uint8)
+            Image.fromarray(pixels).save(organized / dish / f"{dish}_{i}.png")
+    (organized / "pudim" / "corrompida.jpg").write_bytes(b"nao e uma imagem")
+    return organized
+
+
+def _build(tmp_path, organized, name, **kwargs):
+    idx = index_module.DishIndex(data_dir=str(organized), index_file=str(tmp_path / name / "dish_index.json"))
+    (tmp_path / name).mkdir(exist_ok=True)
+    stats = idx.build_index(**kwargs)
+    return idx, stats
+
+
+def _use_parallel(monkeypatch, sessions=2):
+    monkeypatch.setattr(parallel_build, "default_embed_fns", lambda: [_fake_batch] * sessions)
+
+
+def test_paralelo_igual_ao_serial(tmp_path, dataset, monkeypatch):
+    serial, s_stats = _build(tmp_path, dataset, "serial", workers=0)
+    _use_parallel(monkeypatch)
+    parallel, p_stats = _build(tmp_path, dataset, "paralelo", workers=2)
+
+    assert parallel.dishes == serial.dishes
+    assert parallel.files == serial.files
+    assert parallel.dish_to_idx == serial.dish_to_idx
+    assert list(parallel.dish_to_idx) == list(serial.dish_to_idx)
+    assert parallel.metadata == serial.metadata
+    assert np.array_equal(np.asarray(parallel.embeddings), np.asarray(serial.embeddings))
+    assert "corrompida.jpg" not in parallel.files
+    assert p_stats["total_images"] == s_stats["total_images"] == 18
+
+
+def test_cache_hits_e_progresso(tmp_path, dataset, monkeypatch):
+    _use_parallel(monkeypatch, sessions=1)
+    _build(tmp_path, dataset, "a", workers=2)
+    calls = []
+
+    def counting_batch(inputs):
+        calls.append(len(inputs))
+        return _fake_batch(inputs)
+
+    monkeypatch.setattr(parallel_build, "default_embed_fns", lambda: [counting_batch])
+    monkeypatch.setattr(cache_module, "EMBED_CACHE_PATH", str(tmp_path / "a" / "dish_index_embcache.sqlite"))
+    _, stats = _build(tmp_path, dataset, "b", workers=2)
+    assert calls == []
+    assert stats["embedding_cache"]["hits"] == 18
+
+    progress = parallel_build.read_progress()
+    assert progress["phase"] == "done"
+    assert progress["dishes_done"] == progress["dishes_total"] == 4
+    assert progress["images_done"] == progress["images_total"] == 19
+    assert progress["cache_hits"] == 18
+
+
+def test_sem_onnx_cai_para_serial(tmp_path, dataset, monkeypatch):
+    monkeypatch.setattr(parallel_build, "default_embed_fns", lambda: None)
+    idx, stats = _build(tmp_path, dataset, "c", workers=4)
+    assert stats["total_images"] == 18
+    assert parallel_build.read_progress()["workers"] == 1
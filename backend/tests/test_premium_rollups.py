@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+Agregados incrementais do Premium (services/premium_rollup_service.py).
+
+Cobre os casos:
+- intervalo [inicio, hoje] em meses + semanas + dias sem sobreposicao nem buraco
+- dashboard (dia/semana/mes/ano) e relatorio iguais ao calculo antigo sobre os daily_logs
+- agregados incrementais (log_meal) == reconstrucao a partir dos daily_logs (backfill)
+- streak quebra em dia sem registro e ignora dias so com 0 kcal no relatorio
+
+Executar:
+    python3 -m pytest backend/tests/test_premium_rollups.py -v
+"""
+
+import sys
+import random
+import asyncio
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest  # noqa: E402
+
+from services import premium_rollup_service as rollups  # noqa: E402
+
+mongomock = pytest.importorskip("mongomock")
+
+HOJE = date(2026, 3, 4)
+
+
+# ── adaptador assincrono minimo (mesma interface do motor usada pelo servico) ──
+
+class _Cursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, *args):
+        self._cursor = self._cursor.sort(*args)
+        return self
+
+    async def to_list(self, length=None):
+        return list(self._cursor.limit(length) if length else self._cursor)
+
+
+class _Collection:
+    def __init__(self, col):
+        self._col = col
+
+    def find(self, *args, **kwargs):
+        return _Cursor(self._col.find(*args, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self._col, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+class _DB:
+    def __init__(self):
+        self._db = mongomock.MongoClient()["soulnutri_test"]
+
+    def __getattr__(self, name):
+        return _Collection(self._db[name])
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+# ── calculo antigo (copiado dos endpoints, sobre a lista de daily_logs) ──
+
+def _legacy_logs(all_logs, dias, hoje):
+    inicio = (hoje - timedelta(days=dias)).isoformat()
+    return sorted((l for l in all_logs if l["data"] >= inicio), key=lambda l: l["data"], reverse=True)
+
+
+def _legacy_dashboard(all_logs, periodo, hoje):
+    dias = {"dia": 1, "semana": 7, "mes": 30, "ano": 365}.get(periodo, 7)
+    now = datetime.combine(hoje, datetime.min.time())
+    hoje_str = hoje.isoformat()
+    logs = _legacy_logs(all_logs, dias, hoje)
+    log_hoje = next((l for l in logs if l.get("data") == hoje_str), None)
+    grafico = []
+    if periodo == "dia":
+        for i, prato in enumerate((log_hoje or {}).get("pratos", [])[:10]):
+            grafico.append({"dia": prato.get("nome", f"Item {i+1}")[:15], "data": hoje_str,
+                            **{m: prato.get(m, 0) for m in rollups.MACROS}})
+    elif periodo == "semana":
+        for i in range(7):
+            data = (now - timedelta(days=6 - i)).strftime("%Y-%m-%d")
+            log_dia = next((l for l in logs if l.get("data") == data), None) or {}
+            grafico.append({"dia": rollups.DIAS_NOMES[(now - timedelta(days=6 - i)).weekday()], "data": data,
+                            **{m: log_dia.get(f"{m}_total", 0) for m in rollups.MACROS}})
+    elif periodo == "mes":
+        for semana in range(4):
+            soma = {m: 0 for m in rollups.MACROS}
+            for i in range(28 - (semana + 1) * 7, 28 - semana * 7):
+                data = (now - timedelta(days=i)).strftime("%Y-%m-%d")
+                log_dia = next((l for l in logs if l.get("data") == data), None)
+                if log_dia:
+                    for m in rollups.MACROS:
+                        soma[m] += log_dia.get(f"{m}_total", 0)
+            grafico.append({"dia": f"Sem {4-semana}", **{m: v / 7 for m, v in soma.items()}})
+    elif periodo == "ano":
+        for i in range(12):
+            mes_data = now - timedelta(days=30 * (11 - i))
+            logs_mes = [l for l in logs if l.get("data", "").startswith(mes_data.strftime("%Y-%m"))]
+            n = len([l for l in logs_mes if l.get("calorias_total", 0) > 0])
+            grafico.append({"dia": rollups.MESES_NOMES[mes_data.month - 1],
+                            **{m: sum(l.get(f"{m}_total", 0) for l in logs_mes) / max(n, 1) for m in rollups.MACROS},
+                            "dias_registrados": n})
+    streak = 0
+    for i in range(min(dias, 365)):
+        data = (now - timedelta(days=i)).strftime("%Y-%m-%d")
+        if any(l.get("data", "") == data for l in logs):
+            streak += 1
+        else:
+            break
+    limite = 30 if periodo in ["mes", "ano"] else 10
+    return {
+        "hoje": {m: (log_hoje or {}).get(f"{m}_total", 0) for m in rollups.MACROS},
+        "grafico": grafico,
+        "historico": [l["data"] for l in logs[:limite]],
+        "dias_com_log": len([l for l in logs if l.get("calorias_total", 0) > 0]),
+        "totais": {m: sum(l.get(f"{m}_total", 0) for l in logs) for m in rollups.MACROS},
+        "total_pratos": sum(len(l.get("pratos", [])) for l in logs),
+        "streak": streak,
+    }
+
+
+def _legacy_report(all_logs, periodo, hoje):
+    dias = {"dia": 1, "semana": 7, "mes": 30, "ano": 365}.get(periodo, 7)
+    logs = _legacy_logs(all_logs, dias, hoje)
+    ativos = [l for l in logs if l.get("calorias_total", 0) > 0]
+    streak = 0
+    for i in range(min(dias, 365)):
+        data = (hoje - timedelta(days=i)).isoformat()
+        if any(l.get("data") == data and l.get("calorias_total", 0) > 0 for l in logs):
+            streak += 1
+        else:
+            break
+    return {
+        "n_dias": len(ativos),
+        "totais": {m: sum(l.get(f"{m}_total", 0) for l in ativos) for m in rollups.MACROS},
+        "total_pratos": sum(len(l.get("pratos", [])) for l in ativos),
+        "pratos_unicos": len({p.get("nome", "").lower() for l in ativos for p in l.get("pratos", [])}),
+        "streak": streak,
+        "detalhes": [l["data"] for l in ativos[:15]],
+    }
+
+
+# ── historico sintetico gravado refeicao a refeicao (como o log_meal) ──
+
+PRATOS = ["Arroz", "Feijao", "Salada Verde", "Frango Grelhado", "Pudim", "Agua", "Cafe"]
+
+
+def _log_meal(db, nome, dia, rng):
+    cal = 0 if rng.random() < 0.1 else round(rng.uniform(50, 800), 1)
+    meal = {"nome": rng.choice(PRATOS), "calorias": cal, "proteinas": round(rng.uniform(0, 40), 1),
+            "carboidratos": round(rng.uniform(0, 90), 1), "gorduras": round(rng.uniform(0, 30), 1)}
+    db._db.daily_logs.update_one(
+        {"user_nome": nome, "data": dia},
+        {"$push": {"pratos": meal}, "$inc": {f"{m}_total": meal[m] for m in rollups.MACROS}},
+        upsert=True)
+    after = db._db.daily_logs.find_one({"user_nome": nome, "data": dia}, {"_id": 0})
+    _run(rollups.apply_meal(db, nome, dia, after, meal))
+
+
+@pytest.fixture(scope="module")
+def history():
+    rng = random.Random(7)
+    db = _DB()
+    # Ja existe historico antigo (antes dos agregados): o primeiro log_meal reconstroi
+    for d in range(420, 380, -1):
+        dia = (HOJE - timedelta(days=d)).isoformat()
+        db._db.daily_logs.insert_one({"user_nome": "ana", "data": dia, "pratos": [{"nome": "Arroz", "calorias": 300}],
+                                      "calorias_total": 300, "proteinas_total": 5,
+                                      "carboidratos_total": 60, "gorduras_total": 1})
+    for d in range(380, -1, -1):
+        if rng.random() < 0.25 and d > 6:
+            continue  # dia sem registro (streak quebra), ultima semana completa
+        dia = (HOJE - timedelta(days=d)).isoformat()
+        for _ in range(rng.randint(1, 4)):
+            _log_meal(db, "ana", dia, rng)
+    all_logs = list(db._db.daily_logs.find({"user_nome": "ana"}, {"_id": 0}))
+    return db, all_logs
+
+
+def test_split_range_cobre_intervalo_sem_sobreposicao():
+    for start in (date(2025, 12, 29), date(2026, 1, 31), date(2025, 3, 4), date(2026, 2, 23)):
+        months, weeks, days = rollups.split_range(start, HOJE)
+        covered = []
+        d = start
+        while d <= HOJE:
+            if rollups.month_key(d) in months:
+                covered.append("M")
+            if rollups.week_key(d) in weeks:
+                covered.append("W")
+            if d.isoformat() in days:
+                covered.append("D")
+            assert len(covered) == 1, (start, d, covered)
+            covered = []
+            d += timedelta(days=1)
+    assert rollups.split_range(date(2025, 3, 4), HOJE)[0][:2] == ["2025-04", "2025-05"]
+
+
+@pytest.mark.parametrize("periodo", ["dia", "semana", "mes", "ano"])
+def test_dashboard_igual_ao_calculo_antigo(history, periodo):
+    db, all_logs = history
+    new = _run(rollups.dashboard_data(db, "ana", periodo, HOJE))
+    old = _legacy_dashboard(all_logs, periodo, HOJE)
+    assert new["hoje"] == pytest.approx(old["hoje"])
+    assert len(new["grafico"]) == len(old["grafico"])
+    for a, b in zip(new["grafico"], old["grafico"]):
+        assert a.keys() == b.keys()
+        for k, v in b.items():
+            assert a[k] == (v if isinstance(v, str) else pytest.approx(v)), (k, a, b)
+    assert [h["data"] for h in new["historico"]] == old["historico"]
+    assert new["dias_com_log"] == old["dias_com_log"]
+    assert new["totais"] == pytest.approx(old["totais"])
+    assert new["total_pratos"] == old["total_pratos"]
+    assert new["streak"] == old["streak"]
+
+
+@pytest.mark.parametrize("periodo", ["dia", "semana", "mes", "ano"])
+def test_relatorio_igual_ao_calculo_antigo(history, periodo):
+    db, all_logs = history
+    new = _run(rollups.report_data(db, "ana", periodo, HOJE))
+    old = _legacy_report(all_logs, periodo, HOJE)
+    assert new["n_dias"] == old["n_dias"]
+    assert new["totais"] == pytest.approx(old["totais"])
+    assert new["total_pratos"] == old["total_pratos"]
+    assert new["pratos_unicos"] == old["pratos_unicos"]
+    assert new["streak"] == old["streak"]
+    assert [d["data"] for d in new["detalhes"]] == old["detalhes"]
+
+
+def test_incremental_igual_a_reconstrucao(history):
+    db, _ = history
+
+    def snapshot():
+        docs = db._db.premium_rollups.find({"user_nome": "ana"}, {"_id": 0, "rebuilt_at": 0})
+        return {(d["periodo"], d.get("chave")): d for d in docs}
+
+    incremental = snapshot()
+    _run(rollups.rebuild_user(db, "ana"))
+    rebuilt = snapshot()
+    assert incremental.keys() == rebuilt.keys()
+    for key, doc in rebuilt.items():
+        inc = incremental[key]
+        assert sorted(inc.get("nomes", [])) == doc.get("nomes", [])
+        for group in ("totais", "ativos"):
+            assert inc.get(group, {}) == pytest.approx(doc.get(group, {}))
+        for field in ("registro_ultimo", "registro_dias", "ativo_ultimo", "ativo_dias"):
+            assert inc.get(field) == doc.get(field)
+
+
+def test_streak_e_dia_sem_calorias():
+    db = _DB()
+    for d, cal in ((3, 100), (2, 0), (1, 200), (0, 300)):
+        dia = (HOJE - timedelta(days=d)).isoformat()
+        meal = {"nome": "Cafe", "calorias": cal, "proteinas": 0, "carboidratos": 0, "gorduras": 0}
+        db._db.daily_logs.update_one({"user_nome": "bia", "data": dia},
+                                     {"$push": {"pratos": meal}, "$inc": {"calorias_total": cal}}, upsert=True)
+        after = db._db.daily_logs.find_one({"user_nome": "bia", "data": dia}, {"_id": 0})
+        _run(rollups.apply_meal(db, "bia", dia, after, meal))
+    assert _run(rollups.dashboard_data(db, "bia", "semana", HOJE))["streak"] == 4
+    assert _run(rollups.report_data(db, "bia", "semana", HOJE))["streak"] == 2
+    # Amanha sem registro ainda: streak zera (igual ao loop antigo)
+    assert _run(rollups.dashboard_data(db, "bia", "semana", HOJE + timedelta(days=1)))["streak"] == 0
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
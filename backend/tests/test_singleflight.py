@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Coalescencia de requests identicos em andamento (services/singleflight.py).
+
+Cobre os casos:
+- do(): N chamadas simultaneas da mesma chave executam o trabalho 1 vez
+- chaves diferentes nao coalescem; chave liberada apos terminar
+- excecao do lider chega aos seguidores
+- cancelar o request lider nao cancela o trabalho dos seguidores
+- join()/finish(): seguidor recebe o resultado publicado; None/timeout = segue sozinho
+- stats (leaders, coalesced, follower_misses, follower_timeouts)
+
+Executar:
+    python3 -m pytest backend/tests/test_singleflight.py -v
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest  # noqa: E402
+
+from services.singleflight import SingleFlight  # noqa: E402
+
+
+def test_do_executa_uma_vez_por_chave():
+    group = SingleFlight("teste")
+    calls = []
+
+    async def work(key):
+        calls.append(key)
+        await asyncio.sleep(0.02)
+        return {"dish": key}
+
+    async def main():
+        same = [group.do("img-a", lambda: work("img-a")) for _ in range(5)]
+        other = group.do("img-b", lambda: work("img-b"))
+        results = await asyncio.gather(*same, other)
+        again = await group.do("img-a", lambda: work("img-a"))
+        return results, again
+
+    results, again = asyncio.run(main())
+    assert [r["dish"] for r in results] == ["img-a"] * 5 + ["img-b"]
+    assert again == {"dish": "img-a"}
+    assert calls == ["img-a", "img-b", "img-a"]
+    stats = group.stats()
+    assert stats["leaders"] == 3 and stats["coalesced"] == 4 and stats["in_flight"] == 0
+
+
+def test_excecao_do_lider_chega_aos_seguidores():
+    group = SingleFlight("teste")
+
+    async def boom():
+        await asyncio.sleep(0.01)
+        raise ValueError("gemini fora")
+
+    async def main():
+        return await asyncio.gather(*[group.do("k", boom) for _ in range(3)], return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_cancelar_lider_nao_cancela_seguidores():
+    group = SingleFlight("teste")
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def main():
+        leader = asyncio.ensure_future(group.do("k", work))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(group.do("k", work))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower, leader
+
+    result, leader = asyncio.run(main())
+    assert result == "ok"
+    assert leader.cancelled()
+
+
+def test_join_finish_publica_para_seguidores():
+    group = SingleFlight("teste")
+
+    async def main():
+        leader = group.join("img")
+        follower = group.join("img")
+        assert leader.leader and not follower.leader
+        waiting = asyncio.ensure_future(follower.wait())
+        await asyncio.sleep(0.01)
+        leader.finish({"dish_display": "Pudim"})
+        leader.finish(None)  # idempotente
+        shared = await waiting
+
+        # Lider sem resultado: seguidor recebe None e roda sozinho
+        leader2 = group.join("img")
+        follower2 = group.join("img")
+        leader2.finish(None)
+        missing = await follower2.wait()
+
+        # Lider travado: timeout do seguidor
+        group.join("lento")
+        slow = await group.join("lento").wait(timeout=0.01)
+        return shared, missing, slow
+
+    shared, missing, slow = asyncio.run(main())
+    assert shared == {"dish_display": "Pudim"}
+    assert missing is None and slow is None
+    stats = group.stats()
+    assert stats["coalesced"] == 3
+    assert stats["follower_misses"] == 1
+    assert stats["follower_timeouts"] == 1
+    assert stats["in_flight"] == 1  # "lento" nunca terminou
+
+
+def test_join_apos_finish_vira_novo_lider():
+    group = SingleFlight("teste")
+
+    async def main():
+        first = group.join("k")
+        first.finish({"x": 1})
+        return group.join("k").leader
+
+    assert asyncio.run(main()) is True
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
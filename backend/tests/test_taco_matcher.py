@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Matcher compilado da TACO (data/taco_database.py).
+
+Cobre os casos:
+- buscar_dados_taco igual a busca linear original (5 etapas) para chaves, nomes,
+  termos do mapeamento e variacoes (maiusculas, acento, "picado", "molho de ...")
+- regra conservadora: "molho" nunca casa com batata; "sal" nao captura "salmao"
+- buscar_dados_taco_lote na mesma ordem da lista
+- proporcoes por token iguais ao loop original sobre PROPORCOES
+
+Executar:
+    python3 -m pytest backend/tests/test_taco_matcher.py -v
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from data.taco_database import (  # noqa: E402
+    INGREDIENTE_PARA_TACO,
+    PROPORCOES,
+    TACO_DATABASE,
+    _eh_match_parcial_seguro,
+    _normalizar_frase_taco,
+    _proporcao_tabelada,
+    buscar_dados_taco,
+    buscar_dados_taco_lote,
+)
+
+
+def _buscar_linear(ingrediente: str):
+    """Busca original (varredura linear), referencia de equivalencia."""
+    import re
+    import unicodedata
+    ingrediente_norm = unicodedata.normalize('NFKD', ingrediente.lower().strip())
+    ingrediente_norm = ingrediente_norm.encode('ASCII', 'ignore').decode('ASCII')
+    ingrediente_key = re.sub(r'\s+', '_', re.sub(r'[^\w\s]', ' ', ingrediente_norm).strip())
+    if ingrediente_key in TACO_DATABASE:
+        return TACO_DATABASE[ingrediente_key]
+    ingrediente_lower = ingrediente.lower().strip()
+    if ingrediente_lower in INGREDIENTE_PARA_TACO:
+        return TACO_DATABASE.get(INGREDIENTE_PARA_TACO[ingrediente_lower])
+    frase = _normalizar_frase_taco(ingrediente)
+    for taco_key, data in TACO_DATABASE.items():
+        if frase == _normalizar_frase_taco(taco_key.replace('_', ' ')):
+            return data
+    for termo, chave in INGREDIENTE_PARA_TACO.items():
+        if _eh_match_parcial_seguro(frase, _normalizar_frase_taco(termo)):
+            return TACO_DATABASE.get(chave)
+    for taco_key, data in TACO_DATABASE.items():
+        if _eh_match_parcial_seguro(frase, _normalizar_frase_taco(taco_key.replace('_', ' '))):
+            return data
+    return None
+
+
+def _proporcao_linear(ingrediente: str) -> float:
+    ing_tokens = set(_normalizar_frase_taco(ingrediente).split())
+    for chave, valor in PROPORCOES.items():
+        if all(t in ing_tokens for t in chave.split()):
+            return valor
+    return 0.0
+
+
+def _entradas():
+    entradas = {"", "  ", "xyz", "molho de batata", "Sal a gosto", "Frango (peito)", "arroz_branco"}
+    for key, data in list(TACO_DATABASE.items())[::3]:
+        toks = key.split('_')
+        entradas |= {key, data["nome"], data["nome"].upper(), toks[0], " ".join(toks[-2:])}
+    for termo in INGREDIENTE_PARA_TACO:
+        entradas |= {termo, termo.title(), f"{termo} picado", f"molho de {termo}"}
+    return sorted(entradas)
+
+
+def test_igual_a_busca_linear():
+    for ingrediente in _entradas():
+        assert buscar_dados_taco(ingrediente) is _buscar_linear(ingrediente), ingrediente
+
+
+def test_regras_conservadoras():
+    batata = [k for k, d in TACO_DATABASE.items() if "batata" in k.split("_")]
+    assert batata
+    resultado = buscar_dados_taco("molho batata")
+    assert resultado is None or "batata" not in _normalizar_frase_taco(resultado["nome"]).split()
+    assert _proporcao_tabelada("Salmão grelhado") == PROPORCOES["salmao"]
+    assert _proporcao_tabelada("sal a gosto") == PROPORCOES["sal"]
+
+
+def test_lote_mesma_ordem():
+    ingredientes = ["Arroz branco", "xyz", "feijão", "Sal a gosto", "xyz"]
+    assert buscar_dados_taco_lote(ingredientes) == [buscar_dados_taco(i) for i in ingredientes]
+    assert buscar_dados_taco_lote([]) == []
+
+
+def test_proporcoes_iguais_ao_loop():
+    for ingrediente in _entradas() + ["banana da terra frita", "creme de leite fresco", "leite condensado"]:
+        assert _proporcao_tabelada(ingrediente) == _proporcao_linear(ingrediente), ingrediente
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Thumbnails pre-gerados (services/thumbnail_service.py) e mapa slug -> pasta
+do services/image_service.py.
+
+Cobre os casos:
+- todos os tamanhos/formatos gerados uma vez, indexados pelo hash do conteudo
+- manifest por bytes+mtime: servir de novo nao abre o PIL nem rele a foto
+- ETag forte e If-None-Match (lista, W/, *)
+- varredura em background gera so o que falta
+- mapa slug -> pasta reconstruido quando o dataset muda; pasta com mais imagens vence
+
+Executar:
+    python3 -m pytest backend/tests/test_thumbnail_service.py -v
+"""
+
+import io
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest  # noqa: E402
+from PIL import Image  # noqa: E402
+
+import services.image_service as image_service  # noqa: E402
+import services.thumbnail_service as thumbs  # noqa: E402
+
+
+def _jpeg(color=(200, 120, 40), size=(1200, 900)) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", size, color).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(thumbs, "THUMB_DIR", tmp_path / "thumbs")
+    monkeypatch.setattr(thumbs, "_MANIFEST", {})
+    monkeypatch.setattr(thumbs, "_MANIFEST_LOADED", False)
+    monkeypatch.setattr(thumbs, "_MANIFEST_DIRTY", 0)
+    dataset = tmp_path / "organized"
+    dataset.mkdir()
+    monkeypatch.setattr(image_service, "LOCAL_DATASET_DIR", dataset)
+    image_service.invalidate_folder_map()
+    yield dataset
+    image_service.invalidate_folder_map()
+
+
+def test_gera_todos_os_tamanhos_uma_vez(store):
+    data = _jpeg()
+    digest = thumbs.generate_thumbnails(data)
+    assert digest == thumbs.content_hash(data)
+    for size in thumbs.THUMB_SIZES:
+        for fmt, (pil_format, _, _) in thumbs.THUMB_FORMATS.items():
+            with Image.open(thumbs.thumb_path(digest, size, fmt)) as img:
+                assert img.format == pil_format
+                assert max(img.size) == size
+    mtime = thumbs.thumb_path(digest, 300, "webp").stat().st_mtime_ns
+    thumbs.generate_thumbnails(data)
+    assert thumbs.thumb_path(digest, 300, "webp").stat().st_mtime_ns == mtime
+
+
+def test_servir_de_novo_nao_abre_pil(store, monkeypatch):
+    photo = store / "Arroz_Integral" / "a1.jpg"
+    photo.parent.mkdir()
+    photo.write_bytes(_jpeg())
+    path, etag = thumbs.thumbnail_for_file(photo, 300, "webp")
+    assert path.exists()
+
+    def boom(*a, **k):
+        raise AssertionError("PIL/leitura nao deveriam ser usados")
+    monkeypatch.setattr(thumbs, "generate_thumbnails", boom)
+    monkeypatch.setattr(thumbs, "content_hash", boom)
+    assert thumbs.thumbnail_for_file(photo, 300, "webp") == (path, etag)
+
+    # Manifest persistido: outro processo tambem nao rele a foto
+    thumbs.save_manifest()
+    monkeypatch.setattr(thumbs, "_MANIFEST", {})
+    monkeypatch.setattr(thumbs, "_MANIFEST_LOADED", False)
+    assert thumbs.thumbnail_for_file(photo, 300, "webp") == (path, etag)
+
+
+def test_etag_e_negociacao():
+    etag = thumbs.etag_for("ab" * 20, 300, "webp")
+    assert thumbs.etag_matches(etag, etag)
+    assert thumbs.etag_matches(f'"x", W/{etag}', etag)
+    assert thumbs.etag_matches("*", etag)
+    assert not thumbs.etag_matches(None, etag)
+    assert not thumbs.etag_matches(thumbs.etag_for("ab" * 20, 300, "jpg"), etag)
+    assert thumbs.pick_format("image/avif,image/webp,*/*") == "webp"
+    assert thumbs.pick_format("image/*") == "jpg"
+    assert [thumbs.pick_size(n) for n in (1, 100, 300, 400, 2000)] == [300, 150, 300, 600, 600]
+
+
+def test_varredura_gera_so_o_que_falta(store):
+    for name, color in (("Feijao", (10, 10, 10)), ("Salada", (0, 200, 0))):
+        (store / name).mkdir()
+        (store / name / "f1.jpg").write_bytes(_jpeg(color))
+    (store / "Salada" / "dish_info.json").write_text("{}")
+    assert thumbs.sweep(store) == {"images": 2, "generated": 2, "errors": 0}
+    assert thumbs.sweep(store) == {"images": 2, "generated": 0, "errors": 0}
+
+
+def test_mapa_de_pastas(store):
+    (store / "Arroz_Integral").mkdir()
+    (store / "Arroz_Integral" / "a1.jpg").write_bytes(b"x")
+    assert image_service._find_local_folder("arroz-integral") == store / "Arroz_Integral"
+
+    # Pasta duplicada com mais imagens vence (pasta nova -> mapa reconstruido)
+    (store / "arroz integral").mkdir()
+    for i in range(3):
+        (store / "arroz integral" / f"b{i}.jpg").write_bytes(b"x")
+    image_service.invalidate_folder_map()
+    assert image_service._find_local_folder("Arroz Integral") == store / "arroz integral"
+
+    # Pasta vazia nao conta; sem correspondencia nenhuma -> None
+    (store / "Feijao").mkdir()
+    image_service.invalidate_folder_map()
+    assert image_service._find_local_folder("feijão") is None
+    assert image_service._find_local_folder("inexistente") is None
+
+
+def test_imagem_representativa(store):
+    folder = store / "Bolo"
+    folder.mkdir()
+    (folder / "a_mini.jpg").write_bytes(b"x" * 100)
+    (folder / "b_grande.jpg").write_bytes(_jpeg(size=(800, 800)))
+    assert image_service.representative_image(folder) == folder / "b_grande.jpg"
+    (folder / "b_grande.jpg").unlink()
+    assert image_service.representative_image(folder) == folder / "a_mini.jpg"
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Fallback USDA (services/usda_fallback.py) contra o servidor fixture local.
+
+Cobre os casos:
+- parser: energia so em KCAL, formato do TACO_DATABASE
+- cache persistente: outra instancia (restart) le do SQLite sem ir ao USDA
+- cache negativo com TTL proprio; 429 nao e cacheado
+- prefetch de varios ingredientes em paralelo, respeitando concorrencia e rate limit
+- calcular_nutricao_prato busca todos os faltantes de uma vez (inclusive dentro de um loop ativo)
+- um unico AsyncClient (loop proprio) serve chamadas sincronas e async; close() fecha o pool
+
+Executar:
+    python3 -m pytest backend/tests/test_usda_fallback.py -v
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import pytest  # noqa: E402
+
+import services.usda_fallback as usda  # noqa: E402
+from usda_fixture_server import FOODS, UsdaFixtureServer  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    with UsdaFixtureServer() as srv:
+        yield srv
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "usda_cache.sqlite")
+
+
+@pytest.fixture
+def wired(server, cache_path, monkeypatch):
+    """Singletons do modulo apontando para o fixture e um cache temporario."""
+    monkeypatch.setattr(usda, "_cache", usda.UsdaCache(cache_path))
+    client = usda.UsdaClient(base_url=server.base_url, rps=0, concurrency=4)
+    monkeypatch.setattr(usda, "_client", client)
+    yield server
+    client.close()
+
+
+def test_parser_kcal_e_formato_taco():
+    assert usda._parse_foods("kj only", FOODS["kj only"]) is None
+    dados = usda._parse_foods("miso paste", FOODS["miso paste"])
+    assert dados["calorias"] == 198 and dados["proteinas"] == 12.8 and dados["sodio"] == 3728
+    assert dados["nome"] == "(USDA) Miso"
+    assert set(usda.USDA_NUTRIENT_MAP.values()) <= set(dados)
+
+
+def test_cache_persiste_entre_instancias(wired, cache_path):
+    assert usda.buscar_dados_usda("Missô")["calorias"] == 198
+    assert wired.queries == ["miso paste"]
+
+    # "restart": memoria vazia, mesmo arquivo
+    usda._cache = usda.UsdaCache(cache_path)
+    assert usda.buscar_dados_usda("missô")["calorias"] == 198
+    assert wired.queries == ["miso paste"]
+    assert usda._cache.stats()["disk_entries"] == 1
+
+
+def test_cache_negativo_com_ttl(wired, cache_path):
+    cache = usda.UsdaCache(cache_path, ttl_s=1000, negative_ttl_s=10)
+    usda._cache = cache
+    assert usda.buscar_dados_usda("ingrediente inexistente") is None
+    assert usda.buscar_dados_usda("ingrediente inexistente") is None
+    assert len(wired.queries) == 1
+    assert cache.stats()["disk_negative"] == 1
+
+    agora = time.time()
+    assert cache.get("ingrediente inexistente", now=agora + 5) is None
+    assert cache.get("ingrediente inexistente", now=agora + 11) is usda._MISSING
+
+    cache.set("misso", {"calorias": 1}, now=agora)
+    assert cache.get("misso", now=agora + 500) == {"calorias": 1}  # positivo vive mais
+    assert usda.UsdaCache(cache_path, ttl_s=1000).get("misso", now=agora + 1001) is usda._MISSING
+
+
+def test_rate_limit_429_nao_e_cacheado(wired):
+    wired.fail_with = 429
+    assert usda.buscar_dados_usda("nori") is None
+    wired.fail_with = None
+    assert usda.buscar_dados_usda("nori")["calorias"] == 35
+    assert wired.queries == ["nori seaweed dried", "nori seaweed dried"]
+
+
+def test_prefetch_paralelo_e_rate_limit(server, cache_path, monkeypatch):
+    server.delay_s = 0.2
+    monkeypatch.setattr(usda, "_cache", usda.UsdaCache(cache_path))
+    monkeypatch.setattr(usda, "_client", usda.UsdaClient(base_url=server.base_url, rps=0, concurrency=3))
+
+    inicio = time.perf_counter()
+    res = asyncio.run(usda.prefetch_usda(["misso", "nori", "molho de ostras", "misso", ""]))
+    assert time.perf_counter() - inicio < 0.5  # 3 x 0.2s em paralelo, nao em serie
+    assert 2 <= server.max_in_flight <= 3
+    assert sorted(res) == ["misso", "molho de ostras", "nori"]
+    assert res["molho de ostras"]["calorias"] == 51
+    assert sorted(server.queries) == ["miso paste", "nori seaweed dried", "oyster sauce"]
+    usda._client.close()
+
+    # rate limit: 4 requisicoes a 10/s ocupam >= 0.3s mesmo com concorrencia sobrando
+    server.delay_s = 0
+    usda._client = usda.UsdaClient(base_url=server.base_url, rps=10, concurrency=8)
+    inicio = time.perf_counter()
+    asyncio.run(usda.prefetch_usda(["a1", "a2", "a3", "a4"]))
+    assert time.perf_counter() - inicio >= 0.29
+    usda._client.close()
+
+
+def test_calcular_nutricao_prato_prefetch(wired):
+    from data.taco_database import calcular_nutricao_prato
+
+    ingredientes = ["arroz branco", "misso", "nori", "ingrediente inexistente"]
+    totais = calcular_nutricao_prato(ingredientes, 300, "Arroz com misso")
+    assert "misso [USDA]" in totais["ingredientes_encontrados"]
+    assert "nori [USDA]" in totais["ingredientes_encontrados"]
+    assert "arroz branco" in totais["ingredientes_encontrados"]
+    assert totais["ingredientes_nao_encontrados"] == ["ingrediente inexistente"]
+    assert sorted(wired.queries) == ["ingrediente inexistente", "miso paste", "nori seaweed dried"]
+
+    # chamado de dentro de um loop ativo (endpoint async): tudo do cache, nenhuma requisicao nova
+    async def no_loop():
+        return calcular_nutricao_prato(ingredientes, 300, "Arroz com misso")
+    assert asyncio.run(no_loop())["calorias"] == pytest.approx(totais["calorias"])
+    assert len(wired.queries) == 3
+
+
+def test_sync_dentro_de_loop_ativo_busca_em_thread(wired):
+    async def endpoint():
+        return usda.buscar_dados_usda("molho de ostras")
+    assert asyncio.run(endpoint())["nome"] == "(USDA) Sauce, oyster, ready-to-serve"
+
+
+
+def test_um_pool_para_sync_e_async(wired):
+    client = usda._client
+    assert usda.buscar_dados_usda("misso")["calorias"] == 198
+    http = client._http
+    assert asyncio.run(usda.prefetch_usda(["nori"]))["nori"]["calorias"] == 35
+    assert usda.buscar_dados_usda("molho de ostras")["calorias"] == 51
+    assert client._http is http and not http.is_closed  # mesmo pool nas 3 rodadas
+    thread = client._thread
+    assert thread.is_alive()
+
+    client.close()
+    assert http.is_closed
+    assert not thread.is_alive()
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
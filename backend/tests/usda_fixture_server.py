@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Servidor local que imita GET /foods/search do USDA FoodData Central, para
+testar services/usda_fallback.py sem rede.
+
+Uso nos testes:
+    with UsdaFixtureServer() as srv:
+        client = UsdaClient(base_url=srv.base_url)
+
+Standalone (para apontar o backend para ele):
+    python3 backend/tests/usda_fixture_server.py 8765
+    USDA_BASE_URL=http://127.0.0.1:8765 ...
+"""
+
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def _food(description, kcal, protein=0.0, carbs=0.0, fat=0.0, sodium=0.0):
+    return {
+        "description": description,
+        "foodNutrients": [
+            {"nutrientName": "Energy", "unitName": "KJ", "value": round(kcal * 4.184, 1)},
+            {"nutrientName": "Energy", "unitName": "KCAL", "value": kcal},
+            {"nutrientName": "Protein", "unitName": "G", "value": protein},
+            {"nutrientName": "Carbohydrate, by difference", "unitName": "G", "value": carbs},
+            {"nutrientName": "Total lipid (fat)", "unitName": "G", "value": fat},
+            {"nutrientName": "Sodium, Na", "unitName": "MG", "value": sodium},
+        ],
+    }
+
+
+# query (em inglês, como chega da tradução) -> foods
+FOODS = {
+    "miso paste": [_food("Miso", 198, protein=12.8, carbs=25.4, fat=6.0, sodium=3728)],
+    "nori seaweed dried": [_food("Seaweed, laver, dried", 35, protein=5.8, carbs=5.1, fat=0.3, sodium=48)],
+    "oyster sauce": [_food("Sauce, oyster, ready-to-serve", 51, protein=1.4, carbs=10.9, sodium=2733)],
+    # só energia em kJ: deve ser ignorado pelo parser
+    "kj only": [{"description": "KJ only", "foodNutrients": [{"nutrientName": "Energy", "unitName": "KJ", "value": 800}]}],
+}
+
+
+class UsdaFixtureServer:
+    """ThreadingHTTPServer em 127.0.0.1 (porta livre). Conta requisições e
+    concorrência máxima; `fail_with` força um status (ex.: 429) nas próximas respostas."""
+
+    def __init__(self, foods=None, delay_s=0.0, port=0):
+        self.foods = dict(FOODS if foods is None else foods)
+        self.delay_s = delay_s
+        self.fail_with = None
+        self.queries = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path != "/foods/search":
+                    self.send_error(404)
+                    return
+                query = parse_qs(url.query).get("query", [""])[0]
+                with fixture._lock:
+                    fixture.queries.append(query)
+                    fixture.in_flight += 1
+                    fixture.max_in_flight = max(fixture.max_in_flight, fixture.in_flight)
+                try:
+                    if fixture.delay_s:
+                        time.sleep(fixture.delay_s)
+                    if fixture.fail_with:
+                        body, status = b'{"error": "fixture"}', fixture.fail_with
+                    else:
+                        body = json.dumps({"foods": fixture.foods.get(query, [])}).encode()
+                        status = 200
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                finally:
+                    with fixture._lock:
+                        fixture.in_flight -= 1
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    srv = UsdaFixtureServer(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8765)
+    print(f"USDA fixture em {srv.base_url}")
+    try:
+        srv._httpd.serve_forever()
+    except KeyboardInterrupt:
+        srv.stop()